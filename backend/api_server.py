@@ -23,8 +23,8 @@ FastAPI server for Opentrons AI Protocol Generator - Simplified Version
 4. POST /api/simulate-protocol
    - 作用：模拟验证Opentrons协议代码
    - 输入：protocol_code (协议代码字符串)
-   - 返回：success, raw_simulation_output, error_message, warnings_present, warning_details, final_status_message, timestamp
-   - 功能：等同于opentrons_validator的simulate.py功能，验证代码正确性
+   - 返回：success, raw_simulation_output, error_message, warnings_present, warning_details, final_status_message, duration_estimate, timestamp
+   - 功能：等同于opentrons_validator的simulate.py功能，验证代码正确性；成功时根据运行日志估算运行时间 (用于仪器排期)
 
 5. GET /api/health
    - 作用：API服务健康检查
@@ -46,35 +46,61 @@ FastAPI server for Opentrons AI Protocol Generator - Simplified Version
    - 返回：zip文件流
    - 功能：生成并返回一个zip文件，其中包含协议脚本和详细说明，以便于上传到protocols.io
 
+9. GET /api/artifacts/code/{code_hash}
+   - 作用：按内容哈希获取某次尝试生成的完整代码
+   - 返回：success, code_hash, code
+   - 功能：配合紧凑事件模式 (compact_events=true) 使用，事件中只携带哈希和与上一次尝试的 unified diff
+
+10. GET /api/artifacts/logs/{log_id}
+   - 作用：按ID获取被截断的完整模拟日志
+   - 返回：success, log_id, content
+
+11. GET /metrics
+   - 作用：Prometheus 文本格式的运行指标
+   - 返回：各端点请求数/耗时、模拟器调用 (success/timeout/failure)、进行中的生成数、每次生成的尝试次数、缓存命中率、LLM 延迟和事件循环延迟
+
+12. GET /api/admin/traces, GET /api/admin/traces/{run_id}
+   - 作用：查询最近的运行及某次运行的完整 trace（run_id 为响应头 X-Run-ID 或 X-Request-ID）
+   - 需要：环境变量 LABSCRIPT_ADMIN_TOKEN 与请求头 X-Admin-Token 一致
+   - 返回：根 span 列表 / 按开始时间排序的 span（节点、LLM 调用、模拟、diff 应用）
+   - 同样带 X-Admin-Token 的任意请求可加请求头 X-Profile: 1（或 ?profile=1）对该请求做 CPU 分析，结果写入 profiles/（响应头 X-Profile-ID）
+
 === 核心工作流程 ===
 用户目标 → 生成SOP → 生成代码 → 模拟验证 → 完成协议
 """
 
-import json
+import logging
+import os
 import traceback
 import asyncio
 import io
 from datetime import datetime
 from typing import Dict, Any, List, Optional, AsyncGenerator
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
 
 # Use absolute imports
-from backend.langchain_agent import (
-    generate_sop_with_langchain,
-    run_code_generation_graph_stream,  # 流式代码生成函数
-    generate_sop_with_langchain_stream,
-    converse_about_sop,
-    converse_about_code, # Keep the non-streaming version
-    converse_about_code_stream, # Add the new streaming function
-)
+# NOTE: backend.langchain_agent, backend.pylabrobot_agent and backend.pylabrobot_utils
+# pull in LangChain/LangGraph/PyLabRobot and are slow to import. They are imported
+# inside the endpoints that need them so that importing this module stays fast.
+# Set LABSCRIPT_PREWARM=1 to load them (and build the LLM clients/graphs) at startup.
 from backend.opentrons_utils import run_opentrons_simulation
-from backend.pylabrobot_utils import run_pylabrobot_simulation
-from backend.pylabrobot_agent import run_pylabrobot_agent_and_stream_events
 from backend.file_exporter import ProtocolsIOExporter
+from backend.sse_utils import sse_stream
+from backend.artifact_store import artifact_store, CompactEventEncoder
+from backend.http_utils import CompressionMiddleware, admin_token, etag_json_response, etag_response, is_admin_request
+from backend.profile_catalog import profile_catalog, PyLabRobotProfilesResponse
+from backend.metrics import PROMETHEUS_CONTENT_TYPE, render_prometheus
+from backend.server_metrics import EventLoopLagMonitor, MetricsMiddleware, track_generation
+from backend.log_utils import SAMPLED, RequestIdMiddleware, configure_logging
+from backend.tracing import TracingMiddleware, find_trace, recent_runs
+from backend.profiling import ProfilingMiddleware
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 # Request/Response models
 class SOPGenerationRequest(BaseModel):
@@ -90,6 +116,7 @@ class ProtocolCodeGenerationRequest(BaseModel):
     sop_markdown: str
     hardware_config: str
     robot_model: Optional[str] = None  # Add explicit robot model field
+    compact_events: bool = False  # Send code as hash + diff and truncate logs in stream events
 
 class ProtocolCodeGenerationResponse(BaseModel):
     success: bool
@@ -112,6 +139,7 @@ class ProtocolSimulationResponse(BaseModel):
     warnings_present: bool = False
     warning_details: Optional[str] = None
     final_status_message: str
+    duration_estimate: Optional[Dict[str, Any]] = None  # Estimated run time, see backend/runtime_estimator.py
     timestamp: str
 
 class ProtocolExportRequest(BaseModel):
@@ -154,15 +182,82 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Request-ID", "X-Run-ID", "X-Profile-ID"],
 )
 
+# Response compression (brotli if installed, otherwise gzip); SSE chunks are flushed per frame
+app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
+# Request counts and latencies for /metrics (outside compression, so it also times it;
+# inside request IDs, tracing and profiling)
+app.add_middleware(MetricsMiddleware)
+
+# On-demand profiling of admin requests (X-Profile: 1); not installed at all without an admin token
+if admin_token() is not None:
+    app.add_middleware(ProfilingMiddleware)
+
+# Root trace span per request (run ID returned in X-Run-ID); inside RequestIdMiddleware to record its ID
+app.add_middleware(TracingMiddleware)
+
+# Correlation ID (X-Request-ID) attached to every log record of a request
+app.add_middleware(RequestIdMiddleware)
+
+event_loop_lag_monitor = EventLoopLagMonitor()
+
+# Headers for SSE responses: disable caching and proxy buffering so that
+# coalesced frames reach the client as soon as they are flushed.
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+def sse_response(events: AsyncGenerator[Dict[str, Any], None]) -> StreamingResponse:
+    """Wraps an async generator of event dicts into an SSE StreamingResponse."""
+    return StreamingResponse(sse_stream(events), media_type="text/event-stream", headers=SSE_HEADERS)
+
+def prewarm_agents() -> None:
+    """Imports the agent modules and builds their LLM clients and graphs."""
+    from backend import langchain_agent
+    from backend import pylabrobot_agent
+    langchain_agent.prewarm()
+    pylabrobot_agent.get_pylabrobot_llm_instances()
+    pylabrobot_agent.get_pylabrobot_agent()
+
+@app.on_event("startup")
+async def start_event_loop_lag_monitor():
+    event_loop_lag_monitor.start()
+
+@app.on_event("shutdown")
+async def stop_event_loop_lag_monitor():
+    await event_loop_lag_monitor.stop()
+
+@app.on_event("startup")
+async def prewarm_on_startup():
+    """Optionally pre-warms the agents (LABSCRIPT_PREWARM=1) without blocking the event loop."""
+    if os.getenv("LABSCRIPT_PREWARM", "").lower() not in ("1", "true", "yes"):
+        return
+    try:
+        logger.info("Pre-warming agents, LLM clients and graphs...")
+        await asyncio.to_thread(prewarm_agents)
+        logger.info("Pre-warm complete")
+    except Exception as e:
+        logger.warning("Agent pre-warm failed, components will be built on first use: %s", e)
+
 # Define dependencies
 def get_sop_generator():
+    from backend.langchain_agent import generate_sop_with_langchain
     return generate_sop_with_langchain
 
 def get_protocol_simulator():
     return run_opentrons_simulation
 
+def require_admin(request: Request):
+    """Admin endpoints are hidden without LABSCRIPT_ADMIN_TOKEN and forbidden without the X-Admin-Token header."""
+    if admin_token() is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not is_admin_request(request.headers):
+        raise HTTPException(status_code=403, detail="Invalid or missing X-Admin-Token")
+
 @app.get("/")
 async def root():
     """Health check endpoint for the API."""
@@ -172,6 +267,11 @@ async def root():
         "timestamp": datetime.now().isoformat()
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Service metrics in the Prometheus text exposition format."""
+    return PlainTextResponse(render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 @app.post("/api/generate-sop", response_model=SOPGenerationResponse)
 async def generate_sop(
     request: SOPGenerationRequest,
@@ -182,7 +282,7 @@ async def generate_sop(
         # Build input - hardware config is part of the prompt
         combined_input = f"{request.hardware_config}---{request.user_goal}"
         
-        print(f"Debug - Starting SOP generation, input length: {len(combined_input)}")
+        logger.debug("Starting SOP generation, input length: %d", len(combined_input))
         
         # Call local LangChain SOP generation
         sop_result = sop_generator(combined_input)
@@ -199,7 +299,7 @@ async def generate_sop(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"SOP generation error: {e}")
+        logger.exception("SOP generation error: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"SOP generation failed: {str(e)}"
@@ -218,67 +318,68 @@ async def generate_protocol_code_stream(
     - Otherwise: uses Opentrons Agent (Flex/OT-2)
     """
     try:
-        print(f"Debug - Starting streaming code generation")
-        print(f"Debug - SOP length: {len(request.sop_markdown)}")
-        print(f"Debug - Hardware config length: {len(request.hardware_config)}")
+        logger.debug("Starting streaming code generation, SOP length: %d, hardware config length: %d",
+                     len(request.sop_markdown), len(request.hardware_config))
         
         # Dispatcher logic: check robot type from explicit robot_model field
         is_pylabrobot = request.robot_model == 'PyLabRobot'
-        print(f"Debug - Robot model from request: {request.robot_model}")
-        print(f"Debug - Detected robot type: {'PyLabRobot' if is_pylabrobot else 'Opentrons'}")
+        logger.debug("Robot model from request: %s, detected robot type: %s",
+                     request.robot_model, "PyLabRobot" if is_pylabrobot else "Opentrons")
 
-        async def event_stream():
+        async def generation_events():
             try:
                 if is_pylabrobot:
                     # Use PyLabRobot Agent
-                    print("Debug - Using PyLabRobot Agent for code generation")
+                    logger.debug("Using PyLabRobot Agent for code generation")
                     
                     # Extract user query from SOP for PyLabRobot Agent
                     user_query = f"Generate PyLabRobot protocol based on SOP: {request.sop_markdown}"
                     
+                    from backend.pylabrobot_agent import run_pylabrobot_agent_and_stream_events
                     async for event_data in run_pylabrobot_agent_and_stream_events(
                         user_query=user_query, 
                         hardware_config_str=request.hardware_config, # Pass hardware config string
                         max_attempts=9
                     ):
-                        # Format as SSE event
-                        payload = json.dumps(event_data)
-                        yield f"data: {payload}\n\n"
-                        await asyncio.sleep(0.01)  # Small delay to allow proper streaming
+                        yield event_data
                 else:
                     # Use existing Opentrons Agent
-                    print("Debug - Using Opentrons Agent for code generation")
+                    logger.debug("Using Opentrons Agent for code generation")
                     
                     # Combine SOP and hardware config into a single string for the agent
                     tool_input = f"{request.sop_markdown}\n---CONFIG_SEPARATOR---\n{request.hardware_config}"
 
+                    from backend.langchain_agent import run_code_generation_graph_stream
                     async for event_data in run_code_generation_graph_stream(tool_input, max_iterations=9):
-                        # Format as SSE event
-                        payload = json.dumps(event_data)
-                        yield f"data: {payload}\n\n"
-                        await asyncio.sleep(0.01)  # Small delay to allow proper streaming
+                        yield event_data
                 
                 # Signal completion
-                done_payload = json.dumps({"event_type": "stream_complete"})
-                yield f"data: {done_payload}\n\n"
+                yield {"event_type": "stream_complete"}
 
             except Exception as e:
-                print(f"Error during code generation stream: {e}")
-                import traceback
+                logger.exception("Error during code generation stream: %s", e)
                 error_traceback = traceback.format_exc()
-                error_payload = json.dumps({
+                yield {
                     "event_type": "error", 
                     "message": f"代码生成流程中发生异常: {str(e)}",
                     "error_traceback": error_traceback,
                     "timestamp": datetime.now().isoformat()
-                })
-                yield f"data: {error_payload}\n\n"
+                }
 
-        return StreamingResponse(event_stream(), media_type="text/event-stream")
+        async def event_stream():
+            events = track_generation("pylabrobot" if is_pylabrobot else "opentrons", generation_events())
+            if not request.compact_events:
+                async for event_data in events:
+                    yield event_data
+                return
+            encoder = CompactEventEncoder(artifact_store)
+            async for event_data in events:
+                yield encoder.encode(event_data)
+
+        return sse_response(event_stream())
         
     except Exception as e:
-        print(f"Failed to start code generation stream: {e}")
-        print(f"Error details: {traceback.format_exc()}")
+        logger.exception("Failed to start code generation stream: %s", e)
         raise HTTPException(
             status_code=500,
             detail={
@@ -288,6 +389,36 @@ async def generate_protocol_code_stream(
             }
         )
 
+@app.get("/api/artifacts/code/{code_hash}")
+async def get_code_artifact(code_hash: str):
+    """Returns the full protocol code referenced by a compact generation event."""
+    code = artifact_store.get_code(code_hash)
+    if code is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired code hash: {code_hash}")
+    return {"success": True, "code_hash": code_hash, "code": code}
+
+@app.get("/api/artifacts/logs/{log_id}")
+async def get_log_artifact(log_id: str):
+    """Returns the full simulator log truncated in a compact generation event."""
+    content = artifact_store.get_log(log_id)
+    if content is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired log id: {log_id}")
+    return {"success": True, "log_id": log_id, "content": content}
+
+@app.get("/api/admin/traces", dependencies=[Depends(require_admin)])
+async def list_traces(limit: int = 20):
+    """Root spans of the latest runs, newest first."""
+    runs = await asyncio.to_thread(recent_runs, max(1, min(limit, 200)))
+    return {"success": True, "runs": runs}
+
+@app.get("/api/admin/traces/{run_id}", dependencies=[Depends(require_admin)])
+async def get_trace(run_id: str):
+    """All spans of one run, by run ID (X-Run-ID) or request ID (X-Request-ID)."""
+    spans = await asyncio.to_thread(find_trace, run_id)
+    if not spans:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired run id: {run_id}")
+    return {"success": True, "run_id": run_id, "spans": spans}
+
 @app.post("/api/simulate-protocol", response_model=ProtocolSimulationResponse)
 async def simulate_protocol(
     request: ProtocolSimulationRequest,
@@ -304,11 +435,12 @@ async def simulate_protocol(
             warnings_present=simulation_result.get("warnings_present", False),
             warning_details=simulation_result.get("warning_details"),
             final_status_message=simulation_result.get("final_status", "Simulation status unknown."),
+            duration_estimate=simulation_result.get("duration_estimate"),
             timestamp=datetime.now().isoformat()
         )
     
     except Exception as e:
-        print(f"Simulation error: {e}")
+        logger.exception("Simulation error: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"An unexpected error occurred during simulation: {str(e)}"
@@ -320,9 +452,9 @@ async def simulate_pylabrobot_protocol(
 ):
     """Simulates the provided PyLabRobot protocol code."""
     try:
-        print(f"Debug - Starting PyLabRobot simulation")
-        print(f"Debug - Protocol code length: {len(request.protocol_code)}")
+        logger.debug("Starting PyLabRobot simulation, protocol code length: %d", len(request.protocol_code))
         
+        from backend.pylabrobot_utils import run_pylabrobot_simulation
         simulation_result = await run_pylabrobot_simulation(request.protocol_code, return_structured=True)
         
         return ProtocolSimulationResponse(
@@ -336,8 +468,7 @@ async def simulate_pylabrobot_protocol(
         )
     
     except Exception as e:
-        print(f"PyLabRobot simulation error: {e}")
-        print(f"Error details: {traceback.format_exc()}")
+        logger.exception("PyLabRobot simulation error: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"An unexpected error occurred during PyLabRobot simulation: {str(e)}"
@@ -370,8 +501,7 @@ async def export_for_protocols_io(request: ProtocolExportRequest):
         
         return StreamingResponse(io.BytesIO(zip_bytes), media_type="application/zip", headers=headers)
     except Exception as e:
-        print(f"Export error: {e}")
-        print(f"Error details: {traceback.format_exc()}")
+        logger.exception("Export error: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to generate export file: {str(e)}"
@@ -391,116 +521,54 @@ async def health_check():
         raise HTTPException(status_code=503, detail=f"Health check failed: {str(e)}")
 
 @app.get("/api/tools")
-async def list_tools():
-    """Lists available tools or configurations (example)."""
+async def list_tools(request: Request):
+    """Lists available tools or configurations (example). Supports If-None-Match."""
     # This is a placeholder. In a real scenario, you might list
     # available LangChain tools, Dify workflows, or other resources.
-    return {
+    return etag_json_response(request, {
         "tools_available": [
             {"name": "Local SOP Generation (LangChain)", "description": "Generates detailed SOPs from hardware config and user goal using local LangChain."},
             {"name": "Protocol Code Generation Agent (LangChain)", "description": "Generates Python protocol code from SOP and hardware config, with iteration."},
             {"name": "Opentrons Protocol Simulator", "description": "Simulates Opentrons Python protocols."}
         ],
         "status": "ok"
-    }
-
-# PyLabRobot profile models
-class PyLabRobotProfile(BaseModel):
-    id: str
-    robot_model: str
-    display_name: str
-    manufacturer: str
-    description: str
-    precision_class: str
-    volume_range: Dict[str, float]
-    special_features: List[str]
-    recommended_for: List[str]
-    default_config: Dict[str, Any]  # New field for the full config
-
-class PyLabRobotProfilesResponse(BaseModel):
-    success: bool
-    profiles: List[PyLabRobotProfile]
-    timestamp: str
+    })
 
 @app.get("/api/pylabrobot/profiles", response_model=PyLabRobotProfilesResponse)
-async def get_pylabrobot_profiles():
+async def get_pylabrobot_profiles(request: Request):
     """
     Get all available PyLabRobot hardware configuration profiles.
     
+    Profiles are served from the in-memory profile catalog, which re-reads
+    the profile directory only when files change. The response carries a
+    weak ETag; clients sending a matching If-None-Match header receive
+    304 Not Modified.
+    
     Returns:
         PyLabRobotProfilesResponse: List of available robot configurations
     """
     try:
-        import os
-        import json
-        from pathlib import Path
-        
-        profiles = []
-        profiles_dir = Path(__file__).parent / "hardware_profiles"
-        
-        if profiles_dir.exists():
-            # Scan for PyLabRobot configuration files
-            for config_file in profiles_dir.glob("pylabrobot_*.json"):
-                try:
-                    with open(config_file, 'r', encoding='utf-8') as f:
-                        config_data = json.load(f)
-                    
-                    # Extract profile information
-                    robot_model = config_data.get("robot_model", "unknown")
-                    
-                    # Create display name from robot model
-                    display_name = robot_model.replace("_", " ").title()
-                    if display_name == "Generic":
-                        display_name = "Generic PyLabRobot"
-                    elif display_name == "Hamilton Star":
-                        display_name = "Hamilton STAR"
-                    elif display_name == "Hamilton Vantage":
-                        display_name = "Hamilton Vantage"
-                    elif display_name == "Tecan Evo":
-                        display_name = "Tecan Freedom EVO"
-                    elif display_name == "Opentrons":
-                        display_name = "Opentrons OT-2"
-                    
-                    profile = PyLabRobotProfile(
-                        id=config_file.stem,
-                        robot_model=robot_model,
-                        display_name=display_name,
-                        manufacturer=config_data.get("manufacturer", "Unknown"),
-                        description=config_data.get("description", ""),
-                        precision_class=config_data.get("precision_class", "standard"),
-                        volume_range=config_data.get("volume_range", {"min_ul": 1, "max_ul": 1000}),
-                        special_features=config_data.get("special_features", []),
-                        recommended_for=config_data.get("recommended_for", []),
-                        default_config=config_data  # Pass the entire config object
-                    )
-                    profiles.append(profile)
-                    
-                except Exception as e:
-                    print(f"Warning: Failed to load PyLabRobot profile {config_file}: {e}")
-                    continue
-        
-        # Sort profiles by display name for consistent ordering
-        profiles.sort(key=lambda x: x.display_name)
-        
-        return PyLabRobotProfilesResponse(
-            success=True,
-            profiles=profiles,
-            timestamp=datetime.now().isoformat()
-        )
+        body, etag = profile_catalog.serialized_response()
+        return etag_response(request, body, etag)
         
     except Exception as e:
-        print(f"Error loading PyLabRobot profiles: {e}")
+        logger.exception("Error loading PyLabRobot profiles: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to load PyLabRobot profiles: {str(e)}")
 
 # Streaming Endpoints - Keep SOP streaming functionality
 
 async def generate_sop_stream(request: SOPGenerationRequest) -> AsyncGenerator[str, None]:
     """Stream SOP generation process using Server-Sent Events"""
+    async for frame in sse_stream(_sop_stream_events(request)):
+        yield frame
+
+async def _sop_stream_events(request: SOPGenerationRequest) -> AsyncGenerator[Dict[str, Any], None]:
+    """Yields the SOP generation events consumed by generate_sop_stream."""
     try:
         # Build input - hardware config is part of the prompt
         combined_input = f"{request.hardware_config}---{request.user_goal}"
         
-        print(f"Debug - Starting streaming SOP generation, input length: {len(combined_input)}")
+        logger.debug("Starting streaming SOP generation, input length: %d", len(combined_input))
         
         # Prepare inputs for streaming SOP generation
         if "---" in combined_input:
@@ -511,12 +579,12 @@ async def generate_sop_stream(request: SOPGenerationRequest) -> AsyncGenerator[s
             hardware_context = "No specific hardware configuration provided."
             user_goal = combined_input.strip()
         
-        print(f"Debug - Hardware context: {hardware_context}")
-        print(f"Debug - User goal: {user_goal}")
+        logger.debug("Hardware context: %s", hardware_context, extra=SAMPLED)
+        logger.debug("User goal: %s", user_goal, extra=SAMPLED)
         
         # Send start signal
         start_data = {"type": "start", "message": "Starting real-time SOP generation..."}
-        yield f"data: {json.dumps(start_data)}\n\n"
+        yield start_data
         
         # Import the streaming function
         from backend.langchain_agent import generate_sop_with_langchain_stream
@@ -528,30 +596,23 @@ async def generate_sop_stream(request: SOPGenerationRequest) -> AsyncGenerator[s
                 if token:
                     token_count += 1
                     # Send each token immediately as it's generated
-                    token_data = {"type": "content", "token": token}
-                    yield f"data: {json.dumps(token_data)}\n\n"
-                    
-                    # Add a small delay to pace the stream for the frontend
-                    await asyncio.sleep(0.01)
+                    yield {"type": "content", "token": token}
             
-            print(f"Debug - API: 流式传输完成，总共发送了 {token_count} 个token")
+            logger.debug("流式传输完成，总共发送了 %d 个token", token_count)
         
         except Exception as stream_error:
-            print(f"Error - API: 流式生成过程中发生错误: {stream_error}")
+            logger.exception("流式生成过程中发生错误: %s", stream_error)
             error_data = {"type": "error", "message": f"Real-time SOP generation failed: {str(stream_error)}"}
-            yield f"data: {json.dumps(error_data)}\n\n"
+            yield error_data
             return
         
         # Send completion signal
         completion_data = {"type": "complete", "message": "SOP generation completed"}
-        yield f"data: {json.dumps(completion_data)}\n\n"
+        yield completion_data
         
     except Exception as e:
-        print(f"Streaming SOP generation error: {e}")
-        import traceback
-        print(f"Full traceback: {traceback.format_exc()}")
-        error_data = {"type": "error", "message": f"SOP generation failed: {str(e)}"}
-        yield f"data: {json.dumps(error_data)}\n\n"
+        logger.exception("Streaming SOP generation error: %s", e)
+        yield {"type": "error", "message": f"SOP generation failed: {str(e)}"}
 
 @app.post("/api/generate-sop-stream")
 async def stream_sop_generation(request: SOPGenerationRequest):
@@ -560,30 +621,27 @@ async def stream_sop_generation(request: SOPGenerationRequest):
         # We need a wrapper async function to bridge our sync langchain call to fastapi's async world
         async def event_stream():
             try:
+                from backend.langchain_agent import generate_sop_with_langchain_stream
                 # The generator is an async generator
                 async for chunk in generate_sop_with_langchain_stream(request.hardware_config, request.user_goal):
                     if "STREAM_ERROR:" in chunk:
                         # Handle errors propagated from the stream
-                        error_payload = json.dumps({"event": "error", "message": chunk})
-                        yield f"data: {error_payload}\n\n"
+                        yield {"event": "error", "message": chunk}
                         return
                     
-                    payload = json.dumps({"token": chunk})
-                    yield f"data: {payload}\n\n"
-                    await asyncio.sleep(0.01) # Small sleep to allow for message sending
+                    # Token events are coalesced into larger frames by the SSE writer
+                    yield {"token": chunk}
                 
                 # Signal completion
-                done_payload = json.dumps({"event": "done"})
-                yield f"data: {done_payload}\n\n"
+                yield {"event": "done"}
 
             except Exception as e:
-                print(f"Error during SOP stream: {e}")
-                error_payload = json.dumps({"event": "error", "message": f"An unexpected error occurred in the stream: {str(e)}"})
-                yield f"data: {error_payload}\n\n"
+                logger.exception("Error during SOP stream: %s", e)
+                yield {"event": "error", "message": f"An unexpected error occurred in the stream: {str(e)}"}
 
-        return StreamingResponse(event_stream(), media_type="text/event-stream")
+        return sse_response(track_generation("sop", event_stream()))
     except Exception as e:
-        print(f"Failed to start SOP stream: {e}")
+        logger.exception("Failed to start SOP stream: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to initiate SOP stream: {str(e)}")
 
 
@@ -612,7 +670,7 @@ async def converse_sop(request: SopEditRequest):
         )
         return result
     except Exception as e:
-        print(f"Error during SOP conversation: {traceback.format_exc()}")
+        logger.exception("Error during SOP conversation: %s", e)
         raise HTTPException(status_code=500, detail=f"An unexpected server error occurred: {str(e)}")
 
 
@@ -634,21 +692,19 @@ async def converse_code_stream_endpoint(request: CodeEditRequest):
     """
     async def event_stream():
         try:
+            from backend.langchain_agent import converse_about_code_stream
             async for event in converse_about_code_stream(request.original_code, request.user_instruction):
-                yield f"data: {json.dumps(event)}\n\n"
-                await asyncio.sleep(0.01) # Small delay to allow proper streaming
+                yield event
             
-            done_payload = json.dumps({"event_type": "stream_complete"})
-            yield f"data: {done_payload}\n\n"
+            yield {"event_type": "stream_complete"}
         except Exception as e:
-            print(f"Error during code conversation stream: {traceback.format_exc()}")
-            error_payload = json.dumps({
+            logger.exception("Error during code conversation stream: %s", e)
+            yield {
                 "event_type": "error",
                 "message": f"An unexpected error occurred in the stream: {str(e)}"
-            })
-            yield f"data: {error_payload}\n\n"
+            }
 
-    return StreamingResponse(event_stream(), media_type="text/event-stream")
+    return sse_response(track_generation("code_edit", event_stream()))
 
 @app.post("/api/converse-code", response_model=CodeConverseResponse)
 async def converse_code_endpoint(request: CodeEditRequest):
@@ -664,5 +720,5 @@ async def converse_code_endpoint(request: CodeEditRequest):
         )
         return result
     except Exception as e:
-        print(f"Error during code conversation: {traceback.format_exc()}")
+        logger.exception("Error during code conversation: %s", e)
         raise HTTPException(status_code=500, detail=f"An unexpected server error occurred: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Artifact Store
+==============
+
+Content-addressed storage for generated protocol code and simulator logs,
+plus the compact event encoding used by the code generation stream.
+
+In compact mode the streaming events no longer embed the full code and log
+text on every event. Instead:
+
+- each code field (``generated_code``, ``final_code``) is replaced by the
+  SHA-256 of the code and a unified diff against the previous code sent on
+  the same stream (with ``\\ No newline at end of file`` markers like
+  ``diff``, since generated code has no trailing newline); the full text can
+  be fetched via
+  ``GET /api/artifacts/code/{code_hash}``;
+- long log fields (``raw_output``, ``error_details`` ...) are truncated to
+  their tail and carry a log id; the full text can be fetched via
+  ``GET /api/artifacts/logs/{log_id}``.
+"""
+
+import difflib
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from backend.server_metrics import cache_counters
+
+# Fields carrying full protocol code in generation events
+CODE_FIELDS = ("generated_code", "final_code")
+
+# Fields carrying simulator output or error reports in generation events
+LOG_FIELDS = ("raw_output", "error_details", "warning_details", "error_report", "error_traceback")
+
+# Nested dicts that are compacted recursively
+NESTED_FIELDS = ("structured_result",)
+
+# Log text longer than this is truncated in compact events (tail is kept)
+MAX_INLINE_LOG_CHARS = 2000
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+_ARTIFACT_HITS, _ARTIFACT_MISSES = cache_counters("artifacts")
+
+
+def content_hash(text: str) -> str:
+    """Returns the hex SHA-256 digest of ``text`` encoded as UTF-8."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ArtifactStore:
+    """
+    A bounded, thread-safe LRU store of text artifacts keyed by content hash.
+
+    Entries are namespaced by kind ("code" or "log"). Identical content is
+    stored once. When either the entry or the byte budget is exceeded, the
+    least recently used entries are evicted.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, kind: str, text: str) -> str:
+        """Stores ``text`` and returns its content hash."""
+        digest = content_hash(text)
+        key = (kind, digest)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return digest
+            self._entries[key] = text
+            self._total_bytes += len(text)
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted)
+        return digest
+
+    def get(self, kind: str, digest: str) -> Optional[str]:
+        """Returns the stored text for ``digest`` or None if unknown/evicted."""
+        key = (kind, digest)
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+        (_ARTIFACT_HITS if text is not None else _ARTIFACT_MISSES).inc()
+        return text
+
+    def put_code(self, code: str) -> str:
+        return self.put("code", code)
+
+    def get_code(self, code_hash: str) -> Optional[str]:
+        return self.get("code", code_hash)
+
+    def put_log(self, text: str) -> str:
+        return self.put("log", text)
+
+    def get_log(self, log_id: str) -> Optional[str]:
+        return self.get("log", log_id)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+def unified_diff(old: str, new: str, fromfile: str, tofile: str) -> str:
+    """
+    Unified diff of two texts. A last line without a newline is followed by a
+    ``\\ No newline at end of file`` marker, as ``diff`` and ``patch`` expect.
+    """
+    lines = []
+    for line in difflib.unified_diff(old.splitlines(keepends=True), new.splitlines(keepends=True),
+                                     fromfile=fromfile, tofile=tofile):
+        lines.append(line)
+        if not line.endswith("\n"):
+            lines.append("\n\\ No newline at end of file\n")
+    return "".join(lines)
+
+
+# Process-wide store shared by the streaming endpoints and the fetch endpoints
+artifact_store = ArtifactStore()
+
+
+class CompactEventEncoder:
+    """
+    Rewrites generation events into their compact form for a single stream.
+
+    The encoder remembers the last code sent on the stream so that each new
+    attempt is transmitted as a unified diff against the previous one.
+
+    Args:
+        store: The artifact store receiving the full code and log text.
+        max_inline_log_chars: Length above which log fields are truncated.
+    """
+
+    def __init__(self, store: Optional[ArtifactStore] = None, max_inline_log_chars: int = MAX_INLINE_LOG_CHARS):
+        self.store = store if store is not None else artifact_store
+        self.max_inline_log_chars = max_inline_log_chars
+        self._previous_code = ""
+        self._previous_hash: Optional[str] = None
+
+    def encode(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """Returns a compact copy of ``event``; the input is not modified."""
+        compact = dict(event)
+        for field in CODE_FIELDS:
+            code = compact.get(field)
+            if isinstance(code, str) and code:
+                del compact[field]
+                compact.update(self._encode_code(field, code))
+        self._compact_logs(compact)
+        return compact
+
+    def _encode_code(self, field: str, code: str) -> Dict[str, Any]:
+        code_hash = self.store.put_code(code)
+        base_hash = self._previous_hash
+        if code_hash == base_hash:
+            diff = ""
+        else:
+            diff = unified_diff(self._previous_code, code, base_hash or "empty", code_hash)
+            self._previous_code = code
+            self._previous_hash = code_hash
+        return {
+            f"{field}_hash": code_hash,
+            f"{field}_base_hash": base_hash,
+            f"{field}_diff": diff,
+        }
+
+    def _compact_logs(self, payload: Dict[str, Any]) -> None:
+        for field in LOG_FIELDS:
+            text = payload.get(field)
+            if isinstance(text, str) and len(text) > self.max_inline_log_chars:
+                payload[field] = text[-self.max_inline_log_chars:]
+                payload[f"{field}_truncated"] = True
+                payload[f"{field}_log_id"] = self.store.put_log(text)
+        for field in NESTED_FIELDS:
+            nested = payload.get(field)
+            if isinstance(nested, dict):
+                nested = dict(nested)
+                self._compact_logs(nested)
+                payload[field] = nested
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 """Configuration file for the Opentrons AI Protocol Generator."""
 
+import os
+
 # --- Common Pitfalls for OT-2 ---
 COMMON_PITFALLS_OT2 = [
     "Use metadata = {{\"apiLevel\": \"2.19\"}} for OT-2, not the 'requirements' dictionary.",
@@ -158,6 +160,19 @@ REVIEW_VISION_TOOL_CONFIG = {
     "api_key": "YOUR_GLM_API_KEY",
 }
 
+# Real endpoint of each model, used by the record/replay stand-in (backend/llm_replay.py)
+LLM_UPSTREAMS = {
+    model_name: (base_url, api_key),
+    DEEPSEEK_INTENT_MODEL: (DEEPSEEK_BASE_URL, DEEPSEEK_API_KEY),
+    REVIEW_VISION_TOOL_CONFIG["model"]: (REVIEW_VISION_TOOL_CONFIG["base_url"], REVIEW_VISION_TOOL_CONFIG["api_key"]),
+}
+
+# Offline runs: LABSCRIPT_LLM_BASE_URL points every model client at the local stand-in
+LLM_BASE_URL_OVERRIDE = os.environ.get("LABSCRIPT_LLM_BASE_URL")
+if LLM_BASE_URL_OVERRIDE:
+    base_url = DEEPSEEK_BASE_URL = LLM_BASE_URL_OVERRIDE
+    REVIEW_VISION_TOOL_CONFIG["base_url"] = LLM_BASE_URL_OVERRIDE
+
 # 2. Valid Opentrons Names and Code Examples (Knowledge Base)
 
 # --- Original Flat Lists (for reference and comprehensive checks) ---
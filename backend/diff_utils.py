@@ -7,6 +7,10 @@ This module provides tools for applying a custom SEARCH/REPLACE diff format
 to a given string content. It is a Python port of a robust TypeScript
 implementation, designed to handle multi-level fallbacks for matching search blocks.
 
+Each ``apply_diff`` call is recorded as a ``diff.apply`` trace span with the
+number of blocks, the matching strategy each block needed and the hashes of
+the code before and after.
+
 Author: Gaoyuan (ported to Python)
 """
 
@@ -14,6 +18,9 @@ import re
 from typing import List, Tuple, Dict, Any
 from difflib import SequenceMatcher
 
+from backend import tracing
+from backend.artifact_store import content_hash
+
 # Regex patterns for identifying SEARCH/REPLACE block markers
 SEARCH_BLOCK_START_REGEX = re.compile(r"^[-]{7,} SEARCH$")
 SEARCH_BLOCK_END_REGEX = re.compile(r"^[=]{7,}$")
@@ -174,6 +181,19 @@ def apply_diff(original_content: str, diff_content: str) -> str:
     Raises:
         ValueError: If a SEARCH block cannot be matched.
     """
+    strategies: List[str] = []
+    with tracing.span("diff.apply", {"labscript.code_hash": content_hash(original_content)}) as trace_span:
+        try:
+            result = _apply_diff(original_content, diff_content, strategies)
+        finally:
+            trace_span.set_attributes({"labscript.diff.blocks": len(strategies),
+                                       "labscript.diff.strategies": ",".join(strategies)})
+        trace_span.set_attribute("labscript.diff.result_hash", content_hash(result))
+    return result
+
+
+def _apply_diff(original_content: str, diff_content: str, strategies: List[str]) -> str:
+    """``apply_diff``, appending the strategy that matched each SEARCH block to ``strategies``."""
     lines = diff_content.splitlines()
     
     replacements: List[Dict[str, Any]] = []
@@ -222,6 +242,7 @@ def apply_diff(original_content: str, diff_content: str) -> str:
             if exact_index != -1:
                 search_match_index = exact_index
                 search_end_index = exact_index + len(search_content)
+                strategies.append("exact")
             else:
                 # 策略2: 模糊匹配 (Fuzzy Match using difflib)
                 # 使用Python difflib库的序列匹配算法，可以容忍一定程度的文本差异。
@@ -230,6 +251,7 @@ def apply_diff(original_content: str, diff_content: str) -> str:
                 fuzzy_match_result = fuzzy_match(original_content, search_content)
                 if fuzzy_match_result:
                     search_match_index, search_end_index = fuzzy_match_result
+                    strategies.append("fuzzy")
                 else:
                     # 策略3: 忽略空格的行匹配 (Line-trimmed Fallback)
                     # 逐行比较时忽略每行首尾的空白字符。这对于处理缩进不一致
@@ -237,6 +259,7 @@ def apply_diff(original_content: str, diff_content: str) -> str:
                     line_match = line_trimmed_fallback_match(original_content, search_content, 0)
                     if line_match:
                         search_match_index, search_end_index = line_match
+                        strategies.append("line_trimmed")
                     else:
                         # 策略4: 代码块锚点匹配 (Block Anchor Fallback)
                         # 当SEARCH块有3行以上时，仅使用第一行和最后一行作为"锚点"
@@ -245,7 +268,9 @@ def apply_diff(original_content: str, diff_content: str) -> str:
                         block_match = block_anchor_fallback_match(original_content, search_content, 0)
                         if block_match:
                             search_match_index, search_end_index = block_match
+                            strategies.append("block_anchor")
                         else:
+                            strategies.append("unmatched")
                             # 所有策略都失败：抛出详细的错误信息
                             raise ValueError(f"The SEARCH block does not match anything in the file:\n---\n{search_content}\n---")
             
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP Utility
+============
+
+Response compression and ETag helpers for the FastAPI server.
+
+- ``CompressionMiddleware`` compresses responses with brotli (when the
+  optional ``brotli`` package is installed) or gzip, according to the
+  client's ``Accept-Encoding``. Complete bodies below a size threshold are
+  sent as-is. Streaming responses are compressed incrementally; for
+  ``text/event-stream`` every chunk is sync-flushed so that SSE frames are
+  delivered without waiting for more data.
+- ``etag_json_response`` renders a JSON payload with a weak ETag and answers
+  ``If-None-Match`` with ``304 Not Modified``. The ETag is computed from the
+  uncompressed body and sent unchanged with every content-coding, which is
+  only allowed for weak validators (RFC 9110, 8.8.1).
+- ``is_admin_request`` checks the ``X-Admin-Token`` header against
+  ``LABSCRIPT_ADMIN_TOKEN``; without that variable admin features are off.
+"""
+
+import hashlib
+import hmac
+import os
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    brotli = None
+    BROTLI_AVAILABLE = False
+
+# Bodies smaller than this are not worth compressing
+DEFAULT_MINIMUM_SIZE = 1024
+DEFAULT_GZIP_LEVEL = 6
+DEFAULT_BROTLI_QUALITY = 4
+
+# Content types that are already compressed
+EXCLUDED_CONTENT_TYPES = ("application/zip", "application/gzip", "image/", "video/", "audio/")
+
+SSE_CONTENT_TYPE = "text/event-stream"
+
+ADMIN_TOKEN_HEADER = "x-admin-token"
+
+
+def parse_accept_encoding(header_value: str) -> Dict[str, float]:
+    """Parses an Accept-Encoding header into a {coding: qvalue} mapping."""
+    codings: Dict[str, float] = {}
+    for part in header_value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        coding, _, params = part.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[coding.strip().lower()] = q
+    return codings
+
+
+def select_encoding(header_value: str) -> Optional[str]:
+    """Selects the preferred supported content coding, or None for identity."""
+    codings = parse_accept_encoding(header_value)
+    wildcard = codings.get("*", 0.0)
+    candidates: List[Tuple[float, int, str]] = []
+    supported = ["br", "gzip"] if BROTLI_AVAILABLE else ["gzip"]
+    for preference, coding in enumerate(supported):
+        q = codings.get(coding, wildcard)
+        if q > 0:
+            # Higher q wins; on ties, prefer the server order (br before gzip)
+            candidates.append((q, -preference, coding))
+    if not candidates:
+        return None
+    return max(candidates)[2]
+
+
+class _StreamCompressor:
+    """Incremental compressor with a uniform interface for gzip and brotli."""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        if self.encoding == "br":
+            out = self._compressor.process(data)
+            if flush:
+                out += self._compressor.flush()
+            return out
+        out = self._compressor.compress(data)
+        if flush:
+            out += self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        return out
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+def compress_bytes(data: bytes, encoding: str, gzip_level: int = DEFAULT_GZIP_LEVEL,
+                   brotli_quality: int = DEFAULT_BROTLI_QUALITY) -> bytes:
+    """Compresses a complete body with the given content coding."""
+    compressor = _StreamCompressor(encoding, gzip_level, brotli_quality)
+    return compressor.compress(data) + compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing HTTP responses with brotli or gzip.
+
+    Args:
+        app: The wrapped ASGI application.
+        minimum_size: Complete bodies smaller than this are sent uncompressed.
+        gzip_level: zlib compression level for gzip.
+        brotli_quality: Brotli quality (0-11) when brotli is available.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = DEFAULT_MINIMUM_SIZE,
+                 gzip_level: int = DEFAULT_GZIP_LEVEL, brotli_quality: int = DEFAULT_BROTLI_QUALITY):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = select_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    """Per-request state machine deciding whether and how to compress."""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.downstream = send
+        self.start_message: Optional[Message] = None
+        self.passthrough = False
+        self.started = False
+        self.compressor: Optional[_StreamCompressor] = None
+        self.flush_each_chunk = False
+
+    def _should_skip(self, headers: Headers, status: int) -> bool:
+        if status < 200 or status in (204, 304):
+            return True
+        if "content-encoding" in headers:
+            return True
+        content_type = headers.get("content-type", "")
+        return any(content_type.startswith(excluded) for excluded in EXCLUDED_CONTENT_TYPES)
+
+    def _set_encoding_headers(self, headers: MutableHeaders) -> None:
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+
+    async def send(self, message: Message) -> None:
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            self.passthrough = self._should_skip(headers, message["status"])
+            self.flush_each_chunk = headers.get("content-type", "").startswith(SSE_CONTENT_TYPE)
+            if self.passthrough:
+                await self.downstream(message)
+                self.started = True
+            return
+
+        if message_type != "http.response.body" or self.passthrough:
+            await self.downstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if not self.started:
+            self.started = True
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            if not more_body:
+                # Complete body: compress only above the threshold
+                if len(body) < self.middleware.minimum_size:
+                    await self.downstream(self.start_message)
+                    await self.downstream(message)
+                    return
+                compressed = compress_bytes(body, self.encoding, self.middleware.gzip_level,
+                                            self.middleware.brotli_quality)
+                self._set_encoding_headers(headers)
+                headers["Content-Length"] = str(len(compressed))
+                await self.downstream(self.start_message)
+                await self.downstream({"type": "http.response.body", "body": compressed})
+                return
+
+            # Streaming body: the total size is unknown, compress incrementally
+            self.compressor = _StreamCompressor(self.encoding, self.middleware.gzip_level,
+                                                self.middleware.brotli_quality)
+            self._set_encoding_headers(headers)
+            if "content-length" in headers:
+                del headers["Content-Length"]
+            await self.downstream(self.start_message)
+
+        data = self.compressor.compress(body, flush=self.flush_each_chunk)
+        if not more_body:
+            data += self.compressor.finish()
+        if data or not more_body:
+            await self.downstream({"type": "http.response.body", "body": data, "more_body": more_body})
+
+
+def make_etag(body: bytes) -> str:
+    """
+    Returns a weak ETag derived from the SHA-256 of ``body``; weak because the
+    same value is sent with the identity, gzip and brotli representations.
+    """
+    return 'W/"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Evaluates an If-None-Match header against ``etag`` (weak comparison, RFC 9110)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def etag_response(request: Request, body: bytes, etag: Optional[str] = None,
+                  media_type: str = "application/json") -> Response:
+    """
+    Returns ``body`` with a weak ETag, or an empty 304 if the client's
+    If-None-Match already matches. ``etag`` may be precomputed by the caller.
+    """
+    etag = etag or make_etag(body)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def etag_json_response(request: Request, payload: Any) -> Response:
+    """Renders ``payload`` as JSON and returns it via ``etag_response``."""
+    body = JSONResponse(content=payload).body
+    return etag_response(request, body)
+
+
+def admin_token() -> Optional[str]:
+    """The configured admin token, or None when admin features are disabled."""
+    return os.getenv("LABSCRIPT_ADMIN_TOKEN") or None
+
+
+def is_admin_request(headers: Headers) -> bool:
+    """Whether the request carries the configured admin token (compared in constant time)."""
+    expected = admin_token()
+    provided = headers.get(ADMIN_TOKEN_HEADER)
+    if expected is None or provided is None:
+        return False
+    return hmac.compare_digest(provided.encode("utf-8"), expected.encode("utf-8"))
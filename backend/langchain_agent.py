@@ -14,16 +14,16 @@ Opentrons协议生成器 - LangGraph
 
 """
 
+import logging
 import os
 import requests
 import re # 用于正则表达式匹配，提取错误信息
 import ast # 用于快速Python语法检查
 import json # 用于处理Planner返回的JSON格式修改计划
+from functools import lru_cache # 用于LLM客户端、链和图的惰性构建
 from typing import Optional, Callable, Dict, Any, TypedDict, Annotated, Literal, List
 from datetime import datetime  # 用于给流式事件添加时间戳
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import PromptTemplate
-from langchain.chains import LLMChain
 from langgraph.graph import StateGraph, END, START
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
@@ -41,6 +41,8 @@ from backend.config import (
     REVIEW_PRIMARY_MODEL_NAME, REVIEW_VISION_TOOL_CONFIG,
 )
 from backend.diff_utils import apply_diff
+from backend.log_utils import SAMPLED
+from backend.node_timing import instrument_node, start_run
 from backend.opentrons_utils import run_opentrons_simulation, SimulateToolInput
 from backend.prompts import (
     SOP_GENERATION_PROMPT_TEMPLATE, 
@@ -65,6 +67,8 @@ from backend.prompts import (
     REVIEWER_PROMPT_TEMPLATE,
 )
 
+logger = logging.getLogger(__name__)
+
 # ============================================================================
 # 数据结构定义部分
 # ============================================================================
@@ -143,21 +147,21 @@ def generate_sop_with_langchain(user_goal_with_hardware_context: str) -> str:
             user_goal = user_goal_with_hardware_context.strip()
         
         # 打印调试信息，帮助开发者了解处理过程
-        print(f"Debug - [generate_sop_with_langchain] 原始输入长度: {len(user_goal_with_hardware_context)}")
-        print(f"Debug - [generate_sop_with_langchain] 硬件配置长度: {len(hardware_context)}")
-        print(f"Debug - [generate_sop_with_langchain] 硬件配置内容:\n{hardware_context}")
-        print(f"Debug - [generate_sop_with_langchain] 用户目标: {user_goal}")
+        logger.debug("原始输入长度: %s", len(user_goal_with_hardware_context))
+        logger.debug("硬件配置长度: %s", len(hardware_context))
+        logger.debug("硬件配置内容:\n%s", hardware_context, extra=SAMPLED)
+        logger.debug("用户目标: %s", user_goal, extra=SAMPLED)
         
         # 步骤2: 使用本地LangChain生成SOP
-        print(f"Debug - [generate_sop_with_langchain] 开始使用本地LangChain生成SOP")
+        logger.debug("开始使用本地LangChain生成SOP")
         
         # 调用预先配置的SOP生成链
-        sop_result = sop_generation_chain.run({
+        sop_result = get_chain("sop_generation").run({
             "hardware_context": hardware_context,
             "user_goal": user_goal
         })
         
-        print(f"Debug - [generate_sop_with_langchain] SOP生成完成，长度: {len(sop_result)} 字符")
+        logger.debug("SOP生成完成，长度: %s 字符", len(sop_result))
         
         # 步骤3: 确保返回格式一致
         # 如果生成的SOP没有标准标题，自动添加
@@ -168,10 +172,9 @@ def generate_sop_with_langchain(user_goal_with_hardware_context: str) -> str:
         
     except Exception as e:
         # 步骤4: 错误处理 - 捕获并记录所有异常
-        print(f"Debug - [generate_sop_with_langchain] SOP生成异常: {e}")
+        logger.exception("SOP生成异常: %s", e)
         import traceback
         error_traceback = traceback.format_exc()
-        print(f"Debug - [generate_sop_with_langchain] 完整错误堆栈: {error_traceback}")
         # 返回标准化的错误字符串，而不是抛出原始异常
         return f"Error: An unexpected error occurred during SOP generation. Details: {str(e)}\nTraceback:\n{error_traceback}"
 
@@ -179,38 +182,64 @@ def generate_sop_with_langchain(user_goal_with_hardware_context: str) -> str:
 # 大语言模型配置部分
 # ============================================================================
 
-# LLM for complex generation tasks (SOPs)
-llm = ChatOpenAI(
-    model_name=model_name,
-    openai_api_base=base_url,
-    openai_api_key=api_key,
-    temperature=0.0,
-    streaming=True, 
-    max_retries=2,
-    request_timeout=60
-)
+# ChatOpenAI客户端和LLMChain不再在导入时创建，而是在首次使用时由下面的
+# 工厂函数构建并缓存（导入 langchain_openai / langchain.chains 本身就很慢）。
+# 服务启动时可以调用 prewarm() 提前构建，见 api_server 的 startup 钩子。
+
+@lru_cache(maxsize=None)
+def get_llm():
+    """LLM for complex generation tasks (SOPs), streaming enabled."""
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        model_name=model_name,
+        openai_api_base=base_url,
+        openai_api_key=api_key,
+        temperature=0.0,
+        streaming=True, 
+        max_retries=2,
+        request_timeout=60
+    )
 
-# LLM for faster code generation and correction tasks
-code_gen_llm = ChatOpenAI(
-    model_name=DEEPSEEK_INTENT_MODEL, # Re-using the intent model name, "DeepSeek-V3-Fast"
-    openai_api_base=DEEPSEEK_BASE_URL,
-    openai_api_key=DEEPSEEK_API_KEY,
-    temperature=0.0,
-    streaming=False, # Code generation should not be streaming token by token in the backend
-    max_retries=2,
-    request_timeout=120 # Give more time for code generation
-)
+@lru_cache(maxsize=None)
+def get_code_gen_llm():
+    """LLM for faster code generation and correction tasks."""
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        model_name=DEEPSEEK_INTENT_MODEL, # Re-using the intent model name, "DeepSeek-V3-Fast"
+        openai_api_base=DEEPSEEK_BASE_URL,
+        openai_api_key=DEEPSEEK_API_KEY,
+        temperature=0.0,
+        streaming=False, # Code generation should not be streaming token by token in the backend
+        max_retries=2,
+        request_timeout=120 # Give more time for code generation
+    )
 
-# Reviewer LLM (defaults to same provider as main model)
-review_llm = ChatOpenAI(
-    model_name=REVIEW_PRIMARY_MODEL_NAME,
-    openai_api_base=base_url,
-    openai_api_key=api_key,
-    temperature=0.0,
-    streaming=False,
-    max_retries=2,
-    request_timeout=90
-)
+@lru_cache(maxsize=None)
+def get_review_llm():
+    """Reviewer LLM (defaults to same provider as main model)."""
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        model_name=REVIEW_PRIMARY_MODEL_NAME,
+        openai_api_base=base_url,
+        openai_api_key=api_key,
+        temperature=0.0,
+        streaming=False,
+        max_retries=2,
+        request_timeout=90
+    )
+
+@lru_cache(maxsize=None)
+def get_intent_llm():
+    """Specialized, faster model for intent classification."""
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        model_name=DEEPSEEK_INTENT_MODEL,
+        openai_api_base=DEEPSEEK_BASE_URL,
+        openai_api_key=DEEPSEEK_API_KEY,
+        temperature=0.0,
+        max_retries=1,
+        request_timeout=20
+    )
 
 # ============================================================================
 # 提示词模板对象创建
@@ -262,16 +291,26 @@ CODE_CORRECTION_PROMPT_OT2 = PromptTemplate(
 # LangChain链式处理配置部分
 # ============================================================================
 
-# 初始化SOP生成链 (uses powerful 'llm' instance)
-sop_generation_chain = LLMChain(llm=llm, prompt=SOP_GENERATION_PROMPT)
-
-# 初始化代码生成链 (为Flex和OT-2分别创建)
-code_gen_chain_flex = LLMChain(llm=code_gen_llm, prompt=CODE_GEN_PROMPT_FLEX)
-code_gen_chain_ot2 = LLMChain(llm=code_gen_llm, prompt=CODE_GEN_PROMPT_OT2)
-
-# 初始化代码修正链 (为Flex和OT-2分别创建)
-code_correction_chain_flex = LLMChain(llm=code_gen_llm, prompt=CODE_CORRECTION_PROMPT_FLEX)
-code_correction_chain_ot2 = LLMChain(llm=code_gen_llm, prompt=CODE_CORRECTION_PROMPT_OT2)
+# 链名称 -> (LLM工厂函数, 提示词模板)
+_CHAIN_SPECS = {
+    "sop_generation": (get_llm, SOP_GENERATION_PROMPT),               # SOP生成链 (uses powerful 'llm' instance)
+    "code_gen_flex": (get_code_gen_llm, CODE_GEN_PROMPT_FLEX),        # 代码生成链 (Flex)
+    "code_gen_ot2": (get_code_gen_llm, CODE_GEN_PROMPT_OT2),          # 代码生成链 (OT-2)
+    "code_correction_flex": (get_code_gen_llm, CODE_CORRECTION_PROMPT_FLEX),  # 代码修正链 (Flex)
+    "code_correction_ot2": (get_code_gen_llm, CODE_CORRECTION_PROMPT_OT2),    # 代码修正链 (OT-2)
+}
+
+@lru_cache(maxsize=None)
+def get_chain(name: str):
+    """
+    按名称惰性构建并缓存LLMChain
+    
+    参数:
+        name (str): _CHAIN_SPECS 中的链名称
+    """
+    from langchain.chains import LLMChain
+    llm_factory, prompt = _CHAIN_SPECS[name]
+    return LLMChain(llm=llm_factory(), prompt=prompt)
 
 # ============================================================================
 # 流式生成功能部分
@@ -296,7 +335,7 @@ async def generate_sop_with_langchain_stream(hardware_context: str, user_goal: s
         - 直接调用llm.astream()绕过LLMChain的缓冲
         - 每个token立即yield给调用者
     """
-    print("Debug - [generate_sop_with_langchain_stream] 开始使用LLM astream 实时生成SOP")
+    logger.debug("开始使用LLM astream 实时生成SOP")
     
     try:
         # 准备链的输入参数
@@ -306,23 +345,21 @@ async def generate_sop_with_langchain_stream(hardware_context: str, user_goal: s
         # 步骤1: 手动格式化提示词
         formatted_prompt = SOP_GENERATION_PROMPT.format(**chain_input)
         
-        print(f"Debug - [stream] Prompt已格式化，准备直接调用llm.astream")
+        logger.debug("Prompt已格式化，准备直接调用llm.astream")
         
         # 步骤2: 直接调用llm.astream，它返回一个包含AIMessageChunk的异步迭代器
         token_count = 0
-        async for chunk in llm.astream(formatted_prompt):
+        async for chunk in get_llm().astream(formatted_prompt):
             # AIMessageChunk有一个.content属性，包含实际的token字符串
             if chunk and hasattr(chunk, 'content') and chunk.content:
                 token_count += 1
                 # print(f"Debug - [stream] Yielding token #{token_count}")
                 yield chunk.content  # 立即yield每个token
         
-        print(f"Debug - [generate_sop_with_langchain_stream] 流式生成完成，总共产出 {token_count} 个token")
+        logger.debug("流式生成完成，总共产出 %s 个token", token_count)
         
     except Exception as e:
-        print(f"Error - [generate_sop_with_langchain_stream] 流式生成失败: {e}")
-        import traceback
-        print(f"Full traceback: {traceback.format_exc()}")
+        logger.exception("流式生成失败: %s", e)
         # 错误时提供一个回退信息
         yield f"Error: Streaming failed. Details: {str(e)}"
 
@@ -407,7 +444,7 @@ def generate_code_node(state: CodeGenerationState):
     - 后续尝试: 生成一个diff补丁并应用它来修正代码
     """
     attempt_num = state['attempts'] + 1
-    print(f"--- Graph: Generating Code (Attempt {attempt_num}) ---")
+    logger.debug("--- Graph: Generating Code (Attempt %s) ---", attempt_num)
     reporter = state.get('iteration_reporter')
     final_code = None
     llm_diff_output = None
@@ -418,20 +455,20 @@ def generate_code_node(state: CodeGenerationState):
     
     # 根据机器人类型选择正确的配置
     if is_flex:
-        print("Debug - Detected 'Flex' robot. Using Flex-specific hardware lists and prompt.")
+        logger.debug("Detected 'Flex' robot. Using Flex-specific hardware lists and prompt.")
         valid_labware = LABWARE_FOR_FLEX
         valid_instruments = INSTRUMENTS_FOR_FLEX
         valid_modules = MODULES_FOR_FLEX
-        code_gen_chain = code_gen_chain_flex
-        code_correction_chain = code_correction_chain_flex
+        code_gen_chain = get_chain("code_gen_flex")
+        code_correction_chain = get_chain("code_correction_flex")
         common_pitfalls_str = "" # Not used for Flex
     else:
-        print("Debug - Detected 'OT-2' robot (or default). Using OT-2-specific hardware lists and prompt.")
+        logger.debug("Detected 'OT-2' robot (or default). Using OT-2-specific hardware lists and prompt.")
         valid_labware = LABWARE_FOR_OT2
         valid_instruments = INSTRUMENTS_FOR_OT2
         valid_modules = MODULES_FOR_OT2
-        code_gen_chain = code_gen_chain_ot2
-        code_correction_chain = code_correction_chain_ot2
+        code_gen_chain = get_chain("code_gen_ot2")
+        code_correction_chain = get_chain("code_correction_ot2")
         common_pitfalls_str = "\n".join(f"- {pitfall}" for pitfall in COMMON_PITFALLS_OT2)
 
     api_version_match = re.search(r"API Version:\s*([\d.]+)", hardware_context)
@@ -512,7 +549,7 @@ def generate_code_node(state: CodeGenerationState):
             if reporter:
                 reporter({"event_type": "diff_applied", "attempt_num": attempt_num, "message": "Diff patch applied successfully."})
         except ValueError as e:
-            print(f"CRITICAL: Failed to apply diff on attempt {attempt_num}: {e}")
+            logger.error("Failed to apply diff on attempt %s: %s", attempt_num, e)
             final_code = previous_code
             if reporter:
                 reporter({
@@ -539,7 +576,7 @@ def simulate_code_node(state: CodeGenerationState):
     代码模拟节点函数
     运行Opentrons模拟器来验证生成的代码
     """
-    print("--- Graph: Simulating Code ---")
+    logger.debug("--- Graph: Simulating Code ---")
     
     # 向前端报告模拟开始
     if state.get('iteration_reporter'):
@@ -580,7 +617,7 @@ def _build_reviewer_feedback_prompt(sop_text: str, hardware_context: str, python
 
 def review_code_node(state: CodeGenerationState):
     """Reviewer node to validate code against SOP"""
-    print("--- Graph: Reviewing Code Against SOP ---")
+    logger.debug("--- Graph: Reviewing Code Against SOP ---")
 
     simulation_result = state.get("simulation_result") or {}
     reporter = state.get('iteration_reporter')
@@ -607,11 +644,11 @@ def review_code_node(state: CodeGenerationState):
     parsed_feedback: Dict[str, Any]
 
     try:
-        response = review_llm.invoke(prompt)
+        response = get_review_llm().invoke(prompt)
         raw_output = getattr(response, "content", str(response))
         parsed_feedback = json.loads(raw_output)
     except Exception as exc:  # parsing or request failure
-        print(f"Reviewer invocation failed: {exc}")
+        logger.warning("Reviewer invocation failed: %s", exc)
         parsed_feedback = {
             "result": "FAIL",
             "reasoning": f"Reviewer encountered an error: {exc}",
@@ -686,7 +723,7 @@ def prepare_feedback_node(state: CodeGenerationState):
     """
     分析模拟失败并为LLM准备结构化的、可操作的反馈。
     """
-    print("--- Graph: Preparing Intelligent Feedback for LLM ---")
+    logger.debug("--- Graph: Preparing Intelligent Feedback for LLM ---")
     
     simulation_result = state["simulation_result"]
     raw_error_output = simulation_result.get("raw_output", "")
@@ -699,7 +736,7 @@ def prepare_feedback_node(state: CodeGenerationState):
     is_stuck = error_details == previous_error and state["attempts"] > 1
 
     if is_stuck:
-        print("🔥🔥🔥 LOOP DETECTED! The previous fix failed. Escalating feedback to LLM. 🔥🔥🔥")
+        logger.info("LOOP DETECTED! The previous fix failed. Escalating feedback to LLM.")
         # 提供一个更强烈的指令来打破循环
         analysis = (
             "The previous attempt to fix the code was unsuccessful and resulted in the exact same error. "
@@ -806,7 +843,7 @@ def should_continue(state: CodeGenerationState):
     
     决策逻辑遵循"开发-测试-调试"的迭代模式，模拟真实的编程工作流。
     """
-    print("=== [LangGraph Decision Engine] 分析当前状态 ===")
+    logger.debug("=== [LangGraph Decision Engine] 分析当前状态 ===")
     
     # 获取关键状态信息
     simulation_result = state.get("simulation_result")
@@ -814,10 +851,10 @@ def should_continue(state: CodeGenerationState):
     current_attempt = state.get("attempts", 0)
     max_attempts = state.get("max_attempts", 5)
     
-    print(f"[Decision Engine] 当前尝试: {current_attempt}/{max_attempts}")
+    logger.debug("[Decision Engine] 当前尝试: %s/%s", current_attempt, max_attempts)
     
     if not simulation_result:
-        print("[Decision Engine] ⚠️  缺少模拟结果，继续下一轮生成")
+        logger.debug("[Decision Engine] ⚠️  缺少模拟结果，继续下一轮生成")
         return "continue"
     
     # 检查成功状态和警告
@@ -825,15 +862,15 @@ def should_continue(state: CodeGenerationState):
     has_warnings = simulation_result.get("has_warnings", False)
     error_details = simulation_result.get("error_details", "")
     
-    print(f"[Decision Engine] 模拟结果: 成功={success}, 有警告={has_warnings}")
+    logger.debug("[Decision Engine] 模拟结果: 成功=%s, 有警告=%s", success, has_warnings)
     
     if success:
         # 需要 Reviewer 通过
         if review_feedback and review_feedback.get("result", "FAIL") != "PASS":
-            print("[Decision Engine] ❌ Reviewer 未通过，继续迭代")
+            logger.debug("[Decision Engine] ❌ Reviewer 未通过，继续迭代")
             return "continue"
         status = "SUCCESS_WITH_WARNINGS" if has_warnings else "SUCCESS"
-        print(f"[Decision Engine] ✅ 模拟成功且審稿通过，状态 {status}")
+        logger.debug("[Decision Engine] ✅ 模拟成功且審稿通过，状态 %s", status)
         if state.get('iteration_reporter'):
             state['iteration_reporter']({
                 "event_type": "iteration_result",
@@ -847,7 +884,7 @@ def should_continue(state: CodeGenerationState):
 
     if current_attempt >= max_attempts:
         # 💀 失败情况：已达到最大尝试次数，必须停止避免无限循环
-        print(f"[Decision Engine] 💀 已达到最大尝试次数 ({max_attempts})，强制结束")
+        logger.info("[Decision Engine] 💀 已达到最大尝试次数 (%s)，强制结束", max_attempts)
         if state.get('iteration_reporter'):
             state['iteration_reporter']({
                 "event_type": "iteration_result",
@@ -860,39 +897,50 @@ def should_continue(state: CodeGenerationState):
         return "end"
     else:
         # 🔄 继续情况：模拟失败，但还有重试机会，进入调试修复流程
-        print(f"[Decision Engine] 🔄 模拟失败，准备第 {current_attempt + 1} 次尝试")
-        print(f"[Decision Engine] 错误信息: {error_details[:100]}..." if error_details else "无具体错误详情")
+        logger.debug("[Decision Engine] 🔄 模拟失败，准备第 %s 次尝试", current_attempt + 1)
+        logger.debug("[Decision Engine] 错误信息: %s", f"{error_details[:100]}..." if error_details else "无具体错误详情")
         return "continue"
 
 # ============================================================================
 # LangGraph工作流构建和编译
 # ============================================================================
 
-# 创建和编译LangGraph工作流
-workflow = StateGraph(CodeGenerationState)
-
-# 向图中添加节点
-workflow.add_node("generator", generate_code_node)           # 代码生成器节点
-workflow.add_node("simulator", simulate_code_node)           # 代码模拟器节点
-workflow.add_node("reviewer", review_code_node)              # 审稿节点
-workflow.add_node("feedback_preparer", prepare_feedback_node) # 反馈准备器节点
-
-# 定义图的流程
-workflow.add_edge(START, "generator")                        # 从开始节点到代码生成器
-workflow.add_edge("generator", "simulator")
-workflow.add_edge("simulator", "reviewer")
-workflow.add_conditional_edges(
-    "reviewer",
-    should_continue,
-    {
-        "continue": "feedback_preparer",  # 如果需要继续，去反馈准备器
-        "end": END                        # 如果完成，结束流程
-    }
-)
-workflow.add_edge("feedback_preparer", "generator")          # 循环回到代码生成器
+def build_code_generation_graph():
+    """
+    创建和编译代码生成的LangGraph工作流
+    
+    返回:
+        编译后的图对象
+    """
+    workflow = StateGraph(CodeGenerationState)
+
+    # 向图中添加节点
+    workflow.add_node("generator", instrument_node("code_generation", "generator", generate_code_node))  # 代码生成器节点
+    workflow.add_node("simulator", instrument_node("code_generation", "simulator", simulate_code_node))  # 代码模拟器节点
+    workflow.add_node("reviewer", instrument_node("code_generation", "reviewer", review_code_node))  # 审稿节点
+    workflow.add_node("feedback_preparer", instrument_node("code_generation", "feedback_preparer", prepare_feedback_node))  # 反馈准备器节点
+
+    # 定义图的流程
+    workflow.add_edge(START, "generator")                        # 从开始节点到代码生成器
+    workflow.add_edge("generator", "simulator")
+    workflow.add_edge("simulator", "reviewer")
+    workflow.add_conditional_edges(
+        "reviewer",
+        should_continue,
+        {
+            "continue": "feedback_preparer",  # 如果需要继续，去反馈准备器
+            "end": END                        # 如果完成，结束流程
+        }
+    )
+    workflow.add_edge("feedback_preparer", "generator")          # 循环回到代码生成器
 
-# 将图编译为可运行的应用程序
-code_generation_graph = workflow.compile()
+    # 将图编译为可运行的应用程序
+    return workflow.compile()
+
+@lru_cache(maxsize=None)
+def get_code_generation_graph():
+    """首次使用时编译代码生成图并缓存"""
+    return build_code_generation_graph()
 
 def run_code_generation_graph(
     tool_input: str, 
@@ -911,26 +959,26 @@ def run_code_generation_graph(
         str: 生成的协议代码或错误信息
     """
     try:
-        print(f"Debug - [langchain_agent.py] Entering LangGraph-based code generation")
+        logger.debug("Entering LangGraph-based code generation")
 
         # 为命令行兼容性定义默认报告器
         def default_reporter(event_data: Dict[str, Any]):
             if event_data["event_type"] == "iteration_log":
-                print(f"[ProtocolCodeGenerator] {event_data['message']}")
+                logger.debug("[ProtocolCodeGenerator] %s", event_data['message'])
             elif event_data["event_type"] == "code_attempt":
-                print(f"[ProtocolCodeGenerator] 生成代码尝试 {event_data['attempt_num']}")
+                logger.debug("[ProtocolCodeGenerator] 生成代码尝试 %s", event_data['attempt_num'])
             elif event_data["event_type"] == "simulation_start":
-                print(f"[ProtocolCodeGenerator] 开始模拟验证第 {event_data['attempt_num']} 次尝试...")
+                logger.debug("[ProtocolCodeGenerator] 开始模拟验证第 %s 次尝试...", event_data['attempt_num'])
             elif event_data["event_type"] == "simulation_log_raw":
-                print(f"[ProtocolCodeGenerator] 模拟结果: {event_data.get('message', '')}")
+                logger.debug("[ProtocolCodeGenerator] 模拟结果: %s", event_data.get('message', ''))
             elif event_data["event_type"] == "iteration_result":
-                print(f"[ProtocolCodeGenerator] 第 {event_data['attempt_num']} 次尝试结果: {event_data['status']}")
+                logger.debug("[ProtocolCodeGenerator] 第 %s 次尝试结果: %s", event_data['attempt_num'], event_data['status'])
             elif event_data["event_type"] == "review_start":
-                print(f"[ProtocolCodeGenerator] 审稿开始 第 {event_data['attempt_num']} 次")
+                logger.debug("[ProtocolCodeGenerator] 审稿开始 第 %s 次", event_data['attempt_num'])
             elif event_data["event_type"] == "review_feedback":
-                print(f"[ProtocolCodeGenerator] 审稿结果: {event_data.get('result', 'UNKNOWN')}")
+                logger.debug("[ProtocolCodeGenerator] 审稿结果: %s", event_data.get('result', 'UNKNOWN'))
                 if event_data.get("details"):
-                    print(f"[ProtocolCodeGenerator] 审稿细节: {event_data['details']}")
+                    logger.debug("[ProtocolCodeGenerator] 审稿细节: %s", event_data['details'], extra=SAMPLED)
 
         reporter = iteration_reporter or default_reporter
 
@@ -974,7 +1022,7 @@ def run_code_generation_graph(
         # 每次尝试涉及3个节点（generator -> simulator -> feedback_preparer）
         # 所以9次尝试 × 3个节点 =27次总节点访问
         config = {"recursion_limit": 50}
-        final_state = code_generation_graph.invoke(initial_state, config=config)
+        final_state = get_code_generation_graph().invoke(initial_state, config=config)
         
         # 格式化并返回最终结果
         simulation_result = final_state.get("simulation_result", {})
@@ -1051,10 +1099,9 @@ def run_code_generation_graph(
 
     except Exception as e:
         # 异常处理
-        print(f"Debug - [langchain_agent.py] Exception in LangGraph code generation: {e}")
+        logger.exception("Exception in LangGraph code generation: %s", e)
         import traceback
         error_traceback = traceback.format_exc()
-        print(f"Debug - 完整错误堆栈: {error_traceback}")
         return f"Error: An unexpected error occurred during protocol generation. Details: {str(e)}\nTraceback:\n{error_traceback}"
 
 # ============================================================================
@@ -1092,7 +1139,7 @@ async def run_code_generation_graph_stream(
         - "error": 执行错误
     """
     try:
-        print(f"Debug - [run_code_generation_graph_stream] 开始异步流式代码生成")
+        logger.debug("开始异步流式代码生成")
         
         # 发送开始事件
         yield {
@@ -1146,15 +1193,16 @@ async def run_code_generation_graph_stream(
         
         # 使用 astream 异步执行图
         config = {"recursion_limit": 50}
+        timings = start_run()  # 各节点耗时与 token 统计，随 final_result 返回
         
         # 跟踪当前状态
         current_state = initial_state
         current_attempt = 0
         
-        async for chunk in code_generation_graph.astream(initial_state, config=config):
+        async for chunk in get_code_generation_graph().astream(initial_state, config=config):
             # chunk 是一个字典，键是节点名，值是该节点的输出
             for node_name, node_output in chunk.items():
-                print(f"Debug - [stream] Node '{node_name}' completed with output keys: {list(node_output.keys())}")
+                logger.debug("Node '%s' completed with output keys: %s", node_name, list(node_output.keys()))
                 
                 # 更新当前状态
                 current_state.update(node_output)
@@ -1201,27 +1249,27 @@ async def run_code_generation_graph_stream(
                         }
                     
                 elif node_name == "reviewer":
-                review_feedback = current_state.get("review_feedback")
-                yield {
-                    "event_type": "node_complete",
-                    "node_name": "reviewer",
-                    "message": f"第 {current_attempt} 次审稿完成",
-                    "attempt_num": current_attempt,
-                    "review_feedback": review_feedback,
-                    "timestamp": datetime.now().isoformat()
-                }
-
-                if review_feedback and review_feedback.get("result") != "PASS":
+                    review_feedback = current_state.get("review_feedback")
                     yield {
-                        "event_type": "attempt_result",
-                        "status": "REVIEW_FAILED",
+                        "event_type": "node_complete",
+                        "node_name": "reviewer",
+                        "message": f"第 {current_attempt} 次审稿完成",
                         "attempt_num": current_attempt,
-                        "message": "Reviewer indicated mismatches with SOP.",
                         "review_feedback": review_feedback,
                         "timestamp": datetime.now().isoformat()
                     }
 
-        elif node_name == "feedback_preparer":
+                    if review_feedback and review_feedback.get("result") != "PASS":
+                        yield {
+                            "event_type": "attempt_result",
+                            "status": "REVIEW_FAILED",
+                            "attempt_num": current_attempt,
+                            "message": "Reviewer indicated mismatches with SOP.",
+                            "review_feedback": review_feedback,
+                            "timestamp": datetime.now().isoformat()
+                        }
+
+                elif node_name == "feedback_preparer":
                     # 反馈准备器节点完成
                     feedback = current_state.get("feedback_for_llm", {})
                     yield {
@@ -1288,6 +1336,7 @@ async def run_code_generation_graph_stream(
                 "error_report": failure_report,
                 "generated_code": final_code,
                 "total_attempts": current_attempt,
+                "timings": timings.to_dict(),
                 "timestamp": datetime.now().isoformat()
             }
             return
@@ -1303,6 +1352,7 @@ async def run_code_generation_graph_stream(
                 "review_feedback": final_review_feedback,
                 "reviewer_history": final_reviewer_history,
                 "total_attempts": current_attempt,
+                "timings": timings.to_dict(),
                 "timestamp": datetime.now().isoformat()
             }
         else:
@@ -1339,15 +1389,15 @@ async def run_code_generation_graph_stream(
                 "review_feedback": final_review_feedback,
                 "reviewer_history": final_reviewer_history,
                 "total_attempts": current_attempt,
+                "timings": timings.to_dict(),
                 "timestamp": datetime.now().isoformat()
             }
 
     except Exception as e:
         # 异常处理
-        print(f"Debug - [run_code_generation_graph_stream] Exception: {e}")
+        logger.exception("Code generation stream failed: %s", e)
         import traceback
         error_traceback = traceback.format_exc()
-        print(f"Debug - 完整错误堆栈: {error_traceback}")
         
         yield {
             "event_type": "error",
@@ -1373,7 +1423,7 @@ def generate_protocol_code(sop_markdown: str, hardware_config: str, max_iteratio
     返回:
         str: 生成的协议代码或错误信息
     """
-    print(f"Debug - [generate_protocol_code] 开始协议代码生成 (max_iterations={max_iterations})")
+    logger.debug("开始协议代码生成 (max_iterations=%s)", max_iterations)
     
     try:
         # 格式化输入参数，使用特定分隔符连接SOP和硬件配置
@@ -1382,14 +1432,12 @@ def generate_protocol_code(sop_markdown: str, hardware_config: str, max_iteratio
         # 调用LangGraph工作流生成代码
         result = run_code_generation_graph(tool_input, max_iterations=max_iterations)
         
-        print(f"Debug - [generate_protocol_code] 代码生成完成，长度: {len(result)} 字符")
+        logger.debug("代码生成完成，长度: %s 字符", len(result))
         return result
         
     except Exception as e:
         # 捕获异常并返回错误信息
-        print(f"Error - [generate_protocol_code] 代码生成失败: {e}")
-        import traceback
-        print(f"Full traceback: {traceback.format_exc()}")
+        logger.exception("代码生成失败: %s", e)
         return f"Error: 协议代码生成失败: {str(e)}"
 
 # ============================================================================
@@ -1397,7 +1445,9 @@ def generate_protocol_code(sop_markdown: str, hardware_config: str, max_iteratio
 # ============================================================================
 
 if __name__ == '__main__':
-    print("Langchain agent setup complete with LangGraph-based iterative protocol generator.")
+    from backend.log_utils import configure_logging
+    configure_logging()
+    logger.info("Langchain agent setup complete with LangGraph-based iterative protocol generator.")
     
     # 测试新的LangGraph实现
     # 这里定义了一个简单的测试用例
@@ -1407,10 +1457,9 @@ if __name__ == '__main__':
     # 格式化测试输入并运行测试
     test_tool_input = f"{test_sop}\n---CONFIG_SEPARATOR---\n{test_hw}"
     # 测试代码生成（使用唯一的增量修复策略）
-    print("\n--- Testing code generation with diff_edit strategy ---")
+    logger.info("--- Testing code generation with diff_edit strategy ---")
     result = run_code_generation_graph(test_tool_input, max_iterations=5)
-    print("\n--- LangGraph Code Generation Test Result ---")
-    print(result)
+    logger.info("--- LangGraph Code Generation Test Result ---\n%s", result)
 
 # ############################################################################
 # # 第一阶段：定义 Agent 的核心工具 (自主代码编辑)
@@ -1467,7 +1516,7 @@ def modify_code_tool(original_code: str, user_instruction: str) -> str:
         Exception: 如果修改失败
     """
     try:
-        print(f"Debug - [modify_code_tool] 开始代码修改")
+        logger.debug("开始代码修改")
         
         # 使用简化的 Planner-Differ 架构
         planner_prompt = CODE_PLANNER_PROMPT_TEMPLATE.format(
@@ -1481,7 +1530,7 @@ def modify_code_tool(original_code: str, user_instruction: str) -> str:
         )
         
         # 步骤1：生成修改计划
-        planner_response = llm.invoke(planner_prompt).content.strip()
+        planner_response = get_llm().invoke(planner_prompt).content.strip()
         
         # 提取JSON格式的修改计划
         try:
@@ -1501,7 +1550,7 @@ def modify_code_tool(original_code: str, user_instruction: str) -> str:
             original_code=original_code
         )
         
-        diff_response = code_gen_llm.invoke(differ_prompt).content.strip()
+        diff_response = get_code_gen_llm().invoke(differ_prompt).content.strip()
         
         # 步骤3：应用 diff (增加重试逻辑)
         diff_content = _extract_diff_content(diff_response)
@@ -1509,7 +1558,7 @@ def modify_code_tool(original_code: str, user_instruction: str) -> str:
         try:
             modified_code = apply_diff(original_code, diff_content)
         except ValueError as e:
-            print(f"Warning - [modify_code_tool] Diff应用失败，尝试自动修复: {e}")
+            logger.warning("Diff应用失败，尝试自动修复: %s", e)
             
             # 尝试修复 diff
             fixer_prompt = CODE_DIFFER_FIX_PROMPT_TEMPLATE.format(
@@ -1519,7 +1568,7 @@ def modify_code_tool(original_code: str, user_instruction: str) -> str:
                 error_message=str(e)
             )
             
-            fixed_diff_response = code_gen_llm.invoke(fixer_prompt).content.strip()
+            fixed_diff_response = get_code_gen_llm().invoke(fixer_prompt).content.strip()
             fixed_diff_content = _extract_diff_content(fixed_diff_response)
             
             # 再次尝试应用修复后的 diff
@@ -1530,11 +1579,11 @@ def modify_code_tool(original_code: str, user_instruction: str) -> str:
         if not syntax_valid:
             raise Exception(f"生成的代码语法错误: {syntax_error}")
         
-        print(f"Debug - [modify_code_tool] 代码修改成功")
+        logger.debug("代码修改成功")
         return modified_code
         
     except Exception as e:
-        print(f"Error - [modify_code_tool] 代码修改失败: {e}")
+        logger.error("代码修改失败: %s", e)
         raise Exception(f"代码修改失败: {str(e)}")
 
 
@@ -1552,7 +1601,7 @@ def simulate_protocol_tool(code_to_simulate: str) -> str:
         模拟结果的字符串描述
     """
     try:
-        print(f"Debug - [simulate_protocol_tool] 开始协议模拟")
+        logger.debug("开始协议模拟")
         
         # 运行 Opentrons 模拟器
         simulation_result = run_opentrons_simulation(code_to_simulate, return_structured=True)
@@ -1571,11 +1620,11 @@ def simulate_protocol_tool(code_to_simulate: str) -> str:
             if recommendations:
                 result_msg += f"\n\n建议:\n" + "\n".join(f"- {rec}" for rec in recommendations)
         
-        print(f"Debug - [simulate_protocol_tool] 模拟完成")
+        logger.debug("模拟完成")
         return result_msg
         
     except Exception as e:
-        print(f"Error - [simulate_protocol_tool] 模拟失败: {e}")
+        logger.error("模拟失败: %s", e)
         return f"❌ 模拟过程中发生错误: {str(e)}"
 
 
@@ -1610,7 +1659,7 @@ def agent_node(state: CodeAgentState):
     Returns:
         包含 LLM 响应消息的状态更新
     """
-    print("Debug - [agent_node] Agent is thinking...")
+    logger.debug("Agent is thinking...")
     
     # 为 Agent 添加系统提示
     system_message = HumanMessage(content="""You are an expert Opentrons protocol programming assistant. Your primary goal is to help users modify and validate their protocols. You have two powerful tools at your disposal:
@@ -1634,12 +1683,12 @@ Always proceed one step at a time. Do not chain multiple tool calls in a single
     
     # 将两个工具绑定到 LLM
     tools = [modify_code_tool, simulate_protocol_tool]
-    llm_with_tools = llm.bind_tools(tools)
+    llm_with_tools = get_llm().bind_tools(tools)
     
     # 调用 LLM，让它决定下一步行动
     response = llm_with_tools.invoke(messages)
     
-    print(f"Debug - [agent_node] LLM 响应类型: {'工具调用' if response.tool_calls else '直接回复'}")
+    logger.debug("LLM 响应类型: %s", '工具调用' if response.tool_calls else '直接回复')
     
     # 返回包含 LLM 响应的状态更新
     return {"messages": [response]}
@@ -1658,14 +1707,14 @@ def tool_node(state: CodeAgentState):
     Returns:
         包含工具执行结果的状态更新
     """
-    print("Debug - [tool_node] 开始执行工具...")
+    logger.debug("开始执行工具...")
     
     # 获取最后一条消息（应该是包含工具调用的 AI 消息）
     last_message = state["messages"][-1]
     tool_calls = last_message.tool_calls if hasattr(last_message, 'tool_calls') else []
     
     if not tool_calls:
-        print("Warning - [tool_node] 没有工具调用，返回空结果")
+        logger.warning("没有工具调用，返回空结果")
         return {"messages": []}
     
     # 创建工具映射
@@ -1683,7 +1732,7 @@ def tool_node(state: CodeAgentState):
         tool_args = tool_call["args"]
         tool_call_id = tool_call["id"]
         
-        print(f"Debug - [tool_node] 执行工具: {tool_name}")
+        logger.debug("执行工具: %s", tool_name)
         
         try:
             if tool_name == "modify_code_tool":
@@ -1719,7 +1768,7 @@ def tool_node(state: CodeAgentState):
                     )
                 )
         except Exception as e:
-            print(f"Error - [tool_node] 工具执行失败 {tool_name}: {e}")
+            logger.error("工具执行失败 %s: %s", tool_name, e)
             tool_messages.append(
                 ToolMessage(
                     content=f"工具执行失败: {str(e)}",
@@ -1728,7 +1777,7 @@ def tool_node(state: CodeAgentState):
                 )
             )
     
-    print(f"Debug - [tool_node] 执行了 {len(tool_messages)} 个工具")
+    logger.debug("执行了 %s 个工具", len(tool_messages))
     
     # 返回工具消息和更新的代码
     return {
@@ -1737,7 +1786,7 @@ def tool_node(state: CodeAgentState):
     }
 
 
-def should_continue(state: CodeAgentState) -> Literal["tools", "__end__"]:
+def should_continue_agent(state: CodeAgentState) -> Literal["tools", "__end__"]:
     """
     条件路由函数：决定 Agent 的下一步行动
     
@@ -1753,10 +1802,10 @@ def should_continue(state: CodeAgentState) -> Literal["tools", "__end__"]:
     last_message = state["messages"][-1]
     
     if hasattr(last_message, 'tool_calls') and last_message.tool_calls:
-        print("Debug - [should_continue] 路由到工具执行")
+        logger.debug("路由到工具执行")
         return "tools"
     else:
-        print("Debug - [should_continue] 路由到结束")
+        logger.debug("路由到结束")
         return "__end__"
 
 
@@ -1768,14 +1817,14 @@ def build_code_agent_graph():
     Returns:
         编译后的图对象，可以直接调用
     """
-    print("Debug - [build_code_agent_graph] 开始构建 Agent 图")
+    logger.debug("开始构建 Agent 图")
     
     # 创建状态图
     workflow = StateGraph(CodeAgentState)
     
     # 添加节点
-    workflow.add_node("agent", agent_node)      # Agent 思考节点
-    workflow.add_node("tools", tool_node)       # 工具执行节点
+    workflow.add_node("agent", instrument_node("code_agent", "agent", agent_node))  # Agent 思考节点
+    workflow.add_node("tools", instrument_node("code_agent", "tools", tool_node))  # 工具执行节点
     
     # 定义图的流程
     workflow.add_edge(START, "agent")           # 从开始节点到 Agent
@@ -1783,7 +1832,7 @@ def build_code_agent_graph():
     # 添加条件边：Agent 决定是调用工具还是结束
     workflow.add_conditional_edges(
         "agent",
-        should_continue,
+        should_continue_agent,
         {
             "tools": "tools",      # 如果需要工具，去工具节点
             "__end__": END         # 如果完成，结束流程
@@ -1795,13 +1844,54 @@ def build_code_agent_graph():
     
     # 编译图
     graph = workflow.compile()
-    print("Debug - [build_code_agent_graph] Agent 图构建完成")
+    logger.debug("Agent 图构建完成")
     
     return graph
 
 
-# 初始化全局的代码编辑 Agent
-code_agent_graph = build_code_agent_graph()
+# 全局的代码编辑 Agent，首次使用时构建
+@lru_cache(maxsize=None)
+def get_code_agent_graph():
+    """首次使用时构建代码编辑 Agent 图并缓存"""
+    return build_code_agent_graph()
+
+
+def prewarm():
+    """
+    预热：提前构建所有LLM客户端、链和图
+    
+    由 api_server 的 startup 钩子在设置 LABSCRIPT_PREWARM=1 时调用，
+    避免首个请求承担构建开销。
+    """
+    get_llm()
+    get_code_gen_llm()
+    get_review_llm()
+    get_intent_llm()
+    for chain_name in _CHAIN_SPECS:
+        get_chain(chain_name)
+    get_code_generation_graph()
+    get_code_agent_graph()
+
+
+# 兼容旧的模块级属性名 (例如 from backend.langchain_agent import code_generation_graph)
+_LAZY_ATTRIBUTES = {
+    "llm": get_llm,
+    "code_gen_llm": get_code_gen_llm,
+    "review_llm": get_review_llm,
+    "sop_generation_chain": lambda: get_chain("sop_generation"),
+    "code_gen_chain_flex": lambda: get_chain("code_gen_flex"),
+    "code_gen_chain_ot2": lambda: get_chain("code_gen_ot2"),
+    "code_correction_chain_flex": lambda: get_chain("code_correction_flex"),
+    "code_correction_chain_ot2": lambda: get_chain("code_correction_ot2"),
+    "code_generation_graph": get_code_generation_graph,
+    "code_agent_graph": get_code_agent_graph,
+}
+
+def __getattr__(name: str):
+    factory = _LAZY_ATTRIBUTES.get(name)
+    if factory is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return factory()
 
 
 # ############################################################################
@@ -1821,7 +1911,7 @@ def _edit_sop_with_diff(original_sop: str, user_instruction: str, hardware_conte
         str: 修改后的新SOP。
     """
     try:
-        print(f"Debug - [edit_sop_with_diff] 开始为SOP生成diff")
+        logger.debug("开始为SOP生成diff")
         
         # 导入我们需要的模板和工具
         from backend.prompts import SOP_EDIT_DIFF_PROMPT_TEMPLATE
@@ -1833,7 +1923,7 @@ def _edit_sop_with_diff(original_sop: str, user_instruction: str, hardware_conte
             input_variables=["original_sop", "user_instruction", "hardware_context"],
             template=SOP_EDIT_DIFF_PROMPT_TEMPLATE
         )
-        chain = LLMChain(llm=llm, prompt=prompt)
+        chain = LLMChain(llm=get_llm(), prompt=prompt)
         
         # 2. 调用大模型生成diff
         diff_output = chain.run({
@@ -1842,29 +1932,26 @@ def _edit_sop_with_diff(original_sop: str, user_instruction: str, hardware_conte
             "hardware_context": hardware_context
         })
         
-        print(f"Debug - [edit_sop_with_diff] LLM生成的SOP Diff内容:\n---\n{diff_output}\n---")
+        logger.debug("LLM生成的SOP Diff内容:\n---\n%s\n---", diff_output, extra=SAMPLED)
         
         if not diff_output or not "------- SEARCH" in diff_output:
-            print("Warning - LLM did not return a valid diff. Returning original SOP.")
+            logger.warning("LLM did not return a valid diff. Returning original SOP.")
             raise ValueError("AI did not produce a valid modification for the SOP. Please try rephrasing your request.")
 
         # 3. 应用diff
-        print(f"Debug - [edit_sop_with_diff] 应用diff前的SOP长度: {len(original_sop)}")
+        logger.debug("应用diff前的SOP长度: %s", len(original_sop))
         new_sop = apply_diff(original_sop, diff_output)
-        print(f"Debug - [edit_sop_with_diff] 应用diff后的SOP长度: {len(new_sop)}")
+        logger.debug("应用diff后的SOP长度: %s", len(new_sop))
         
-        print(f"Debug - [edit_sop_with_diff] SOP Diff应用成功，SOP已修改。")
+        logger.debug("SOP Diff应用成功，SOP已修改。")
         
         return new_sop
 
     except ValueError as ve:
-        print(f"Error - [edit_sop_with_diff] 应用SOP diff时出错: {ve}")
+        logger.error("应用SOP diff时出错: %s", ve)
         raise ve # 重新抛出，让调用者知道是diff应用问题
     except Exception as e:
-        print(f"Error - [edit_sop_with_diff] 编辑SOP时发生未知错误: {e}")
-        import traceback
-        error_traceback = traceback.format_exc()
-        print(f"Debug - [edit_sop_with_diff] 完整错误堆栈:\n{error_traceback}")
+        logger.exception("编辑SOP时发生未知错误: %s", e)
         raise RuntimeError(f"An unexpected error occurred while editing the SOP: {e}")
 
 
@@ -1874,9 +1961,9 @@ def converse_about_sop(original_sop: str, user_instruction: str, hardware_contex
     
     返回一个字典，包含类型和内容。
     """
-    print(f"Debug - [converse_about_sop] Classifying user instruction: '{user_instruction}'")
+    logger.debug("Classifying user instruction: '%s'", user_instruction, extra=SAMPLED)
     intent = _classify_sop_intent(user_instruction)
-    print(f"Debug - [converse_about_sop] Classified intent as: '{intent}'")
+    logger.debug("Classified intent as: '%s'", intent)
     
     if intent == "edit":
         try:
@@ -1885,12 +1972,12 @@ def converse_about_sop(original_sop: str, user_instruction: str, hardware_contex
             return {"type": "edit", "content": modified_sop}
         except ValueError as e:
             # 专门处理diff应用失败的情况
-            print(f"Warning - [converse_about_sop] Diff application failed: {e}")
+            logger.warning("Diff application failed: %s", e)
             error_message = f"I tried to edit the SOP, but couldn't apply the changes. This can happen if the instruction is ambiguous. Please try rephrasing. (Error: {str(e)})"
             return {"type": "chat", "content": error_message}
         except Exception as e:
             # 处理其他所有未知错误
-            print(f"Error - [converse_about_sop] An unexpected error occurred: {e}")
+            logger.error("An unexpected error occurred: %s", e)
             error_message = f"I encountered an unexpected server error while trying to edit the SOP. Please try again. (Details: {str(e)})"
             return {"type": "chat", "content": error_message}
     else: # intent == "chat"
@@ -1911,14 +1998,7 @@ def _classify_sop_intent(user_instruction: str) -> str:
         from langchain.chains import LLMChain
 
         # Use specialized, faster model for intent classification
-        intent_llm = ChatOpenAI(
-            model_name=DEEPSEEK_INTENT_MODEL,
-            openai_api_base=DEEPSEEK_BASE_URL,
-            openai_api_key=DEEPSEEK_API_KEY,
-            temperature=0.0,
-            max_retries=1,
-            request_timeout=20
-        )
+        intent_llm = get_intent_llm()
 
         prompt = PromptTemplate(
             input_variables=["user_instruction"],
@@ -1952,14 +2032,14 @@ def _classify_sop_intent(user_instruction: str) -> str:
             
         return intent
     except Exception as e:
-        print(f"Error during intent classification, defaulting to 'chat': {e}")
+        logger.warning("Error during intent classification, defaulting to 'chat': %s", e)
         # 降级：如果JSON解析和提取都失败，使用关键词进行判断
         edit_keywords = [
             'change', 'add', 'remove', 'replace', 'modify', 'update', 'use', 'delete', 'make', 
             '改', '增加', '添加', '删除', '替换', '修改', '更新', '使用', '设为', '换成', '变为'
         ]
         if any(keyword in user_instruction.lower() for keyword in edit_keywords):
-            print("Info: JSON parsing failed, but keyword matching classified as 'edit'.")
+            logger.info("JSON parsing failed, but keyword matching classified as 'edit'.")
             return "edit"
         return "chat"
 
@@ -1976,14 +2056,7 @@ def _classify_code_intent(user_instruction: str) -> str:
         from langchain.chains import LLMChain
 
         # Use specialized, faster model for intent classification
-        intent_llm = ChatOpenAI(
-            model_name=DEEPSEEK_INTENT_MODEL,
-            openai_api_base=DEEPSEEK_BASE_URL,
-            openai_api_key=DEEPSEEK_API_KEY,
-            temperature=0.0,
-            max_retries=1,
-            request_timeout=20
-        )
+        intent_llm = get_intent_llm()
 
         prompt = PromptTemplate(
             input_variables=["user_instruction"],
@@ -2010,14 +2083,14 @@ def _classify_code_intent(user_instruction: str) -> str:
         
         return intent if intent in ["edit", "chat"] else "chat"
     except Exception as e:
-        print(f"Error during code intent classification, defaulting to 'chat': {e}")
+        logger.warning("Error during code intent classification, defaulting to 'chat': %s", e)
         # Fallback to keyword matching
         edit_keywords = [
             'change', 'add', 'remove', 'replace', 'modify', 'update', 'use', 'delete', 'make', 
             '改', '增加', '添加', '删除', '替换', '修改', '更新', '使用', '设为', '换成', '变为'
         ]
         if any(keyword in user_instruction.lower() for keyword in edit_keywords):
-            print("Info: JSON parsing failed, but keyword matching classified as 'edit' for code.")
+            logger.info("JSON parsing failed, but keyword matching classified as 'edit' for code.")
             return "edit"
         return "chat"
 
@@ -2034,7 +2107,7 @@ def _chat_about_code(original_code: str, user_instruction: str) -> str:
             input_variables=["original_code", "user_instruction"],
             template=ENG_GENERAL_CODE_CHAT_PROMPT_TEMPLATE
         )
-        chain = LLMChain(llm=llm, prompt=prompt)
+        chain = LLMChain(llm=get_llm(), prompt=prompt)
         
         response = chain.run({
             "original_code": original_code,
@@ -2042,7 +2115,7 @@ def _chat_about_code(original_code: str, user_instruction: str) -> str:
         })
         return response
     except Exception as e:
-        print(f"Error during general code chat: {e}")
+        logger.exception("Error during general code chat: %s", e)
         return "Sorry, I encountered an error while trying to respond."
 
 def converse_about_code(original_code: str, user_instruction: str) -> Dict[str, str]:
@@ -2059,7 +2132,7 @@ def converse_about_code(original_code: str, user_instruction: str) -> Dict[str,
     Returns:
         包含类型和内容的字典
     """
-    print(f"Debug - [converse_about_code] Processing user instruction with autonomous agent")
+    logger.debug("Processing user instruction with autonomous agent")
     
     try:
         # Initialize Agent state
@@ -2080,14 +2153,14 @@ Please analyze the user's request. If it requires modifying the code, use the `m
         )
         
         # Invoke the Agent graph
-        print("Debug - [converse_about_code] Starting Agent execution")
-        final_state = code_agent_graph.invoke(initial_state)
+        logger.debug("Starting Agent execution")
+        final_state = get_code_agent_graph().invoke(initial_state)
         
         # 分析 Agent 的最终响应
         last_message = final_state["messages"][-1]
         final_code = final_state.get("current_code", original_code)
         
-        print(f"Debug - [converse_about_code] Agent 执行完成")
+        logger.debug("Agent 执行完成")
         
         # 判断是否有代码修改
         if final_code != original_code:
@@ -2109,9 +2182,7 @@ Please analyze the user's request. If it requires modifying the code, use the `m
             }
             
     except Exception as e:
-        print(f"Error - [converse_about_code] Agent execution failed: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Agent execution failed: %s", e)
         
         # Fallback to a simple reply
         error_message = f"I'm sorry, I encountered a problem while processing your request. Error details: {str(e)}\n\nPlease try rephrasing your request or ensure the code is formatted correctly."
@@ -2152,7 +2223,7 @@ async def converse_about_code_stream(original_code: str, user_instruction: str):
     Handles conversational code edits via a real-time stream.
     Yields events for agent thoughts, tool calls, and final results.
     """
-    print(f"Debug - [converse_about_code_stream] Starting stream for: {user_instruction}")
+    logger.debug("Starting stream for: %s", user_instruction, extra=SAMPLED)
     
     # Initialize Agent state
     initial_state = CodeAgentState(
@@ -2172,9 +2243,10 @@ Please analyze the user's request. If it requires modifying the code, use the `m
     )
     
     current_state = initial_state
+    timings = start_run()
     
     try:
-        async for chunk in code_agent_graph.astream(initial_state):
+        async for chunk in get_code_agent_graph().astream(initial_state):
             for node_name, node_output in chunk.items():
                 current_state.update(node_output)
                 
@@ -2214,11 +2286,12 @@ Please analyze the user's request. If it requires modifying the code, use the `m
             "event_type": "final_result",
             "type": result_type,
             "content": final_content,
-            "message": "Agent has finished the task."
+            "message": "Agent has finished the task.",
+            "timings": timings.to_dict()
         }
 
     except Exception as e:
-        print(f"Error - [converse_about_code_stream] Stream failed: {e}")
+        logger.exception("Code conversation stream failed: %s", e)
         yield {
             "event_type": "error",
             "message": str(e)
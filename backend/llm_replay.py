@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+"""
+LLM Record/Replay Stand-in
+=========================
+
+A local OpenAI-compatible server that answers ``/v1/chat/completions`` from
+recorded completions, so that ``run_code_generation_graph`` and the PyLabRobot
+agent loops can run offline, deterministically and for free. It is meant for
+benchmarks: graph, simulator and API overhead can be measured without the
+latency noise of the remote models.
+
+- Completions are stored in a JSONL cassette, one line per prompt, keyed by
+  the SHA-256 of the canonical JSON of the request messages and tools
+  (``prompt_key``). The whole assistant message is kept: its content, its
+  ``tool_calls`` and the ``finish_reason``, so that tool-calling agents
+  (``bind_tools``) replay their tool loops.
+- ``replay`` answers from the cassette only; ``record`` forwards every request
+  to the real endpoint of its model (``LLM_UPSTREAMS`` in ``config.py``) and
+  stores the answer; ``auto`` replays hits and records misses.
+- Replayed answers wait for a synthetic latency: a fixed time to first token
+  plus the completion tokens at a fixed token rate. Streaming requests receive
+  the answer in word chunks at the same rate, followed by one
+  ``delta.tool_calls`` chunk per tool call.
+- Misses in ``replay`` mode return ``miss_response`` when one is configured,
+  otherwise an OpenAI-style 404 error.
+
+Usage::
+
+    python -m backend.llm_replay --cassette benchmarks/cassettes/llm.jsonl --mode record
+    python -m backend.llm_replay --cassette benchmarks/cassettes/llm.jsonl --ttft-ms 300 --tokens-per-second 60
+
+then start the backend with ``LABSCRIPT_LLM_BASE_URL=http://127.0.0.1:8765/v1``
+(or set ``base_url`` / ``DEEPSEEK_BASE_URL`` in ``config.py`` to that URL).
+``ReplayServer`` runs the same server in a background thread for in-process
+benchmarks.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from backend.log_utils import configure_logging
+
+logger = logging.getLogger(__name__)
+
+MODES = ("replay", "record", "auto")
+DEFAULT_PORT = 8765
+
+_CHUNK_PATTERN = re.compile(r"\s*\S+")
+
+
+def _message_content(content: Any) -> Any:
+    """Text of a message; multimodal parts are kept as-is (minus image payloads)."""
+    if isinstance(content, list):
+        return [part.get("text", part.get("type")) if isinstance(part, dict) else part for part in content]
+    return content
+
+
+def _canonical_message(message: Dict[str, Any]) -> List[Any]:
+    canonical = [message.get("role"), _message_content(message.get("content"))]
+    # Tool fields are only added when present, so keys of plain chat prompts stay stable
+    if message.get("tool_calls") or message.get("tool_call_id"):
+        canonical.append([[call.get("id"), (call.get("function") or {}).get("name"),
+                           (call.get("function") or {}).get("arguments")]
+                          for call in message.get("tool_calls") or []])
+        canonical.append(message.get("tool_call_id"))
+    return canonical
+
+
+def prompt_key(messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> str:
+    """
+    SHA-256 of the canonical JSON of a chat request: the role and content of
+    its messages, their tool calls / tool call IDs and the offered ``tools``.
+    """
+    canonical: Any = [_canonical_message(message) for message in messages]
+    if tools:
+        canonical = {"messages": canonical, "tools": tools}
+    payload = json.dumps(canonical, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def request_key(request: Dict[str, Any]) -> str:
+    """``prompt_key`` of an OpenAI chat completion request body."""
+    return prompt_key(request.get("messages", []), request.get("tools"))
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (about four characters per token). Also used by
+    ``backend.node_timing`` when the model reports no usage, so replayed and
+    timed runs count tokens the same way.
+    """
+    return (len(text) + 3) // 4
+
+
+@dataclass
+class SyntheticLatency:
+    """Time to first token plus a fixed token rate; zero values disable the delay."""
+    ttft_ms: float = 0.0
+    tokens_per_second: float = 0.0
+
+    def first_token(self) -> float:
+        return self.ttft_ms / 1000.0
+
+    def tokens(self, count: int) -> float:
+        return count / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+
+class Cassette:
+    """Recorded completions in a JSONL file, keyed by ``prompt_key``."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path) if path else None
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if self.path and self.path.exists():
+            with self.path.open(encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry["key"]] = entry
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(key)
+
+    def put(self, key: str, model: str, content: str, usage: Optional[Dict[str, int]] = None,
+            tool_calls: Optional[List[Dict[str, Any]]] = None, finish_reason: Optional[str] = None) -> Dict[str, Any]:
+        """Stores a completion in memory and appends it to the cassette file."""
+        entry = {"key": key, "model": model, "content": content, "usage": usage or {}}
+        if tool_calls:
+            entry["tool_calls"] = tool_calls
+        if finish_reason:
+            entry["finish_reason"] = finish_reason
+        with self._lock:
+            self.entries[key] = entry
+            if self.path:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with self.path.open("a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return entry
+
+
+class ReplayBackend:
+    """Resolves chat requests against the cassette and, when recording, the real endpoints."""
+
+    def __init__(self, cassette: Cassette, mode: str = "replay",
+                 latency: Optional[SyntheticLatency] = None,
+                 upstreams: Optional[Dict[str, Tuple[str, str]]] = None,
+                 miss_response: Optional[str] = None, upstream_timeout: float = 180.0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode '{mode}', expected one of {MODES}")
+        self.cassette = cassette
+        self.mode = mode
+        self.latency = latency or SyntheticLatency()
+        self._upstreams = upstreams
+        self.miss_response = miss_response
+        self.upstream_timeout = upstream_timeout
+        self.stats = {"requests": 0, "hits": 0, "misses": 0, "recorded": 0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def upstreams(self) -> Dict[str, Tuple[str, str]]:
+        """Model -> (base URL, API key); read from ``config.py`` on first use."""
+        if self._upstreams is None:
+            self._upstreams = default_upstreams()
+        return self._upstreams
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _forward(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        model = request.get("model", "")
+        if model not in self.upstreams:
+            raise LookupError(f"No upstream configured for model '{model}'")
+        url, key = self.upstreams[model]
+        body = dict(request, stream=False)
+        body.pop("stream_options", None)
+        http_request = urllib.request.Request(
+            url.rstrip("/") + "/chat/completions",
+            data=json.dumps(body).encode("utf-8"),
+            headers={"Content-Type": "application/json", "Authorization": f"Bearer {key}"},
+        )
+        with urllib.request.urlopen(http_request, timeout=self.upstream_timeout) as response:
+            return json.loads(response.read())
+
+    def resolve(self, request: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """
+        Returns ``(entry, replayed)`` for a chat request, or ``(None, False)`` on a miss.
+
+        Only replayed entries are delayed by the synthetic latency; recorded ones
+        already paid the real one.
+        """
+        self._count("requests")
+        key = request_key(request)
+        model = request.get("model", "")
+        entry = None if self.mode == "record" else self.cassette.get(key)
+        if entry is not None:
+            self._count("hits")
+            return entry, True
+        if self.mode == "replay":
+            self._count("misses")
+            if self.miss_response is None:
+                return None, False
+            return {"key": key, "model": model, "content": self.miss_response, "usage": {}}, True
+        completion = self._forward(request)
+        self._count("recorded")
+        choice = completion["choices"][0]
+        message = choice["message"]
+        entry = self.cassette.put(key, model, message.get("content") or "", completion.get("usage"),
+                                  message.get("tool_calls"), choice.get("finish_reason"))
+        return entry, False
+
+
+def default_upstreams() -> Dict[str, Tuple[str, str]]:
+    """Real model endpoints from ``config.py``."""
+    from backend.config import LLM_UPSTREAMS
+    return dict(LLM_UPSTREAMS)
+
+
+def _completion_text(entry: Dict[str, Any]) -> str:
+    """The generated text of an entry: its content and tool call arguments."""
+    arguments = [(call.get("function") or {}).get("arguments") or "" for call in entry.get("tool_calls") or []]
+    return entry["content"] + "".join(arguments)
+
+
+def _finish_reason(entry: Dict[str, Any]) -> str:
+    return entry.get("finish_reason") or ("tool_calls" if entry.get("tool_calls") else "stop")
+
+
+def _usage(entry: Dict[str, Any], messages: List[Dict[str, Any]]) -> Dict[str, int]:
+    usage = entry.get("usage") or {}
+    prompt_tokens = usage.get("prompt_tokens") or estimate_tokens(json.dumps(messages, ensure_ascii=False))
+    completion_tokens = usage.get("completion_tokens") or estimate_tokens(_completion_text(entry))
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def completion_body(entry: Dict[str, Any], request: Dict[str, Any]) -> Dict[str, Any]:
+    """OpenAI ``chat.completion`` object for a cassette entry."""
+    message: Dict[str, Any] = {"role": "assistant", "content": entry["content"]}
+    if entry.get("tool_calls"):
+        message["tool_calls"] = entry["tool_calls"]
+        message["content"] = entry["content"] or None
+    return {
+        "id": "chatcmpl-" + entry["key"][:24],
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model") or entry.get("model", ""),
+        "choices": [{
+            "index": 0,
+            "message": message,
+            "finish_reason": _finish_reason(entry),
+        }],
+        "usage": _usage(entry, request.get("messages", [])),
+    }
+
+
+def completion_chunks(entry: Dict[str, Any], request: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """OpenAI ``chat.completion.chunk`` objects, one per word of the answer and one per tool call."""
+    base = {
+        "id": "chatcmpl-" + entry["key"][:24],
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": request.get("model") or entry.get("model", ""),
+    }
+    yield dict(base, choices=[{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+    if entry["content"] or not entry.get("tool_calls"):
+        for piece in _CHUNK_PATTERN.findall(entry["content"]) or [entry["content"]]:
+            yield dict(base, choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+    for index, call in enumerate(entry.get("tool_calls") or []):
+        delta = {"tool_calls": [dict(call, index=index)]}
+        yield dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": None}])
+    final = dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": _finish_reason(entry)}])
+    if (request.get("stream_options") or {}).get("include_usage"):
+        final["usage"] = _usage(entry, request.get("messages", []))
+    yield final
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    backend: ReplayBackend = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str, error_type: str) -> None:
+        self._send_json(status, {"error": {"message": message, "type": error_type, "code": status}})
+
+    def do_GET(self) -> None:
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path.endswith("/models"):
+            models = sorted(set(self.backend.upstreams) | {e.get("model", "") for e in self.backend.cassette.entries.values()})
+            self._send_json(200, {"object": "list", "data": [
+                {"id": name, "object": "model", "owned_by": "llm-replay"} for name in models if name
+            ]})
+        elif path.endswith("/stats"):
+            self._send_json(200, dict(self.backend.stats, mode=self.backend.mode, entries=len(self.backend.cassette)))
+        else:
+            self._send_error(404, f"Unknown path {self.path}", "invalid_request_error")
+
+    def do_POST(self) -> None:
+        if not self.path.split("?", 1)[0].rstrip("/").endswith("/chat/completions"):
+            self._send_error(404, f"Unknown path {self.path}", "invalid_request_error")
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except json.JSONDecodeError as e:
+            self._send_error(400, f"Invalid JSON body: {e}", "invalid_request_error")
+            return
+        try:
+            entry, replayed = self.backend.resolve(request)
+        except (LookupError, urllib.error.URLError, OSError) as e:
+            self._send_error(502, f"Recording failed: {e}", "upstream_error")
+            return
+        if entry is None:
+            self._send_error(404, "No recorded completion for this prompt "
+                                  f"(key {request_key(request)})", "replay_miss")
+            return
+
+        latency = self.backend.latency if replayed else SyntheticLatency()
+        if not request.get("stream"):
+            time.sleep(latency.first_token() + latency.tokens(_usage(entry, [])["completion_tokens"]))
+            self._send_json(200, completion_body(entry, request))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        time.sleep(latency.first_token())
+        for chunk in completion_chunks(entry, request):
+            delta = chunk["choices"][0]["delta"]
+            text = delta.get("content") or "".join((call.get("function") or {}).get("arguments") or ""
+                                                   for call in delta.get("tool_calls") or [])
+            if text:
+                time.sleep(latency.tokens(estimate_tokens(text)))
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class ReplayServer:
+    """The stand-in server on a background thread; usable as a context manager."""
+
+    def __init__(self, backend: ReplayBackend, host: str = "127.0.0.1", port: int = 0):
+        handler = type("ReplayHandler", (_ReplayHandler,), {"backend": backend})
+        self.backend = backend
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Base URL to use as ``base_url`` / ``DEEPSEEK_BASE_URL``."""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "ReplayServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="llm-replay", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self) -> "ReplayServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="OpenAI-compatible record/replay stand-in for the LLM endpoints.")
+    parser.add_argument("--cassette", required=True, help="JSONL file of recorded completions")
+    parser.add_argument("--mode", choices=MODES, default="replay")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--ttft-ms", type=float, default=0.0, help="synthetic time to first token of replayed answers")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0,
+                        help="synthetic token rate of replayed answers (0 = instant)")
+    parser.add_argument("--miss-response", help="answer for prompts missing from the cassette in replay mode")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    backend = ReplayBackend(
+        Cassette(args.cassette), mode=args.mode,
+        latency=SyntheticLatency(args.ttft_ms, args.tokens_per_second),
+        upstreams=None if args.mode != "replay" else {},
+        miss_response=args.miss_response,
+    )
+    server = ReplayServer(backend, args.host, args.port)
+    logger.info("LLM %s stand-in on %s (%d recorded completions)", args.mode, server.url, len(backend.cassette))
+    logger.info("Start the backend with LABSCRIPT_LLM_BASE_URL=%s", server.url)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        logger.info("Stats: %s", backend.stats)
+
+
+if __name__ == "__main__":
+    main()
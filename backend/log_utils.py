@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Logging Utility
+===============
+
+Structured, non-blocking logging for the backend.
+
+- Modules log through ``logging.getLogger(__name__)``; nothing is written on
+  the calling thread. ``configure_logging()`` installs a ``QueueHandler`` on
+  the ``backend`` logger whose bounded queue is drained by a ``QueueListener``
+  thread that formats and writes the records. When the queue is full, records
+  are dropped (and counted in ``labscript_log_records_dropped_total``) rather
+  than blocking the event loop.
+- Every record carries the correlation ID of the current request
+  (``request_id_var``), set by ``RequestIdMiddleware`` from the
+  ``X-Request-ID`` header or generated, and echoed in the response. The ID
+  follows the request into threads started with ``asyncio.to_thread`` and
+  into the LangGraph nodes.
+- Verbose debug payloads (full hardware configurations, generated code,
+  simulator output) are logged with ``extra=SAMPLED``. They are only kept for
+  a fraction ``LABSCRIPT_LOG_DEBUG_SAMPLE_RATE`` of requests, chosen by request
+  ID so that a sampled request keeps all of its payloads.
+- Records are written as ``key=value`` text or, with
+  ``LABSCRIPT_LOG_FORMAT=json``, as one JSON object per line. Keyword
+  arguments passed in ``extra`` become fields of the record.
+
+Environment variables:
+    LABSCRIPT_LOG_LEVEL: Level of the ``backend`` logger (default ``INFO``).
+    LABSCRIPT_LOG_FORMAT: ``text`` (default) or ``json``.
+    LABSCRIPT_LOG_DEBUG_SAMPLE_RATE: Share of requests whose sampled debug
+        payloads are kept (default ``0.1``).
+    LABSCRIPT_LOG_QUEUE_SIZE: Records buffered before dropping (default 10000).
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import uuid
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.metrics import counter
+
+ROOT_LOGGER = "backend"
+REQUEST_ID_HEADER = "x-request-id"
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_DEBUG_SAMPLE_RATE = 0.1
+
+# ``extra`` marking a verbose debug payload that is subject to sampling
+SAMPLED = {"sampled": True}
+
+# Attributes of every LogRecord; anything else was passed in ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+LOG_RECORDS_DROPPED = counter("labscript_log_records_dropped_total", "Log records dropped because the queue was full")
+LOG_RECORDS_DROPPED.labels()  # expose a 0 sample before the first drop
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def _record_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    return {key: value for key, value in vars(record).items()
+            if key not in _RECORD_ATTRIBUTES and key != "sampled"}
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the current request ID."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """
+    Keeps records logged with ``extra=SAMPLED`` for a share ``rate`` of the
+    requests; other records always pass.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False) or self.rate >= 1.0:
+            return True
+        if self.rate <= 0.0:
+            return False
+        request_id = getattr(record, "request_id", None)
+        if request_id is None:
+            return random.random() < self.rate
+        return (zlib.crc32(request_id.encode()) % 10000) < self.rate * 10000
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """``QueueHandler`` that drops records instead of blocking when the queue is full."""
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+class TextFormatter(logging.Formatter):
+    """``time level logger [request_id] message key=value ...``"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = (f"{self.formatTime(record, '%Y-%m-%d %H:%M:%S')}.{int(record.msecs):03d} "
+                f"{record.levelname:<7} {record.name} [{getattr(record, 'request_id', None) or '-'}] "
+                f"{record.getMessage()}")
+        fields = _record_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value!r}" for key, value in fields.items())
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", None),
+            "message": record.getMessage(),
+        }
+        entry.update(_record_fields(record))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_configure_lock = threading.Lock()
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None,
+                      debug_sample_rate: Optional[float] = None, stream=None) -> None:
+    """
+    Routes the ``backend`` loggers through the queue handler. Idempotent; the
+    first call wins. Arguments default to the ``LABSCRIPT_LOG_*`` variables.
+    """
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+        level = (level or os.getenv("LABSCRIPT_LOG_LEVEL", "INFO")).upper()
+        fmt = (fmt or os.getenv("LABSCRIPT_LOG_FORMAT", "text")).lower()
+        if debug_sample_rate is None:
+            debug_sample_rate = float(os.getenv("LABSCRIPT_LOG_DEBUG_SAMPLE_RATE", DEFAULT_DEBUG_SAMPLE_RATE))
+        queue_size = int(os.getenv("LABSCRIPT_LOG_QUEUE_SIZE", DEFAULT_QUEUE_SIZE))
+
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+        # Filters run on the calling thread, where the request context is available
+        handler.addFilter(RequestIdFilter())
+        handler.addFilter(DebugSamplingFilter(debug_sample_rate))
+
+        logger = logging.getLogger(ROOT_LOGGER)
+        logger.setLevel(level)
+        logger.addHandler(handler)
+        logger.propagate = False
+
+        _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Writes the queued records and stops the listener thread."""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware binding each HTTP request to a correlation ID, taken from
+    the ``X-Request-ID`` request header or generated, and echoed back in the
+    response header.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == REQUEST_ID_HEADER.encode():
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or new_request_id()
+        token = request_id_var.set(request_id)
+
+        async def send_with_request_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Request-ID"] = request_id
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
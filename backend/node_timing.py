@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Graph Node Timing
+=================
+
+Latency and token spans around the nodes of the LangGraph pipelines
+(``code_generation``, ``code_agent`` and ``pylabrobot``), so that a slow run
+can be attributed to the LLM, the simulator, diff application or the reviewer.
+
+- ``instrument_node(graph, name, node)`` wraps a (sync or async) node function
+  before it is added to the ``StateGraph``. Each call records a span with its
+  wall time and the LLM time, calls and prompt / completion tokens of the LLM
+  requests made inside it.
+- LLM usage is collected by ``LlmUsage``, a LangChain callback handler that
+  ``register_configure_hook`` attaches to every LLM run started while it is the
+  current handler, so node code does not need to pass callbacks around.
+  Token counts come from the provider's usage report and are estimated from
+  the text (about four characters per token) when there is none.
+- ``start_run()`` begins a ``RunTimings`` for the current context; spans of
+  that run add to it and ``RunTimings.to_dict()`` gives the per-node totals
+  that the streaming entry points attach to their ``final_result`` event.
+- Every span is also observed in the process-wide histograms
+  ``labscript_graph_node_seconds`` / ``labscript_graph_node_llm_seconds`` and
+  the ``labscript_graph_node_tokens_total`` counter (``backend.metrics``).
+- ``LlmRequestObserver`` is attached to every LLM run, inside a node or not;
+  it observes ``labscript_llm_request_seconds`` by model and outcome and
+  records each request as a client span (``backend.tracing``).
+- Node calls are also recorded as trace spans, with the attempt number and
+  the hash of the protocol code in the graph state.
+"""
+
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+from backend import tracing
+from backend.artifact_store import content_hash
+from backend.llm_replay import estimate_tokens
+from backend.metrics import counter, histogram
+from backend.server_metrics import LLM_REQUEST_SECONDS
+
+NODE_SECONDS = histogram("labscript_graph_node_seconds", "Wall time of LangGraph node calls", ("graph", "node"))
+NODE_LLM_SECONDS = histogram("labscript_graph_node_llm_seconds", "LLM time inside LangGraph node calls",
+                             ("graph", "node"))
+NODE_TOKENS = counter("labscript_graph_node_tokens_total", "LLM tokens used by LangGraph nodes",
+                      ("graph", "node", "kind"))
+
+
+def _response_usage(response: Any) -> Dict[str, Optional[int]]:
+    """Prompt / completion tokens reported for an ``LLMResult``, None when unreported."""
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    prompt, completion = usage.get("prompt_tokens"), usage.get("completion_tokens")
+    if prompt is None:
+        for batch in response.generations:
+            for generation in batch:
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if metadata:
+                    prompt = (prompt or 0) + metadata.get("input_tokens", 0)
+                    completion = (completion or 0) + metadata.get("output_tokens", 0)
+    return {"prompt_tokens": prompt, "completion_tokens": completion}
+
+
+class LlmUsage(BaseCallbackHandler):
+    """Accumulates LLM time, calls and token counts of the runs it is attached to."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._started: Dict[Any, tuple] = {}
+        self._lock = threading.Lock()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = (time.perf_counter(), sum(estimate_tokens(p) for p in prompts))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        prompt_tokens = sum(estimate_tokens(str(m.content)) for batch in messages for m in batch)
+        self._started[run_id] = (time.perf_counter(), prompt_tokens)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start, estimated_prompt = self._started.pop(run_id, (time.perf_counter(), 0))
+        usage = _response_usage(response)
+        completion = usage["completion_tokens"]
+        if completion is None:
+            completion = estimate_tokens("".join(g.text for batch in response.generations for g in batch))
+        with self._lock:
+            self.seconds += time.perf_counter() - start
+            self.calls += 1
+            self.prompt_tokens += usage["prompt_tokens"] if usage["prompt_tokens"] is not None else estimated_prompt
+            self.completion_tokens += completion
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        start, _ = self._started.pop(run_id, (time.perf_counter(), 0))
+        with self._lock:
+            self.seconds += time.perf_counter() - start
+            self.calls += 1
+
+
+class LlmRequestObserver(BaseCallbackHandler):
+    """
+    Observes the latency of every LLM request in ``labscript_llm_request_seconds``
+    and records it as a ``chat <model>`` span.
+    """
+
+    def __init__(self):
+        self._started: Dict[Any, tuple] = {}
+
+    def _start(self, serialized, run_id, kwargs) -> None:
+        params = kwargs.get("invocation_params") or {}
+        model = ((kwargs.get("metadata") or {}).get("ls_model_name")
+                 or params.get("model_name") or params.get("model") or "unknown")
+        trace_span = tracing.start_span(f"chat {model}", {"gen_ai.operation.name": "chat",
+                                                          "gen_ai.request.model": model},
+                                        tracing.SPAN_KIND_CLIENT)
+        self._started[run_id] = (time.perf_counter(), model, trace_span)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(serialized, run_id, kwargs)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(serialized, run_id, kwargs)
+
+    def _finish(self, run_id, outcome: str):
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return tracing.NOOP_SPAN
+        LLM_REQUEST_SECONDS.labels(started[1], outcome).observe(time.perf_counter() - started[0])
+        return started[2]
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        trace_span = self._finish(run_id, "success")
+        usage = _response_usage(response)
+        trace_span.set_attributes({"gen_ai.usage.input_tokens": usage["prompt_tokens"],
+                                   "gen_ai.usage.output_tokens": usage["completion_tokens"]})
+        trace_span.end()
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        trace_span = self._finish(run_id, "error")
+        trace_span.record_exception(error)
+        trace_span.end()
+
+
+# Always set, so LangChain attaches the observer to every LLM run
+_llm_requests: contextvars.ContextVar[Optional[LlmRequestObserver]] = contextvars.ContextVar(
+    "llm_requests", default=LlmRequestObserver())
+register_configure_hook(_llm_requests, inheritable=True)
+
+# LangChain attaches the handler held by this variable to every LLM run configured in the same context
+_node_usage: contextvars.ContextVar[Optional[LlmUsage]] = contextvars.ContextVar("node_llm_usage", default=None)
+register_configure_hook(_node_usage, inheritable=True)
+
+
+class RunTimings:
+    """Spans and per-node totals of one graph run."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Dict[str, Any]) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Run totals and per-node (``graph.node``) calls, seconds and tokens."""
+        with self._lock:
+            spans = list(self.spans)
+        nodes: Dict[str, Dict[str, Any]] = {}
+        for span in spans:
+            node = nodes.setdefault(f"{span['graph']}.{span['node']}", {
+                "calls": 0, "seconds": 0.0, "llm_seconds": 0.0, "llm_calls": 0,
+                "prompt_tokens": 0, "completion_tokens": 0, "errors": 0,
+            })
+            node["calls"] += 1
+            node["errors"] += span["error"] is not None
+            for key in ("seconds", "llm_seconds", "llm_calls", "prompt_tokens", "completion_tokens"):
+                node[key] += span[key]
+        for node in nodes.values():
+            node["seconds"] = round(node["seconds"], 3)
+            node["llm_seconds"] = round(node["llm_seconds"], 3)
+        return {
+            "total_seconds": round(time.perf_counter() - self.started, 3),
+            "node_seconds": round(sum(span["seconds"] for span in spans), 3),
+            "llm_seconds": round(sum(span["llm_seconds"] for span in spans), 3),
+            "llm_calls": sum(span["llm_calls"] for span in spans),
+            "prompt_tokens": sum(span["prompt_tokens"] for span in spans),
+            "completion_tokens": sum(span["completion_tokens"] for span in spans),
+            "nodes": nodes,
+        }
+
+
+_current_run: contextvars.ContextVar[Optional[RunTimings]] = contextvars.ContextVar("graph_run_timings", default=None)
+
+
+def start_run() -> RunTimings:
+    """Starts collecting the node spans of a graph run in the current context."""
+    run = RunTimings()
+    _current_run.set(run)
+    return run
+
+
+def current_run() -> Optional[RunTimings]:
+    return _current_run.get()
+
+
+@contextmanager
+def node_span(graph: str, node: str) -> Iterator[Dict[str, Any]]:
+    """Times one node call and the LLM usage inside it, and records it as a trace span."""
+    with tracing.span(f"{graph}.{node}", {"labscript.graph": graph, "labscript.node": node}) as trace_span:
+        yield from _timed_node(graph, node, trace_span)
+
+
+def _timed_node(graph: str, node: str, trace_span) -> Iterator[Dict[str, Any]]:
+    usage = LlmUsage()
+    token = _node_usage.set(usage)
+    span: Dict[str, Any] = {"graph": graph, "node": node, "error": None}
+    start = time.perf_counter()
+    try:
+        yield span
+    except BaseException as e:
+        span["error"] = type(e).__name__
+        raise
+    finally:
+        _node_usage.reset(token)
+        trace_span.set_attributes({"labscript.llm_calls": usage.calls,
+                                   "gen_ai.usage.input_tokens": usage.prompt_tokens,
+                                   "gen_ai.usage.output_tokens": usage.completion_tokens})
+        span.update(
+            seconds=time.perf_counter() - start,
+            llm_seconds=usage.seconds,
+            llm_calls=usage.calls,
+            prompt_tokens=usage.prompt_tokens,
+            completion_tokens=usage.completion_tokens,
+        )
+        NODE_SECONDS.labels(graph, node).observe(span["seconds"])
+        if usage.calls:
+            NODE_LLM_SECONDS.labels(graph, node).observe(usage.seconds)
+            NODE_TOKENS.labels(graph, node, "prompt").inc(usage.prompt_tokens)
+            NODE_TOKENS.labels(graph, node, "completion").inc(usage.completion_tokens)
+        run = _current_run.get()
+        if run is not None:
+            run.add(span)
+
+
+def _trace_node_state(state: Any, update: Any) -> None:
+    """Adds the attempt number and the protocol code hash after a node call to its span."""
+    if not isinstance(state, dict):
+        return
+    merged = {**state, **update} if isinstance(update, dict) else state
+    attempt = merged.get("attempts")
+    code = merged.get("python_code")
+    tracing.current_span().set_attributes({
+        "labscript.attempt": attempt if isinstance(attempt, int) else None,
+        "labscript.code_hash": content_hash(code) if isinstance(code, str) and code else None,
+    })
+
+
+def instrument_node(graph: str, name: str, node: Callable) -> Callable:
+    """Wraps a LangGraph node function so that every call is recorded by ``node_span``."""
+    if inspect.iscoroutinefunction(node):
+        @functools.wraps(node)
+        async def async_wrapper(*args, **kwargs):
+            with node_span(graph, name):
+                update = await node(*args, **kwargs)
+                _trace_node_state(args[0] if args else None, update)
+                return update
+        return async_wrapper
+
+    @functools.wraps(node)
+    def wrapper(*args, **kwargs):
+        with node_span(graph, name):
+            update = node(*args, **kwargs)
+            _trace_node_state(args[0] if args else None, update)
+            return update
+    return wrapper
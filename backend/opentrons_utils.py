@@ -7,11 +7,19 @@ import sys
 import re
 import traceback
 import json
+import logging
 from typing import Dict, Any, Union
 from pydantic import BaseModel, Field
 from pathlib import Path
 import platform
 
+from backend.artifact_store import content_hash
+from backend.runtime_estimator import estimate_opentrons_run
+from backend.server_metrics import SimulationSpan
+from backend.log_utils import SAMPLED
+
+logger = logging.getLogger(__name__)
+
 # 缩短模拟超时时间（秒）- 正常模拟应该在30秒内完成
 SIMULATION_TIMEOUT = 30
 
@@ -54,16 +62,21 @@ def run_opentrons_simulation(protocol_code: str, return_structured: bool = False
     """
     通过子进程调用隔离的 .ot_env 环境来安全地运行 Opentrons 模拟。
     优化了超时处理和错误诊断。
+    模拟成功时根据运行日志估算运行时间 (duration_estimate，见 backend/runtime_estimator.py)。
     """
     result_data = {
         "success": False, "has_warnings": False, "error_details": "",
-        "recommendations": [], "raw_output": "", "final_status": ""
+        "recommendations": [], "raw_output": "", "final_status": "",
+        "duration_estimate": None
     }
 
     python_executable = get_ot_env_python_executable()
+    # 环境缺失也计入模拟指标 (failure)，否则坏掉的模拟环境看起来像是没有流量
+    span = SimulationSpan("opentrons", content_hash(protocol_code))
 
     if not python_executable.exists():
         error_msg = "错误: 未找到 '.ot_env' 隔离环境。请运行 'scripts/setup-uv.ps1' 脚本来创建它。"
+        span.finish("failure", error_msg)
         if return_structured:
             result_data.update({"error_details": error_msg, "final_status": "失败 - 环境缺失"})
             return result_data
@@ -79,8 +92,8 @@ def run_opentrons_simulation(protocol_code: str, return_structured: bool = False
         command = [str(python_executable), "-m", "opentrons.simulate", temp_file_path]
 
         # 添加详细的进程监控
-        print(f"🔍 开始模拟: {temp_file_path}")
-        print(f"🔧 命令: {' '.join(command)}")
+        logger.debug("开始模拟: %s", temp_file_path)
+        logger.debug("命令: %s", " ".join(command), extra=SAMPLED)
         
         proc = subprocess.run(
             command,
@@ -96,6 +109,7 @@ def run_opentrons_simulation(protocol_code: str, return_structured: bool = False
 
         if proc.returncode == 0:
             result_data["success"] = True
+            result_data["duration_estimate"] = estimate_opentrons_run(proc.stdout or "")
             # Opentrons 模拟成功时也可能在 stderr 中打印警告
             if proc.stderr:
                 result_data["has_warnings"] = True
@@ -128,6 +142,10 @@ def run_opentrons_simulation(protocol_code: str, return_structured: bool = False
     finally:
         if os.path.exists(temp_file_path):
             os.unlink(temp_file_path)
+        if result_data["final_status"] == "失败 - 超时":
+            span.finish("timeout")
+        else:
+            span.finish("success" if result_data["success"] else "failure", result_data["error_details"] or "")
 
     if return_structured:
         return result_data
@@ -136,7 +154,9 @@ def run_opentrons_simulation(protocol_code: str, return_structured: bool = False
 
 if __name__ == '__main__':
     # 注意: 由于此模块不再直接导入 opentrons，此处的测试用例需要一个已正确设置的 ot_env 环境才能运行。
-    print("--- Testing opentrons_utils.py (Subprocess Mode) ---")
+    from backend.log_utils import configure_logging
+    configure_logging()
+    logger.info("--- Testing opentrons_utils.py (Subprocess Mode) ---")
 
     valid_flex_code = """
 from opentrons.protocol_api import ProtocolContext
@@ -148,9 +168,9 @@ def run(protocol: ProtocolContext):
     pipette.drop_tip()
     protocol.comment('Flex Test Protocol Complete!')
 """
-    print("\n--- Test 1: Valid Flex Protocol ---")
+    logger.info("--- Test 1: Valid Flex Protocol ---")
     result1 = run_opentrons_simulation(valid_flex_code, return_structured=True)
-    print(json.dumps(result1, indent=2, ensure_ascii=False))
+    logger.info("%s", json.dumps(result1, indent=2, ensure_ascii=False))
     assert result1['success'], "Test 1 Failed"
 
     error_code = """
@@ -159,10 +179,10 @@ metadata = {"apiLevel": "2.19"}
 def run(protocol: ProtocolContext):
     protocol.load_labware('non_existent_labware_12345', 'A1')
 """
-    print("\n--- Test 2: Protocol with Error ---")
+    logger.info("--- Test 2: Protocol with Error ---")
     result2 = run_opentrons_simulation(error_code, return_structured=True)
-    print(json.dumps(result2, indent=2, ensure_ascii=False))
+    logger.info("%s", json.dumps(result2, indent=2, ensure_ascii=False))
     assert not result2['success'], "Test 2 Failed"
     assert "recommendations" in result2 and len(result2['recommendations']) > 0, "Test 2 did not provide recommendations"
 
-    print("\n--- All tests complete. Review output. ---") 
\ No newline at end of file
+    logger.info("--- All tests complete. Review output. ---") 
\ No newline at end of file
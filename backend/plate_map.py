@@ -0,0 +1,454 @@
+# -*- coding: utf-8 -*-
+"""
+Plate Map Engine
+================
+
+Reusable well-to-well mappings for plate reformatting, computed with NumPy
+instead of the nested loops generated protocols usually carry (see
+``archive/backend/OT2protocolcode/07_384_Well_Plate_Advanced_Mapping.py``).
+
+A ``PlateMap`` is a set of parallel arrays, one entry per transfer:
+``source_plate``, ``source`` (well index), ``dest_plate``, ``dest`` and
+``volume``. Well indexes are column-major (A1 = 0, B1 = 1, ... A2 = rows),
+the order used by Opentrons ``wells()`` and Tecan FluentControl.
+
+Builders:
+
+- ``quadrant_interleave`` / ``quadrant_deinterleave``: 4 x 96 <-> 384
+  (and 4 x 384 <-> 1536) quadrant stamping, quadrants ordered A1, A2, B1, B2;
+- ``compress``: pack selected wells (e.g. hits) densely by column or by row,
+  spilling over into further destination plates;
+- ``pool``: pool wells by row, by column or the whole plate into one well;
+- ``PlateMap.from_transfers``: any explicit list of transfers.
+
+Exporters emit the whole mapping as bulk transfers: a single
+``pipette.transfer(...)`` call for Opentrons, a transfer table plus one loop
+for PyLabRobot, and 8-channel FCA cycles on a pyFluent ``Protocol``. Whole
+quadrant stamps on a Tecan MCA 96 head go through pyFluent's
+``mca().stamp_quadrants()`` instead.
+"""
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# Plate format (number of wells) -> (rows, columns)
+PLATE_SHAPES = {
+    6: (2, 3),
+    12: (3, 4),
+    24: (4, 6),
+    48: (6, 8),
+    96: (8, 12),
+    384: (16, 24),
+    1536: (32, 48),
+}
+
+# (row, column) offset of quadrants A1, A2, B1, B2 in the denser plate
+QUADRANT_OFFSETS = ((0, 0), (0, 1), (1, 0), (1, 1))
+
+POOL_MODES = ("row", "column", "plate")
+
+WellsLike = Union[str, int, Sequence[Union[str, int]], np.ndarray]
+LabelsLike = Union[str, Sequence[str]]
+
+
+def plate_shape(plate_format: int) -> Tuple[int, int]:
+    """Returns (rows, columns) of a plate format."""
+    try:
+        return PLATE_SHAPES[plate_format]
+    except KeyError:
+        raise ValueError(f"Unsupported plate format: {plate_format}") from None
+
+
+def row_label(row: int) -> str:
+    """0 -> A, 25 -> Z, 26 -> AA"""
+    if row < 26:
+        return chr(ord("A") + row)
+    return chr(ord("A") + row // 26 - 1) + chr(ord("A") + row % 26)
+
+
+@lru_cache(maxsize=None)
+def well_names(plate_format: int) -> Tuple[str, ...]:
+    """Well names of a plate in column-major index order."""
+    rows, columns = plate_shape(plate_format)
+    return tuple(f"{row_label(row)}{column + 1}" for column in range(columns) for row in range(rows))
+
+
+@lru_cache(maxsize=None)
+def _name_lookup(plate_format: int) -> Dict[str, int]:
+    return {name: index for index, name in enumerate(well_names(plate_format))}
+
+
+def well_index(wells: WellsLike, plate_format: int = 96) -> np.ndarray:
+    """Converts well names ("A1") and/or indexes to an int64 index array."""
+    if isinstance(wells, np.ndarray) and wells.dtype.kind in "iu":
+        indexes = wells.astype(np.int64, copy=False).ravel()
+    else:
+        if isinstance(wells, (str, int, np.integer)):
+            wells = [wells]
+        lookup = _name_lookup(plate_format)
+        try:
+            indexes = np.fromiter((lookup[well.strip().upper()] if isinstance(well, str) else well
+                                   for well in wells), dtype=np.int64)
+        except KeyError as exc:
+            raise ValueError(f"Unknown well {exc.args[0]!r} for a {plate_format}-well plate") from None
+    if indexes.size and (indexes.min() < 0 or indexes.max() >= plate_format):
+        raise ValueError(f"Well index out of range for a {plate_format}-well plate")
+    return indexes
+
+
+def rows_cols(indexes: np.ndarray, plate_format: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Column-major well indexes -> (rows, columns), both 0-based."""
+    rows, _ = plate_shape(plate_format)
+    return indexes % rows, indexes // rows
+
+
+def index_of(rows: np.ndarray, columns: np.ndarray, plate_format: int) -> np.ndarray:
+    """(rows, columns) -> column-major well indexes."""
+    plate_rows, _ = plate_shape(plate_format)
+    return np.asarray(columns, dtype=np.int64) * plate_rows + np.asarray(rows, dtype=np.int64)
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _labels(labels: LabelsLike, plates: np.ndarray, what: str) -> List[str]:
+    """Resolves a label (or one label per plate number) for every transfer."""
+    if isinstance(labels, str):
+        if plates.size and plates.max() > 0:
+            raise ValueError(f"The map uses several {what} plates; pass one label per plate")
+        return [labels] * plates.size
+    labels = list(labels)
+    if plates.size and plates.max() >= len(labels):
+        raise ValueError(f"The map uses {plates.max() + 1} {what} plates but only {len(labels)} labels were given")
+    return [labels[plate] for plate in plates.tolist()]
+
+
+def _wrap(items: List[str], indent: str, per_line: int = 8) -> str:
+    return ",\n".join(indent + ", ".join(items[start:start + per_line])
+                      for start in range(0, len(items), per_line))
+
+
+@dataclass
+class PlateMap:
+    """
+    A vectorized list of transfers.
+
+    ``volume``, ``source_plate`` and ``dest_plate`` may be passed as scalars
+    and are broadcast to the number of transfers.
+    """
+    source: np.ndarray
+    dest: np.ndarray
+    volume: Union[np.ndarray, float] = 0.0
+    source_plate: Union[np.ndarray, int] = 0
+    dest_plate: Union[np.ndarray, int] = 0
+    source_format: int = 96
+    dest_format: int = 96
+
+    def __post_init__(self):
+        self.source = well_index(self.source, self.source_format)
+        self.dest = well_index(self.dest, self.dest_format)
+        if self.source.shape != self.dest.shape:
+            raise ValueError(f"source and dest must have the same length: {self.source.size} != {self.dest.size}")
+        size = self.source.size
+        self.volume = np.broadcast_to(np.asarray(self.volume, dtype=np.float64), (size,)).copy()
+        self.source_plate = np.broadcast_to(np.asarray(self.source_plate, dtype=np.int64), (size,)).copy()
+        self.dest_plate = np.broadcast_to(np.asarray(self.dest_plate, dtype=np.int64), (size,)).copy()
+        if size and (self.volume.min() < 0 or self.source_plate.min() < 0 or self.dest_plate.min() < 0):
+            raise ValueError("Volumes and plate numbers must not be negative")
+
+    @classmethod
+    def from_transfers(cls, transfers: Iterable[Tuple[Any, Any, float]],
+                       source_format: int = 96, dest_format: int = 96) -> "PlateMap":
+        """
+        Builds a map from ``(source_well, dest_well, volume)`` tuples.
+
+        Wells are names or indexes; ``((plate, well), (plate, well), volume)``
+        selects the plate number as well.
+        """
+        source_plates, sources, dest_plates, dests, volumes = [], [], [], [], []
+        for source, dest, volume in transfers:
+            source_plate, source = source if isinstance(source, tuple) else (0, source)
+            dest_plate, dest = dest if isinstance(dest, tuple) else (0, dest)
+            source_plates.append(source_plate)
+            sources.append(source)
+            dest_plates.append(dest_plate)
+            dests.append(dest)
+            volumes.append(volume)
+        return cls(well_index(sources, source_format), well_index(dests, dest_format), volumes,
+                   source_plates, dest_plates, source_format, dest_format)
+
+    def __len__(self) -> int:
+        return int(self.source.size)
+
+    def _take(self, selection) -> "PlateMap":
+        return PlateMap(self.source[selection], self.dest[selection], self.volume[selection],
+                        self.source_plate[selection], self.dest_plate[selection],
+                        self.source_format, self.dest_format)
+
+    def concat(self, *others: "PlateMap") -> "PlateMap":
+        """Appends other maps with the same plate formats."""
+        maps = (self,) + others
+        for other in others:
+            if (other.source_format, other.dest_format) != (self.source_format, self.dest_format):
+                raise ValueError("Only maps with the same plate formats can be concatenated")
+        return PlateMap(*(np.concatenate([getattr(item, name) for item in maps])
+                          for name in ("source", "dest", "volume", "source_plate", "dest_plate")),
+                        source_format=self.source_format, dest_format=self.dest_format)
+
+    def sort(self, by: str = "source") -> "PlateMap":
+        """Returns the transfers ordered by source or dest (plate, well)."""
+        if by == "source":
+            order = np.lexsort((self.dest, self.source, self.source_plate))
+        elif by == "dest":
+            order = np.lexsort((self.source, self.dest, self.dest_plate))
+        else:
+            raise ValueError(f"by must be 'source' or 'dest': {by!r}")
+        return self._take(order)
+
+    def without_empty(self) -> "PlateMap":
+        """Drops zero-volume transfers."""
+        return self._take(self.volume > 0)
+
+    def dest_volumes(self) -> np.ndarray:
+        """Total volume added to each destination well, shape (plates, rows, columns)."""
+        return self._totals(self.dest_plate, self.dest, self.dest_format)
+
+    def source_volumes(self) -> np.ndarray:
+        """Total volume taken from each source well, shape (plates, rows, columns)."""
+        return self._totals(self.source_plate, self.source, self.source_format)
+
+    def _totals(self, plates: np.ndarray, wells: np.ndarray, plate_format: int) -> np.ndarray:
+        plate_count = int(plates.max()) + 1 if plates.size else 1
+        totals = np.bincount(plates * plate_format + wells, weights=self.volume,
+                             minlength=plate_count * plate_format)
+        rows, columns = plate_shape(plate_format)
+        # column-major well order -> (plates, columns, rows) -> (plates, rows, columns)
+        return totals.reshape(plate_count, columns, rows).transpose(0, 2, 1)
+
+    def records(self) -> List[Tuple[int, str, int, str, float]]:
+        """Transfers as ``(source_plate, source_well, dest_plate, dest_well, volume)``."""
+        source_names, dest_names = well_names(self.source_format), well_names(self.dest_format)
+        return [(source_plate, source_names[source], dest_plate, dest_names[dest], volume)
+                for source_plate, source, dest_plate, dest, volume in zip(
+                    self.source_plate.tolist(), self.source.tolist(), self.dest_plate.tolist(),
+                    self.dest.tolist(), self.volume.tolist())]
+
+    def channel_batches(self, channels: int = 8) -> List[np.ndarray]:
+        """
+        Splits the transfers, in order, into batches a multichannel head can do at once.
+
+        A batch stays in one source column and one destination column, with
+        rows strictly increasing by at least the channel pitch on both plates
+        (every row on a 96-well plate, every other row on a 384-well plate).
+        """
+        source_rows, source_columns = rows_cols(self.source, self.source_format)
+        dest_rows, dest_columns = rows_cols(self.dest, self.dest_format)
+        source_step = max(1, plate_shape(self.source_format)[0] // 8)
+        dest_step = max(1, plate_shape(self.dest_format)[0] // 8)
+        # A new batch starts wherever the next transfer cannot join the previous one
+        breaks = np.ones(len(self), dtype=bool)
+        if len(self) > 1:
+            breaks[1:] = ((self.source_plate[1:] != self.source_plate[:-1])
+                          | (self.dest_plate[1:] != self.dest_plate[:-1])
+                          | (source_columns[1:] != source_columns[:-1])
+                          | (dest_columns[1:] != dest_columns[:-1])
+                          | (source_rows[1:] - source_rows[:-1] < source_step)
+                          | (dest_rows[1:] - dest_rows[:-1] < dest_step))
+        batches = []
+        starts = np.flatnonzero(breaks).tolist() + [len(self)]
+        for start, end in zip(starts, starts[1:]):
+            batches.extend(np.arange(offset, min(offset + channels, end))
+                           for offset in range(start, end, channels))
+        return batches
+
+    # ---------------- exporters ----------------
+
+    def to_opentrons(self, pipette: str = "pipette", source: LabelsLike = "source", dest: LabelsLike = "dest",
+                     new_tip: str = "always") -> str:
+        """
+        Opentrons code performing the whole map with one ``transfer`` call.
+
+        ``source`` / ``dest`` are the labware variable names in the protocol,
+        or one name per plate number for multi-plate maps.
+        """
+        source_names, dest_names = well_names(self.source_format), well_names(self.dest_format)
+        sources = [f"{label}['{source_names[well]}']"
+                   for label, well in zip(_labels(source, self.source_plate, "source"), self.source.tolist())]
+        dests = [f"{label}['{dest_names[well]}']"
+                 for label, well in zip(_labels(dest, self.dest_plate, "dest"), self.dest.tolist())]
+        volumes = [_format_number(volume) for volume in self.volume.tolist()]
+        return (f"{pipette}.transfer(\n"
+                f"    [\n{_wrap(volumes, ' ' * 8, 16)}\n    ],\n"
+                f"    [\n{_wrap(sources, ' ' * 8)}\n    ],\n"
+                f"    [\n{_wrap(dests, ' ' * 8)}\n    ],\n"
+                f"    new_tip='{new_tip}',\n"
+                f")\n")
+
+    def to_pylabrobot(self, source: LabelsLike = "source", dest: LabelsLike = "dest",
+                      tip_rack: LabelsLike = "tip_rack", lh: str = "lh") -> str:
+        """
+        PyLabRobot code (inside ``async def protocol(lh)``) for the whole map:
+        a transfer table and one loop, a fresh tip per transfer.
+
+        ``tip_rack`` may be a list of rack variables; transfer ``i`` uses tip
+        ``i % 96`` of rack ``i // 96``.
+        """
+        source_names, dest_names = well_names(self.source_format), well_names(self.dest_format)
+        tip_names = well_names(96)
+        racks = [tip_rack] if isinstance(tip_rack, str) else list(tip_rack)
+        if len(self) > 96 * len(racks):
+            raise ValueError(f"{len(self)} transfers need {-(-len(self) // 96)} tip racks, got {len(racks)}")
+        rows = []
+        for index, (source_label, source_well, dest_label, dest_well, volume) in enumerate(zip(
+                _labels(source, self.source_plate, "source"), self.source.tolist(),
+                _labels(dest, self.dest_plate, "dest"), self.dest.tolist(), self.volume.tolist())):
+            tip = f"{racks[index // 96]}['{tip_names[index % 96]}']"
+            rows.append(f"    ({source_label}['{source_names[source_well]}'], "
+                        f"{dest_label}['{dest_names[dest_well]}'], {_format_number(volume)}, {tip}),")
+        return ("transfers = [\n" + "\n".join(rows) + "\n]\n"
+                "for source_well, dest_well, volume, tip in transfers:\n"
+                f"    await {lh}.pick_up_tips(tip)\n"
+                f"    await {lh}.aspirate(source_well, vols=[volume])\n"
+                f"    await {lh}.dispense(dest_well, vols=[volume])\n"
+                f"    await {lh}.drop_tips(tip)\n")
+
+    def to_pyfluent(self, protocol, source: LabelsLike, dest: LabelsLike, tip_type: str = "200ul",
+                    liquid_class: str = "Water Free Single", channels: int = 8):
+        """
+        Appends the map to a pyFluent ``Protocol`` as multichannel FCA cycles.
+
+        Each batch from ``channel_batches(channels)`` becomes one
+        get_tips / aspirate / dispense / drop_tips cycle. ``source`` / ``dest``
+        are labware labels already added to the protocol.
+
+        Returns:
+            The protocol, for chaining.
+        """
+        source_names, dest_names = well_names(self.source_format), well_names(self.dest_format)
+        source_labels = _labels(source, self.source_plate, "source")
+        dest_labels = _labels(dest, self.dest_plate, "dest")
+        fca = protocol.fca()
+        for batch in self.channel_batches(channels):
+            first = int(batch[0])
+            used = list(range(batch.size))
+            volumes = self.volume[batch].tolist()
+            fca.get_tips(tip_type, used) \
+                .aspirate(volumes, source_labels[first], wells=",".join(source_names[i] for i in self.source[batch]),
+                          liquid_class=liquid_class, channels=used) \
+                .dispense(volumes, dest_labels[first], wells=",".join(dest_names[i] for i in self.dest[batch]),
+                          liquid_class=liquid_class, channels=used) \
+                .drop_tips(used)
+        return protocol
+
+
+# ---------------- builders ----------------
+
+def quadrant_interleave(volume: float, source_format: int = 96,
+                        quadrants: Sequence[int] = (0, 1, 2, 3)) -> PlateMap:
+    """
+    Stamps up to four source plates into the quadrants of one denser plate.
+
+    Source plate ``k`` goes to quadrant ``quadrants[k]`` (0 = A1, 1 = A2,
+    2 = B1, 3 = B2), e.g. four 96-well plates into one 384-well plate.
+    """
+    dest_format = source_format * 4
+    plate_shape(dest_format)
+    rows, columns = rows_cols(np.arange(source_format, dtype=np.int64), source_format)
+    offsets = np.asarray([QUADRANT_OFFSETS[quadrant] for quadrant in quadrants], dtype=np.int64)
+    dest = index_of(2 * rows[None, :] + offsets[:, :1], 2 * columns[None, :] + offsets[:, 1:], dest_format)
+    plates = np.repeat(np.arange(len(quadrants), dtype=np.int64), source_format)
+    return PlateMap(np.tile(np.arange(source_format, dtype=np.int64), len(quadrants)), dest.ravel(), volume,
+                    source_plate=plates, source_format=source_format, dest_format=dest_format)
+
+
+def quadrant_deinterleave(volume: float, source_format: int = 384,
+                          quadrants: Sequence[int] = (0, 1, 2, 3)) -> PlateMap:
+    """
+    Splits the quadrants of one plate into separate, less dense plates;
+    quadrant ``quadrants[k]`` goes to destination plate ``k``.
+    """
+    if source_format % 4:
+        raise ValueError(f"Unsupported plate format: {source_format}")
+    forward = quadrant_interleave(volume, source_format // 4, quadrants)
+    return PlateMap(forward.dest, forward.source, volume, dest_plate=forward.source_plate,
+                    source_format=source_format, dest_format=source_format // 4)
+
+
+def _selected_wells(wells: WellsLike, plate_format: int) -> np.ndarray:
+    """Indexes from names, indexes or a boolean mask (flat column-major or (rows, columns))."""
+    array = np.asarray(wells) if not isinstance(wells, str) else None
+    if array is not None and array.dtype == bool:
+        if array.ndim == 2:
+            array = array.T.ravel()  # (rows, columns) -> column-major
+        if array.size != plate_format:
+            raise ValueError(f"A well mask must have {plate_format} entries, got {array.size}")
+        return np.flatnonzero(array)
+    return well_index(wells, plate_format)
+
+
+def compress(wells: WellsLike, volume: Union[float, Sequence[float]], source_format: int = 96,
+             dest_format: int = 96, order: str = "column", start: int = 0) -> PlateMap:
+    """
+    Packs the selected wells densely into destination plates (cherry-pick compression).
+
+    Args:
+        wells: selected source wells as names, indexes or a boolean mask
+        volume: one volume, or one per selected well (in selection order)
+        order: "column" fills and reads column by column, "row" row by row
+        start: first destination position (in fill order), e.g. to continue
+            after a previous compression; positions past the end of a plate
+            spill over into the next destination plate
+    """
+    if order not in ("column", "row"):
+        raise ValueError(f"order must be 'column' or 'row': {order!r}")
+    selected = _selected_wells(wells, source_format)
+    volumes = np.broadcast_to(np.asarray(volume, dtype=np.float64), selected.shape)
+    if order == "row":
+        rows, columns = rows_cols(selected, source_format)
+        source_columns = plate_shape(source_format)[1]
+        ordering = np.argsort(rows * source_columns + columns, kind="stable")
+    else:
+        ordering = np.argsort(selected, kind="stable")
+    selected, volumes = selected[ordering], volumes[ordering]
+
+    positions = start + np.arange(selected.size, dtype=np.int64)
+    plates, positions = np.divmod(positions, dest_format)
+    if order == "row":
+        _, dest_columns = plate_shape(dest_format)
+        positions = index_of(positions // dest_columns, positions % dest_columns, dest_format)
+    return PlateMap(selected, positions, volumes, dest_plate=plates,
+                    source_format=source_format, dest_format=dest_format)
+
+
+def pool(volume: float, by: str = "row", plate_format: int = 96, wells: Optional[WellsLike] = None,
+         dest_format: Optional[int] = None) -> PlateMap:
+    """
+    Pools wells of a plate into single destination wells.
+
+    ``by="row"`` pools each row into column 1 of the same row, ``by="column"``
+    each column into row A of the same column, ``by="plate"`` everything into A1.
+
+    Args:
+        wells: restrict pooling to these wells (names, indexes or a mask); default all
+        dest_format: destination plate format, defaults to the source format
+    """
+    if by not in POOL_MODES:
+        raise ValueError(f"by must be one of {POOL_MODES}: {by!r}")
+    dest_format = dest_format or plate_format
+    source = (np.arange(plate_format, dtype=np.int64) if wells is None
+              else _selected_wells(wells, plate_format))
+    rows, columns = rows_cols(source, plate_format)
+    dest_rows, dest_columns = plate_shape(dest_format)
+    if by == "row":
+        dest = index_of(rows, np.zeros_like(rows), dest_format) if rows.max(initial=0) < dest_rows else None
+    elif by == "column":
+        dest = index_of(np.zeros_like(columns), columns, dest_format) if columns.max(initial=0) < dest_columns else None
+    else:
+        dest = np.zeros_like(source)
+    if dest is None:
+        raise ValueError(f"A {dest_format}-well plate is too small to pool a {plate_format}-well plate by {by}")
+    return PlateMap(source, dest, volume, source_format=plate_format, dest_format=dest_format)
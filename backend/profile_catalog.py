@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Hardware Profile Catalog
+========================
+
+An in-memory catalog of the PyLabRobot hardware profiles in
+``backend/hardware_profiles``. The catalog replaces per-request globbing and
+JSON parsing:
+
+- profile files are loaded once and re-loaded only when the directory
+  signature (file names, mtimes and sizes) changes; the signature is checked
+  at most once per ``min_check_interval`` seconds;
+- ``PyLabRobotProfile`` objects and the serialized ``/api/pylabrobot/profiles``
+  response (with its ETag) are built once per reload;
+- configurations loaded by path are cached by (mtime, size);
+- knowledge prompts derived from a configuration are memoized by the
+  configuration's content hash.
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from pydantic import BaseModel
+
+from backend.http_utils import make_etag
+from backend.server_metrics import cache_counters
+
+HARDWARE_PROFILES_DIR = Path(__file__).parent / "hardware_profiles"
+PROFILE_FILE_PREFIX = "pylabrobot_"
+
+# Display names that differ from the title-cased robot_model
+DISPLAY_NAME_OVERRIDES = {
+    "Generic": "Generic PyLabRobot",
+    "Hamilton Star": "Hamilton STAR",
+    "Tecan Evo": "Tecan Freedom EVO",
+    "Opentrons": "Opentrons OT-2",
+}
+
+MAX_KNOWLEDGE_ENTRIES = 64
+
+logger = logging.getLogger(__name__)
+
+_CONFIG_HITS, _CONFIG_MISSES = cache_counters("profile_config")
+_KNOWLEDGE_HITS, _KNOWLEDGE_MISSES = cache_counters("profile_knowledge")
+
+
+# PyLabRobot profile models
+class PyLabRobotProfile(BaseModel):
+    id: str
+    robot_model: str
+    display_name: str
+    manufacturer: str
+    description: str
+    precision_class: str
+    volume_range: Dict[str, float]
+    special_features: List[str]
+    recommended_for: List[str]
+    default_config: Dict[str, Any]  # New field for the full config
+
+class PyLabRobotProfilesResponse(BaseModel):
+    success: bool
+    profiles: List[PyLabRobotProfile]
+    timestamp: str
+
+
+def config_fingerprint(config: Dict[str, Any]) -> str:
+    """Returns a stable content hash of a hardware configuration."""
+    canonical = json.dumps(config, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def profile_display_name(robot_model: str) -> str:
+    """Creates the display name shown in the frontend from a robot model."""
+    display_name = robot_model.replace("_", " ").title()
+    return DISPLAY_NAME_OVERRIDES.get(display_name, display_name)
+
+
+def build_profile(profile_id: str, config_data: Dict[str, Any]) -> PyLabRobotProfile:
+    """Builds a PyLabRobotProfile from a parsed profile file."""
+    robot_model = config_data.get("robot_model", "unknown")
+    return PyLabRobotProfile(
+        id=profile_id,
+        robot_model=robot_model,
+        display_name=profile_display_name(robot_model),
+        manufacturer=config_data.get("manufacturer", "Unknown"),
+        description=config_data.get("description", ""),
+        precision_class=config_data.get("precision_class", "standard"),
+        volume_range=config_data.get("volume_range", {"min_ul": 1, "max_ul": 1000}),
+        special_features=config_data.get("special_features", []),
+        recommended_for=config_data.get("recommended_for", []),
+        default_config=config_data  # Pass the entire config object
+    )
+
+
+class ProfileCatalog:
+    """
+    Cached view of the hardware profile directory.
+
+    Args:
+        profiles_dir: Directory containing ``pylabrobot_*.json`` profiles.
+        min_check_interval: Minimum seconds between two directory scans.
+    """
+
+    def __init__(self, profiles_dir: Union[str, Path] = HARDWARE_PROFILES_DIR, min_check_interval: float = 1.0):
+        self.profiles_dir = Path(profiles_dir)
+        self.min_check_interval = min_check_interval
+        self._lock = threading.RLock()
+        self._signature: Optional[Tuple] = None
+        self._last_check = 0.0
+        self._profiles: List[PyLabRobotProfile] = []
+        self._response_body = b""
+        self._response_etag = ""
+        self._file_cache: Dict[str, Tuple[int, int, Dict[str, Any]]] = {}
+        self._knowledge: "OrderedDict[str, str]" = OrderedDict()
+
+    # ------------------------------------------------------------------
+    # Invalidation
+    # ------------------------------------------------------------------
+
+    def _scan_signature(self) -> Tuple:
+        entries = []
+        try:
+            with os.scandir(self.profiles_dir) as it:
+                for entry in it:
+                    if entry.name.startswith(PROFILE_FILE_PREFIX) and entry.name.endswith(".json"):
+                        stat = entry.stat()
+                        entries.append((entry.name, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            return ()
+        return tuple(sorted(entries))
+
+    def _ensure_fresh(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self._signature is not None and now - self._last_check < self.min_check_interval:
+                return
+            self._last_check = now
+            signature = self._scan_signature()
+            if signature != self._signature:
+                self._reload(signature)
+
+    def invalidate(self) -> None:
+        """Forces a directory re-scan on the next access."""
+        with self._lock:
+            self._signature = None
+
+    def _reload(self, signature: Tuple) -> None:
+        profiles = []
+        for name, _, _ in signature:
+            config_file = self.profiles_dir / name
+            try:
+                config_data = self.load_config(config_file)
+                profiles.append(build_profile(config_file.stem, config_data))
+            except Exception as e:
+                logger.warning("Failed to load PyLabRobot profile %s: %s", config_file, e)
+                continue
+
+        # Sort profiles by display name for consistent ordering
+        profiles.sort(key=lambda x: x.display_name)
+
+        last_modified_ns = max((mtime for _, mtime, _ in signature), default=0)
+        timestamp = datetime.fromtimestamp(last_modified_ns / 1e9) if last_modified_ns else datetime.now()
+        response = PyLabRobotProfilesResponse(success=True, profiles=profiles, timestamp=timestamp.isoformat())
+
+        self._profiles = profiles
+        self._response_body = response.model_dump_json().encode("utf-8")
+        self._response_etag = make_etag(self._response_body)
+        self._signature = signature
+        logger.debug("Loaded %d profiles from %s", len(profiles), self.profiles_dir)
+
+    # ------------------------------------------------------------------
+    # Accessors
+    # ------------------------------------------------------------------
+
+    def profiles(self) -> List[PyLabRobotProfile]:
+        """Returns the pre-built profile objects, sorted by display name."""
+        self._ensure_fresh()
+        return list(self._profiles)
+
+    def serialized_response(self) -> Tuple[bytes, str]:
+        """Returns the serialized profiles response and its weak ETag."""
+        self._ensure_fresh()
+        return self._response_body, self._response_etag
+
+    def load_config(self, config_path: Union[str, Path]) -> Dict[str, Any]:
+        """
+        Loads a JSON configuration, re-reading the file only when its mtime or
+        size changed. Returns a deep copy so callers may mutate it freely.
+
+        Raises:
+            OSError / json.JSONDecodeError: If the file cannot be read or parsed.
+        """
+        path = os.path.abspath(config_path)
+        stat = os.stat(path)
+        with self._lock:
+            cached = self._file_cache.get(path)
+            if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+                _CONFIG_HITS.inc()
+                return copy.deepcopy(cached[2])
+        _CONFIG_MISSES.inc()
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        with self._lock:
+            self._file_cache[path] = (stat.st_mtime_ns, stat.st_size, config)
+        return copy.deepcopy(config)
+
+    def knowledge_for(self, config: Dict[str, Any], builder: Callable[[Dict[str, Any]], str]) -> str:
+        """Returns ``builder(config)``, memoized by the configuration's content hash."""
+        key = config_fingerprint(config)
+        with self._lock:
+            knowledge = self._knowledge.get(key)
+            if knowledge is not None:
+                self._knowledge.move_to_end(key)
+                _KNOWLEDGE_HITS.inc()
+                return knowledge
+        _KNOWLEDGE_MISSES.inc()
+        knowledge = builder(config)
+        with self._lock:
+            self._knowledge[key] = knowledge
+            while len(self._knowledge) > MAX_KNOWLEDGE_ENTRIES:
+                self._knowledge.popitem(last=False)
+        return knowledge
+
+
+# Process-wide catalog used by the API server and the PyLabRobot utilities
+profile_catalog = ProfileCatalog()
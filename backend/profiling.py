@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Request Profiling
+=================
+
+On-demand CPU profiling of single API requests, for finding hotspots such as
+error extraction regexes, diff matching, XML building or the serialization of
+large events under real traffic.
+
+- ``ProfilingMiddleware`` profiles a request that asks for it with the
+  ``X-Profile: 1`` header or the ``?profile=1`` query parameter *and* carries
+  the admin token (``backend.http_utils.is_admin_request``). Other requests
+  pass through after a header check; ``api_server.py`` only installs the
+  middleware when ``LABSCRIPT_ADMIN_TOKEN`` is set, so with admin features
+  off there is no cost at all.
+- A profiled request runs under ``cProfile`` (the event loop thread, written
+  as ``<profile_id>.pstats``) and a stack sampler that records every busy
+  thread, including the ``asyncio.to_thread`` workers running simulations,
+  every ``LABSCRIPT_PROFILE_SAMPLE_INTERVAL`` seconds (written as
+  ``<profile_id>.collapsed``, one ``thread;outer;...;leaf count`` line per
+  stack, the input of ``flamegraph.pl`` and speedscope). For SSE endpoints
+  the profile covers the whole stream.
+- The profile ID is returned in the ``X-Profile-ID`` response header and
+  recorded on the request's root trace span. Only one
+  request is profiled at a time; a concurrent one gets ``X-Profile-ID: busy``.
+- After each profile the oldest files are deleted until the directory is
+  below ``LABSCRIPT_PROFILE_MAX_BYTES``.
+
+The event loop is shared, so the ``cProfile`` output also contains the
+coroutines of requests served concurrently; the collapsed stacks of worker
+threads are per thread.
+
+Environment variables:
+    LABSCRIPT_PROFILE_DIR: Output directory (default ``profiles/`` in the project).
+    LABSCRIPT_PROFILE_MAX_BYTES: Size bound of the directory (default 200 MB).
+    LABSCRIPT_PROFILE_SAMPLE_INTERVAL: Seconds between stack samples (default 0.005).
+"""
+
+import asyncio
+import cProfile
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List
+from urllib.parse import parse_qs
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend import tracing
+from backend.http_utils import is_admin_request
+from backend.log_utils import request_id_var
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-profile"
+PROFILE_QUERY_PARAMETER = "profile"
+DEFAULT_PROFILE_DIR = Path(__file__).parent.parent / "profiles"
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+# Leaf functions of threads that are blocked waiting, not using the CPU
+IDLE_FUNCTIONS = frozenset({"wait", "select", "poll", "_wait_for_tstate_lock", "_worker"})
+# Background threads that block in C calls (their leaf frame looks busy)
+IGNORED_THREADS = frozenset({"trace-exporter"})
+
+_TRUTHY = ("1", "true", "yes")
+
+
+def profile_directory() -> Path:
+    return Path(os.getenv("LABSCRIPT_PROFILE_DIR", DEFAULT_PROFILE_DIR))
+
+
+def profiling_requested(scope: Scope) -> bool:
+    """Whether the request asks to be profiled (admin token not checked)."""
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER.encode():
+            return value.decode("latin-1").strip().lower() in _TRUTHY
+    query_string = scope.get("query_string", b"")
+    if PROFILE_QUERY_PARAMETER.encode() not in query_string:
+        return False
+    values = parse_qs(query_string.decode("latin-1")).get(PROFILE_QUERY_PARAMETER, [])
+    return any(value.lower() in _TRUTHY for value in values)
+
+
+class StackSampler:
+    """
+    Background thread counting the Python stacks of all busy threads (except
+    itself) every ``interval`` seconds.
+    """
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="labscript-stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        names: Dict[int, str] = {}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if len(names) != len(frames):
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in frames.items():
+                thread_name = names.get(thread_id, str(thread_id))
+                if thread_id == own_id or frame.f_code.co_name in IDLE_FUNCTIONS or thread_name in IGNORED_THREADS:
+                    continue
+                stack: List[str] = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(thread_name)
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """The samples in the collapsed-stack format of ``flamegraph.pl``."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def enforce_retention(directory: Path, max_bytes: int) -> None:
+    """Deletes the oldest files of ``directory`` until it holds at most ``max_bytes``."""
+    files = sorted((path for path in directory.iterdir() if path.is_file()), key=lambda path: path.stat().st_mtime)
+    total = sum(path.stat().st_size for path in files)
+    for path in files:
+        if total <= max_bytes:
+            break
+        total -= path.stat().st_size
+        path.unlink(missing_ok=True)
+
+
+def _write_profile(directory: Path, profile_id: str, profiler: cProfile.Profile, sampler: StackSampler) -> None:
+    directory.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(str(directory / f"{profile_id}.pstats"))
+    (directory / f"{profile_id}.collapsed").write_text(sampler.collapsed(), encoding="utf-8")
+    enforce_retention(directory, int(os.getenv("LABSCRIPT_PROFILE_MAX_BYTES", DEFAULT_MAX_BYTES)))
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling the admin requests that ask for it."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._busy = threading.Lock()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not profiling_requested(scope) or not is_admin_request(Headers(scope=scope)):
+            await self.app(scope, receive, send)
+            return
+        if not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, self._with_profile_id(send, "busy"))
+            return
+        try:
+            await self._profile(scope, receive, send)
+        finally:
+            self._busy.release()
+
+    @staticmethod
+    def _with_profile_id(send: Send, profile_id: str) -> Send:
+        async def send_with_profile_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Profile-ID"] = profile_id
+            await send(message)
+        return send_with_profile_id
+
+    async def _profile(self, scope: Scope, receive: Receive, send: Send) -> None:
+        path = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_")[:40] or "root"
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{request_id_var.get() or os.getpid()}-{path}"
+        profile_id = re.sub(r"[^A-Za-z0-9_.-]", "_", profile_id)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:  # another profiler (debugger, coverage) is active
+            logger.warning("Cannot profile request: %s", e)
+            await self.app(scope, receive, self._with_profile_id(send, "unavailable"))
+            return
+        tracing.current_span().set_attribute("labscript.profile_id", profile_id)
+        sampler = StackSampler(float(os.getenv("LABSCRIPT_PROFILE_SAMPLE_INTERVAL", DEFAULT_SAMPLE_INTERVAL)))
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, self._with_profile_id(send, profile_id))
+        finally:
+            profiler.disable()
+            sampler.stop()
+            seconds = time.perf_counter() - start
+            try:
+                await asyncio.to_thread(_write_profile, profile_directory(), profile_id, profiler, sampler)
+                logger.info("Profiled %s %s in %.3fs (%d samples) as %s", scope["method"], scope["path"],
+                            seconds, sampler.samples, profile_id)
+            except OSError as e:
+                logger.warning("Could not write profile %s: %s", profile_id, e)
@@ -10,11 +10,12 @@ import asyncio
 import os
 import sys
 import json
+import logging
 import re
+from functools import lru_cache
 from typing import TypedDict, Optional, Dict, AsyncGenerator
 from langgraph.graph import StateGraph, END, START
-from langchain_openai import ChatOpenAI
-from langchain.schema import HumanMessage, SystemMessage
+from langchain_core.messages import HumanMessage, SystemMessage
 
 # Import utilities - Enhanced version
 from backend.pylabrobot_utils import (
@@ -23,6 +24,8 @@ from backend.pylabrobot_utils import (
     generate_dynamic_pylabrobot_knowledge
 )
 from backend.diff_utils import apply_diff
+from backend.log_utils import SAMPLED
+from backend.node_timing import instrument_node, start_run
 from backend.config import (
     api_key, base_url, model_name,
     DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL, DEEPSEEK_INTENT_MODEL
@@ -33,6 +36,8 @@ from backend.prompts import (
     PYLABROBOT_FORCE_REGENERATE_PROMPT_TEMPLATE
 )
 
+logger = logging.getLogger(__name__)
+
 # State definition for LangGraph - enhanced version with hardware configuration support
 class PyLabRobotGraphState(TypedDict):
     user_query: str                 # User's natural language requirements
@@ -113,10 +118,14 @@ Generate the precise diff now:
 # LLM Instances Initialization - Mixed Strategy (moved to function level)
 # ============================================================================
 
+@lru_cache(maxsize=None)
 def get_pylabrobot_llm_instances():
     """
-    Get PyLabRobot LLM instances with lazy initialization
+    Get PyLabRobot LLM instances with lazy initialization.
+    The clients are created on first use and reused afterwards.
     """
+    from langchain_openai import ChatOpenAI
+
     # LLM for initial protocol creation - use powerful model for complex reasoning
     creation_llm = ChatOpenAI(
         model_name=model_name,  # gemini-2.5-pro for complex protocol generation
@@ -146,7 +155,7 @@ def load_golden_template() -> str:
         with open(template_path, 'r', encoding='utf-8') as f:
             return f.read()
     except Exception as e:
-        print(f"Warning: Failed to load golden template: {e}")
+        logger.warning("Failed to load golden template: %s", e)
         # Fallback template
         return """
 import asyncio
@@ -189,7 +198,7 @@ def fill_template_with_logic(template: str, protocol_logic: str) -> str:
         return new_code
     else:
         # Fallback if the primary pattern is not found for some reason.
-        print("Warning: Could not find [AGENT_CODE_STUB] placeholder with primary pattern. Using fallback.")
+        logger.warning("Could not find [AGENT_CODE_STUB] placeholder with primary pattern. Using fallback.")
         return template.replace("    # [AGENT_CODE_STUB]\n    pass", protocol_logic)
 
 def generate_code_node(state: PyLabRobotGraphState) -> PyLabRobotGraphState:
@@ -197,7 +206,7 @@ def generate_code_node(state: PyLabRobotGraphState) -> PyLabRobotGraphState:
     Enhanced template-based code generation node - eliminates "MissingProtocolFunction" errors
     """
     attempt_num = state['attempts'] + 1
-    print(f"\n=== PyLabRobot Generate Code (Attempt {attempt_num}) ===")
+    logger.debug("=== PyLabRobot Generate Code (Attempt %s) ===", attempt_num)
     
     # Report to frontend
     if state.get('iteration_reporter'):
@@ -217,7 +226,7 @@ def generate_code_node(state: PyLabRobotGraphState) -> PyLabRobotGraphState:
     # Determine generation strategy
     if state.get("force_regenerate", False) or state['attempts'] == 0:
         # Generate protocol logic using template-based approach
-        print("Template-based generation: Generating protocol function logic only")
+        logger.debug("Template-based generation: Generating protocol function logic only")
         selected_llm = get_pylabrobot_llm_instances()[0]  # Use creation_llm
         
         # Create specialized prompt for protocol logic generation
@@ -252,10 +261,10 @@ Generate ONLY the protocol logic (function body content) with proper indentation
 """
         
         if state.get("force_regenerate", False):
-            print("Force regeneration mode: Creating fresh protocol logic")
+            logger.debug("Force regeneration mode: Creating fresh protocol logic")
             state["force_regenerate"] = False
         else:
-            print("First generation: Creating initial protocol logic")
+            logger.debug("First generation: Creating initial protocol logic")
         
         try:
             messages = [
@@ -289,10 +298,10 @@ Generate ONLY the protocol logic (function body content) with proper indentation
             # Fill template with generated logic
             final_code = fill_template_with_logic(template, protocol_logic)
             
-            print(f"Generated protocol logic and filled template, total length: {len(final_code)} characters")
+            logger.debug("Generated protocol logic and filled template, total length: %s characters", len(final_code))
             
         except Exception as e:
-            print(f"Error in LLM generation: {e}")
+            logger.exception("Error in LLM generation: %s", e)
             # Fallback: use template with minimal logic
             fallback_logic = """    print("ERROR: Failed to generate protocol logic from LLM")
     raise Exception("LLM generation failed")"""
@@ -300,7 +309,7 @@ Generate ONLY the protocol logic (function body content) with proper indentation
             
     else:
         # Function-level regeneration for fixes (replace diff approach)
-        print("Function-level regeneration: Re-generating protocol logic based on error feedback")
+        logger.debug("Function-level regeneration: Re-generating protocol logic based on error feedback")
         selected_llm = get_pylabrobot_llm_instances()[1]  # Use correction_llm
         
         feedback = state["feedback_for_llm"]
@@ -370,10 +379,10 @@ Generate the CORRECTED protocol logic (function body only) with proper indentati
             # Fill template with corrected logic
             final_code = fill_template_with_logic(template, protocol_logic)
             
-            print(f"Generated corrected protocol logic and filled template, total length: {len(final_code)} characters")
+            logger.debug("Generated corrected protocol logic and filled template, total length: %s characters", len(final_code))
             
         except Exception as e:
-            print(f"Error in LLM fix generation: {e}")
+            logger.exception("Error in LLM fix generation: %s", e)
             # Fallback to original code
             final_code = state["python_code"]
     
@@ -398,7 +407,7 @@ async def simulate_code_node(state: PyLabRobotGraphState) -> PyLabRobotGraphStat
     """
     Code simulation node: executes PyLabRobot protocol simulation verification
     """
-    print("=== PyLabRobot Simulating Code ===")
+    logger.debug("=== PyLabRobot Simulating Code ===")
     
     # Report to frontend
     if state.get('iteration_reporter'):
@@ -420,10 +429,10 @@ async def simulate_code_node(state: PyLabRobotGraphState) -> PyLabRobotGraphStat
         }
     else:
         try:
-            print("Executing PyLabRobot simulation...")
+            logger.debug("Executing PyLabRobot simulation...")
             # Use the enhanced simulation utility with hardware configuration
             hardware_config = state.get("hardware_config")
-            print(f"Debug - [simulate_code_node] Using hardware config: {hardware_config.get('deck_type', 'unknown') if hardware_config else 'None'}")
+            logger.debug("Using hardware config: %s", hardware_config.get('deck_type', 'unknown') if hardware_config else 'None')
             simulation_results = await run_pylabrobot_simulation(
                 code_to_simulate, 
                 return_structured=True,
@@ -440,11 +449,11 @@ async def simulate_code_node(state: PyLabRobotGraphState) -> PyLabRobotGraphStat
                 "warning_details": simulation_results.get("warning_details", "")
             }
             
-            print(f"Simulation Success: {simulation_results['success']}")
-            print(f"Result Summary: {simulation_results['final_status']}")
+            logger.debug("Simulation Success: %s", simulation_results['success'])
+            logger.debug("Result Summary: %s", simulation_results['final_status'])
             
         except Exception as e:
-            print(f"Error during simulation execution: {e}")
+            logger.exception("Error during simulation execution: %s", e)
             simulation_result = {
                 "success": False,
                 "raw_output": f"Simulation execution error: {e}",
@@ -576,7 +585,7 @@ def _analyze_pylabrobot_error(simulation_output: str) -> dict:
             if match:
                 line_number = int(match.group(1))
                 traceback_start = i
-                print(f"[DEBUG] Found error at line {line_number} in traceback at index {i}")
+                logger.debug("Found error at line %s in traceback at index %s", line_number, i)
                 break
         if line_number:
             break
@@ -591,7 +600,7 @@ def _analyze_pylabrobot_error(simulation_output: str) -> dict:
                 # This looks like actual code
                 if any(keyword in line_content for keyword in ['await', 'lh.', 'source_plate', 'destination_plate', 'tip_rack']):
                     offending_line = line_content
-                    print(f"[DEBUG] Found offending code: {offending_line}")
+                    logger.debug("Found offending code: %s", offending_line)
                     break
         
         # Strategy 2: Build full traceback context for better analysis
@@ -657,7 +666,7 @@ def _analyze_pylabrobot_error(simulation_output: str) -> dict:
                                     extracted_entities["resource_in_error"] = resource_match.group(1)
                                     if len(resource_match.groups()) > 1:
                                         extracted_entities["invalid_index"] = resource_match.group(2)
-                                    print(f"[DEBUG] IndexError - Resource: {resource_match.group(1)}, Index: {resource_match.group(2) if len(resource_match.groups()) > 1 else 'unknown'}")
+                                    logger.debug("IndexError - Resource: %s, Index: %s", resource_match.group(1), resource_match.group(2) if len(resource_match.groups()) > 1 else 'unknown')
                                     break
                             
                             # Strategy 2: If no specific pattern found, try to extract any resource-like name
@@ -721,11 +730,11 @@ def _analyze_pylabrobot_error(simulation_output: str) -> dict:
         context_lines = lines[-10:]
     
     # Debug output for verification
-    print(f"[DEBUG] Error Analysis Results:")
-    print(f"  - Error Type: {detected_error}")
-    print(f"  - Line Number: {line_number}")
-    print(f"  - Offending Code: {offending_line}")
-    print(f"  - Extracted Entities: {extracted_entities}")
+    logger.debug("Error Analysis Results:")
+    logger.debug("  - Error Type: %s", detected_error)
+    logger.debug("  - Line Number: %s", line_number)
+    logger.debug("  - Offending Code: %s", offending_line)
+    logger.debug("  - Extracted Entities: %s", extracted_entities)
     
     return {
         "error_type": detected_error or "Unknown",
@@ -741,7 +750,7 @@ def prepare_feedback_node(state: PyLabRobotGraphState) -> PyLabRobotGraphState:
     """
     Analyze simulation failure and prepare structured, actionable feedback for LLM - enhanced version
     """
-    print("=== Preparing Advanced Feedback for LLM ===")
+    logger.debug("=== Preparing Advanced Feedback for LLM ===")
     
     # Report to frontend
     if state.get('iteration_reporter'):
@@ -760,8 +769,8 @@ def prepare_feedback_node(state: PyLabRobotGraphState) -> PyLabRobotGraphState:
     entities = error_info["extracted_entities"]
     error_message = error_info["error_message"]
     
-    print(f"Detected Error Type: {error_type}")
-    print(f"Extracted Entities: {entities}")
+    logger.debug("Detected Error Type: %s", error_type)
+    logger.debug("Extracted Entities: %s", entities)
     
     # Check for infinite loop detection (borrowed from langchain_agent.py)
     previous_feedback = state.get("feedback_for_llm", {})
@@ -770,7 +779,7 @@ def prepare_feedback_node(state: PyLabRobotGraphState) -> PyLabRobotGraphState:
     is_stuck = error_message == previous_error and state["attempts"] > 1
     
     if is_stuck:
-        print("🔥🔥🔥 LOOP DETECTED! The previous PyLabRobot fix failed. Escalating feedback to LLM. 🔥🔥🔥")
+        logger.info("LOOP DETECTED! The previous PyLabRobot fix failed. Escalating feedback to LLM.")
         # Set force regeneration flag
         state["force_regenerate"] = True
         
@@ -941,7 +950,7 @@ def prepare_feedback_node(state: PyLabRobotGraphState) -> PyLabRobotGraphState:
         # Update entities with the real error line if we got a better one
         if actual_error_line != "unknown" and actual_error_line != entities.get("offending_code", ""):
             entities["actual_error_line"] = actual_error_line
-            print(f"[DEBUG] Updated offending code from traceback to actual: {actual_error_line}")
+            logger.debug("Updated offending code from traceback to actual: %s", actual_error_line)
     
     # Extract error context code snippet
     code_snippet_info = _extract_code_snippet_around_error(current_code, error_info)
@@ -963,8 +972,8 @@ def prepare_feedback_node(state: PyLabRobotGraphState) -> PyLabRobotGraphState:
         "full_traceback": error_info.get("full_traceback", "")
     }
     
-    print(f"Advanced Error Analysis: {analysis}")
-    print(f"Precision Action: {action}")
+    logger.debug("Advanced Error Analysis: %s", analysis, extra=SAMPLED)
+    logger.debug("Precision Action: %s", action)
     
     # Report completion to frontend
     if state.get('iteration_reporter'):
@@ -991,13 +1000,13 @@ def _extract_actual_error_line_from_code(code: str, line_number: int) -> str:
         code_lines = code.split('\n')
         if 1 <= line_number <= len(code_lines):
             actual_line = code_lines[line_number - 1].strip()
-            print(f"[DEBUG] Extracted actual error line {line_number}: {actual_line}")
+            logger.debug("Extracted actual error line %s: %s", line_number, actual_line)
             return actual_line
         else:
-            print(f"[DEBUG] Line number {line_number} out of range (code has {len(code_lines)} lines)")
+            logger.debug("Line number %s out of range (code has %s lines)", line_number, len(code_lines))
             return "line number out of range"
     except Exception as e:
-        print(f"[DEBUG] Error extracting line: {e}")
+        logger.debug("Error extracting line: %s", e)
         return "extraction failed"
 
 def _extract_code_snippet_around_error(code: str, error_info: dict) -> dict:
@@ -1148,12 +1157,12 @@ def should_continue_edge(state: PyLabRobotGraphState) -> str:
     """
     Conditional edge: determine whether to continue iteration
     """
-    print("=== Checking Condition ===")
+    logger.debug("=== Checking Condition ===")
     
     # Get simulation results
     simulation_result = state.get("simulation_result")
     if not simulation_result:
-        print("Condition: No simulation result, continuing.")
+        logger.debug("Condition: No simulation result, continuing.")
         return "continue"
     
     # Check success status
@@ -1161,17 +1170,17 @@ def should_continue_edge(state: PyLabRobotGraphState) -> str:
     
     if success:
         # Success, end process
-        print("✅ PyLabRobot protocol successfully simulated and validated!")
+        logger.debug("✅ PyLabRobot protocol successfully simulated and validated!")
         state["final_outcome"] = "Success"
         return "end"
     elif state["attempts"] >= state["max_attempts"]:
         # Reached maximum attempts, end process
-        print(f"❌ Max attempts ({state['max_attempts']}) reached. PyLabRobot protocol failed to validate.")
+        logger.error("Max attempts (%s) reached. PyLabRobot protocol failed to validate.", state['max_attempts'])
         state["final_outcome"] = "Max attempts reached"
         return "end"
     else:
         # Failed but not reached max attempts, continue loop
-        print(f"🔄 Attempt {state['attempts']} failed. Retrying...")
+        logger.debug("🔄 Attempt %s failed. Retrying...", state['attempts'])
         return "continue"
 
 # Build LangGraph - enhanced version with diff-based repair
@@ -1182,9 +1191,9 @@ def create_pylabrobot_agent():
     workflow = StateGraph(PyLabRobotGraphState)
     
     # Add three independent nodes
-    workflow.add_node("generator", generate_code_node)           # Code generator node
-    workflow.add_node("simulator", simulate_code_node)           # Code simulator node  
-    workflow.add_node("feedback_preparer", prepare_feedback_node) # Feedback preparer node
+    workflow.add_node("generator", instrument_node("pylabrobot", "generator", generate_code_node))  # Code generator node
+    workflow.add_node("simulator", instrument_node("pylabrobot", "simulator", simulate_code_node))  # Code simulator node  
+    workflow.add_node("feedback_preparer", instrument_node("pylabrobot", "feedback_preparer", prepare_feedback_node))  # Feedback preparer node
     
     # Define graph flow
     workflow.add_edge(START, "generator")                        # From start node to code generator
@@ -1201,6 +1210,11 @@ def create_pylabrobot_agent():
     
     return workflow.compile()
 
+@lru_cache(maxsize=None)
+def get_pylabrobot_agent():
+    """Compile the PyLabRobot agent graph on first use and reuse it for later runs."""
+    return create_pylabrobot_agent()
+
 async def run_pylabrobot_agent_and_stream_events(
     user_query: str, 
     hardware_config_str: str, 
@@ -1218,12 +1232,12 @@ async def run_pylabrobot_agent_and_stream_events(
         Dict: Event data for frontend SSE stream
     """
     
-    print(f"🚀 Starting PyLabRobot Protocol Generation Agent")
-    print(f"📝 User Query: {user_query}")
-    print(f"🔄 Max Attempts: {max_attempts}")
+    logger.debug("🚀 Starting PyLabRobot Protocol Generation Agent")
+    logger.debug("📝 User Query: %s", user_query, extra=SAMPLED)
+    logger.debug("🔄 Max Attempts: %s", max_attempts)
     
-    # Create Agent
-    app = create_pylabrobot_agent()
+    # Get (cached) Agent
+    app = get_pylabrobot_agent()
     
     # Create event reporter function
     async def report_event(event_data: Dict):
@@ -1240,15 +1254,15 @@ async def run_pylabrobot_agent_and_stream_events(
     try:
         hardware_config = json.loads(hardware_config_str)
     except json.JSONDecodeError:
-        print(f"Error: Invalid JSON in hardware_config_str. Falling back to default.")
+        logger.warning("Invalid JSON in hardware_config_str. Falling back to default.")
         # Fallback to loading the default configuration
         from .pylabrobot_utils import load_hardware_configuration
         hardware_config = load_hardware_configuration()
 
     dynamic_knowledge = generate_dynamic_pylabrobot_knowledge(hardware_config)
     
-    print(f"Debug - [PyLabRobot Agent] Loaded hardware config: {hardware_config.get('deck_type', 'unknown')}")
-    print(f"Debug - [PyLabRobot Agent] Available resources: {list(hardware_config.get('resources', {}).keys())}")
+    logger.debug("Loaded hardware config: %s", hardware_config.get('deck_type', 'unknown'))
+    logger.debug("Available resources: %s", list(hardware_config.get('resources', {}).keys()))
     
     # Initial state
     initial_state = {
@@ -1274,6 +1288,7 @@ async def run_pylabrobot_agent_and_stream_events(
         "timestamp": asyncio.get_event_loop().time()
     }
     
+    timings = start_run()  # Per-node latency and token totals, sent with final_result
     try:
         # Use astream for real-time event processing
         async for event in app.astream(
@@ -1291,13 +1306,12 @@ async def run_pylabrobot_agent_and_stream_events(
             # but the primary reporting is handled within the nodes.
             # For now, we'll just print a high-level trace.
             
-            print(f"--- Agent Step: {node_name} ---")
+            logger.debug("--- Agent Step: %s ---", node_name)
             # print(f"Output: {node_output}") # Uncomment for verbose logging
 
             # The 'sync_reporter' collects events from nodes. We yield them here.
             while event_queue:
                 yield event_queue.pop(0)
-                await asyncio.sleep(0.01)
 
         # After the stream is finished, the final state is in the last event
         final_state = event.get('__end__', {})
@@ -1313,11 +1327,12 @@ async def run_pylabrobot_agent_and_stream_events(
             "total_attempts": final_state.get('attempts'),
             "final_outcome": final_state.get('final_outcome'),
             "error_report": simulation_result.get('error_details') if not success else None,
-            "message": f"PyLabRobot Agent completed after {final_state.get('attempts')} attempts"
+            "message": f"PyLabRobot Agent completed after {final_state.get('attempts')} attempts",
+            "timings": timings.to_dict()
         }
         
     except Exception as e:
-        print(f"❌ PyLabRobot Agent failed with exception: {e}")
+        logger.exception("PyLabRobot Agent failed with exception: %s", e)
         # Yield a comprehensive error event
         yield {
             "event_type": "error",
@@ -1332,6 +1347,9 @@ async def run_pylabrobot_agent_and_stream_events(
         }
 
 if __name__ == "__main__":
+    from backend.log_utils import configure_logging
+    configure_logging()
+
     # Test function
     async def test_pylabrobot_agent():
         """
@@ -1339,13 +1357,13 @@ if __name__ == "__main__":
         """
         test_query = "Print hello and show deck information"
         
-        print(f"Testing PyLabRobot Agent with query: {test_query}")
+        logger.info("Testing PyLabRobot Agent with query: %s", test_query)
         
         try:
             async for event in run_pylabrobot_agent_and_stream_events(test_query, max_attempts=2):
-                print(f"Event: {event}")
+                logger.info("Event: %s", event)
         except Exception as e:
-            print(f"❌ Test failed with exception: {e}")
+            logger.exception("Test failed with exception: %s", e)
     
     # Run test
     asyncio.run(test_pylabrobot_agent()) 
\ No newline at end of file
@@ -10,6 +10,7 @@ PyLabRobot protocols with real error reporting and feedback.
 """
 
 import asyncio
+import copy
 import traceback
 import re
 import tempfile
@@ -17,9 +18,16 @@ import subprocess
 import sys
 import os
 import json
+import logging
 from pathlib import Path
 from typing import Dict, Any, Union, Optional
 
+from backend.artifact_store import content_hash
+from backend.profile_catalog import profile_catalog
+from backend.server_metrics import SimulationSpan
+
+logger = logging.getLogger(__name__)
+
 # PyLabRobot imports for real simulation
 try:
     from pylabrobot.liquid_handling import LiquidHandler
@@ -36,7 +44,7 @@ try:
         OTDeck = None
     PYLABROBOT_AVAILABLE = True
 except ImportError as e:
-    print(f"Warning: PyLabRobot not available: {e}")
+    logger.warning("PyLabRobot not available: %s", e)
     PYLABROBOT_AVAILABLE = False
 
 # Hardware configuration file path
@@ -70,6 +78,9 @@ def load_hardware_configuration(config_path: Optional[str] = None) -> Dict[str,
     """
     Load hardware configuration from JSON file with fallback to defaults.
     
+    The parsed file is cached by the profile catalog and only re-read when
+    its mtime or size changes; a fresh copy is returned on every call.
+    
     Args:
         config_path: Optional path to hardware configuration file
         
@@ -81,21 +92,30 @@ def load_hardware_configuration(config_path: Optional[str] = None) -> Dict[str,
     
     try:
         if os.path.exists(config_path):
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-            print(f"Debug - [load_hardware_configuration] Loaded config from {config_path}")
+            config = profile_catalog.load_config(config_path)
+            logger.debug("Loaded config from %s", config_path)
             return config
         else:
-            print(f"Debug - [load_hardware_configuration] Config file not found, using defaults")
-            return DEFAULT_HARDWARE_SETUP
+            logger.debug("Config file not found, using defaults")
+            return copy.deepcopy(DEFAULT_HARDWARE_SETUP)
     except Exception as e:
-        print(f"Warning - [load_hardware_configuration] Failed to load config: {e}")
-        return DEFAULT_HARDWARE_SETUP
+        logger.warning("Failed to load config: %s", e)
+        return copy.deepcopy(DEFAULT_HARDWARE_SETUP)
 
 def generate_dynamic_pylabrobot_knowledge(hardware_config: Dict[str, Any]) -> str:
     """
     Generate dynamic PyLabRobot knowledge prompt based on hardware configuration.
     
+    The result is memoized per configuration content hash in the profile
+    catalog, so repeated runs with the same profile reuse the prompt text.
+    See _build_pylabrobot_knowledge for the prompt itself.
+    """
+    return profile_catalog.knowledge_for(hardware_config, _build_pylabrobot_knowledge)
+
+def _build_pylabrobot_knowledge(hardware_config: Dict[str, Any]) -> str:
+    """
+    Build the PyLabRobot knowledge prompt for a hardware configuration.
+    
     This function now generates device-specific knowledge and best practices based on
     the robot_model field, providing tailored guidance for different robot platforms.
     
@@ -292,10 +312,10 @@ async def run_pylabrobot_simulation(
     # Load hardware configuration - prefer passed config over file path
     if hardware_config is not None:
         hw_config = hardware_config
-        print(f"Debug - [run_pylabrobot_simulation] Using provided hardware config")
+        logger.debug("Using provided hardware config")
     else:
         hw_config = load_hardware_configuration(hardware_config_path)
-        print(f"Debug - [run_pylabrobot_simulation] Loaded hardware config from file")
+        logger.debug("Loaded hardware config from file")
     
     # Initialize result data structure (mirroring langchain_agent.py style)
     result_data = {
@@ -309,6 +329,7 @@ async def run_pylabrobot_simulation(
         "hardware_config": hw_config
     }
     
+    span = SimulationSpan("pylabrobot", content_hash(protocol_code))
     try:
         # Run the real async simulation
         try:
@@ -375,6 +396,9 @@ async def run_pylabrobot_simulation(
             return result_data
         else:
             return f"❌ PyLabRobot 模拟执行异常: {error_msg}"
+    finally:
+        span.finish("success" if result_data["success"] else "failure",
+                    result_data["raw_output"] if not result_data["success"] else "")
 
 async def setup_simulation_environment(hardware_config: Dict[str, Any]):
     """
@@ -408,7 +432,7 @@ async def setup_simulation_environment(hardware_config: Dict[str, Any]):
                     self.x, self.y, self.z = x, y, z
         
         robot_model = hardware_config.get("robot_model", "").lower()
-        print(f"Debug - [setup_simulation_environment] Setting up {robot_model} simulation environment")
+        logger.debug("Setting up %s simulation environment", robot_model)
         
         # Use ChatterBoxBackend for reliable simulation
         backend = ChatterBoxBackend()
@@ -417,11 +441,11 @@ async def setup_simulation_environment(hardware_config: Dict[str, Any]):
         if robot_model == "hamilton_star" or robot_model == "hamilton_vantage":
             if STARLetDeck:
                 deck = STARLetDeck()
-                print(f"Debug - [setup_simulation_environment] Using Hamilton deck")
+                logger.debug("Using Hamilton deck")
             else:
                 # Fallback to generic deck
                 deck = Deck(name="hamilton_deck", size_x=600, size_y=400, size_z=120)
-                print(f"Debug - [setup_simulation_environment] Using generic deck (Hamilton imports not available)")
+                logger.debug("Using generic deck (Hamilton imports not available)")
         else:
             # Generic deck
             deck = Deck(
@@ -430,7 +454,7 @@ async def setup_simulation_environment(hardware_config: Dict[str, Any]):
                 size_y=hardware_config.get("size_y", 400), 
                 size_z=hardware_config.get("size_z", 100)
             )
-            print(f"Debug - [setup_simulation_environment] Using generic deck")
+            logger.debug("Using generic deck")
         
         # Create liquid handler
         lh = LiquidHandler(backend=backend, deck=deck)
@@ -440,7 +464,7 @@ async def setup_simulation_environment(hardware_config: Dict[str, Any]):
         resources_config = hardware_config.get('resources', {})
         configured_resources = {}
         
-        print(f"Debug - [setup_simulation_environment] Configuring {len(resources_config)} resources...")
+        logger.debug("Configuring %s resources...", len(resources_config))
         
         for resource_name, resource_info in resources_config.items():
             try:
@@ -490,10 +514,10 @@ async def setup_simulation_environment(hardware_config: Dict[str, Any]):
                     deck.assign_child_resource(resource, location=coord)
                     configured_resources[resource_name] = resource
                     
-                    print(f"Debug - [setup_simulation_environment] Configured {resource_name} ({type(resource).__name__})")
+                    logger.debug("Configured %s (%s)", resource_name, type(resource).__name__)
                     
                 except ImportError as e:
-                    print(f"Warning - [setup_simulation_environment] Could not import PyLabRobot resources: {e}")
+                    logger.warning("Could not import PyLabRobot resources: %s", e)
                     # Create a simple mock object
                     class MockResource:
                         def __init__(self, name):
@@ -508,10 +532,10 @@ async def setup_simulation_environment(hardware_config: Dict[str, Any]):
                             self.name = name
                     
                     configured_resources[resource_name] = MockResource(resource_name)
-                    print(f"Debug - [setup_simulation_environment] Created mock resource {resource_name}")
+                    logger.debug("Created mock resource %s", resource_name)
                     
             except Exception as e:
-                print(f"Warning - [setup_simulation_environment] Failed to configure resource {resource_name}: {e}")
+                logger.warning("Failed to configure resource %s: %s", resource_name, e)
         
         # Monkey-patch get_resource method to return our configured resources
         original_get_resource = getattr(lh, 'get_resource', None)
@@ -520,7 +544,7 @@ async def setup_simulation_environment(hardware_config: Dict[str, Any]):
             if name in configured_resources:
                 return configured_resources[name]
             else:
-                print(f"Warning - Resource '{name}' not found in configuration")
+                logger.warning("Resource '%s' not found in configuration", name)
                 if original_get_resource:
                     return original_get_resource(name)
                 else:
@@ -528,13 +552,13 @@ async def setup_simulation_environment(hardware_config: Dict[str, Any]):
         
         lh.get_resource = get_resource
         
-        print(f"Debug - [setup_simulation_environment] Environment ready with {len(configured_resources)} resources")
-        print(f"Debug - [setup_simulation_environment] Available resources: {list(configured_resources.keys())}")
+        logger.debug("Environment ready with %s resources", len(configured_resources))
+        logger.debug("Available resources: %s", list(configured_resources.keys()))
         
         return lh
         
     except Exception as e:
-        print(f"Error - [setup_simulation_environment] Failed to setup simulation: {e}")
+        logger.exception("Failed to setup simulation: %s", e)
         raise
 
 async def run_pylabrobot_protocol_async(
@@ -601,7 +625,7 @@ async def run_pylabrobot_protocol_async(
     
     try:
         # Set up real simulation environment
-        print("Debug - [run_pylabrobot_protocol_async] Setting up simulation environment...")
+        logger.debug("Setting up simulation environment...")
         lh = await setup_simulation_environment(hardware_config)
         
         # Create safe execution context
@@ -613,7 +637,7 @@ async def run_pylabrobot_protocol_async(
         }
         
         # Execute protocol code to define the function
-        print("Debug - [run_pylabrobot_protocol_async] Executing protocol code...")
+        logger.debug("Executing protocol code...")
         exec(protocol_code, exec_globals)
         
         # Get the protocol function from executed context
@@ -622,7 +646,7 @@ async def run_pylabrobot_protocol_async(
             raise ValueError("Protocol function 'protocol' not found or not callable after code execution")
         
         # Execute the protocol function
-        print("Debug - [run_pylabrobot_protocol_async] Running protocol function...")
+        logger.debug("Running protocol function...")
         await protocol_func(lh)
         
         # Get simulation events/logs
@@ -659,7 +683,7 @@ async def run_pylabrobot_protocol_async(
         execution_info["execution_time"] = asyncio.get_event_loop().time() - start_time
         execution_info["error_type"] = type(e).__name__
         
-        print(f"Debug - [run_pylabrobot_protocol_async] Protocol execution failed: {e}")
+        logger.debug("Protocol execution failed: %s", e)
         
         return {
             "success": False,
@@ -674,9 +698,9 @@ async def run_pylabrobot_protocol_async(
         if lh:
             try:
                 await lh.stop()
-                print("Debug - [run_pylabrobot_protocol_async] Simulation environment cleaned up")
+                logger.debug("Simulation environment cleaned up")
             except Exception as cleanup_error:
-                print(f"Warning - [run_pylabrobot_protocol_async] Cleanup failed: {cleanup_error}")
+                logger.warning("Cleanup failed: %s", cleanup_error)
 
 def get_pylabrobot_error_recommendations(error_output: str) -> str:
     """
@@ -730,15 +754,15 @@ def create_default_hardware_config():
     """
     if not HARDWARE_PROFILES_DIR.exists():
         HARDWARE_PROFILES_DIR.mkdir(parents=True, exist_ok=True)
-        print(f"Debug - [create_default_hardware_config] Created hardware profiles directory")
+        logger.debug("Created hardware profiles directory")
     
     if not DEFAULT_HARDWARE_CONFIG.exists():
         try:
             with open(DEFAULT_HARDWARE_CONFIG, 'w', encoding='utf-8') as f:
                 json.dump(DEFAULT_HARDWARE_SETUP, f, indent=2, ensure_ascii=False)
-            print(f"Debug - [create_default_hardware_config] Created default hardware config at {DEFAULT_HARDWARE_CONFIG}")
+            logger.debug("Created default hardware config at %s", DEFAULT_HARDWARE_CONFIG)
         except Exception as e:
-            print(f"Warning - [create_default_hardware_config] Failed to create default config: {e}")
+            logger.warning("Failed to create default config: %s", e)
 
 def get_available_hardware_profiles() -> list:
     """
@@ -771,13 +795,15 @@ async def protocol(lh):
     print("--- PROTOCOL_SUCCESS ---")
 '''
     
-    print("Testing Enhanced PyLabRobot simulation utility...")
+    logger.info("Testing Enhanced PyLabRobot simulation utility...")
     result = await run_pylabrobot_simulation(test_code, return_structured=True)
-    print(f"Structured result: {result}")
+    logger.info("Structured result: %s", result)
     
     result_str = await run_pylabrobot_simulation(test_code, return_structured=False)
-    print(f"String result: {result_str}")
+    logger.info("String result: %s", result_str)
 
 if __name__ == "__main__":
+    from backend.log_utils import configure_logging
+    configure_logging()
     # Run the async test
     asyncio.run(test_pylabrobot_simulation()) 
\ No newline at end of file
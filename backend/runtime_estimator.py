@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+Opentrons Run-Time Estimator
+============================
+
+Estimates how long an Opentrons protocol will run on the robot from the run
+log printed by ``opentrons.simulate``. The estimate is used to pack the
+instrument calendar; it is a model, not a measurement.
+
+The run log is indented by nesting level (``transfer`` -> ``aspirate`` ...),
+so only leaf lines are costed and composite commands are never counted twice.
+Each leaf line is matched against a table of patterns:
+
+- tip handling (pick up, drop, return) has a fixed cost;
+- aspirate / dispense cost a base time plus volume / flow rate, using the
+  ``at X uL/sec`` rate printed by the simulator when present;
+- moving to a different deck slot adds arm travel proportional to the
+  distance between the slots (OT-2 numeric slots and Flex ``A1``-``D4``);
+- delays are exact, and module commands wait for the temperature ramp,
+  thermocycler profile holds, shaker spin-up and so on.
+
+Lines that match no pattern are counted in ``unparsed_lines`` and cost nothing.
+The returned dict has the same shape as pyFluent's ``RunTimeEstimate.to_dict()``.
+"""
+
+import ast
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+CATEGORIES = ("tips", "pipetting", "travel", "modules", "delays", "other")
+
+# Deck slot pitch (mm): OT-2 slots 1-12 (3 columns, bottom row first), Flex slots A1-D4
+OT2_SLOT_PITCH = (132.5, 90.5)
+FLEX_SLOT_PITCH = (164.0, 107.0)
+
+_SLOT_PATTERN = re.compile(r"\bon (?:slot )?([A-D][1-4]|1[0-2]|[1-9])\b")
+_RATE_PATTERN = re.compile(r"at ([\d.]+) u[lL]/sec")
+_VOLUME_PATTERN = re.compile(r"([\d.]+) u[lL]")
+_DELAY_PATTERN = re.compile(r"Delaying for ([\d.]+) minutes? and ([\d.]+) seconds?")
+_TEMPERATURE_PATTERN = re.compile(r"temperature to (-?[\d.]+)", re.IGNORECASE)
+_HOLD_PATTERN = re.compile(r"hold time of ([\d.]+) (second|minute)", re.IGNORECASE)
+_REPETITIONS_PATTERN = re.compile(r"starting (\d+) repetitions", re.IGNORECASE)
+_STEPS_PATTERN = re.compile(r"(\[\{.*\}\])")
+
+
+@dataclass
+class OpentronsDurationModel:
+    """Per-command costs (seconds) and rates of the Opentrons duration model."""
+    pick_up_tip: float = 6.0
+    drop_tip: float = 5.0
+    return_tip: float = 6.0
+    aspirate_base: float = 1.5
+    dispense_base: float = 1.5
+    default_flow_rate: float = 92.86  # uL/s, P300 default
+    blow_out: float = 1.5
+    touch_tip: float = 2.0
+    air_gap: float = 1.0
+    move_to: float = 1.0
+    travel_base: float = 0.5
+    travel_speed: float = 400.0  # mm/s
+    home: float = 10.0
+    move_labware: float = 20.0
+    magnet: float = 3.0
+    shaker: float = 3.0
+    latch: float = 2.0
+    lid: float = 20.0
+    ambient_temperature: float = 25.0
+    # Ramp rates (degC/s) by module keyword
+    ramp_rates: Dict[str, float] = field(default_factory=lambda: {
+        "thermocycler lid": 0.3,
+        "thermocycler": 2.0,
+        "heater-shaker": 0.1,
+        "temperature module": 0.2,
+    })
+    default_ramp_rate: float = 0.2
+
+
+def format_duration(seconds: float) -> str:
+    """Formats seconds as e.g. ``1 h 02 min 05 s``."""
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours} h {minutes:02d} min {seconds:02d} s"
+    if minutes:
+        return f"{minutes} min {seconds:02d} s"
+    return f"{seconds} s"
+
+
+def slot_coordinates(slot: str) -> Tuple[float, float]:
+    """Returns the (x, y) centre of a deck slot in mm."""
+    if slot[0].isalpha():
+        row = "ABCD".index(slot[0])
+        column = int(slot[1:]) - 1
+        return column * FLEX_SLOT_PITCH[0], (3 - row) * FLEX_SLOT_PITCH[1]
+    index = int(slot) - 1
+    return (index % 3) * OT2_SLOT_PITCH[0], (index // 3) * OT2_SLOT_PITCH[1]
+
+
+def leaf_lines(run_log: str) -> List[str]:
+    """Returns the stripped run log lines that have no deeper-indented children."""
+    entries = []
+    for line in run_log.splitlines():
+        text = line.strip()
+        if not text or text.startswith("---"):
+            continue
+        entries.append((len(line) - len(line.lstrip()), text))
+    return [text for index, (depth, text) in enumerate(entries)
+            if index + 1 == len(entries) or entries[index + 1][0] <= depth]
+
+
+class OpentronsRunEstimator:
+    """Accumulates the duration of an ``opentrons.simulate`` run log."""
+
+    def __init__(self, model: Optional[OpentronsDurationModel] = None):
+        self.model = model or OpentronsDurationModel()
+        self.total_seconds = 0.0
+        self.by_category = dict.fromkeys(CATEGORIES, 0.0)
+        self.by_command: Dict[str, float] = {}
+        self.steps = 0
+        self.unparsed_lines = 0
+        self.pauses = 0
+        self._slot: Optional[str] = None
+        self._temperatures: Dict[str, float] = {}
+
+    def _add(self, command: str, category: str, seconds: float) -> None:
+        self.total_seconds += seconds
+        self.by_category[category] += seconds
+        self.by_command[command] = self.by_command.get(command, 0.0) + seconds
+
+    def _travel(self, command: str, line: str) -> None:
+        slots = _SLOT_PATTERN.findall(line)
+        if not slots:
+            return
+        slot = slots[-1]
+        if slot == self._slot:
+            return
+        seconds = self.model.travel_base
+        if self._slot is not None:
+            (x0, y0), (x1, y1) = slot_coordinates(self._slot), slot_coordinates(slot)
+            seconds += math.hypot(x1 - x0, y1 - y0) / self.model.travel_speed
+        self._slot = slot
+        self._add(command, "travel", seconds)
+
+    def _liquid(self, command: str, line: str, base: float) -> None:
+        volume = _VOLUME_PATTERN.search(line)
+        rate = _RATE_PATTERN.search(line)
+        flow_rate = float(rate.group(1)) if rate else self.model.default_flow_rate
+        seconds = base + (float(volume.group(1)) / flow_rate if volume and flow_rate > 0 else 0.0)
+        self._travel(command, line)
+        self._add(command, "pipetting", seconds)
+
+    def _ramp_rate(self, lower: str) -> Tuple[str, float]:
+        for keyword, rate in self.model.ramp_rates.items():
+            if keyword in lower:
+                return keyword, rate
+        return "module", self.model.default_ramp_rate
+
+    def _set_temperature(self, line: str, lower: str) -> None:
+        match = _TEMPERATURE_PATTERN.search(line)
+        if not match:
+            return
+        module, rate = self._ramp_rate(lower)
+        target = float(match.group(1))
+        current = self._temperatures.get(module, self.model.ambient_temperature)
+        self._temperatures[module] = target
+        seconds = abs(target - current) / rate
+        hold = _HOLD_PATTERN.search(line)
+        if hold:
+            seconds += float(hold.group(1)) * (60 if hold.group(2).lower() == "minute" else 1)
+        self._add("set_temperature", "modules", seconds)
+
+    def _thermocycler_profile(self, line: str) -> None:
+        repetitions = _REPETITIONS_PATTERN.search(line)
+        steps = _STEPS_PATTERN.search(line)
+        if not repetitions or not steps:
+            return
+        try:
+            profile = ast.literal_eval(steps.group(1))
+        except (ValueError, SyntaxError):
+            return
+        _, rate = self._ramp_rate("thermocycler")
+        start = self._temperatures.get("thermocycler", self.model.ambient_temperature)
+
+        def cycle_seconds(current: float) -> Tuple[float, float]:
+            seconds = 0.0
+            for step in profile:
+                target = float(step.get("temperature", current))
+                hold = float(step.get("hold_time_seconds", 0)) + 60 * float(step.get("hold_time_minutes", 0))
+                seconds += abs(target - current) / rate + hold
+                current = target
+            return seconds, current
+
+        # The first cycle ramps from the current block temperature, later cycles from the last step
+        first, end = cycle_seconds(start)
+        repeat, _ = cycle_seconds(end)
+        self._temperatures["thermocycler"] = end
+        self._add("thermocycler_profile", "modules", first + repeat * (int(repetitions.group(1)) - 1))
+
+    def feed(self, line: str) -> None:
+        """Costs one leaf line of the run log."""
+        model = self.model
+        lower = line.lower()
+        self.steps += 1
+        if lower.startswith("picking up tip"):
+            self._travel("pick_up_tip", line)
+            self._add("pick_up_tip", "tips", model.pick_up_tip)
+        elif lower.startswith("dropping tip"):
+            self._travel("drop_tip", line)
+            self._add("drop_tip", "tips", model.drop_tip)
+        elif lower.startswith("returning tip"):
+            self._travel("return_tip", line)
+            self._add("return_tip", "tips", model.return_tip)
+        elif lower.startswith("aspirating"):
+            self._liquid("aspirate", line, model.aspirate_base)
+        elif lower.startswith("dispensing"):
+            self._liquid("dispense", line, model.dispense_base)
+        elif lower.startswith("blowing out"):
+            self._travel("blow_out", line)
+            self._add("blow_out", "pipetting", model.blow_out)
+        elif lower.startswith("touching tip"):
+            self._add("touch_tip", "pipetting", model.touch_tip)
+        elif lower.startswith("air gap"):
+            self._add("air_gap", "pipetting", model.air_gap)
+        elif lower.startswith("moving labware"):
+            self._add("move_labware", "other", model.move_labware)
+        elif lower.startswith("moving to"):
+            self._travel("move_to", line)
+            self._add("move_to", "travel", model.move_to)
+        elif lower.startswith("delaying"):
+            match = _DELAY_PATTERN.search(line)
+            if match:
+                self._add("delay", "delays", float(match.group(1)) * 60 + float(match.group(2)))
+        elif lower.startswith("pausing"):
+            self.pauses += 1
+        elif lower.startswith("homing"):
+            self._add("home", "other", model.home)
+        elif "repetitions" in lower:
+            self._thermocycler_profile(line)
+        elif "temperature to" in lower:
+            self._set_temperature(line, lower)
+        elif "engaging magnetic" in lower or "disengaging magnetic" in lower:
+            self._add("magnet", "modules", model.magnet)
+        elif "shake" in lower:
+            self._add("shake", "modules", model.shaker)
+        elif "latch" in lower:
+            self._add("latch", "modules", model.latch)
+        elif "lid" in lower and ("open" in lower or "clos" in lower):
+            self._add("lid", "modules", model.lid)
+        elif lower.startswith(("deactivating", "commenting")) or lower.startswith("#"):
+            pass
+        else:
+            self.steps -= 1
+            self.unparsed_lines += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total_seconds": round(self.total_seconds, 1),
+            "total_human": format_duration(self.total_seconds),
+            "commands": self.steps,
+            "unparsed_lines": self.unparsed_lines,
+            "pauses": self.pauses,
+            "by_category": {name: round(value, 1) for name, value in self.by_category.items()},
+            "by_command": {name: round(value, 1) for name, value in self.by_command.items()},
+        }
+
+
+def estimate_opentrons_run(run_log: str, model: Optional[OpentronsDurationModel] = None) -> Dict[str, Any]:
+    """
+    Estimates the run duration of a protocol from its ``opentrons.simulate`` run log.
+
+    Args:
+        run_log: stdout of ``python -m opentrons.simulate protocol.py``
+        model: duration model, defaults to ``OpentronsDurationModel()``
+
+    Returns:
+        Dict with ``total_seconds``, ``total_human``, ``by_category``, ``by_command``,
+        ``commands`` (costed log lines), ``unparsed_lines`` and ``pauses``
+        (manual pauses, not included in the total).
+    """
+    estimator = OpentronsRunEstimator(model)
+    for line in leaf_lines(run_log):
+        estimator.feed(line)
+    return estimator.to_dict()
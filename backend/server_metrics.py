@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Service Metrics
+===============
+
+The operational metrics of the API server, exposed in the Prometheus text
+format at ``GET /metrics`` (``backend.metrics.render_prometheus``).
+
+- ``MetricsMiddleware`` counts every HTTP request by method, route template
+  (``/api/artifacts/code/{code_hash}``, not the raw path) and status, and
+  observes its duration until the last body chunk (for SSE endpoints: the
+  whole stream).
+- ``SimulationSpan`` is started by the Opentrons and PyLabRobot simulators;
+  it tracks the simulations in progress (the simulator queue depth), counts
+  finished ones as ``success``, ``timeout`` or ``failure`` and records each
+  one as a trace span with the code hash and error class.
+- ``track_generation(pipeline, events)`` wraps a generation event stream: it
+  tracks the generations in progress and records the outcome and the
+  ``total_attempts`` of the ``final_result`` event, also on the request's
+  root trace span.
+- ``cache_counters(cache)`` returns the hit / miss counters of a cache; the
+  hit ratio gauges are derived from them at scrape time.
+- ``EventLoopLagMonitor`` samples how late the event loop wakes up from a
+  short sleep, i.e. how long handlers block it.
+- LLM request latency by model is observed by ``backend.node_timing``.
+
+Updating a metric is a dictionary lookup and a lock-protected addition, so
+the hot paths only pay a few microseconds per request.
+"""
+
+import asyncio
+import re
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend import tracing
+from backend.metrics import REGISTRY, counter, gauge, histogram
+
+HTTP_REQUESTS = counter("labscript_http_requests_total", "HTTP requests by method, route and status",
+                        ("method", "route", "status"))
+HTTP_REQUEST_SECONDS = histogram("labscript_http_request_seconds",
+                                 "HTTP request duration until the last body chunk", ("method", "route"))
+HTTP_REQUESTS_IN_PROGRESS = gauge("labscript_http_requests_in_progress", "HTTP requests being served")
+
+SIMULATIONS = counter("labscript_simulations_total", "Protocol simulations by simulator and result",
+                      ("simulator", "result"))
+SIMULATION_SECONDS = histogram("labscript_simulation_seconds", "Protocol simulation duration", ("simulator",))
+SIMULATIONS_IN_PROGRESS = gauge("labscript_simulations_in_progress",
+                                "Protocol simulations running (simulator queue depth)", ("simulator",))
+
+GENERATIONS = counter("labscript_generations_total", "Generation runs by pipeline and outcome",
+                      ("pipeline", "outcome"))
+GENERATIONS_IN_PROGRESS = gauge("labscript_generations_in_progress", "Generation runs in progress", ("pipeline",))
+GENERATION_ATTEMPTS = histogram("labscript_generation_attempts", "Code generation attempts per run", ("pipeline",),
+                                buckets=(1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 15, 20))
+
+LLM_REQUEST_SECONDS = histogram("labscript_llm_request_seconds", "LLM request latency by model and outcome",
+                                ("model", "outcome"))
+
+CACHE_LOOKUPS = counter("labscript_cache_lookups_total", "Cache lookups by cache and result", ("cache", "result"))
+CACHE_HIT_RATIO = gauge("labscript_cache_hit_ratio", "Share of cache lookups that were hits", ("cache",))
+
+EVENT_LOOP_LAG = gauge("labscript_event_loop_lag_last_seconds", "Latest event loop lag sample")
+EVENT_LOOP_LAG_SECONDS = histogram("labscript_event_loop_lag_seconds", "Event loop lag samples",
+                                   buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+
+# Route label of requests that matched no route (keeps 404 scans from adding label values)
+UNMATCHED_ROUTE = "<unmatched>"
+
+# Exception class at the start of a line of simulator output ("KeyError: 'A13'")
+ERROR_CLASS_REGEX = re.compile(r"^\s*(?:[\w.]+\.)?(\w*(?:Error|Exception))\b", re.MULTILINE)
+
+
+# ----------------------------------------------------------------------
+# HTTP
+# ----------------------------------------------------------------------
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request counts, durations and concurrency.
+
+    The route label is the path template of the matched route, which the
+    router stores in the scope before the response starts.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_PROGRESS.dec()
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+            method = scope["method"]
+            HTTP_REQUESTS.labels(method, route, status).inc()
+            HTTP_REQUEST_SECONDS.labels(method, route).observe(time.perf_counter() - start)
+
+
+# ----------------------------------------------------------------------
+# Simulations and generations
+# ----------------------------------------------------------------------
+
+def error_class(output: str) -> Optional[str]:
+    """The last exception class named at the start of a line of ``output``."""
+    matches = ERROR_CLASS_REGEX.findall(output or "")
+    return matches[-1] if matches else None
+
+
+class SimulationSpan:
+    """One simulator invocation; ``finish()`` must be called exactly once."""
+
+    __slots__ = ("simulator", "start", "trace_span")
+
+    def __init__(self, simulator: str, code_hash: Optional[str] = None):
+        self.simulator = simulator
+        self.start = time.perf_counter()
+        self.trace_span = tracing.start_span(f"simulation.{simulator}", {"labscript.simulator": simulator,
+                                                                          "labscript.code_hash": code_hash})
+        SIMULATIONS_IN_PROGRESS.labels(simulator).inc()
+
+    def finish(self, result: str, error_output: str = "") -> None:
+        """
+        Records the simulation as ``success``, ``timeout`` or ``failure``; the
+        error class of a failure is taken from ``error_output``.
+        """
+        SIMULATIONS_IN_PROGRESS.labels(self.simulator).dec()
+        SIMULATIONS.labels(self.simulator, result).inc()
+        SIMULATION_SECONDS.labels(self.simulator).observe(time.perf_counter() - self.start)
+        self.trace_span.set_attribute("labscript.simulation.result", result)
+        if result != "success":
+            self.trace_span.set_error(error_class(error_output) or result, error_output[-500:])
+        self.trace_span.end()
+
+
+def generation_outcome(final_result: Dict[str, Any]) -> str:
+    """Outcome label of a ``final_result`` event (its status, or success/failure)."""
+    if final_result.get("status"):
+        return str(final_result["status"])
+    if "success" in final_result:
+        return "success" if final_result["success"] else "failure"
+    return "completed"
+
+
+async def track_generation(pipeline: str, events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """Passes ``events`` through while recording the run in the generation metrics."""
+    outcome = "aborted"  # the client went away before the run finished
+    in_progress = GENERATIONS_IN_PROGRESS.labels(pipeline)
+    in_progress.inc()
+    try:
+        async for event in events:
+            event_type = event.get("event_type") if isinstance(event, dict) else None
+            if event_type == "final_result":
+                outcome = generation_outcome(event)
+                attempts = event.get("total_attempts")
+                if isinstance(attempts, int):
+                    GENERATION_ATTEMPTS.labels(pipeline).observe(attempts)
+                    tracing.current_span().set_attribute("labscript.generation.attempts", attempts)
+            elif event_type == "error" or (isinstance(event, dict) and event.get("event") == "error"):
+                outcome = "error"
+            elif outcome == "aborted" and isinstance(event, dict) and event.get("event") == "done":
+                outcome = "success"
+            yield event
+        if outcome == "aborted":
+            outcome = "completed"
+    finally:
+        in_progress.dec()
+        GENERATIONS.labels(pipeline, outcome).inc()
+        root = tracing.current_span()
+        root.set_attributes({"labscript.pipeline": pipeline, "labscript.generation.outcome": outcome})
+        if outcome not in ("success", "completed"):
+            root.set_error(outcome)
+
+
+# ----------------------------------------------------------------------
+# Caches
+# ----------------------------------------------------------------------
+
+def cache_counters(cache: str) -> Tuple[Any, Any]:
+    """The (hit, miss) counters of ``cache``; owners keep them and call ``inc()``."""
+    return CACHE_LOOKUPS.labels(cache, "hit"), CACHE_LOOKUPS.labels(cache, "miss")
+
+
+def _update_cache_hit_ratios() -> None:
+    lookups: Dict[str, Dict[str, float]] = {}
+    for labels, child in CACHE_LOOKUPS.children():
+        lookups.setdefault(labels["cache"], {})[labels["result"]] = child.value
+    for cache, results in lookups.items():
+        total = results.get("hit", 0.0) + results.get("miss", 0.0)
+        if total:
+            CACHE_HIT_RATIO.labels(cache).set(results.get("hit", 0.0) / total)
+
+
+REGISTRY.add_collect_hook(_update_cache_hit_ratios)
+
+
+# ----------------------------------------------------------------------
+# Event loop lag
+# ----------------------------------------------------------------------
+
+class EventLoopLagMonitor:
+    """
+    Background task measuring how much later than requested the event loop
+    wakes up from ``asyncio.sleep(interval)``.
+
+    Args:
+        interval: Seconds between two samples.
+    """
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            EVENT_LOOP_LAG.set(lag)
+            EVENT_LOOP_LAG_SECONDS.observe(lag)
+
+    def start(self) -> None:
+        """Starts sampling on the running event loop (no-op if already running)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Server-Sent Events Utility
+==========================
+
+A shared writer for all SSE endpoints in ``api_server.py``.
+
+The endpoints produce plain event dictionaries; ``SSEWriter`` turns them into
+wire frames. Consecutive token events (e.g. ``{"token": "..."}`` from the SOP
+stream) are coalesced into a single frame within a small time/size window,
+every frame carries an incremental ``id:`` field, idle connections receive
+heartbeat comments, and any non-token (control) event flushes the pending
+tokens and is sent immediately.
+
+Frame layout keeps the ``data:`` line first so that simple line-based clients
+continue to work:
+
+    data: {"token": "..."}
+    id: 7
+
+"""
+
+import asyncio
+import json
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional
+
+# Default coalescing window for token events
+DEFAULT_FLUSH_INTERVAL = 0.02       # seconds
+DEFAULT_MAX_BATCH_BYTES = 1024      # bytes of buffered token text
+DEFAULT_HEARTBEAT_INTERVAL = 15.0   # seconds of idleness before a comment frame
+
+HEARTBEAT_FRAME = ": keep-alive\n\n"
+
+# Sentinel marking the end of the upstream event source
+_END_OF_STREAM = object()
+
+
+class _UpstreamFailure:
+    """Carries an exception raised by the event source across the queue."""
+
+    __slots__ = ("error",)
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class SSEWriter:
+    """
+    Formats event dictionaries as SSE frames with token coalescing.
+
+    Args:
+        token_key: The key identifying coalescible token events. An event is
+            coalesced only when it is a dict whose sole key is ``token_key``
+            and whose value is a string.
+        flush_interval: Maximum time (seconds) a token may wait in the buffer.
+        max_batch_bytes: Buffered token size that forces an immediate flush.
+        heartbeat_interval: Idle time (seconds) after which a heartbeat comment
+            is written. ``None`` disables heartbeats.
+    """
+
+    def __init__(
+        self,
+        token_key: str = "token",
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_batch_bytes: int = DEFAULT_MAX_BATCH_BYTES,
+        heartbeat_interval: Optional[float] = DEFAULT_HEARTBEAT_INTERVAL,
+    ):
+        self.token_key = token_key
+        self.flush_interval = flush_interval
+        self.max_batch_bytes = max_batch_bytes
+        self.heartbeat_interval = heartbeat_interval
+        self._next_id = 0
+
+    def format_event(self, payload: Dict[str, Any]) -> str:
+        """Serializes a single event as an SSE frame with the next event id."""
+        self._next_id += 1
+        data = json.dumps(payload, ensure_ascii=False)
+        return f"data: {data}\nid: {self._next_id}\n\n"
+
+    def _is_token_event(self, event: Any) -> bool:
+        return (
+            isinstance(event, dict)
+            and len(event) == 1
+            and isinstance(event.get(self.token_key), str)
+        )
+
+    def _flush_tokens(self, tokens: List[str]) -> str:
+        frame = self.format_event({self.token_key: "".join(tokens)})
+        tokens.clear()
+        return frame
+
+    async def stream(self, events: AsyncIterator[Dict[str, Any]]) -> AsyncGenerator[str, None]:
+        """
+        Consumes an async iterator of event dicts and yields SSE frames.
+
+        The source is drained by a background task so that waiting for the
+        flush deadline or the heartbeat never cancels the source generator
+        itself. Exceptions raised by the source are re-raised here after any
+        buffered tokens have been flushed.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def pump() -> None:
+            try:
+                async for event in events:
+                    await queue.put(event)
+            except Exception as e:
+                await queue.put(_UpstreamFailure(e))
+            finally:
+                await queue.put(_END_OF_STREAM)
+
+        producer = asyncio.create_task(pump())
+        tokens: List[str] = []
+        buffered_bytes = 0
+        deadline = 0.0
+
+        try:
+            while True:
+                if tokens:
+                    timeout = max(0.0, deadline - loop.time())
+                else:
+                    timeout = self.heartbeat_interval
+
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    if tokens:
+                        buffered_bytes = 0
+                        yield self._flush_tokens(tokens)
+                    else:
+                        yield HEARTBEAT_FRAME
+                    continue
+
+                if item is _END_OF_STREAM:
+                    break
+
+                if isinstance(item, _UpstreamFailure):
+                    if tokens:
+                        yield self._flush_tokens(tokens)
+                    raise item.error
+
+                if self._is_token_event(item):
+                    text = item[self.token_key]
+                    if not tokens:
+                        deadline = loop.time() + self.flush_interval
+                        buffered_bytes = 0
+                    tokens.append(text)
+                    buffered_bytes += len(text.encode("utf-8"))
+                    if buffered_bytes >= self.max_batch_bytes:
+                        buffered_bytes = 0
+                        yield self._flush_tokens(tokens)
+                    continue
+
+                # Control event: flush pending tokens first to preserve order
+                if tokens:
+                    buffered_bytes = 0
+                    yield self._flush_tokens(tokens)
+                yield self.format_event(item)
+
+            if tokens:
+                yield self._flush_tokens(tokens)
+        finally:
+            if not producer.done():
+                producer.cancel()
+                try:
+                    await producer
+                except (asyncio.CancelledError, Exception):
+                    pass
+
+
+def sse_stream(events: AsyncIterator[Dict[str, Any]], **writer_options: Any) -> AsyncGenerator[str, None]:
+    """Convenience wrapper: formats ``events`` with a fresh ``SSEWriter``."""
+    return SSEWriter(**writer_options).stream(events)
@@ -0,0 +1,427 @@
+# -*- coding: utf-8 -*-
+"""
+Request Tracing
+===============
+
+OpenTelemetry-compatible spans for reconstructing a generation run, exported
+to local JSONL files so that no collector is needed.
+
+- ``TracingMiddleware`` opens a root (server) span per API request. It joins
+  the trace of an incoming W3C ``traceparent`` header, and returns the trace
+  ID as the run ID in the ``X-Run-ID`` response header. For SSE endpoints the
+  root span lasts until the stream ends. Root spans carry the
+  ``labscript.root`` attribute, since one that joined a trace has a parent.
+- ``span(name, attributes)`` is a context manager for a child of the current
+  span; ``start_span()`` / ``Span.end()`` are for spans that do not fit a
+  ``with`` block (LLM callbacks, simulations). The current span is held in a
+  ContextVar, so children follow the request into ``asyncio.to_thread`` and
+  the LangGraph nodes.
+- Child spans are opened for graph nodes (``backend.node_timing``), LLM calls,
+  Opentrons / PyLabRobot simulations and diff application, with attributes
+  such as ``labscript.attempt``, ``labscript.code_hash`` and ``error.type``.
+- Finished spans are queued and written by a background thread to
+  ``<LABSCRIPT_TRACE_DIR>/spans.jsonl`` as OTLP/JSON ``resourceSpans`` lines
+  (the format read by the collector's ``otlpjsonfile`` receiver). The file is
+  rotated at ``LABSCRIPT_TRACE_MAX_BYTES`` with ``TRACE_BACKUP_COUNT`` backups.
+- ``find_trace(run_id)`` and ``recent_runs()`` read the spans back for the
+  admin endpoints in ``api_server.py``.
+
+Environment variables:
+    LABSCRIPT_TRACING: ``0`` disables tracing; spans are then no-ops.
+    LABSCRIPT_TRACE_DIR: Output directory (default ``traces/`` in the project).
+    LABSCRIPT_TRACE_MAX_BYTES: Size at which ``spans.jsonl`` is rotated
+        (default 50 MB).
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.log_utils import request_id_var
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "labscript-ai"
+SCOPE_NAME = "backend.tracing"
+TRACE_FILE_NAME = "spans.jsonl"
+TRACE_BACKUP_COUNT = 3
+DEFAULT_TRACE_DIR = Path(__file__).parent.parent / "traces"
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# Attribute marking the root span of a request, whether or not it has a remote parent
+ROOT_ATTRIBUTE = "labscript.root"
+TRACEPARENT_REGEX = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+TRACING_ENABLED = os.getenv("LABSCRIPT_TRACING", "1").lower() not in ("0", "false", "no")
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+def _plain_attributes(attributes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    plain = {}
+    for attribute in attributes:
+        (kind, value), = attribute["value"].items()
+        plain[attribute["key"]] = int(value) if kind == "intValue" else value
+    return plain
+
+
+class Span:
+    """A span being recorded; ``end()`` exports it."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "kind", "start_ns", "end_ns",
+                 "attributes", "events", "status_code", "status_message")
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: str = "", kind: int = SPAN_KIND_INTERNAL,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes: Dict[str, Any] = {}
+        self.events: List[Dict[str, Any]] = []
+        self.status_code = STATUS_UNSET
+        self.status_message = ""
+        if attributes:
+            self.set_attributes(attributes)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def add_event(self, name: str, attributes: Optional[Dict[str, Any]] = None) -> None:
+        self.events.append({"timeUnixNano": str(time.time_ns()), "name": name,
+                            "attributes": _otlp_attributes(attributes or {})})
+
+    def set_error(self, error_type: str, message: str = "") -> None:
+        """Marks the span as failed with ``error.type`` = ``error_type``."""
+        self.attributes["error.type"] = error_type
+        self.status_code = STATUS_ERROR
+        self.status_message = message[:500]
+
+    def record_exception(self, error: BaseException) -> None:
+        self.add_event("exception", {"exception.type": type(error).__name__,
+                                     "exception.message": str(error)[:2000]})
+        self.set_error(type(error).__name__, str(error))
+
+    def end(self) -> None:
+        if self.end_ns:
+            return
+        self.end_ns = time.time_ns()
+        _exporter.export(self)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _otlp_attributes(self.attributes),
+            "events": self.events,
+            "status": {"code": self.status_code, "message": self.status_message},
+        }
+
+
+class _NoopSpan:
+    """Stand-in for spans that are not recorded (tracing disabled, or outside a request)."""
+
+    trace_id = ""
+    span_id = ""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        pass
+
+    def add_event(self, name: str, attributes: Optional[Dict[str, Any]] = None) -> None:
+        pass
+
+    def set_error(self, error_type: str, message: str = "") -> None:
+        pass
+
+    def record_exception(self, error: BaseException) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("trace_span", default=None)
+
+
+def current_span():
+    """The span of the current context (a no-op span outside of any trace)."""
+    return _current_span.get() or NOOP_SPAN
+
+
+def start_span(name: str, attributes: Optional[Dict[str, Any]] = None, kind: int = SPAN_KIND_INTERNAL,
+               parent: Optional[Span] = None):
+    """
+    Starts a span that is *not* made current. It is a child of ``parent`` (by
+    default the current span); without a parent a new trace is started only
+    for server spans, other spans outside a request are not recorded.
+    """
+    if not TRACING_ENABLED:
+        return NOOP_SPAN
+    parent = parent or _current_span.get()
+    if parent is None:
+        if kind != SPAN_KIND_SERVER:
+            return NOOP_SPAN
+        return Span(name, secrets.token_hex(16), "", kind, attributes)
+    return Span(name, parent.trace_id, parent.span_id, kind, attributes)
+
+
+@contextmanager
+def span(name: str, attributes: Optional[Dict[str, Any]] = None, kind: int = SPAN_KIND_INTERNAL) -> Iterator[Any]:
+    """Records ``name`` as a child of the current span around the ``with`` block."""
+    child = start_span(name, attributes, kind)
+    if child is NOOP_SPAN:
+        yield child
+        return
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end()
+
+
+# ----------------------------------------------------------------------
+# Export
+# ----------------------------------------------------------------------
+
+class JsonlSpanExporter:
+    """
+    Writes finished spans as OTLP/JSON lines from a background thread, rotating
+    the file when it grows past ``max_bytes``.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = DEFAULT_MAX_BYTES, backup_count: int = TRACE_BACKUP_COUNT):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._queue: "queue.SimpleQueue[Optional[Span]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> Path:
+        return self.directory / TRACE_FILE_NAME
+
+    def files(self) -> List[Path]:
+        """The trace files, newest first."""
+        candidates = [self.path] + [self.path.with_name(f"{TRACE_FILE_NAME}.{i}") for i in range(1, self.backup_count + 1)]
+        return [path for path in candidates if path.exists()]
+
+    def export(self, finished: Span) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.shutdown)
+        self._queue.put(finished)
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._write(batch)
+                    return
+                batch.append(item)
+            self._write(batch)
+
+    def _write(self, batch: List[Span]) -> None:
+        line = json.dumps({"resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": SERVICE_NAME})},
+            "scopeSpans": [{"scope": {"name": SCOPE_NAME}, "spans": [s.to_otlp() for s in batch]}],
+        }]}, ensure_ascii=False)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if self.path.exists() and self.path.stat().st_size + len(line) > self.max_bytes:
+                self._rotate()
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            logger.warning("Failed to write %d spans to %s: %s", len(batch), self.path, e)
+
+    def _rotate(self) -> None:
+        for i in range(self.backup_count, 0, -1):
+            source = self.path if i == 1 else self.path.with_name(f"{TRACE_FILE_NAME}.{i - 1}")
+            if source.exists():
+                os.replace(source, self.path.with_name(f"{TRACE_FILE_NAME}.{i}"))
+
+    def shutdown(self) -> None:
+        """Writes the queued spans and stops the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout=5)
+
+
+_exporter = JsonlSpanExporter(Path(os.getenv("LABSCRIPT_TRACE_DIR", DEFAULT_TRACE_DIR)),
+                              int(os.getenv("LABSCRIPT_TRACE_MAX_BYTES", DEFAULT_MAX_BYTES)))
+
+
+def _read_spans(needle: str = "") -> Iterator[Dict[str, Any]]:
+    for path in _exporter.files():
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if needle and needle not in line:
+                    continue
+                try:
+                    payload = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # partially written last line
+                for resource_spans in payload.get("resourceSpans", []):
+                    for scope_spans in resource_spans.get("scopeSpans", []):
+                        yield from scope_spans.get("spans", [])
+
+
+def span_summary(otlp_span: Dict[str, Any]) -> Dict[str, Any]:
+    """A readable view of an OTLP/JSON span: ids, timing, status and plain attributes."""
+    start, end = int(otlp_span["startTimeUnixNano"]), int(otlp_span["endTimeUnixNano"])
+    return {
+        "name": otlp_span["name"],
+        "span_id": otlp_span["spanId"],
+        "parent_span_id": otlp_span["parentSpanId"] or None,
+        "start_time_unix_nano": start,
+        "duration_ms": round((end - start) / 1e6, 3),
+        "status": {STATUS_UNSET: "unset", STATUS_OK: "ok", STATUS_ERROR: "error"}[otlp_span["status"]["code"]],
+        "status_message": otlp_span["status"]["message"] or None,
+        "attributes": _plain_attributes(otlp_span["attributes"]),
+        "events": [{"name": event["name"], "attributes": _plain_attributes(event["attributes"])}
+                   for event in otlp_span.get("events", [])],
+    }
+
+
+def find_trace(run_id: str) -> List[Dict[str, Any]]:
+    """
+    Spans of the run ``run_id`` (a trace ID, or the request ID of its root
+    span), sorted by start time.
+    """
+    trace_id = run_id
+    if not re.fullmatch(r"[0-9a-f]{32}", run_id):
+        for candidate in _read_spans(run_id):
+            if _plain_attributes(candidate["attributes"]).get("labscript.request_id") == run_id:
+                trace_id = candidate["traceId"]
+                break
+        else:
+            return []
+    spans = [span_summary(s) for s in _read_spans(trace_id) if s["traceId"] == trace_id]
+    return sorted(spans, key=lambda s: s["start_time_unix_nano"])
+
+
+def recent_runs(limit: int = 20) -> List[Dict[str, Any]]:
+    """The latest request root spans (including those that joined a ``traceparent``), newest first."""
+    roots = [dict(span_summary(s), run_id=s["traceId"]) for s in _read_spans(f'"{ROOT_ATTRIBUTE}"')
+             if _plain_attributes(s["attributes"]).get(ROOT_ATTRIBUTE)]
+    roots.sort(key=lambda s: s["start_time_unix_nano"], reverse=True)
+    return roots[:limit]
+
+
+# ----------------------------------------------------------------------
+# Root spans
+# ----------------------------------------------------------------------
+
+class TracingMiddleware:
+    """ASGI middleware opening the root span of every HTTP request."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        attributes = {"http.request.method": method, "url.path": scope["path"],
+                      "labscript.request_id": request_id_var.get(), ROOT_ATTRIBUTE: True}
+
+        root = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                match = TRACEPARENT_REGEX.match(value.decode("latin-1").strip())
+                if match:
+                    root = Span(method, match.group(1), match.group(2), SPAN_KIND_SERVER, attributes)
+                break
+        root = root or start_span(method, attributes, SPAN_KIND_SERVER, parent=None)
+        token = _current_span.set(root)
+
+        async def send_with_run_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.response.status_code", message["status"])
+                if message["status"] >= 500:
+                    root.set_error(str(message["status"]))
+                MutableHeaders(scope=message)["X-Run-ID"] = root.trace_id
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_run_id)
+        except BaseException as e:
+            root.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            route = getattr(scope.get("route"), "path", None)
+            root.name = f"{method} {route}" if route else method
+            root.set_attribute("http.route", route)
+            root.end()
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for LabscriptAI
+==========================
+
+独立的性能基准脚本（不属于测试套件），在项目根目录下以模块方式运行，例如：
+
+    python -m benchmarks.bench_compression
+"""
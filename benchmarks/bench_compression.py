@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Compression / ETag benchmark
+============================
+
+Measures compressed size and compression time of typical API payloads for
+each content coding supported by ``backend.http_utils``:
+
+- ``/api/pylabrobot/profiles`` response (built from backend/hardware_profiles)
+- protocol code (archive/backend/OT2protocolcode)
+- SOP markdown (README.md as a stand-in for a long SOP)
+- simulator log (synthetic Opentrons ``simulate`` output)
+- a code generation SSE stream, compressed frame by frame with sync flushes
+
+Usage:
+    python -m benchmarks.bench_compression [--repeat N]
+"""
+
+import argparse
+import json
+from typing import List, Tuple
+
+from backend.http_utils import BROTLI_AVAILABLE, _StreamCompressor, compress_bytes, make_etag
+from benchmarks.common import PROJECT_ROOT, print_table, time_call
+
+
+def load_profiles_payload() -> bytes:
+    profiles = []
+    for config_file in sorted((PROJECT_ROOT / "backend" / "hardware_profiles").glob("pylabrobot_*.json")):
+        config = json.loads(config_file.read_text(encoding="utf-8"))
+        profiles.append({
+            "id": config_file.stem,
+            "robot_model": config.get("robot_model", "unknown"),
+            "display_name": config.get("robot_model", "unknown").replace("_", " ").title(),
+            "manufacturer": config.get("manufacturer", "Unknown"),
+            "description": config.get("description", ""),
+            "precision_class": config.get("precision_class", "standard"),
+            "volume_range": config.get("volume_range", {"min_ul": 1, "max_ul": 1000}),
+            "special_features": config.get("special_features", []),
+            "recommended_for": config.get("recommended_for", []),
+            "default_config": config,
+        })
+    return json.dumps({"success": True, "profiles": profiles, "timestamp": "2025-01-01T00:00:00"}).encode("utf-8")
+
+
+def load_protocol_code() -> bytes:
+    return (PROJECT_ROOT / "archive" / "backend" / "OT2protocolcode" / "01_DNA_Lib_Prep_Illumina.py").read_bytes()
+
+
+def load_sop_markdown() -> bytes:
+    return (PROJECT_ROOT / "README.md").read_bytes()
+
+
+def build_simulation_log(steps: int = 2000) -> bytes:
+    lines = []
+    for i in range(steps):
+        column = i % 12 + 1
+        row = "ABCDEFGH"[i % 8]
+        lines.append(f"Picking up tip from {row}{column} of Opentrons 96 Tip Rack 300 µL on 1")
+        lines.append(f"Aspirating 50.0 uL from {row}{column} of NEST 96 Well Plate 100 µL PCR Full Skirt on 2 at 92.86 uL/sec")
+        lines.append(f"Dispensing 50.0 uL into {row}{column} of NEST 96 Well Plate 100 µL PCR Full Skirt on 3 at 92.86 uL/sec")
+        lines.append("Dropping tip into Trash on 12")
+    return "\n".join(lines).encode("utf-8")
+
+
+def build_sse_frames(code: bytes, attempts: int = 5) -> List[bytes]:
+    text = code.decode("utf-8")
+    frames = []
+    for attempt in range(1, attempts + 1):
+        for event in (
+            {"event_type": "node_complete", "node_name": "generator", "attempt_num": attempt},
+            {"event_type": "code_generated", "attempt_num": attempt, "generated_code": text},
+            {"event_type": "attempt_result", "attempt_num": attempt, "final_code": text},
+        ):
+            frames.append(f"data: {json.dumps(event)}\nid: {len(frames) + 1}\n\n".encode("utf-8"))
+    return frames
+
+
+def compress_stream(frames: List[bytes], encoding: str) -> int:
+    compressor = _StreamCompressor(encoding, 6, 4)
+    total = sum(len(compressor.compress(frame, flush=True)) for frame in frames)
+    return total + len(compressor.finish())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark response compression on typical payloads")
+    parser.add_argument("--repeat", type=int, default=5, help="timing rounds per measurement")
+    args = parser.parse_args()
+
+    payloads: List[Tuple[str, bytes]] = [
+        ("profiles", load_profiles_payload()),
+        ("protocol_code", load_protocol_code()),
+        ("sop_markdown", load_sop_markdown()),
+        ("simulation_log", build_simulation_log()),
+    ]
+    codings: List[Tuple[str, dict]] = [
+        ("gzip-1", {"encoding": "gzip", "gzip_level": 1}),
+        ("gzip-6", {"encoding": "gzip", "gzip_level": 6}),
+        ("gzip-9", {"encoding": "gzip", "gzip_level": 9}),
+    ]
+    if BROTLI_AVAILABLE:
+        codings += [
+            ("br-4", {"encoding": "br", "brotli_quality": 4}),
+            ("br-11", {"encoding": "br", "brotli_quality": 11}),
+        ]
+
+    rows = []
+    for name, body in payloads:
+        etag_ms = time_call(lambda: make_etag(body), repeat=args.repeat, number=20) * 1000
+        rows.append([name, len(body), "identity", len(body), "1.00", "0.000", f"{etag_ms:.3f}"])
+        for label, options in codings:
+            compressed = compress_bytes(body, **options)
+            seconds = time_call(lambda: compress_bytes(body, **options), repeat=args.repeat)
+            rows.append([name, len(body), label, len(compressed),
+                         f"{len(body) / len(compressed):.2f}", f"{seconds * 1000:.3f}", ""])
+
+    frames = build_sse_frames(load_protocol_code())
+    raw_size = sum(len(frame) for frame in frames)
+    for encoding in (["gzip", "br"] if BROTLI_AVAILABLE else ["gzip"]):
+        size = compress_stream(frames, encoding)
+        seconds = time_call(lambda: compress_stream(frames, encoding), repeat=args.repeat)
+        rows.append(["sse_stream", raw_size, f"{encoding}-flush", size,
+                     f"{raw_size / size:.2f}", f"{seconds * 1000:.3f}", ""])
+
+    print_table(["payload", "bytes", "coding", "compressed", "ratio", "compress_ms", "etag_ms"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+End-to-end benchmark over archive/55question.csv
+================================================
+
+Runs SOP generation followed by the LangGraph code generation loop
+(``run_code_generation_graph``) for each benchmark question and records, per
+question:
+
+- wall time, number of code attempts and final status
+  (``success``, ``success_with_warnings``, ``reviewer_rejected``, ``failed``,
+  ``sop_error``, ``error``) and whether the last review was a PASS;
+- simulator time (``simulation_start`` -> ``simulation_log_raw`` events);
+- LLM time, calls and prompt / completion tokens, collected by a LangChain
+  callback handler bound to the question through a context variable
+  (tokens are estimated from the text when the provider reports no usage).
+
+Results are written as JSON (configuration, summary, questions) and CSV. The
+summary has pass rate, p50/p95 wall time and throughput; ``--baseline``
+compares it against a previous JSON result and exits with 1 when throughput
+drops or p50/p95 latency grows by more than ``--max-regression``.
+
+The LLMs are the ones in ``backend/config.py``; ``--replay CASSETTE`` starts
+the record/replay stand-in (``backend.llm_replay``) in-process instead and
+points every model at it, ``--record`` adds misses to the cassette.
+
+Usage:
+    python main.py bench [--limit N] [--concurrency 4] [--replay benchmarks/cassettes/e2e.jsonl]
+    python -m benchmarks.bench_e2e --baseline benchmarks/results/baseline.json
+"""
+
+import argparse
+import contextvars
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from langchain_core.tracers.context import register_configure_hook
+
+from backend.log_utils import configure_logging
+from backend.node_timing import LlmUsage
+from benchmarks.common import PROJECT_ROOT, percentile, print_table
+
+QUESTIONS_FILE = PROJECT_ROOT / "archive" / "55question.csv"
+RESULTS_DIR = PROJECT_ROOT / "benchmarks" / "results"
+DEFAULT_MAX_ITERATIONS = 5
+DEFAULT_MAX_REGRESSION = 0.10
+
+# The questions target an OT-2 with P300/P20 single-channel pipettes
+DEFAULT_HARDWARE_CONTEXT = """Robot Model: OT-2
+API Version: 2.19
+Left Pipette: p300_single_gen2
+Right Pipette: p20_single_gen2
+Use Gripper: false
+Deck Layout:
+  1: opentrons_96_tiprack_300ul
+  2: opentrons_96_tiprack_20ul
+  3: nest_12_reservoir_15ml
+  4: opentrons_24_tuberack_eppendorf_1.5ml_safelock_snapcap
+  5: corning_96_wellplate_360ul_flat
+  6: corning_96_wellplate_360ul_flat"""
+
+
+@dataclass
+class QuestionResult:
+    """Measurements of one benchmark question."""
+    index: int
+    type: str
+    difficulty: str
+    status: str = "error"
+    review_pass: bool = False
+    attempts: int = 0
+    wall_seconds: float = 0.0
+    sop_seconds: float = 0.0
+    code_seconds: float = 0.0
+    simulator_seconds: float = 0.0
+    simulations: int = 0
+    llm_seconds: float = 0.0
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    error: str = ""
+
+
+# LangChain adds the handler held by this variable to every run configured in the same context
+_usage_handler: contextvars.ContextVar[Optional[LlmUsage]] = contextvars.ContextVar(
+    "bench_e2e_usage_handler", default=None
+)
+register_configure_hook(_usage_handler, inheritable=True)
+
+
+class _GraphEvents:
+    """``iteration_reporter`` that records attempts, simulator time and reviewer verdicts."""
+
+    def __init__(self):
+        self.attempts = 0
+        self.simulator_seconds = 0.0
+        self.simulations = 0
+        self.review_results: List[str] = []
+        self._simulation_started: Optional[float] = None
+
+    def __call__(self, event: Dict[str, Any]) -> None:
+        event_type = event.get("event_type")
+        if event_type == "code_generated":
+            self.attempts = max(self.attempts, int(event.get("attempt_num") or 0))
+        elif event_type == "simulation_start":
+            self._simulation_started = time.perf_counter()
+        elif event_type == "simulation_log_raw" and self._simulation_started is not None:
+            self.simulator_seconds += time.perf_counter() - self._simulation_started
+            self.simulations += 1
+            self._simulation_started = None
+        elif event_type == "review_feedback":
+            self.review_results.append(str(event.get("result", "UNKNOWN")))
+
+
+def classify_result(result: str) -> str:
+    """Final status of a ``run_code_generation_graph`` return value."""
+    if result.startswith("Error:"):
+        return "error"
+    if result.startswith("**协议生成失败 (Reviewer"):
+        return "reviewer_rejected"
+    if result.startswith("**协议生成失败报告"):
+        return "failed"
+    if result.startswith("Warning:"):
+        return "success_with_warnings"
+    return "success"
+
+
+def load_questions(path: Path = QUESTIONS_FILE, limit: Optional[int] = None,
+                   types: Optional[List[str]] = None,
+                   difficulties: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Reads the benchmark questions; ``index`` is the 1-based row number."""
+    with path.open(encoding="utf-8", newline="") as f:
+        rows = [dict(row, index=index) for index, row in enumerate(csv.DictReader(f), start=1)]
+    if types:
+        rows = [row for row in rows if row["Type"] in types]
+    if difficulties:
+        rows = [row for row in rows if row["Difficulty"] in difficulties]
+    return rows[:limit] if limit else rows
+
+
+def run_question(question: Dict[str, Any], hardware_context: str, max_iterations: int) -> QuestionResult:
+    """Runs SOP generation and the code generation graph for one question."""
+    from backend.langchain_agent import generate_sop_with_langchain, run_code_generation_graph
+
+    result = QuestionResult(index=question["index"], type=question["Type"], difficulty=question["Difficulty"])
+    usage = LlmUsage()
+    events = _GraphEvents()
+    _usage_handler.set(usage)
+    start = time.perf_counter()
+    try:
+        sop = generate_sop_with_langchain(f"{hardware_context}---{question['Question']}")
+        result.sop_seconds = time.perf_counter() - start
+        if sop.startswith("Error:"):
+            result.status, result.error = "sop_error", sop[:500]
+        else:
+            tool_input = f"{sop}\n---CONFIG_SEPARATOR---\n{hardware_context}"
+            code_start = time.perf_counter()
+            output = run_code_generation_graph(tool_input, max_iterations, iteration_reporter=events)
+            result.code_seconds = time.perf_counter() - code_start
+            result.status = classify_result(output)
+            if result.status == "error":
+                result.error = output[:500]
+    except Exception as e:
+        result.status, result.error = "error", f"{type(e).__name__}: {e}"
+    finally:
+        _usage_handler.set(None)
+    result.wall_seconds = time.perf_counter() - start
+    result.attempts = events.attempts
+    result.simulator_seconds = events.simulator_seconds
+    result.simulations = events.simulations
+    result.review_pass = bool(events.review_results) and events.review_results[-1] == "PASS"
+    result.llm_seconds = usage.seconds
+    result.llm_calls = usage.calls
+    result.prompt_tokens = usage.prompt_tokens
+    result.completion_tokens = usage.completion_tokens
+    return result
+
+
+def summarize(results: List[QuestionResult], elapsed: float) -> Dict[str, Any]:
+    """Pass rate, latency percentiles, throughput and totals of a run."""
+    walls = [r.wall_seconds for r in results]
+    statuses: Dict[str, int] = {}
+    for r in results:
+        statuses[r.status] = statuses.get(r.status, 0) + 1
+    passed = sum(r.status in ("success", "success_with_warnings") for r in results)
+    return {
+        "questions": len(results),
+        "statuses": statuses,
+        "pass_rate": round(passed / len(results), 4) if results else 0.0,
+        "review_pass_rate": round(sum(r.review_pass for r in results) / len(results), 4) if results else 0.0,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_per_minute": round(len(results) / elapsed * 60, 3) if elapsed > 0 else 0.0,
+        "wall_p50": round(percentile(walls, 50), 3),
+        "wall_p95": round(percentile(walls, 95), 3),
+        "wall_mean": round(sum(walls) / len(walls), 3) if walls else 0.0,
+        "attempts_mean": round(sum(r.attempts for r in results) / len(results), 3) if results else 0.0,
+        "simulator_p50": round(percentile([r.simulator_seconds for r in results], 50), 3),
+        "llm_p50": round(percentile([r.llm_seconds for r in results], 50), 3),
+        "llm_calls": sum(r.llm_calls for r in results),
+        "prompt_tokens": sum(r.prompt_tokens for r in results),
+        "completion_tokens": sum(r.completion_tokens for r in results),
+    }
+
+
+def compare_to_baseline(summary: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Returns the throughput / latency regressions beyond ``max_regression`` (a fraction)."""
+    failures = []
+    old, new = baseline.get("throughput_per_minute", 0.0), summary["throughput_per_minute"]
+    if old and new < old * (1 - max_regression):
+        failures.append(f"throughput {new:.2f}/min < baseline {old:.2f}/min")
+    for key in ("wall_p50", "wall_p95"):
+        old, new = baseline.get(key, 0.0), summary[key]
+        if old and new > old * (1 + max_regression):
+            failures.append(f"{key} {new:.2f} s > baseline {old:.2f} s")
+    return failures
+
+
+def write_results(stem: Path, config: Dict[str, Any], summary: Dict[str, Any],
+                  results: List[QuestionResult]) -> None:
+    stem.parent.mkdir(parents=True, exist_ok=True)
+    payload = {"config": config, "summary": summary, "questions": [asdict(r) for r in results]}
+    stem.with_suffix(".json").write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    with stem.with_suffix(".csv").open("w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=[f.name for f in fields(QuestionResult)])
+        writer.writeheader()
+        writer.writerows(asdict(r) for r in results)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="End-to-end SOP + code generation benchmark over archive/55question.csv")
+    parser.add_argument("--questions", type=Path, default=QUESTIONS_FILE, help="benchmark CSV")
+    parser.add_argument("--limit", type=int, help="only run the first N questions")
+    parser.add_argument("--type", action="append", dest="types", help="only run questions of this Type (repeatable)")
+    parser.add_argument("--difficulty", action="append", dest="difficulties", help="only run this Difficulty (repeatable)")
+    parser.add_argument("--concurrency", type=int, default=1, help="questions run in parallel")
+    parser.add_argument("--max-iterations", type=int, default=DEFAULT_MAX_ITERATIONS, help="code generation attempts")
+    parser.add_argument("--hardware", type=Path, help="file with the hardware context (default: OT-2 deck)")
+    parser.add_argument("--replay", metavar="CASSETTE", help="serve the LLMs from a record/replay cassette")
+    parser.add_argument("--record", action="store_true", help="with --replay: record prompts missing from the cassette")
+    parser.add_argument("--ttft-ms", type=float, default=0.0, help="with --replay: synthetic time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="with --replay: synthetic token rate")
+    parser.add_argument("--output", type=Path, help="output path without extension (default: benchmarks/results/e2e_<time>)")
+    parser.add_argument("--baseline", type=Path, help="previous JSON result to compare against")
+    parser.add_argument("--max-regression", type=float, default=DEFAULT_MAX_REGRESSION,
+                        help="allowed throughput / latency regression against the baseline (fraction)")
+    parser.add_argument("--verbose", action="store_true", help="log the agents' debug output (default: warnings only)")
+    args = parser.parse_args(argv)
+    if args.verbose:
+        configure_logging(level="DEBUG", debug_sample_rate=1.0)
+    else:
+        configure_logging(level="WARNING")
+
+    questions = load_questions(args.questions, args.limit, args.types, args.difficulties)
+    hardware_context = args.hardware.read_text(encoding="utf-8") if args.hardware else DEFAULT_HARDWARE_CONTEXT
+
+    replay_server = None
+    if args.replay:
+        from backend.llm_replay import Cassette, ReplayBackend, ReplayServer, SyntheticLatency
+        if "backend.config" in sys.modules:
+            raise RuntimeError("--replay must be set up before backend.config is imported")
+        backend = ReplayBackend(Cassette(args.replay), mode="auto" if args.record else "replay",
+                                latency=SyntheticLatency(args.ttft_ms, args.tokens_per_second))
+        replay_server = ReplayServer(backend).start()
+        os.environ["LABSCRIPT_LLM_BASE_URL"] = replay_server.url
+
+    results: List[QuestionResult] = []
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+            futures = [pool.submit(run_question, q, hardware_context, args.max_iterations) for q in questions]
+            for future in futures:
+                result = future.result()
+                results.append(result)
+                print(f"[{len(results)}/{len(questions)}] Q{result.index} {result.status} "
+                      f"{result.wall_seconds:.1f} s, {result.attempts} attempts", file=sys.stderr)
+    finally:
+        if replay_server:
+            replay_server.stop()
+    elapsed = time.perf_counter() - start
+
+    summary = summarize(results, elapsed)
+    config = {
+        "questions_file": str(args.questions),
+        "concurrency": args.concurrency,
+        "max_iterations": args.max_iterations,
+        "llm": f"replay:{args.replay}" if args.replay else "config",
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    stem = args.output or RESULTS_DIR / f"e2e_{datetime.now():%Y%m%d_%H%M%S}"
+    write_results(stem, config, summary, results)
+
+    print_table(
+        ["Q", "type", "difficulty", "status", "review", "attempts", "wall_s", "sim_s", "llm_s", "tokens"],
+        [[r.index, r.type, r.difficulty, r.status, "PASS" if r.review_pass else "-", r.attempts,
+          f"{r.wall_seconds:.1f}", f"{r.simulator_seconds:.1f}", f"{r.llm_seconds:.1f}",
+          r.prompt_tokens + r.completion_tokens] for r in sorted(results, key=lambda r: r.index)],
+    )
+    print()
+    print(f"pass rate {summary['pass_rate']:.0%} (review PASS {summary['review_pass_rate']:.0%}), "
+          f"wall p50 {summary['wall_p50']:.1f} s / p95 {summary['wall_p95']:.1f} s, "
+          f"{summary['throughput_per_minute']:.2f} questions/min")
+    print(f"Results: {stem.with_suffix('.json')}, {stem.with_suffix('.csv')}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        failures = compare_to_baseline(summary, baseline.get("summary", baseline), args.max_regression)
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        if failures:
+            return 1
+        print(f"OK: within {args.max_regression:.0%} of baseline {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Import-time budget check
+========================
+
+Runs ``python -X importtime -c "import <module>"`` in a fresh interpreter and
+checks the cumulative import time of the module against a budget. It also
+fails if modules that must stay lazy (LangChain clients, LangGraph, PyLabRobot,
+the agent modules) are imported eagerly.
+
+Usage:
+    python -m benchmarks.bench_import_time [--module backend.api_server] [--budget-ms 1500]
+
+Exit code is 1 when the budget is exceeded or a lazy module was imported.
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+from benchmarks.common import PROJECT_ROOT, print_table
+
+DEFAULT_MODULE = "backend.api_server"
+DEFAULT_BUDGET_MS = 1500.0
+
+# Modules that importing the API server must not pull in
+LAZY_MODULES = (
+    "backend.langchain_agent",
+    "backend.pylabrobot_agent",
+    "backend.pylabrobot_utils",
+    "langchain_openai",
+    "langgraph",
+    "pylabrobot",
+)
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def measure_import(module: str) -> Dict[str, Tuple[int, int]]:
+    """Returns {module_name: (self_us, cumulative_us)} for one cold import."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+    timings: Dict[str, Tuple[int, int]] = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            timings[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return timings
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check the cold import time of a module against a budget")
+    parser.add_argument("--module", default=DEFAULT_MODULE, help="module to import")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="cumulative import budget")
+    parser.add_argument("--repeat", type=int, default=3, help="number of cold imports (best is reported)")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest imports to list")
+    args = parser.parse_args()
+
+    runs = [measure_import(args.module) for _ in range(args.repeat)]
+    best = min(runs, key=lambda timings: timings.get(args.module, (0, 0))[1])
+    total_ms = best.get(args.module, (0, 0))[1] / 1000
+
+    slowest: List[Tuple[str, int]] = sorted(
+        ((name, self_us) for name, (self_us, _) in best.items()), key=lambda item: item[1], reverse=True
+    )[: args.top]
+    print_table(["module", "self_ms"], [[name, f"{us / 1000:.1f}"] for name, us in slowest])
+    print()
+
+    eager = [name for name in best if any(name == lazy or name.startswith(lazy + ".") for lazy in LAZY_MODULES)]
+    failed = False
+    if eager:
+        roots = sorted({name.split(".")[0] if not name.startswith("backend.") else name for name in eager})
+        print(f"FAIL: lazily-loaded modules were imported eagerly: {', '.join(roots)}")
+        failed = True
+    status = "OK" if total_ms <= args.budget_ms else "FAIL"
+    print(f"{status}: import {args.module} took {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    failed = failed or status == "FAIL"
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
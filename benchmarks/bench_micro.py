@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks of the hot pure-Python helpers
+===============================================
+
+Times the helpers that run on every code generation attempt or every pyFluent
+export on synthetic inputs sized above what the agents see in practice:
+
+- ``apply_diff`` with a 50-block diff against a 5,000-line protocol, once per
+  matching stage (exact, fuzzy, line-trimmed and block-anchor fallback; the
+  setup checks that each diff really reaches its stage);
+- ``extract_error_from_simulation`` and ``_analyze_pylabrobot_error`` on 10 MB
+  simulator logs (traceback at the end, keyword scan, nothing to extract);
+- ``wells_string_to_indexes`` on cached and uncached well selections;
+- the pyFluent XML builders (templates and ElementTree) for a 10,000-command
+  worklist, and indexing that worklist with ``GwlReader``.
+
+Results are the best time per call over ``--repeat`` rounds. ``--save-baseline``
+writes them to ``benchmarks/baselines/micro.json`` (checked in, so timing
+changes show up in review); ``--baseline`` compares against that file and
+exits with 1 when a case is slower by more than ``--max-regression``. Baselines
+are machine-specific: regenerate the file on the machine that compares.
+
+Usage:
+    python -m benchmarks.bench_micro [--filter apply_diff] [--repeat 5]
+    python -m benchmarks.bench_micro --save-baseline
+    python -m benchmarks.bench_micro --baseline
+"""
+
+import argparse
+import json
+import platform
+import sys
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from backend.diff_utils import (
+    apply_diff, block_anchor_fallback_match, fuzzy_match, line_trimmed_fallback_match,
+)
+from backend.langchain_agent import extract_error_from_simulation
+from backend.pylabrobot_agent import _analyze_pylabrobot_error
+from benchmarks.bench_pyfluent_templates import build_worklist
+from benchmarks.common import PROJECT_ROOT, print_table, time_call
+
+# pyFluent uses flat imports (``from Protocol import ...``)
+sys.path.insert(0, str(PROJECT_ROOT / "pyFluent"))
+
+from FCACommand import TecanFCAScriptGenerator  # noqa: E402
+from FluentWorklist import GwlReader  # noqa: E402
+
+BASELINE_FILE = PROJECT_ROOT / "benchmarks" / "baselines" / "micro.json"
+DEFAULT_MAX_REGRESSION = 0.25
+
+PROTOCOL_LINES = 5000
+DIFF_BLOCKS = 50
+LOG_BYTES = 10 * 1024 * 1024
+FLUENT_COMMANDS = 10000
+# Commands per plate of benchmarks.bench_pyfluent_templates.build_worklist
+COMMANDS_PER_PLATE = 2 + 12 * 4 + 4
+
+STEP_LINES = 6
+DIFF_STAGES = ("exact", "fuzzy", "line_trimmed", "block_anchor")
+
+
+def synthetic_protocol(lines: int = PROTOCOL_LINES) -> str:
+    """An OT-2 protocol of about ``lines`` lines made of numbered transfer steps."""
+    header = [
+        "from opentrons import protocol_api",
+        "",
+        "metadata = {'apiLevel': '2.19'}",
+        "",
+        "def run(protocol: protocol_api.ProtocolContext):",
+        "    tiprack = protocol.load_labware('opentrons_96_tiprack_300ul', '1')",
+        "    source = protocol.load_labware('nest_12_reservoir_15ml', '2')",
+        "    plate = protocol.load_labware('corning_96_wellplate_360ul_flat', '3')",
+        "    p300 = protocol.load_instrument('p300_single_gen2', 'left', tip_racks=[tiprack])",
+    ]
+    body = []
+    for step in range((lines - len(header)) // STEP_LINES):
+        body += [
+            f"    # Step {step}: reagent {step % 12} to well {step % 96}",
+            "    p300.pick_up_tip()",
+            f"    p300.aspirate({step % 200 + 20}, source.wells()[{step % 12}])",
+            f"    p300.dispense({step % 200 + 20}, plate.wells()[{step % 96}])",
+            "    p300.blow_out()",
+            "    p300.drop_tip()",
+        ]
+    return "\n".join(header + body) + "\n"
+
+
+def _search_block(lines: List[str], stage: str) -> List[str]:
+    """The SEARCH lines of one step, altered so that only ``stage`` matches them."""
+    if stage == "exact":
+        return lines
+    if stage == "fuzzy":
+        # 5 of 6 lines match verbatim
+        return lines[:-1] + ["    p300.return_tip()"]
+    if stage == "line_trimmed":
+        return ["  " + line.strip() for line in lines]
+    # Anchors match after trimming, the middle of the block does not
+    return ["  " + lines[0].strip()] + ["  p300.touch_tip()"] * (len(lines) - 2) + ["  " + lines[-1].strip()]
+
+
+def synthetic_diff(protocol: str, stage: str, blocks: int = DIFF_BLOCKS) -> str:
+    """A diff of ``blocks`` SEARCH/REPLACE blocks spread evenly over the protocol steps."""
+    lines = protocol.splitlines()
+    first = next(i for i, line in enumerate(lines) if line.startswith("    # Step 0:"))
+    steps = (len(lines) - first) // STEP_LINES
+    parts = []
+    for block in range(blocks):
+        start = first + block * (steps // blocks) * STEP_LINES
+        step_lines = lines[start:start + STEP_LINES]
+        replace = [step_lines[0], "    p300.pick_up_tip()", "    p300.mix(3, 50)"] + step_lines[2:]
+        parts += ["------- SEARCH", *_search_block(step_lines, stage), "=======", *replace, "+++++++ REPLACE"]
+    return "\n".join(parts)
+
+
+def diff_stage(original: str, search: str) -> Optional[str]:
+    """The first matching stage of ``apply_diff`` for one SEARCH block."""
+    if original.find(search) != -1:
+        return "exact"
+    if fuzzy_match(original, search):
+        return "fuzzy"
+    if line_trimmed_fallback_match(original, search, 0):
+        return "line_trimmed"
+    if block_anchor_fallback_match(original, search, 0):
+        return "block_anchor"
+    return None
+
+
+def check_diff_stages(protocol: str) -> None:
+    """Raises if a synthetic diff does not exercise the stage it is named after."""
+    for stage in DIFF_STAGES:
+        diff_lines = synthetic_diff(protocol, stage, blocks=1).splitlines()
+        search = "\n".join(diff_lines[1:diff_lines.index("=======")])
+        actual = diff_stage(protocol, search)
+        if actual != stage:
+            raise RuntimeError(f"Synthetic '{stage}' diff is matched by the '{actual}' stage")
+
+
+def synthetic_simulator_log(size: int = LOG_BYTES, tail: str = "") -> str:
+    """``run_opentrons_simulation`` raw output of about ``size`` bytes, ending with ``tail``."""
+    chunk = (
+        "Picking up tip from A1 of Opentrons OT-2 96 Tip Rack 300 µL on slot 1\n"
+        "Aspirating 50.0 uL from A1 of NEST 12 Well Reservoir 15 mL on slot 2 at 92.86 uL/sec\n"
+        "Dispensing 50.0 uL into B3 of Corning 96 Well Plate 360 µL Flat on slot 3 at 92.86 uL/sec\n"
+        "Dropping tip into A1 of Opentrons Fixed Trash on slot 12\n"
+    )
+    stdout = chunk * (size // len(chunk.encode("utf-8")))
+    return f"--- Simulation STDOUT ---\n{stdout}{tail}\n--- Simulation STDERR ---\n"
+
+
+OPENTRONS_TRACEBACK = """Traceback (most recent call last):
+  File "/tmp/protocol.py", line 4210, in run
+    p300.aspirate(350, source.wells()[3])
+opentrons.protocols.api_support.util.UnsupportedAPIError: volume 350 exceeds the pipette maximum of 300 uL
+"""
+
+PYLABROBOT_TRACEBACK = """Traceback (most recent call last):
+  File "protocol.py", line 42, in protocol
+    await lh.aspirate(plate["A13"], vols=[50])
+IndexError: list index out of range
+"""
+
+
+def well_selections(count: int) -> List[str]:
+    """``count`` distinct 384-well selections (more than the selection cache holds)."""
+    rows = "ABCDEFGHIJKLMNOP"
+
+    def name(index: int) -> str:
+        return f"{rows[index % 16]}{index // 16 % 24 + 1}"
+
+    selections = []
+    for i in range(count):
+        # The first two wells make every selection unique
+        wells = [name(i), name(i // 384)] + [name(i * 37 + k * 53) for k in range(6)]
+        selections.append(",".join(wells) + f",{rows[i % 16]}1:{rows[i % 16]}{i % 24 + 1}")
+    return selections
+
+
+def build_cases(repeat: int) -> Dict[str, Tuple[Callable[[], object], int]]:
+    """Benchmark name -> (zero-argument callable, repeat rounds)."""
+    protocol = synthetic_protocol()
+    check_diff_stages(protocol)
+    diffs = {stage: synthetic_diff(protocol, stage) for stage in DIFF_STAGES}
+
+    traceback_log = synthetic_simulator_log(tail=OPENTRONS_TRACEBACK)
+    keyword_log = synthetic_simulator_log(tail="ERROR: simulation FAILED while dispensing\n")
+    clean_log = synthetic_simulator_log()
+    pylabrobot_log = synthetic_simulator_log(tail=PYLABROBOT_TRACEBACK)
+
+    fca = TecanFCAScriptGenerator()
+    selections = well_selections(5000)
+    full_plate = ",".join(f"{row}{column}" for column in range(1, 25) for row in "ABCDEFGHIJKLMNOP")
+
+    plates = -(-FLUENT_COMMANDS // COMMANDS_PER_PLATE)
+    worklist = build_worklist(plates, use_templates=True)
+    gwl_file = Path(tempfile.gettempdir()) / "bench_micro_worklist.gwl"
+    gwl_file.write_text("\n".join(worklist) + "\n", encoding="utf-8")
+
+    def index_worklist():
+        reader = GwlReader(str(gwl_file))
+        reader.count_by_type()
+        reader.close()
+
+    cases: Dict[str, Tuple[Callable[[], object], int]] = {
+        f"apply_diff[{stage}]": (lambda diff=diff: apply_diff(protocol, diff), repeat)
+        for stage, diff in diffs.items()
+    }
+    cases.update({
+        "extract_error_from_simulation[traceback]": (lambda: extract_error_from_simulation(traceback_log), repeat),
+        "extract_error_from_simulation[keywords]": (lambda: extract_error_from_simulation(keyword_log), repeat),
+        "extract_error_from_simulation[nothing]": (lambda: extract_error_from_simulation(clean_log), repeat),
+        "_analyze_pylabrobot_error[traceback]": (lambda: _analyze_pylabrobot_error(pylabrobot_log), repeat),
+        "wells_string_to_indexes[cached_full_plate]": (
+            lambda: [fca.wells_string_to_indexes(full_plate, 384) for _ in range(1000)], repeat),
+        "wells_string_to_indexes[uncached_5000]": (
+            lambda: [fca.wells_string_to_indexes(selection, 384) for selection in selections], repeat),
+        "pyfluent_worklist[templates]": (lambda: build_worklist(plates, use_templates=True), repeat),
+        "pyfluent_worklist[elementtree]": (lambda: build_worklist(plates, use_templates=False), repeat),
+        "gwl_reader[index]": (index_worklist, repeat),
+    })
+    return cases
+
+
+def compare_to_baseline(results: Dict[str, float], baseline: Dict[str, float],
+                        max_regression: float) -> List[str]:
+    """Returns the cases slower than the baseline by more than ``max_regression`` (a fraction)."""
+    return [
+        f"{name}: {seconds * 1000:.2f} ms > baseline {baseline[name] * 1000:.2f} ms"
+        for name, seconds in results.items()
+        if name in baseline and seconds > baseline[name] * (1 + max_regression)
+    ]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of diff_utils, error extraction and pyFluent")
+    parser.add_argument("--filter", help="only run cases whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=3, help="timing rounds per case")
+    parser.add_argument("--save-baseline", nargs="?", type=Path, const=BASELINE_FILE,
+                        help=f"write the results as the baseline (default {BASELINE_FILE.relative_to(PROJECT_ROOT)})")
+    parser.add_argument("--baseline", nargs="?", type=Path, const=BASELINE_FILE,
+                        help="compare against a baseline file")
+    parser.add_argument("--max-regression", type=float, default=DEFAULT_MAX_REGRESSION,
+                        help="allowed slowdown against the baseline (fraction)")
+    args = parser.parse_args()
+
+    cases = build_cases(args.repeat)
+    if args.filter:
+        cases = {name: case for name, case in cases.items() if args.filter in name}
+    results = {name: time_call(func, repeat=rounds) for name, (func, rounds) in cases.items()}
+
+    baseline: Dict[str, float] = {}
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))["cases"]
+    print_table(
+        ["case", "ms", "baseline_ms", "change"],
+        [[name, f"{seconds * 1000:.2f}",
+          f"{baseline[name] * 1000:.2f}" if name in baseline else "-",
+          f"{(seconds / baseline[name] - 1) * 100:+.0f}%" if baseline.get(name) else "-"]
+         for name, seconds in results.items()],
+    )
+
+    if args.save_baseline:
+        args.save_baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.save_baseline.write_text(json.dumps({
+            "python": platform.python_version(),
+            "machine": f"{platform.system()} {platform.machine()}",
+            "repeat": args.repeat,
+            "cases": {name: round(seconds, 6) for name, seconds in results.items()},
+        }, indent=2) + "\n", encoding="utf-8")
+        print(f"\nBaseline written to {args.save_baseline}")
+
+    if args.baseline:
+        failures = compare_to_baseline(results, baseline, args.max_regression)
+        print()
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        if failures:
+            return 1
+        print(f"OK: no case is more than {args.max_regression:.0%} slower than {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
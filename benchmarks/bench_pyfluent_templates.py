@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+pyFluent template benchmark
+===========================
+
+Generates a full-plate worklist twice, once with the precompiled XML templates
+(``pyFluent/XMLTemplate.py``) and once with the ElementTree builders, checks
+that both worklists are byte-identical and reports the time per command.
+
+The worklist transfers every well of a 96-well plate with the FCA (8 channels
+per column: GetTips / Aspirate / Dispense / DropTips) and stamps plates with the
+MCA384, preceded by the worktable setup.
+
+Usage:
+    python -m benchmarks.bench_pyfluent_templates [--plates 10] [--repeat 5]
+
+Exit code is 1 when the two paths produce different output.
+"""
+
+import argparse
+import sys
+from typing import Callable, Dict, List
+
+from benchmarks.common import PROJECT_ROOT, print_table, time_call
+
+# pyFluent uses flat imports (``from Protocol import ...``)
+sys.path.insert(0, str(PROJECT_ROOT / "pyFluent"))
+
+from FCACommand import TecanFCAScriptGenerator  # noqa: E402
+from FluentLabware import LabwareType, MCA384HeadAdapter, Nest_position  # noqa: E402
+from FluentLiquidClass import LiquidClass  # noqa: E402
+from MCA384Commond import TecanMCA384ScriptGenerator  # noqa: E402
+from WortableCommand import TecanWorktableScriptGenerator  # noqa: E402
+from XMLTemplate import template_cache  # noqa: E402
+
+FLUENT_SN = "19905"
+ROWS = "ABCDEFGH"
+
+
+def build_worklist(plates: int, use_templates: bool) -> List[str]:
+    """Returns the commands of a full-plate worklist."""
+    worktable = TecanWorktableScriptGenerator()
+    fca = TecanFCAScriptGenerator()
+    mca = TecanMCA384ScriptGenerator()
+    for generator in (worktable, fca, mca):
+        generator.use_templates = use_templates
+
+    commands = []
+    for plate in range(1, plates + 1):
+        commands.append(worktable.AddLabware(LabwareType.WELL_96_FLAT, f"Source[{plate:03d}]",
+                                             Nest_position.Nest61mm_Pos, plate))
+        commands.append(worktable.AddLabware(LabwareType.PCR_96, f"Dest[{plate:03d}]",
+                                             Nest_position.Nest7mm_Pos, plate))
+
+    channels = list(range(8))
+    for plate in range(1, plates + 1):
+        for column in range(1, 13):
+            wells = ",".join(f"{row}{column}" for row in ROWS)
+            commands.append(fca.GetTips("200ul", channels, FLUENT_SN))
+            commands.append(fca.Aspirate(20, f"Source[{plate:03d}]", channels, "Water Free Single",
+                                         wells, FLUENT_SN))
+            commands.append(fca.Dispense(20, f"Dest[{plate:03d}]", channels, "Water Free Single",
+                                         wells, FLUENT_SN))
+            commands.append(fca.DropTips(channels, FLUENT_SN))
+
+    adapter = MCA384HeadAdapter(Label="EVA[001]")
+    for plate in range(1, plates + 1):
+        commands.append(mca.Aspirate(adapter, 50.0, f"Source[{plate:03d}]", LiquidClass.Water_Free_Single, FLUENT_SN))
+        commands.append(mca.Dispense(adapter, 50.0, f"Dest[{plate:03d}]", LiquidClass.Water_Free_Single, FLUENT_SN))
+        commands.append(mca.Mix(adapter, 30.0, f"Dest[{plate:03d}]", LiquidClass.Water_Mix, 3, FLUENT_SN))
+        commands.append(mca.SetTipsBack(adapter, FLUENT_SN))
+    return commands
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark pyFluent template rendering against ElementTree")
+    parser.add_argument("--plates", type=int, default=10, help="number of 96-well plates in the worklist")
+    parser.add_argument("--repeat", type=int, default=5, help="timing rounds per path")
+    args = parser.parse_args()
+
+    reference = build_worklist(args.plates, use_templates=False)
+    templated = build_worklist(args.plates, use_templates=True)
+    identical = reference == templated
+
+    paths: Dict[str, Callable[[], List[str]]] = {
+        "elementtree": lambda: build_worklist(args.plates, use_templates=False),
+        "templates": lambda: build_worklist(args.plates, use_templates=True),
+    }
+    seconds = {name: time_call(func, repeat=args.repeat) for name, func in paths.items()}
+
+    count = len(reference)
+    size = sum(len(command) for command in reference)
+    rows = [
+        [name, count, f"{elapsed * 1000:.1f}", f"{elapsed / count * 1e6:.1f}",
+         f"{seconds['elementtree'] / elapsed:.1f}x"]
+        for name, elapsed in seconds.items()
+    ]
+    print_table(["path", "commands", "total_ms", "us_per_command", "speedup"], rows)
+    print()
+    print(f"worklist size: {size} characters, compiled templates: {len(template_cache)}")
+
+    if not identical:
+        mismatches = sum(1 for a, b in zip(reference, templated) if a != b)
+        print(f"FAIL: {mismatches} of {count} commands differ between the two paths")
+        return 1
+    print("OK: template output is byte-identical to the ElementTree output")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Simulation throughput benchmark
+===============================
+
+Simulates the archived OT-2 protocol corpus (``archive/backend/OT2protocolcode``,
+10 protocols of 47 to 2,400 lines) through ``run_opentrons_simulation`` to size
+``SIMULATION_TIMEOUT`` and the number of simulation workers.
+
+1. Latency pass (concurrency 1): every protocol is simulated once cold (its
+   first simulation in this process; the very first one also pays for cold OS
+   and bytecode caches of the ``.ot_env`` child) and then ``--warm-runs`` more
+   times; cold and warm p50 latency and the status are reported per protocol.
+2. Throughput pass: the corpus is simulated ``--rounds`` times at each
+   concurrency level 1..N for each driver:
+
+   - ``threads``: a ``ThreadPoolExecutor`` calling ``run_opentrons_simulation``;
+   - ``asyncio``: ``asyncio.to_thread`` under a semaphore, as an async API
+     handler would call it.
+
+   Each level reports protocols/s, p50/p95 latency, failures, timeouts and the
+   peak RSS of the simulator child processes (``RUSAGE_CHILDREN`` max RSS; it
+   never decreases, so it is the peak up to and including that level).
+
+Usage:
+    python -m benchmarks.bench_simulation [--max-concurrency 4] [--rounds 2] [--timeout 60] [--json out.json]
+
+Requires the ``.ot_env`` simulator environment (``scripts/setup-uv.ps1``).
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from backend import opentrons_utils
+from backend.opentrons_utils import get_ot_env_python_executable, run_opentrons_simulation
+from benchmarks.common import PROJECT_ROOT, percentile, print_table
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CORPUS_DIR = PROJECT_ROOT / "archive" / "backend" / "OT2protocolcode"
+TIMEOUT_STATUS = "失败 - 超时"
+
+# (protocol name, seconds, final_status)
+Sample = Tuple[str, float, str]
+
+
+def load_corpus(directory: Path = CORPUS_DIR, limit: Optional[int] = None) -> List[Tuple[str, str]]:
+    """Returns (file name, code) of the corpus protocols, in file name order."""
+    files = sorted(directory.glob("*.py"))[:limit] if limit else sorted(directory.glob("*.py"))
+    return [(path.name, path.read_text(encoding="utf-8")) for path in files]
+
+
+def simulate(name: str, code: str) -> Sample:
+    start = time.perf_counter()
+    result = run_opentrons_simulation(code, return_structured=True)
+    return name, time.perf_counter() - start, result.get("final_status", "")
+
+
+def peak_child_rss_mb() -> Optional[float]:
+    """Largest RSS of any terminated child process so far (MB); None where unsupported."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+
+def run_threads(jobs: List[Tuple[str, str]], concurrency: int) -> List[Sample]:
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(lambda job: simulate(*job), jobs))
+
+
+def run_asyncio(jobs: List[Tuple[str, str]], concurrency: int) -> List[Sample]:
+    async def gather() -> List[Sample]:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(name: str, code: str) -> Sample:
+            async with semaphore:
+                return await asyncio.to_thread(simulate, name, code)
+
+        return await asyncio.gather(*(one(name, code) for name, code in jobs))
+
+    return asyncio.run(gather())
+
+
+DRIVERS: Dict[str, Callable[[List[Tuple[str, str]], int], List[Sample]]] = {
+    "threads": run_threads,
+    "asyncio": run_asyncio,
+}
+
+
+def latency_pass(corpus: List[Tuple[str, str]], warm_runs: int) -> List[Dict[str, Any]]:
+    """Cold and warm sequential latency of every protocol."""
+    rows = []
+    for name, code in corpus:
+        _, cold, status = simulate(name, code)
+        warm = [simulate(name, code)[1] for _ in range(warm_runs)]
+        rows.append({
+            "protocol": name,
+            "lines": code.count("\n") + 1,
+            "status": status,
+            "cold_seconds": round(cold, 3),
+            "warm_p50_seconds": round(percentile(warm, 50), 3) if warm else None,
+        })
+    return rows
+
+
+def throughput_level(driver: str, corpus: List[Tuple[str, str]], concurrency: int, rounds: int) -> Dict[str, Any]:
+    """Simulates the corpus ``rounds`` times with ``concurrency`` workers."""
+    jobs = corpus * rounds
+    start = time.perf_counter()
+    samples = DRIVERS[driver](jobs, concurrency)
+    elapsed = time.perf_counter() - start
+    latencies = [seconds for _, seconds, _ in samples]
+    return {
+        "driver": driver,
+        "concurrency": concurrency,
+        "simulations": len(samples),
+        "protocols_per_second": round(len(samples) / elapsed, 3) if elapsed > 0 else 0.0,
+        "p50_seconds": round(percentile(latencies, 50), 3),
+        "p95_seconds": round(percentile(latencies, 95), 3),
+        "max_seconds": round(max(latencies), 3) if latencies else 0.0,
+        "failures": sum(not status.startswith("成功") for _, _, status in samples),
+        "timeouts": sum(status == TIMEOUT_STATUS for _, _, status in samples),
+        "peak_child_rss_mb": peak_child_rss_mb(),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Simulate the archived OT-2 protocol corpus at increasing concurrency")
+    parser.add_argument("--corpus", type=Path, default=CORPUS_DIR, help="directory of protocol files")
+    parser.add_argument("--limit", type=int, help="only use the first N protocols")
+    parser.add_argument("--max-concurrency", type=int, default=4, help="highest concurrency level")
+    parser.add_argument("--driver", action="append", choices=sorted(DRIVERS), help="drivers to run (default: all)")
+    parser.add_argument("--rounds", type=int, default=1, help="corpus passes per concurrency level")
+    parser.add_argument("--warm-runs", type=int, default=2, help="warm simulations per protocol in the latency pass")
+    parser.add_argument("--timeout", type=float, help=f"override SIMULATION_TIMEOUT ({opentrons_utils.SIMULATION_TIMEOUT} s)")
+    parser.add_argument("--json", type=Path, help="also write the results as JSON")
+    args = parser.parse_args()
+
+    if not get_ot_env_python_executable().exists():
+        print("FAIL: the .ot_env simulator environment is missing (run scripts/setup-uv.ps1)")
+        return 1
+    if args.timeout:
+        opentrons_utils.SIMULATION_TIMEOUT = args.timeout
+    corpus = load_corpus(args.corpus, args.limit)
+
+    drivers = args.driver or list(DRIVERS)
+    latency = latency_pass(corpus, args.warm_runs)
+    levels = [
+        throughput_level(driver, corpus, concurrency, args.rounds)
+        for driver in drivers
+        for concurrency in range(1, args.max_concurrency + 1)
+    ]
+
+    print_table(
+        ["protocol", "lines", "status", "cold_s", "warm_p50_s"],
+        [[row["protocol"], row["lines"], row["status"], row["cold_seconds"], row["warm_p50_seconds"]] for row in latency],
+    )
+    print()
+    print_table(
+        ["driver", "concurrency", "protocols/s", "p50_s", "p95_s", "max_s", "failures", "timeouts", "peak_child_rss_mb"],
+        [[level["driver"], level["concurrency"], level["protocols_per_second"], level["p50_seconds"],
+          level["p95_seconds"], level["max_seconds"], level["failures"], level["timeouts"],
+          f"{level['peak_child_rss_mb']:.0f}" if level["peak_child_rss_mb"] is not None else "n/a"]
+         for level in levels],
+    )
+    print(f"\nSIMULATION_TIMEOUT = {opentrons_utils.SIMULATION_TIMEOUT} s, "
+          f"slowest simulation {max(level['max_seconds'] for level in levels):.1f} s")
+
+    if args.json:
+        args.json.write_text(json.dumps({
+            "simulation_timeout": opentrons_utils.SIMULATION_TIMEOUT,
+            "latency": latency,
+            "throughput": levels,
+        }, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Shared helpers for the benchmark scripts: project paths, timing and table output.
+"""
+
+import time
+from pathlib import Path
+from typing import Any, Callable, List, Sequence
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def time_call(func: Callable[[], Any], repeat: int = 5, number: int = 1) -> float:
+    """Returns the best wall time per call (seconds) over ``repeat`` rounds of ``number`` calls."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def print_table(headers: Sequence[str], rows: List[Sequence[Any]]) -> None:
+    """Prints rows as a left-aligned plain-text table."""
+    cells = [[str(h) for h in headers]] + [[str(c) for c in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(headers))]
+    for index, row in enumerate(cells):
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+        if index == 0:
+            print("  ".join("-" * width for width in widths))
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Linearly interpolated ``q``-th percentile (0-100); 0.0 for an empty sequence."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
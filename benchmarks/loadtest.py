@@ -0,0 +1,656 @@
+# -*- coding: utf-8 -*-
+"""
+API server load test
+====================
+
+Open-loop load generator for sizing a server node: how many concurrent SOP
+streams, code generations and simulations it sustains before latency, errors
+or event loop lag degrade.
+
+- Requests arrive as a Poisson process at each rate of ``--rates`` (requests
+  per second, all endpoints together) for ``--duration`` seconds; every
+  arrival picks an endpoint according to ``--mix``:
+
+  - ``sop``: ``POST /api/generate-sop-stream`` (goals from ``archive/55question.csv``);
+  - ``code``: ``POST /api/generate-protocol-code`` (a fixed SOP);
+  - ``simulate``: ``POST /api/simulate-protocol`` (the archived OT-2 corpus);
+  - ``converse``: ``POST /api/converse-code-stream`` (corpus code plus an edit
+    instruction; not in the default mix, see below).
+
+  Before the first stage, one request per endpoint warms the server up (lazy
+  agent imports, LLM clients, graphs) and is not measured. After the arrivals
+  of a stage, its outstanding requests are awaited before the next stage
+  starts. At most ``--max-in-flight`` requests are open; an
+  arrival beyond that counts as a ``client_backlog`` error.
+- Per request: time to first event (first SSE ``data:`` frame, or the
+  response headers of ``simulate``), full latency until the end of the
+  stream, HTTP / transport / timeout errors and error events in the stream.
+- The server's ``GET /metrics`` is scraped every second during a stage for
+  the event loop lag (``labscript_event_loop_lag_*``) and the generations and
+  simulations in progress.
+- A stage saturates an endpoint when its error rate exceeds
+  ``--max-error-rate``, its p95 time to first event exceeds ``--ttfe-slo``,
+  its p95 latency grows beyond ``--latency-factor`` times that of the first
+  stage, or (for all endpoints) when the p99 event loop lag exceeds
+  ``--max-lag``. The report gives the highest sustained and the first
+  saturated rate of each endpoint.
+
+By default the server is started as a child process (``uvicorn``, one worker)
+with every model pointed at the record/replay LLM stand-in
+(``backend.llm_replay``), which runs in this process with a synthetic time to
+first token and token rate. Prompts missing from ``--cassette`` are answered
+with ``--miss-response`` (a short SOP with an OT-2 protocol); record a cassette
+against the real models with ``--record`` for realistic answers. ``--url``
+targets a server that is already running instead.
+
+The code-edit agent behind ``converse`` works through tool calls, which the
+plain-text miss response cannot produce: without a cassette recorded for it,
+``converse`` requests measure a conversation that ends after the first answer.
+It is therefore only in the mix when asked for (``--mix ...,converse=1``), and
+the report notes when it ran against the miss response.
+
+Usage:
+    python main.py loadtest [--rates 0.5,1,2,4] [--duration 60] [--mix sop=3,code=2,simulate=4]
+    python main.py loadtest --cassette benchmarks/cassettes/loadtest.jsonl --record --rates 0.2 --duration 120 \
+        --mix sop=3,code=2,simulate=4,converse=1
+    python main.py loadtest --url http://127.0.0.1:8000 --rates 1,2,4
+"""
+
+import argparse
+import asyncio
+import codecs
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from benchmarks.common import PROJECT_ROOT, percentile, print_table
+
+RESULTS_DIR = PROJECT_ROOT / "benchmarks" / "results"
+
+# name -> (path, streams SSE events)
+ENDPOINTS = {
+    "sop": ("/api/generate-sop-stream", True),
+    "code": ("/api/generate-protocol-code", True),
+    "simulate": ("/api/simulate-protocol", False),
+    "converse": ("/api/converse-code-stream", True),
+}
+DEFAULT_MIX = "sop=3,code=2,simulate=4"
+DEFAULT_RATES = "0.5,1,2,4"
+METRICS_INTERVAL = 1.0
+SERVER_START_TIMEOUT = 120.0
+
+SAMPLE_SOP = """# Serial dilution
+1. Add 100 uL of diluent from reservoir well A1 to wells A2-A6 of the plate in slot 5.
+2. Transfer 100 uL from A1 to A2 of the plate and mix 3 times; continue down to A6.
+3. Discard 100 uL from A6 so that every well ends with 100 uL."""
+
+CODE_EDIT_INSTRUCTIONS = [
+    "Change every transfer volume to 50 uL.",
+    "Add a comment before each step describing it.",
+    "Use a new tip for every transfer.",
+]
+
+DEFAULT_MISS_RESPONSE = '''1. Transfer 50 uL from plate well A1 to B1.
+
+```python
+from opentrons import protocol_api
+
+metadata = {"apiLevel": "2.19"}
+
+
+def run(protocol: protocol_api.ProtocolContext):
+    tips = protocol.load_labware("opentrons_96_tiprack_300ul", 1)
+    plate = protocol.load_labware("corning_96_wellplate_360ul_flat", 5)
+    pipette = protocol.load_instrument("p300_single_gen2", "left", tip_racks=[tips])
+    pipette.transfer(50, plate["A1"], plate["B1"])
+```'''
+
+_METRIC_LINE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})?\s+(\S+)$")
+
+
+@dataclass
+class RequestResult:
+    """Measurements of one request."""
+    kind: str
+    rate: float
+    status: int = 0
+    ttfe_seconds: Optional[float] = None
+    latency_seconds: float = 0.0
+    events: int = 0
+    error: Optional[str] = None  # http_<status>, transport, timeout, error_event, client_backlog
+    outcome: Optional[str] = None  # final_result success / simulation success, when reported
+
+
+# ----------------------------------------------------------------------
+# Workload
+# ----------------------------------------------------------------------
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """Parses ``sop=3,code=1`` into endpoint weights."""
+    mix: Dict[str, float] = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{name}' in --mix, expected one of {', '.join(ENDPOINTS)}")
+        mix[name] = float(weight or 1)
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError("--mix needs at least one positive weight")
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+class Workload:
+    """Request bodies for each endpoint, cycling through the benchmark inputs."""
+
+    def __init__(self):
+        from benchmarks.bench_e2e import DEFAULT_HARDWARE_CONTEXT, load_questions
+        from benchmarks.bench_simulation import load_corpus
+        self.hardware_context = DEFAULT_HARDWARE_CONTEXT
+        self.goals = [question["Question"] for question in load_questions()]
+        self.protocols = [code for _, code in load_corpus()]
+        self._counters = {name: 0 for name in ENDPOINTS}
+
+    def body(self, kind: str) -> Dict[str, Any]:
+        index = self._counters[kind]
+        self._counters[kind] += 1
+        if kind == "sop":
+            return {"hardware_config": self.hardware_context, "user_goal": self.goals[index % len(self.goals)]}
+        if kind == "code":
+            return {"sop_markdown": SAMPLE_SOP, "hardware_config": self.hardware_context, "robot_model": "OT-2"}
+        if kind == "simulate":
+            return {"protocol_code": self.protocols[index % len(self.protocols)]}
+        return {"original_code": self.protocols[index % len(self.protocols)],
+                "user_instruction": CODE_EDIT_INSTRUCTIONS[index % len(CODE_EDIT_INSTRUCTIONS)]}
+
+
+# ----------------------------------------------------------------------
+# HTTP client (HTTP/1.1 over asyncio streams, one connection per request)
+# ----------------------------------------------------------------------
+
+class Target:
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        if parts.scheme != "http":
+            raise ValueError(f"Only http:// targets are supported, got {url}")
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.url = url.rstrip("/")
+
+
+async def _open(target: Target, method: str, path: str,
+                body: Optional[bytes] = None) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter, int, Dict[str, str]]:
+    reader, writer = await asyncio.open_connection(target.host, target.port, limit=2 ** 20)
+    head = [f"{method} {path} HTTP/1.1", f"Host: {target.host}:{target.port}", "Connection: close",
+            "Accept-Encoding: identity"]
+    if body is not None:
+        head += ["Content-Type: application/json", f"Content-Length: {len(body)}"]
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + (body or b""))
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed before the response")
+    status = int(status_line.split()[1])
+    headers: Dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return reader, writer, status, headers
+
+
+async def _body_chunks(reader: asyncio.StreamReader, headers: Dict[str, str]):
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size = int((await reader.readline()).split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                await reader.readline()
+                return
+            chunk = await reader.readexactly(size)
+            await reader.readexactly(2)
+            yield chunk
+    elif "content-length" in headers:
+        yield await reader.readexactly(int(headers["content-length"]))
+    else:
+        while True:
+            chunk = await reader.read(65536)
+            if not chunk:
+                return
+            yield chunk
+
+
+async def get_text(target: Target, path: str) -> str:
+    reader, writer, status, headers = await _open(target, "GET", path)
+    try:
+        body = b"".join([chunk async for chunk in _body_chunks(reader, headers)])
+    finally:
+        writer.close()
+    if status != 200:
+        raise ConnectionError(f"GET {path} returned {status}")
+    return body.decode("utf-8")
+
+
+def _event_error(event: Any) -> bool:
+    return isinstance(event, dict) and (event.get("event_type") == "error" or event.get("event") == "error")
+
+
+def _event_outcome(event: Any) -> Optional[str]:
+    if not isinstance(event, dict):
+        return None
+    if event.get("event_type") == "final_result":
+        if "success" in event:
+            return "success" if event["success"] else "failure"
+        return str(event.get("status") or "completed")
+    if event.get("event") == "done":
+        return "success"
+    return None
+
+
+async def _send(target: Target, kind: str, body: Dict[str, Any], result: RequestResult, start: float) -> None:
+    path, streaming = ENDPOINTS[kind]
+    reader, writer, status, headers = await _open(target, "POST", path, json.dumps(body).encode("utf-8"))
+    try:
+        result.status = status
+        if status >= 400:
+            result.error = f"http_{status}"
+        if not streaming or status >= 400:
+            result.ttfe_seconds = time.perf_counter() - start
+            payload = b"".join([chunk async for chunk in _body_chunks(reader, headers)])
+            if status < 400:
+                result.outcome = "success" if json.loads(payload).get("success") else "failure"
+            return
+        buffer = ""
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        async for chunk in _body_chunks(reader, headers):
+            buffer += decoder.decode(chunk)
+            *frames, buffer = buffer.split("\n\n")
+            for frame in frames:
+                data = [line[5:].strip() for line in frame.splitlines() if line.startswith("data:")]
+                if not data:
+                    continue  # heartbeat comment
+                if result.ttfe_seconds is None:
+                    result.ttfe_seconds = time.perf_counter() - start
+                result.events += 1
+                try:
+                    event = json.loads("\n".join(data))
+                except json.JSONDecodeError:
+                    continue
+                if _event_error(event):
+                    result.error = result.error or "error_event"
+                result.outcome = _event_outcome(event) or result.outcome
+    finally:
+        writer.close()
+
+
+async def run_request(target: Target, kind: str, body: Dict[str, Any], rate: float, timeout: float) -> RequestResult:
+    result = RequestResult(kind=kind, rate=rate)
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(_send(target, kind, body, result, start), timeout)
+    except asyncio.TimeoutError:
+        result.error = "timeout"
+    except (OSError, ConnectionError, ValueError, asyncio.IncompleteReadError):
+        result.error = result.error or "transport"
+    result.latency_seconds = time.perf_counter() - start
+    return result
+
+
+# ----------------------------------------------------------------------
+# Server metrics
+# ----------------------------------------------------------------------
+
+def parse_metrics(text: str) -> Dict[str, float]:
+    """Samples of a Prometheus text exposition, keyed by ``name{labels}``."""
+    samples = {}
+    for line in text.splitlines():
+        match = _METRIC_LINE.match(line)
+        if match:
+            samples[match.group(1) + (match.group(2) or "")] = float(match.group(3))
+    return samples
+
+
+def _lag_histogram(samples: Dict[str, float]) -> Tuple[List[Tuple[float, float]], float, float]:
+    buckets = []
+    for key, value in samples.items():
+        if key.startswith("labscript_event_loop_lag_seconds_bucket"):
+            le = re.search(r'le="([^"]+)"', key).group(1)
+            buckets.append((float("inf") if le == "+Inf" else float(le), value))
+    return (sorted(buckets), samples.get("labscript_event_loop_lag_seconds_count", 0.0),
+            samples.get("labscript_event_loop_lag_seconds_sum", 0.0))
+
+
+def _sum_of(samples: Dict[str, float], name: str) -> float:
+    return sum(value for key, value in samples.items() if key == name or key.startswith(name + "{"))
+
+
+class MetricsSampler:
+    """Scrapes ``/metrics`` periodically and summarizes the lag between two scrapes."""
+
+    def __init__(self, target: Target):
+        self.target = target
+        self.first: Optional[Dict[str, float]] = None
+        self.last: Optional[Dict[str, float]] = None
+        self.peaks = {"lag_last_max": 0.0, "generations_in_progress_max": 0.0, "simulations_in_progress_max": 0.0}
+        self.failures = 0
+
+    async def scrape(self) -> None:
+        try:
+            samples = parse_metrics(await get_text(self.target, "/metrics"))
+        except (OSError, ConnectionError, ValueError):
+            self.failures += 1
+            return
+        self.first = self.first or samples
+        self.last = samples
+        self.peaks["lag_last_max"] = max(self.peaks["lag_last_max"],
+                                         samples.get("labscript_event_loop_lag_last_seconds", 0.0))
+        self.peaks["generations_in_progress_max"] = max(self.peaks["generations_in_progress_max"],
+                                                        _sum_of(samples, "labscript_generations_in_progress"))
+        self.peaks["simulations_in_progress_max"] = max(self.peaks["simulations_in_progress_max"],
+                                                        _sum_of(samples, "labscript_simulations_in_progress"))
+
+    async def run(self, stop: asyncio.Event) -> None:
+        while not stop.is_set():
+            await self.scrape()
+            try:
+                await asyncio.wait_for(stop.wait(), METRICS_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+        await self.scrape()
+
+    def summary(self) -> Dict[str, Any]:
+        """Mean and p99 lag of the samples taken between the first and last scrape, plus peaks."""
+        summary: Dict[str, Any] = dict(self.peaks, lag_mean=None, lag_p99=None, lag_samples=0,
+                                       scrape_failures=self.failures)
+        if self.first is None or self.last is None:
+            return summary
+        first_buckets, first_count, first_sum = _lag_histogram(self.first)
+        last_buckets, last_count, last_sum = _lag_histogram(self.last)
+        count = last_count - first_count
+        if count <= 0:
+            return summary
+        before = dict(first_buckets)
+        p99 = None
+        for bound, cumulative in last_buckets:
+            if cumulative - before.get(bound, 0.0) >= 0.99 * count:
+                p99 = bound  # upper bound of the bucket holding the 99th percentile
+                break
+        summary.update(lag_mean=(last_sum - first_sum) / count, lag_p99=p99, lag_samples=int(count))
+        return summary
+
+
+# ----------------------------------------------------------------------
+# Stages
+# ----------------------------------------------------------------------
+
+async def run_stage(target: Target, workload: Workload, mix: Dict[str, float], rate: float, duration: float,
+                    max_in_flight: int, timeout: float, rng: random.Random) -> Tuple[List[RequestResult], Dict[str, Any]]:
+    """Runs one arrival rate for ``duration`` seconds and waits for its requests."""
+    sampler = MetricsSampler(target)
+    stop = asyncio.Event()
+    sampler_task = asyncio.create_task(sampler.run(stop))
+    tasks: List[asyncio.Task] = []
+    results: List[RequestResult] = []
+    names, weights = list(mix), list(mix.values())
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration
+    next_arrival = loop.time() + rng.expovariate(rate)
+    while next_arrival < deadline:
+        await asyncio.sleep(max(0.0, next_arrival - loop.time()))
+        next_arrival += rng.expovariate(rate)
+        kind = rng.choices(names, weights)[0]
+        if sum(not task.done() for task in tasks) >= max_in_flight:
+            results.append(RequestResult(kind=kind, rate=rate, error="client_backlog"))
+            continue
+        tasks.append(asyncio.create_task(run_request(target, kind, workload.body(kind), rate, timeout)))
+    results.extend(await asyncio.gather(*tasks))
+    stop.set()
+    await sampler_task
+    return results, sampler.summary()
+
+
+def summarize(results: List[RequestResult], duration: float) -> Dict[str, Any]:
+    """Counts, error rate and p50/p95 time to first event and latency of ``results``."""
+    answered = [r for r in results if r.error != "client_backlog"]
+    ttfe = [r.ttfe_seconds for r in answered if r.ttfe_seconds is not None]
+    latency = [r.latency_seconds for r in answered if r.error is None]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if r.error:
+            errors[r.error] = errors.get(r.error, 0) + 1
+    return {
+        "requests": len(results),
+        "offered_rate": len(results) / duration if duration else 0.0,
+        "errors": errors,
+        "error_rate": sum(errors.values()) / len(results) if results else 0.0,
+        "successful_outcomes": sum(r.outcome == "success" for r in results),
+        "ttfe_p50": percentile(ttfe, 50), "ttfe_p95": percentile(ttfe, 95),
+        "latency_p50": percentile(latency, 50), "latency_p95": percentile(latency, 95),
+    }
+
+
+def saturation_reasons(stats: Dict[str, Any], first_latency_p95: Optional[float], lag: Dict[str, Any],
+                       args: argparse.Namespace) -> List[str]:
+    reasons = []
+    if stats["error_rate"] > args.max_error_rate:
+        reasons.append(f"errors {stats['error_rate']:.0%}")
+    if stats["ttfe_p95"] > args.ttfe_slo:
+        reasons.append(f"ttfe p95 {stats['ttfe_p95']:.1f}s")
+    if first_latency_p95 and stats["latency_p95"] > args.latency_factor * first_latency_p95:
+        reasons.append(f"latency p95 x{stats['latency_p95'] / first_latency_p95:.1f}")
+    if lag.get("lag_p99") is not None and lag["lag_p99"] > args.max_lag:
+        reasons.append(f"loop lag p99 {lag['lag_p99'] * 1000:.0f}ms")
+    return reasons
+
+
+# ----------------------------------------------------------------------
+# Server under test
+# ----------------------------------------------------------------------
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_until_ready(target: Target, process: Optional[subprocess.Popen], timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            await get_text(target, "/")
+            return
+        except (OSError, ConnectionError, ValueError):
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"The server exited with code {process.returncode}")
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"The server at {target.url} did not answer within {timeout:.0f}s")
+            await asyncio.sleep(0.5)
+
+
+def start_server(llm_url: str, log_path: Path) -> Tuple[subprocess.Popen, str]:
+    """Starts ``backend.api_server`` under uvicorn with the LLMs pointed at ``llm_url``."""
+    port = _free_port()
+    env = dict(os.environ, LABSCRIPT_LLM_BASE_URL=llm_url, PYTHONPATH=str(PROJECT_ROOT))
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(log_path, "w", encoding="utf-8") as log:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "backend.api_server:app", "--host", "127.0.0.1",
+             "--port", str(port), "--log-level", "warning"],
+            cwd=str(PROJECT_ROOT), env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+    return process, f"http://127.0.0.1:{port}"
+
+
+# ----------------------------------------------------------------------
+# Main
+# ----------------------------------------------------------------------
+
+async def run(args: argparse.Namespace, target: Target, process: Optional[subprocess.Popen]) -> Dict[str, Any]:
+    mix = parse_mix(args.mix)
+    workload = Workload()
+    rng = random.Random(args.seed)
+    await wait_until_ready(target, process, SERVER_START_TIMEOUT)
+    if not args.no_warmup:
+        print("warming up ...", file=sys.stderr)
+        for kind in mix:
+            await run_request(target, kind, workload.body(kind), 0.0, args.timeout)
+
+    stages = []
+    first_latency: Dict[str, float] = {}
+    for rate in args.rates:
+        print(f"rate {rate:g}/s for {args.duration:g}s ...", file=sys.stderr)
+        results, lag = await run_stage(target, workload, mix, rate, args.duration, args.max_in_flight,
+                                       args.timeout, rng)
+        stage: Dict[str, Any] = {"rate": rate, "lag": lag, "overall": summarize(results, args.duration),
+                                 "endpoints": {}}
+        for kind in mix:
+            stats = summarize([r for r in results if r.kind == kind], args.duration)
+            if stats["requests"] and stats["latency_p95"] and kind not in first_latency:
+                first_latency[kind] = stats["latency_p95"]
+            stats["saturated"] = saturation_reasons(stats, first_latency.get(kind), lag, args)
+            stage["endpoints"][kind] = stats
+        stage["saturated"] = any(stats["saturated"] for stats in stage["endpoints"].values())
+        stages.append(stage)
+        if stage["saturated"] and not args.keep_going:
+            break
+    return {"mix": mix, "stages": stages, "saturation": saturation_points(stages, mix)}
+
+
+def saturation_points(stages: List[Dict[str, Any]], mix: Dict[str, float]) -> Dict[str, Dict[str, Any]]:
+    """Per endpoint: the highest rate sustained before the first saturated stage, and that stage."""
+    total_weight = sum(mix.values())
+    points = {}
+    for kind, weight in mix.items():
+        sustained, saturated = None, None
+        for stage in stages:
+            stats = stage["endpoints"][kind]
+            if stats["saturated"]:
+                saturated = {"rate": stage["rate"], "endpoint_rate": stage["rate"] * weight / total_weight,
+                             "reasons": stats["saturated"]}
+                break
+            sustained = {"rate": stage["rate"], "endpoint_rate": stage["rate"] * weight / total_weight}
+        points[kind] = {"sustained": sustained, "saturated": saturated}
+    return points
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    rows = []
+    for stage in report["stages"]:
+        lag = stage["lag"]
+        for kind, stats in stage["endpoints"].items():
+            rows.append([
+                f"{stage['rate']:g}", kind, stats["requests"], f"{stats['error_rate']:.0%}",
+                f"{stats['ttfe_p50']:.2f}/{stats['ttfe_p95']:.2f}", f"{stats['latency_p50']:.1f}/{stats['latency_p95']:.1f}",
+                "-" if lag["lag_p99"] is None else f"{lag['lag_p99'] * 1000:.0f}",
+                f"{lag['lag_last_max'] * 1000:.0f}", ", ".join(stats["saturated"]) or "-",
+            ])
+    print_table(["rate/s", "endpoint", "reqs", "errors", "ttfe p50/p95 s", "latency p50/p95 s",
+                 "lag p99 ms", "lag max ms", "saturated"], rows)
+    print()
+    for kind, point in report["saturation"].items():
+        sustained = point["sustained"]
+        saturated = point["saturated"]
+        text = f"{kind}: sustained " + (f"{sustained['rate']:g}/s total ({sustained['endpoint_rate']:.2f}/s {kind})"
+                                        if sustained else "no tested rate")
+        if saturated:
+            text += f", saturated at {saturated['rate']:g}/s ({', '.join(saturated['reasons'])})"
+        else:
+            text += ", not saturated at the tested rates"
+        print(text)
+
+
+def _rates(text: str) -> List[float]:
+    rates = [float(part) for part in text.split(",") if part.strip()]
+    if not rates or any(rate <= 0 for rate in rates):
+        raise argparse.ArgumentTypeError("--rates needs positive numbers")
+    return rates
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Open-loop load test of the API server against an LLM stand-in")
+    parser.add_argument("--url", help="server to test (default: start one with the LLM stand-in)")
+    parser.add_argument("--rates", type=_rates, default=_rates(DEFAULT_RATES),
+                        help=f"arrival rates in requests/s, one stage each (default {DEFAULT_RATES})")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of arrivals per stage")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"endpoint weights (default {DEFAULT_MIX})")
+    parser.add_argument("--max-in-flight", type=int, default=200, help="open requests before arrivals are dropped")
+    parser.add_argument("--timeout", type=float, default=900.0, help="seconds before a request counts as timed out")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the arrival process")
+    parser.add_argument("--max-error-rate", type=float, default=0.05, help="saturation: error rate (fraction)")
+    parser.add_argument("--ttfe-slo", type=float, default=5.0, help="saturation: p95 time to first event (s)")
+    parser.add_argument("--latency-factor", type=float, default=2.0,
+                        help="saturation: p95 latency relative to the first stage")
+    parser.add_argument("--max-lag", type=float, default=0.1, help="saturation: p99 event loop lag (s)")
+    parser.add_argument("--keep-going", action="store_true", help="run all rates even after saturation")
+    parser.add_argument("--no-warmup", action="store_true", help="measure from the first request on")
+    parser.add_argument("--cassette", help="record/replay cassette of the LLM stand-in")
+    parser.add_argument("--record", action="store_true", help="with --cassette: record prompts missing from it")
+    parser.add_argument("--ttft-ms", type=float, default=500.0, help="stand-in time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="stand-in token rate")
+    parser.add_argument("--miss-response", default=DEFAULT_MISS_RESPONSE,
+                        help="stand-in answer for prompts missing from the cassette")
+    parser.add_argument("--output", type=Path, help="JSON report (default: benchmarks/results/loadtest_<time>.json)")
+    args = parser.parse_args(argv)
+    if args.record and not args.cassette:
+        parser.error("--record needs --cassette")
+
+    stamp = f"{datetime.now():%Y%m%d_%H%M%S}"
+    replay_server, process = None, None
+    if args.url:
+        url = args.url
+    else:
+        from backend.llm_replay import Cassette, ReplayBackend, ReplayServer, SyntheticLatency
+        backend = ReplayBackend(Cassette(args.cassette), mode="auto" if args.record else "replay",
+                                latency=SyntheticLatency(args.ttft_ms, args.tokens_per_second),
+                                upstreams=None if args.record else {}, miss_response=args.miss_response)
+        replay_server = ReplayServer(backend).start()
+        server_log = RESULTS_DIR / f"loadtest_{stamp}_server.log"
+        process, url = start_server(replay_server.url, server_log)
+        print(f"server {url} (log {server_log}), LLM stand-in {replay_server.url}", file=sys.stderr)
+
+    try:
+        report = asyncio.run(run(args, Target(url), process))
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if replay_server is not None:
+            replay_server.stop()
+
+    report["config"] = {
+        "url": args.url or "spawned", "duration": args.duration, "rates": args.rates, "mix": args.mix,
+        "max_in_flight": args.max_in_flight, "llm": f"replay:{args.cassette}" if args.cassette else "canned",
+        "ttft_ms": args.ttft_ms, "tokens_per_second": args.tokens_per_second,
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    if replay_server is not None:
+        report["config"]["llm_stats"] = dict(replay_server.backend.stats)
+        if "converse" in report["mix"] and not args.cassette:
+            report["config"]["note"] = ("converse ran against the plain-text miss response, which cannot "
+                                        "make tool calls; record a cassette for realistic conversations")
+    output = args.output or RESULTS_DIR / f"loadtest_{stamp}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print_report(report)
+    if "note" in report["config"]:
+        print(f"Note: {report['config']['note']}")
+    print(f"Report: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
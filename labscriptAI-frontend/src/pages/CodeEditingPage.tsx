@@ -243,8 +243,10 @@ const CodeEditingPage: React.FC = () => {
         const lines = buffer.split('\n\n');
         buffer = lines.pop() || ''; // Keep the last partial message in the buffer
 
-        for (const line of lines) {
-          if (line.startsWith('data:')) {
+        for (const block of lines) {
+          // An event may carry extra fields (e.g. `id:`) or be a heartbeat comment
+          const line = block.split('\n').find(l => l.startsWith('data:'));
+          if (line) {
             const jsonStr = line.substring(5).trim();
             if (jsonStr) {
               try {
@@ -152,6 +152,7 @@ export const apiService = {
       
           const reader = response.body.getReader();
           const decoder = new TextDecoder();
+          let buffer = '';
       
           while (true) {
             const { done, value } = await reader.read();
@@ -159,11 +160,14 @@ export const apiService = {
               onComplete();
               break;
             }
-            const chunk = decoder.decode(value);
-            const lines = chunk.split('\n\n');
+            buffer += decoder.decode(value, { stream: true });
+            const events = buffer.split('\n\n');
+            buffer = events.pop() || ''; // Keep the last partial event in the buffer
       
-            for (const line of lines) {
-              if (line.startsWith('data: ')) {
+            for (const event of events) {
+              // An event may carry extra fields (e.g. `id:`) or be a heartbeat comment
+              const line = event.split('\n').find(l => l.startsWith('data: '));
+              if (line) {
                 const dataStr = line.substring(6);
                 try {
                   const data = JSON.parse(dataStr);
@@ -77,6 +77,16 @@ def run_tests():
         print(f"❌ 测试运行失败: {e}")
         sys.exit(1)
 
+def run_benchmark(argv):
+    """运行端到端基准测试 (archive/55question.csv)"""
+    from benchmarks.bench_e2e import main as bench_main
+    sys.exit(bench_main(argv))
+
+def run_loadtest(argv):
+    """运行 API 服务器负载测试 (LLM 替身)"""
+    from benchmarks.loadtest import main as loadtest_main
+    sys.exit(loadtest_main(argv))
+
 def show_status():
     """显示项目状态"""
     print("📊 Opentrons AI Protocol Generator 状态")
@@ -144,6 +154,11 @@ def show_status():
 
 def main():
     """主函数"""
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        run_benchmark(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == "loadtest":
+        run_loadtest(sys.argv[2:])
+
     parser = argparse.ArgumentParser(
         description="Opentrons AI Protocol Generator",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -152,6 +167,8 @@ def main():
   python main.py                    # 启动API服务器
   python main.py --test            # 运行测试
   python main.py --status          # 显示项目状态
+  python main.py bench --limit 5   # 端到端基准测试 (bench --help 查看参数)
+  python main.py loadtest --rates 0.5,1,2   # 负载测试 (loadtest --help 查看参数)
   
 UV 使用示例:
   uv run python main.py            # 使用UV运行
@@ -0,0 +1,311 @@
+"""
+CommandIR.py - pyFluent 指令的中间表示 (IR)
+
+各生成器在绑定 Protocol 时不再立即生成 XML 字符串，而是创建一个轻量的指令对象
+交给 Protocol 保存，直到 save() 或流式写入时才序列化为 XML。这样可以在内存中
+直接检查、合并、估算整个协议，而无需重新解析 XML；每条指令占用的内存也远小于
+对应的 XML 字符串 (约 3 KB)。
+
+指令对象是不可变 (frozen) 的 dataclass，Python 3.10+ 还带 ``__slots__``，
+因此同一个指令对象可以被多个 Protocol (例如 replicate() 生成的各份) 安全地共享。
+所有字段都是已校验、已规整的值 (枚举已取 value，体积已展开为每通道列表)，
+序列化结果与直接调用生成器完全一致。
+
+作者: Gaoyuan
+"""
+
+import sys
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple, Union
+
+# slots=True 需要 Python 3.10+
+_DATACLASS_OPTIONS = {"frozen": True, "slots": True} if sys.version_info >= (3, 10) else {"frozen": True}
+
+_DEFAULT_GENERATORS = {}
+
+
+def default_generator(arm: str):
+    """
+    返回用于序列化的默认生成器 (不绑定 Protocol，延迟导入避免循环依赖)
+
+    Args:
+        arm (str): "fca" / "mca" / "worktable" / "rga"
+    """
+    generator = _DEFAULT_GENERATORS.get(arm)
+    if generator is None:
+        if arm == "fca":
+            from FCACommand import TecanFCAScriptGenerator as generator_class
+        elif arm == "mca":
+            from MCA384Commond import TecanMCA384ScriptGenerator as generator_class
+        elif arm == "worktable":
+            from WortableCommand import TecanWorktableScriptGenerator as generator_class
+        elif arm == "rga":
+            from RGACommond import TecanRGAScriptGenerator as generator_class
+        else:
+            raise ValueError(f"未知的硬件臂: {arm}")
+        generator = _DEFAULT_GENERATORS[arm] = generator_class()
+    return generator
+
+
+class FluentCommand:
+    """
+    所有指令 IR 的基类
+
+    子类通过类属性声明所属硬件臂 (ARM，与 Protocol 的 fca()/mca()/worktable()/rga() 对应)、
+    生成器上负责序列化的方法名 (XML_METHOD) 和保存耗材标签的字段 (LABWARE_FIELDS)。
+    """
+
+    __slots__ = ()
+
+    ARM = ""
+    XML_METHOD = ""
+    LABWARE_FIELDS: Tuple[str, ...] = ()
+
+    def field_values(self) -> Dict[str, Any]:
+        """返回 {字段名: 值} (浅拷贝，比 dataclasses.asdict / replace 快)"""
+        return {name: getattr(self, name) for name in self.__dataclass_fields__}
+
+    def to_xml(self, generator=None) -> str:
+        """
+        序列化为带前缀的 XML 指令字符串
+
+        Args:
+            generator: 用于序列化的生成器，默认使用该硬件臂的共享生成器
+        """
+        if generator is None:
+            generator = default_generator(self.ARM)
+        return generator.serialize(self)
+
+
+# ================================
+# FCA (灵活通道臂)
+# ================================
+
+@dataclass(**_DATACLASS_OPTIONS)
+class GetTips(FluentCommand):
+    """FCA 获取枪头"""
+    ARM = "fca"
+    XML_METHOD = "_get_tips_xml"
+
+    tip_type: str
+    channels: Tuple[int, ...]
+    fluent_sn: str
+
+
+@dataclass(**_DATACLASS_OPTIONS)
+class Aspirate(FluentCommand):
+    """FCA 吸液"""
+    ARM = "fca"
+    XML_METHOD = "_pipetting_xml"
+    LABWARE_FIELDS = ("labware",)
+
+    volumes: Tuple[float, ...]
+    labware: str
+    channels: Tuple[int, ...]
+    liquid_class: Optional[str]
+    wells: str
+    fluent_sn: str
+    plate_format: int = 96
+
+
+@dataclass(**_DATACLASS_OPTIONS)
+class Dispense(FluentCommand):
+    """FCA 排液"""
+    ARM = "fca"
+    XML_METHOD = "_pipetting_xml"
+    LABWARE_FIELDS = ("labware",)
+
+    volumes: Tuple[float, ...]
+    labware: str
+    channels: Tuple[int, ...]
+    liquid_class: Optional[str]
+    wells: str
+    fluent_sn: str
+    plate_format: int = 96
+
+
+@dataclass(**_DATACLASS_OPTIONS)
+class Mix(FluentCommand):
+    """FCA 混匀"""
+    ARM = "fca"
+    XML_METHOD = "_pipetting_xml"
+    LABWARE_FIELDS = ("labware",)
+
+    cycles: int
+    volumes: Tuple[float, ...]
+    labware: str
+    channels: Tuple[int, ...]
+    liquid_class: Optional[str]
+    wells: str
+    fluent_sn: str
+    plate_format: int = 96
+
+
+@dataclass(**_DATACLASS_OPTIONS)
+class DropTips(FluentCommand):
+    """FCA 丢弃枪头"""
+    ARM = "fca"
+    XML_METHOD = "_drop_tips_xml"
+
+    channels: Tuple[int, ...]
+    fluent_sn: str
+
+
+# ================================
+# MCA384 (多通道臂)
+# ================================
+
+@dataclass(**_DATACLASS_OPTIONS)
+class MCAGetHeadAdapter(FluentCommand):
+    """MCA 获取头部适配器"""
+    ARM = "mca"
+    XML_METHOD = "_get_head_adapter_xml"
+    LABWARE_FIELDS = ("adapter_label",)
+
+    adapter_label: str
+    fluent_sn: str
+
+
+@dataclass(**_DATACLASS_OPTIONS)
+class MCADropHeadAdapter(FluentCommand):
+    """MCA 释放头部适配器"""
+    ARM = "mca"
+    XML_METHOD = "_drop_head_adapter_xml"
+
+    fluent_sn: str
+
+
+@dataclass(**_DATACLASS_OPTIONS)
+class MCAPickUpTips(FluentCommand):
+    """MCA 拾取枪头"""
+    ARM = "mca"
+    XML_METHOD = "_pick_up_tips_xml"
+    LABWARE_FIELDS = ("labware",)
+
+    adapter_label: str
+    adapter_name: str
+    adapter_id: str
+    labware: str
+    fluent_sn: str
+
+
+@dataclass(**_DATACLASS_OPTIONS)
+class MCASetTipsBack(FluentCommand):
+    """MCA 将枪头放回枪头盒"""
+    ARM = "mca"
+    XML_METHOD = "_set_tips_back_xml"
+
+    adapter_label: str
+    adapter_name: str
+    adapter_id: str
+    fluent_sn: str
+
+
+@dataclass(**_DATACLASS_OPTIONS)
+class MCAAspirate(FluentCommand):
+    """MCA 吸液 (column/row 为头部 A1 对准孔位的 0 起始列/行)"""
+    ARM = "mca"
+    XML_METHOD = "_pipetting_xml"
+    LABWARE_FIELDS = ("labware",)
+
+    adapter_label: str
+    adapter_name: str
+    adapter_id: str
+    volume: float
+    labware: str
+    liquid_class: str
+    fluent_sn: str
+    column: int = 0
+    row: int = 0
+
+
+@dataclass(**_DATACLASS_OPTIONS)
+class MCADispense(FluentCommand):
+    """MCA 排液"""
+    ARM = "mca"
+    XML_METHOD = "_pipetting_xml"
+    LABWARE_FIELDS = ("labware",)
+
+    adapter_label: str
+    adapter_name: str
+    adapter_id: str
+    volume: float
+    labware: str
+    liquid_class: str
+    fluent_sn: str
+    column: int = 0
+    row: int = 0
+
+
+@dataclass(**_DATACLASS_OPTIONS)
+class MCAMix(FluentCommand):
+    """MCA 混匀"""
+    ARM = "mca"
+    XML_METHOD = "_pipetting_xml"
+    LABWARE_FIELDS = ("labware",)
+
+    adapter_label: str
+    adapter_name: str
+    adapter_id: str
+    volume: float
+    labware: str
+    liquid_class: str
+    cycles: int
+    fluent_sn: str
+    column: int = 0
+    row: int = 0
+
+
+# ================================
+# 工作台
+# ================================
+
+@dataclass(**_DATACLASS_OPTIONS)
+class AddLabware(FluentCommand):
+    """添加耗材 (labware_type / location 为枚举的 value)"""
+    ARM = "worktable"
+    XML_METHOD = "_add_labware_xml"
+    LABWARE_FIELDS = ("label",)
+
+    labware_type: str
+    label: str
+    location: str
+    position: Union[int, str]
+    rotation: int = 0
+    has_lid: bool = False
+
+
+@dataclass(**_DATACLASS_OPTIONS)
+class RemoveLabware(FluentCommand):
+    """移除耗材"""
+    ARM = "worktable"
+    XML_METHOD = "_remove_labware_xml"
+    LABWARE_FIELDS = ("labware_name",)
+
+    labware_name: str
+
+
+@dataclass(**_DATACLASS_OPTIONS)
+class InteriorLight(FluentCommand):
+    """内部照明开/关"""
+    ARM = "worktable"
+    XML_METHOD = "_interior_light_xml"
+
+    on: bool
+
+
+# ================================
+# RGA (机械臂)
+# ================================
+
+@dataclass(**_DATACLASS_OPTIONS)
+class TransferLabware(FluentCommand):
+    """RGA 转移耗材"""
+    ARM = "rga"
+    XML_METHOD = "_transfer_labware_xml"
+    LABWARE_FIELDS = ("labware",)
+
+    labware: str
+    target_location: str
+    target_position: Union[int, str]
+    only_use_selected_site: bool = True
@@ -1,5 +1,9 @@
-from xml.etree.ElementTree import Element, SubElement, tostring
+from enum import Enum
+from xml.etree.ElementTree import Element, SubElement
 from typing import List, Optional, TYPE_CHECKING
+import CommandIR as ir
+from XMLTemplate import render_command
+from FluentWells import DEFAULT_PLATE_FORMAT, PlateGeometry, get_geometry, plate_format_for
 
 if TYPE_CHECKING:
     from Protocol import Protocol, FCAState, InvalidStateException
@@ -8,7 +12,7 @@ else:
         from Protocol import FCAState, InvalidStateException
     except ImportError:
         # 为了向后兼容，如果没有 Protocol 模块，定义简单的状态类
-        from enum import Enum, auto
+        from enum import auto
         class FCAState(Enum):
             IDLE = auto()
             TIPS_LOADED = auto()
@@ -35,6 +39,8 @@ class TecanFCAScriptGenerator:
         self.DEFAULT_OFFSET = "0"
         self.TIP_SPACING = "9"
         self.COMPARTMENT = "1"
+        # 使用预编译模板生成指令；False 时逐个构建 ElementTree (参考实现，输出一致)
+        self.use_templates = True
         
         # 状态管理
         self.state = FCAState.IDLE
@@ -71,23 +77,50 @@ class TecanFCAScriptGenerator:
         if self.protocol and labware_label not in self.protocol.get_defined_labware():
             raise ValueError(f"错误：耗材 '{labware_label}' 未定义。请先使用 add_labware() 添加。")
     
-    def _execute_command(self, xml_command: str) -> 'TecanFCAScriptGenerator':
+    def _plate_geometry(self, labware_label: str) -> PlateGeometry:
         """
-        执行命令：将 XML 添加到协议或返回字符串
+        获取耗材的孔位寻址表 (根据 protocol 中记录的耗材类型；未知时按 96 孔板处理)
+        """
+        labware_type = self.protocol.get_labware_type(labware_label) if self.protocol else None
+        return get_geometry(plate_format_for(labware_type))
+    
+    def _execute_command(self, command: ir.FluentCommand) -> 'TecanFCAScriptGenerator':
+        """
+        执行命令：将指令 IR 添加到协议 (保存时再序列化) 或返回 XML 字符串
         
         Args:
-            xml_command (str): 生成的 XML 指令
+            command (FluentCommand): 指令 IR
             
         Returns:
             TecanFCAScriptGenerator: 返回自身支持链式调用，或字符串（向后兼容）
         """
         if self.protocol:
-            self.protocol.add_command(xml_command)
+            self.protocol.add_command(command)
             return self
         else:
             # 向后兼容：直接返回 XML 字符串
             # 注意：这种情况下无法链式调用
-            return xml_command
+            return self.serialize(command)
+    
+    def serialize(self, command: ir.FluentCommand) -> str:
+        """
+        将 FCA 指令 IR 序列化为带前缀的 XML 字符串
+        
+        Args:
+            command (FluentCommand): GetTips / Aspirate / Dispense / Mix / DropTips
+        """
+        return getattr(self, command.XML_METHOD)(command)
+
+    def _render(self, build, static, values) -> str:
+        """
+        生成带前缀的指令字符串
+
+        Args:
+            build: 构建方法，以 ``build(*static, **values)`` 调用
+            static (tuple): 嵌入在文本中的静态参数 (如序列号)，每种取值编译一个模板
+            values (dict): 可变的槽位值
+        """
+        return render_command(build, static, values, self.PREFIX, self.use_templates)
 
     def _create_base_structure(self):
         """Create the basic XML structure common to all commands."""
@@ -152,9 +185,10 @@ class TecanFCAScriptGenerator:
         SubElement(parent, "TipOffset").text = self.DEFAULT_OFFSET
         SubElement(parent, "TipSpacing").text = self.TIP_SPACING
 
-    def _add_well_selection(self, parent, selected_well):
+    def _add_well_selection(self, parent, selected_well, serialized_indexes=None):
         """Add well selection structure."""
-        serialized_indexes = self.wells_string_to_indexes(selected_well)
+        if serialized_indexes is None:
+            serialized_indexes = self.wells_string_to_indexes(selected_well)
         SubElement(parent, "SerializedWellIndexes").text = serialized_indexes
         SubElement(parent, "SelectedWellsString").text = selected_well
         SubElement(parent, "WellOffset").text = self.DEFAULT_OFFSET
@@ -209,7 +243,22 @@ class TecanFCAScriptGenerator:
         elif fluent_sn is None:
             raise ValueError("必须提供 fluent_sn 参数或在 Protocol 中设置")
             
-        # 生成 XML
+        command = ir.GetTips(tip_type=tip_type, channels=tuple(use_channels), fluent_sn=fluent_sn)
+        
+        # 更新状态
+        self.state = FCAState.TIPS_LOADED
+        self.current_tip_type = tip_type
+        self.current_channels = list(use_channels)
+        
+        return self._execute_command(command)
+
+    def _get_tips_xml(self, command: ir.GetTips) -> str:
+        """Serialize a GetTips command."""
+        return self._render(self._build_get_tips, (command.fluent_sn, command.tip_type),
+                            {"channels": list(command.channels)})
+
+    def _build_get_tips(self, fluent_sn, tip_type, channels):
+        """Build the GetTips command tree."""
         script_group, objects = self._create_base_structure()
 
         # Create command object
@@ -221,7 +270,7 @@ class TecanFCAScriptGenerator:
         data_v1 = SubElement(liha_get_tips, "Data",
                              Type="Tecan.Core.Instrument.Devices.LiHa.Scripting.LiHaScriptCommandUsingTipSelectionBaseDataV1")
         liha_base = SubElement(data_v1, "LiHaScriptCommandUsingTipSelectionBaseDataV1")
-        self._add_tip_selection(liha_base, use_channels)
+        self._add_tip_selection(liha_base, channels)
 
         # Add common device data
         data_v2 = SubElement(liha_base, "Data",
@@ -239,14 +288,7 @@ class TecanFCAScriptGenerator:
 
         SubElement(liha_get_tips, "UseNextPosition").text = "True"
 
-        xml_command = self.PREFIX + tostring(script_group, encoding='utf-8').decode('utf-8')
-        
-        # 更新状态
-        self.state = FCAState.TIPS_LOADED
-        self.current_tip_type = tip_type
-        self.current_channels = list(use_channels)
-        
-        return self._execute_command(xml_command)
+        return script_group
     
     # 添加链式调用的友好方法
     def get_tips(self, tip_type, channels, fluent_sn=None):
@@ -263,9 +305,79 @@ class TecanFCAScriptGenerator:
         """
         return self.GetTips(tip_type, channels, fluent_sn)
 
+    def _pipetting_command(self, command_class, volume, labwarelabel, use_channels, liquid_class,
+                           selected_well, fluent_sn, **extra):
+        """Create the IR of an Aspirate/Dispense/Mix command, validating the well selection."""
+        # 如果传入单一体积，转换为列表
+        if isinstance(volume, (int, float)):
+            volume = [volume] * len(use_channels)
+        if isinstance(liquid_class, Enum):
+            liquid_class = liquid_class.value
+        geometry = self._plate_geometry(labwarelabel)
+        geometry.parse(selected_well)  # 提前校验孔位 (结果带缓存，序列化时复用)
+        return command_class(volumes=tuple(volume), labware=labwarelabel, channels=tuple(use_channels),
+                             liquid_class=liquid_class, wells=selected_well, fluent_sn=fluent_sn,
+                             plate_format=geometry.plate_format, **extra)
+
+    def _pipetting_xml(self, command) -> str:
+        """Serialize an Aspirate/Dispense/Mix command."""
+        if isinstance(command, ir.Aspirate):
+            command_type = "Tecan.Core.Instrument.Devices.LiHa.Scripting.LihaAspirateScriptCommandDataV5"
+            additional_params = {
+                "IsSwitchContainerSourceEnabled": "False",
+                "OffsetX": self.DEFAULT_OFFSET,
+                "OffsetY": self.DEFAULT_OFFSET
+            }
+        elif isinstance(command, ir.Dispense):
+            command_type = "Tecan.Core.Instrument.Devices.LiHa.Scripting.LihaDispenseScriptCommandDataV6"
+            additional_params = {
+                "OffsetX": self.DEFAULT_OFFSET,
+                "OffsetY": self.DEFAULT_OFFSET,
+                "SkipZOnlyMoveToPipettingPosition": "False",
+                "DispenseDelays": ""
+            }
+        else:
+            command_type = "Tecan.Core.Instrument.Devices.LiHa.Scripting.LihaMixScriptCommandDataV4"
+            additional_params = {
+                "Cycles": command.cycles,
+                "OffsetX": self.DEFAULT_OFFSET,
+                "OffsetY": self.DEFAULT_OFFSET
+            }
+        return self._create_pipetting_command(
+            command_type=command_type,
+            volumes=command.volumes,
+            labware_name=command.labware,
+            use_channels=command.channels,
+            liquid_class=command.liquid_class,
+            selected_well=command.wells,
+            fluent_sn=command.fluent_sn,
+            additional_params=additional_params,
+            plate_format=command.plate_format
+        )
+
     def _create_pipetting_command(self, command_type, volumes, labware_name, use_channels,
-                                  liquid_class, selected_well, fluent_sn, additional_params=None):
+                                  liquid_class, selected_well, fluent_sn, additional_params=None,
+                                  plate_format=None):
         """Generic method to create pipetting commands (Aspirate/Dispense/Mix)."""
+        params = {param: str(value) for param, value in (additional_params or {}).items()}
+        if plate_format is None:
+            geometry = self._plate_geometry(labware_name)
+        else:
+            geometry = get_geometry(plate_format)
+        values = {
+            "volumes": list(volumes),
+            "labware_name": labware_name,
+            "channels": list(use_channels),
+            "liquid_class": liquid_class,
+            "selected_well": geometry.normalize(selected_well),
+            "serialized_indexes": geometry.serialize(selected_well),
+        }
+        values.update(params)
+        return self._render(self._build_pipetting_command, (command_type, fluent_sn, tuple(params)), values)
+
+    def _build_pipetting_command(self, command_type, fluent_sn, param_names, volumes, labware_name, channels,
+                                 liquid_class, selected_well, serialized_indexes, **params):
+        """Build the command tree shared by Aspirate/Dispense/Mix."""
         script_group, objects = self._create_base_structure()
 
         # Create command object
@@ -273,9 +385,8 @@ class TecanFCAScriptGenerator:
         command = SubElement(object_elem, command_type.split('.')[-1])
 
         # Add basic parameters
-        if additional_params:
-            for param, value in additional_params.items():
-                SubElement(command, param).text = str(value)
+        for param in param_names:
+            SubElement(command, param).text = params[param]
 
         # Add pipetting data
         pipetting = SubElement(command, "Data",
@@ -287,13 +398,13 @@ class TecanFCAScriptGenerator:
         well_selection = SubElement(pipetting_data, "Data",
                                     Type="Tecan.Core.Instrument.Devices.LiHa.Scripting.LihaScriptCommandUsingWellSelectionBaseDataV1")
         well_data = SubElement(well_selection, "LihaScriptCommandUsingWellSelectionBaseDataV1")
-        self._add_well_selection(well_data, selected_well)
+        self._add_well_selection(well_data, selected_well, serialized_indexes)
 
         # Add tip selection
         tip_selection = SubElement(well_data, "Data",
                                    Type="Tecan.Core.Instrument.Devices.LiHa.Scripting.LiHaScriptCommandUsingTipSelectionBaseDataV1")
         tip_data = SubElement(tip_selection, "LiHaScriptCommandUsingTipSelectionBaseDataV1")
-        self._add_tip_selection(tip_data, use_channels)
+        self._add_tip_selection(tip_data, channels)
 
         # Add common device data
         liha_cmd = SubElement(tip_data, "Data",
@@ -302,7 +413,7 @@ class TecanFCAScriptGenerator:
         common_data_v2 = self._add_common_data_v2(liha_cmd_data, labware_name)
         self._add_common_device_data(common_data_v2, fluent_sn)
 
-        return self.PREFIX + tostring(script_group, encoding='utf-8').decode('utf-8')
+        return script_group
 
     def Aspirate(self, volume, labwarelabel, use_channels=None, liquid_class=None, selected_well=None, fluent_sn=None):
         """
@@ -337,26 +448,10 @@ class TecanFCAScriptGenerator:
         elif fluent_sn is None:
             raise ValueError("必须提供 fluent_sn 参数或在 Protocol 中设置")
             
-        # 如果传入单一体积，转换为列表
-        if isinstance(volume, (int, float)):
-            volume = [volume] * len(use_channels)
-            
-        xml_command = self._create_pipetting_command(
-            command_type="Tecan.Core.Instrument.Devices.LiHa.Scripting.LihaAspirateScriptCommandDataV5",
-            volumes=volume,
-            labware_name=labwarelabel,
-            use_channels=use_channels,
-            liquid_class=liquid_class,
-            selected_well=selected_well,
-            fluent_sn=fluent_sn,
-            additional_params={
-                "IsSwitchContainerSourceEnabled": "False",
-                "OffsetX": self.DEFAULT_OFFSET,
-                "OffsetY": self.DEFAULT_OFFSET
-            }
-        )
+        command = self._pipetting_command(ir.Aspirate, volume, labwarelabel, use_channels,
+                                          liquid_class, selected_well, fluent_sn)
         
-        return self._execute_command(xml_command)
+        return self._execute_command(command)
     
     # 链式调用友好的方法
     def aspirate(self, volume, labware, wells=None, liquid_class="Water Free Single", channels=None, fluent_sn=None):
@@ -409,27 +504,10 @@ class TecanFCAScriptGenerator:
         elif fluent_sn is None:
             raise ValueError("必须提供 fluent_sn 参数或在 Protocol 中设置")
             
-        # 如果传入单一体积，转换为列表
-        if isinstance(volume, (int, float)):
-            volume = [volume] * len(use_channels)
-            
-        xml_command = self._create_pipetting_command(
-            command_type="Tecan.Core.Instrument.Devices.LiHa.Scripting.LihaDispenseScriptCommandDataV6",
-            volumes=volume,
-            labware_name=labwarelabel,
-            use_channels=use_channels,
-            liquid_class=liquid_class,
-            selected_well=selected_well,
-            fluent_sn=fluent_sn,
-            additional_params={
-                "OffsetX": self.DEFAULT_OFFSET,
-                "OffsetY": self.DEFAULT_OFFSET,
-                "SkipZOnlyMoveToPipettingPosition": "False",
-                "DispenseDelays": ""
-            }
-        )
+        command = self._pipetting_command(ir.Dispense, volume, labwarelabel, use_channels,
+                                          liquid_class, selected_well, fluent_sn)
         
-        return self._execute_command(xml_command)
+        return self._execute_command(command)
     
     # 链式调用友好的方法
     def dispense(self, volume, labware, wells=None, liquid_class="Water Free Single", channels=None, fluent_sn=None):
@@ -451,20 +529,9 @@ class TecanFCAScriptGenerator:
 
     def Mix(self, cycles, volume, labwarelabel, use_channels, liquid_class, selected_well, fluent_sn):
         """Generate XML script for mixing."""
-        return self._create_pipetting_command(
-            command_type="Tecan.Core.Instrument.Devices.LiHa.Scripting.LihaMixScriptCommandDataV4",
-            volumes=volume,
-            labware_name=labwarelabel,
-            use_channels=use_channels,
-            liquid_class=liquid_class,
-            selected_well=selected_well,
-            fluent_sn=fluent_sn,
-            additional_params={
-                "Cycles": cycles,
-                "OffsetX": self.DEFAULT_OFFSET,
-                "OffsetY": self.DEFAULT_OFFSET
-            }
-        )
+        command = self._pipetting_command(ir.Mix, volume, labwarelabel, use_channels,
+                                          liquid_class, selected_well, fluent_sn, cycles=cycles)
+        return self.serialize(command)
 
     def DropTips(self, use_channels=None, fluent_sn=None):
         """
@@ -491,7 +558,21 @@ class TecanFCAScriptGenerator:
         elif fluent_sn is None:
             raise ValueError("必须提供 fluent_sn 参数或在 Protocol 中设置")
             
-        # 生成 XML
+        command = ir.DropTips(channels=tuple(use_channels), fluent_sn=fluent_sn)
+        
+        # 更新状态
+        self.state = FCAState.IDLE
+        self.current_tip_type = None
+        self.current_channels = None
+        
+        return self._execute_command(command)
+
+    def _drop_tips_xml(self, command: ir.DropTips) -> str:
+        """Serialize a DropTips command."""
+        return self._render(self._build_drop_tips, (command.fluent_sn,), {"channels": list(command.channels)})
+
+    def _build_drop_tips(self, fluent_sn, channels):
+        """Build the DropTips command tree."""
         script_group, objects = self._create_base_structure()
 
         # Create command object
@@ -505,7 +586,7 @@ class TecanFCAScriptGenerator:
         data_v1 = SubElement(drop_tips, "Data",
                              Type="Tecan.Core.Instrument.Devices.LiHa.Scripting.LiHaScriptCommandUsingTipSelectionBaseDataV1")
         liha_base = SubElement(data_v1, "LiHaScriptCommandUsingTipSelectionBaseDataV1")
-        self._add_tip_selection(liha_base, use_channels)
+        self._add_tip_selection(liha_base, channels)
 
         # Add common device data
         data_v2 = SubElement(liha_base, "Data",
@@ -514,14 +595,7 @@ class TecanFCAScriptGenerator:
         common_data_v2 = self._add_common_data_v2(liha_cmd, "FCA Thru Deck Waste Chute_1")
         self._add_common_device_data(common_data_v2, fluent_sn)
 
-        xml_command = self.PREFIX + tostring(script_group, encoding='utf-8').decode('utf-8')
-        
-        # 更新状态
-        self.state = FCAState.IDLE
-        self.current_tip_type = None
-        self.current_channels = None
-        
-        return self._execute_command(xml_command)
+        return script_group
     
     # 链式调用友好的方法
     def drop_tips(self, channels=None, fluent_sn=None):
@@ -537,14 +611,9 @@ class TecanFCAScriptGenerator:
         """
         return self.DropTips(channels, fluent_sn)
 
-    def wells_string_to_indexes(self, wells_string):
-        """Convert wells string like 'A1, B2, C3' to index string like '10;11;19;20;28;29;37;45;'"""
-        indexes = []
-        for well in wells_string.split(','):
-            well = well.strip()
-            if not well: continue
-            row = well[0].upper()  # A, B, C etc.
-            col = int(well[1:])  # 1, 2, 3 etc.
-            index = (col - 1) * 8 + (ord(row) - ord('A'))
-            indexes.append(str(index))
-        return ';'.join(indexes) + ';'
\ No newline at end of file
+    def wells_string_to_indexes(self, wells_string, plate_format=DEFAULT_PLATE_FORMAT):
+        """
+        Convert a well selection like 'A1, B2, C3' (or 'A1:H1', 'col2', 'rowB')
+        to an index string like '0;9;18;' for the given plate format (24/96/384/1536).
+        """
+        return get_geometry(plate_format).serialize(wells_string)
\ No newline at end of file
@@ -0,0 +1,290 @@
+"""
+FluentEstimator.py - pyFluent 协议的运行时间估算
+
+按指令 IR (见 CommandIR.py) 累加每条指令的耗时，用于安排仪器排期。耗时模型 (DurationModel)
+由以下几部分组成，所有参数都可以按实际仪器校准后覆盖:
+
+- 固定开销: 取/丢枪头、MCA 适配器与枪头、RGA 转移等每条指令的基础耗时；
+- 移液: 基础耗时 + 体积 / 流速，流速按液体类型取值 (各通道并行，按最大体积计)；
+- 混匀: 每个循环吸、排各一次；
+- 机械臂移动: FCA 和 MCA 各自记录当前所在位置 (耗材所在的 Nest 与位置编号、枪头盒、废弃位)，
+  移动到不同位置时按位置编号的距离计时。
+
+工作台定义 (AddLabware / RemoveLabware) 不计时间。估算只用于排期，不代表仪器的精确运行时间。
+
+用法:
+    estimate = protocol.estimate()
+    print(estimate.summary())
+
+作者: Gaoyuan
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+import CommandIR as ir
+
+# 液体类型 -> (吸液流速, 排液流速)，单位 µL/s
+LIQUID_CLASS_FLOW_RATES = {
+    "Water Free Single": (150.0, 600.0),
+    "Water Free Multi": (150.0, 600.0),
+    "Ethanol Free Single": (100.0, 400.0),
+    "Ethanol Free Multi": (100.0, 400.0),
+    "DMSO Free Single": (50.0, 200.0),
+    "DMSO Free Multi": (50.0, 200.0),
+    "MasterMix Free Single": (50.0, 150.0),
+    "MasterMix Free Multi": (50.0, 150.0),
+    "Water Mix": (150.0, 300.0),
+    "Empty Tip": (300.0, 300.0),
+    "Water Contact Wet Single": (100.0, 200.0),
+    "Water Contact Wet Multi": (100.0, 200.0),
+}
+
+# 丢弃枪头的固定位置
+WASTE_SITE = ("waste", None)
+
+CATEGORIES = ("tips", "pipetting", "travel", "mca", "rga", "other")
+
+
+def format_duration(seconds: float) -> str:
+    """秒数转为可读时长，如 3725 -> "1 h 02 min 05 s" """
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours} h {minutes:02d} min {seconds:02d} s"
+    if minutes:
+        return f"{minutes} min {seconds:02d} s"
+    return f"{seconds} s"
+
+
+@dataclass
+class DurationModel:
+    """每类指令的耗时参数 (秒)"""
+    get_tips: float = 8.0
+    drop_tips: float = 5.0
+    aspirate_base: float = 3.0
+    dispense_base: float = 2.0
+    mix_base: float = 2.0
+    mca_get_head_adapter: float = 25.0
+    mca_drop_head_adapter: float = 25.0
+    mca_pick_up_tips: float = 15.0
+    mca_set_tips_back: float = 15.0
+    rga_transfer: float = 30.0
+    interior_light: float = 0.5
+    # 机械臂移动: 基础耗时 + 每相差一个位置编号的耗时；不同 Nest 之间额外加时
+    travel_base: float = 1.5
+    travel_per_position: float = 0.3
+    travel_between_locations: float = 1.0
+    default_flow_rates: Tuple[float, float] = (100.0, 300.0)
+    flow_rates: Dict[str, Tuple[float, float]] = field(default_factory=lambda: dict(LIQUID_CLASS_FLOW_RATES))
+
+    def flow_rate(self, liquid_class: Optional[str], dispense: bool = False) -> float:
+        rates = self.flow_rates.get(liquid_class or "", self.default_flow_rates)
+        return rates[1] if dispense else rates[0]
+
+    def travel(self, origin: Optional[tuple], target: tuple) -> float:
+        """从 origin 移动到 target 的耗时；origin 为 None (初始位置) 时按一次基础移动计"""
+        if origin == target:
+            return 0.0
+        if origin is None:
+            return self.travel_base
+        (origin_location, origin_position), (location, position) = origin, target
+        seconds = self.travel_base
+        if origin_location != location:
+            seconds += self.travel_between_locations
+        if isinstance(origin_position, int) and isinstance(position, int):
+            seconds += self.travel_per_position * abs(position - origin_position)
+        return seconds
+
+
+@dataclass
+class RunTimeEstimate:
+    """运行时间估算结果"""
+    total_seconds: float = 0.0
+    commands: int = 0
+    skipped: int = 0                                                  # 无法估算的 XML 字符串指令
+    by_category: Dict[str, float] = field(default_factory=lambda: dict.fromkeys(CATEGORIES, 0.0))
+    by_command: Dict[str, float] = field(default_factory=dict)        # 指令类型 -> 累计耗时
+
+    @property
+    def minutes(self) -> float:
+        return self.total_seconds / 60
+
+    def add(self, command: str, category: str, seconds: float) -> None:
+        self.total_seconds += seconds
+        self.by_category[category] += seconds
+        self.by_command[command] = self.by_command.get(command, 0.0) + seconds
+
+    def to_dict(self) -> dict:
+        """转为可 JSON 序列化的字典"""
+        return {
+            "total_seconds": round(self.total_seconds, 1),
+            "total_human": format_duration(self.total_seconds),
+            "commands": self.commands,
+            "skipped": self.skipped,
+            "by_category": {name: round(value, 1) for name, value in self.by_category.items()},
+            "by_command": {name: round(value, 1) for name, value in self.by_command.items()},
+        }
+
+    def summary(self) -> str:
+        """返回一行可读摘要"""
+        parts = ", ".join(f"{name} {format_duration(value)}" for name, value in self.by_category.items() if value)
+        return f"预计运行时间 {format_duration(self.total_seconds)} ({self.commands} 条指令; {parts})"
+
+
+class FluentEstimator:
+    """
+    按顺序累加指令耗时
+
+    Args:
+        model (DurationModel, optional): 耗时参数，默认使用 DurationModel()
+    """
+
+    def __init__(self, model: Optional[DurationModel] = None):
+        self.model = model or DurationModel()
+        self.sites: Dict[str, tuple] = {}          # 耗材标签 -> (Nest, 位置编号)
+        self.labware_types: Dict[str, str] = {}    # 耗材标签 -> 耗材类型
+        self.fca_site: Optional[tuple] = None
+        self.mca_site: Optional[tuple] = None
+        self.estimate = RunTimeEstimate()
+
+    def run(self, commands: Sequence[Union[ir.FluentCommand, str]]) -> RunTimeEstimate:
+        """
+        估算指令序列的运行时间
+
+        Args:
+            commands: 指令 IR 序列 (通常来自 ``Protocol.get_commands()``)
+        """
+        for command in commands:
+            if isinstance(command, str):
+                self.estimate.skipped += 1
+                continue
+            handler = getattr(self, f"_on_{type(command).__name__}", None)
+            if handler is None:
+                self.estimate.skipped += 1
+                continue
+            handler(command)
+            self.estimate.commands += 1
+        return self.estimate
+
+    def _site(self, labware: str) -> tuple:
+        position = self.sites.get(labware)
+        return position if position is not None else (labware, None)
+
+    def _move_fca(self, command: str, site: tuple) -> None:
+        self.estimate.add(command, "travel", self.model.travel(self.fca_site, site))
+        self.fca_site = site
+
+    def _move_mca(self, command: str, site: tuple) -> None:
+        self.estimate.add(command, "travel", self.model.travel(self.mca_site, site))
+        self.mca_site = site
+
+    def _volume_seconds(self, volume: float, liquid_class: Optional[str], dispense: bool) -> float:
+        return float(volume) / self.model.flow_rate(liquid_class, dispense)
+
+    # ------------------------------------------------------------------
+    # 工作台 / RGA
+    # ------------------------------------------------------------------
+
+    def _on_AddLabware(self, command: ir.AddLabware) -> None:
+        position = command.position
+        if isinstance(position, str) and position.strip().isdigit():
+            position = int(position)
+        self.sites[command.label] = (command.location, position)
+        self.labware_types[command.label] = command.labware_type
+
+    def _on_RemoveLabware(self, command: ir.RemoveLabware) -> None:
+        self.sites.pop(command.labware_name, None)
+        self.labware_types.pop(command.labware_name, None)
+
+    def _on_InteriorLight(self, command: ir.InteriorLight) -> None:
+        self.estimate.add("InteriorLight", "other", self.model.interior_light)
+
+    def _on_TransferLabware(self, command: ir.TransferLabware) -> None:
+        self.estimate.add("TransferLabware", "rga", self.model.rga_transfer)
+        position = command.target_position
+        if isinstance(position, str) and position.strip().isdigit():
+            position = int(position)
+        self.sites[command.labware] = (command.target_location, position)
+
+    # ------------------------------------------------------------------
+    # FCA
+    # ------------------------------------------------------------------
+
+    def _on_GetTips(self, command: ir.GetTips) -> None:
+        rack_types = (f"FCA, {command.tip_type}", f"FCA, {command.tip_type} SBS")
+        rack = next((label for label, labware_type in self.labware_types.items() if labware_type in rack_types),
+                    None)
+        site = self._site(rack) if rack is not None else (f"FCA, {command.tip_type}", None)
+        self._move_fca("GetTips", site)
+        self.estimate.add("GetTips", "tips", self.model.get_tips)
+
+    def _on_DropTips(self, command: ir.DropTips) -> None:
+        self._move_fca("DropTips", WASTE_SITE)
+        self.estimate.add("DropTips", "tips", self.model.drop_tips)
+
+    def _on_Aspirate(self, command: ir.Aspirate) -> None:
+        self._move_fca("Aspirate", self._site(command.labware))
+        volume = max(command.volumes, default=0)
+        self.estimate.add("Aspirate", "pipetting",
+                          self.model.aspirate_base + self._volume_seconds(volume, command.liquid_class, False))
+
+    def _on_Dispense(self, command: ir.Dispense) -> None:
+        self._move_fca("Dispense", self._site(command.labware))
+        volume = max(command.volumes, default=0)
+        self.estimate.add("Dispense", "pipetting",
+                          self.model.dispense_base + self._volume_seconds(volume, command.liquid_class, True))
+
+    def _on_Mix(self, command: ir.Mix) -> None:
+        self._move_fca("Mix", self._site(command.labware))
+        volume = max(command.volumes, default=0)
+        cycle = (self._volume_seconds(volume, command.liquid_class, False)
+                 + self._volume_seconds(volume, command.liquid_class, True))
+        self.estimate.add("Mix", "pipetting", self.model.mix_base + int(command.cycles) * cycle)
+
+    # ------------------------------------------------------------------
+    # MCA
+    # ------------------------------------------------------------------
+
+    def _on_MCAGetHeadAdapter(self, command: ir.MCAGetHeadAdapter) -> None:
+        self._move_mca("MCAGetHeadAdapter", self._site(command.adapter_label))
+        self.estimate.add("MCAGetHeadAdapter", "mca", self.model.mca_get_head_adapter)
+
+    def _on_MCADropHeadAdapter(self, command: ir.MCADropHeadAdapter) -> None:
+        self.estimate.add("MCADropHeadAdapter", "mca", self.model.mca_drop_head_adapter)
+
+    def _on_MCAPickUpTips(self, command: ir.MCAPickUpTips) -> None:
+        self._move_mca("MCAPickUpTips", self._site(command.labware))
+        self.estimate.add("MCAPickUpTips", "mca", self.model.mca_pick_up_tips)
+
+    def _on_MCASetTipsBack(self, command: ir.MCASetTipsBack) -> None:
+        self.estimate.add("MCASetTipsBack", "mca", self.model.mca_set_tips_back)
+
+    def _on_MCAAspirate(self, command: ir.MCAAspirate) -> None:
+        self._move_mca("MCAAspirate", self._site(command.labware))
+        self.estimate.add("MCAAspirate", "pipetting",
+                          self.model.aspirate_base + self._volume_seconds(command.volume, command.liquid_class, False))
+
+    def _on_MCADispense(self, command: ir.MCADispense) -> None:
+        self._move_mca("MCADispense", self._site(command.labware))
+        self.estimate.add("MCADispense", "pipetting",
+                          self.model.dispense_base + self._volume_seconds(command.volume, command.liquid_class, True))
+
+    def _on_MCAMix(self, command: ir.MCAMix) -> None:
+        self._move_mca("MCAMix", self._site(command.labware))
+        cycle = (self._volume_seconds(command.volume, command.liquid_class, False)
+                 + self._volume_seconds(command.volume, command.liquid_class, True))
+        self.estimate.add("MCAMix", "pipetting", self.model.mix_base + int(command.cycles) * cycle)
+
+
+def estimate(commands: Sequence[Union[ir.FluentCommand, str]],
+             model: Optional[DurationModel] = None) -> RunTimeEstimate:
+    """
+    便捷函数: 估算指令序列的运行时间
+
+    Args:
+        commands: 指令 IR 序列
+        model (DurationModel, optional): 耗时参数
+    """
+    return FluentEstimator(model).run(commands)
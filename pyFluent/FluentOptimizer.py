@@ -0,0 +1,199 @@
+"""
+FluentOptimizer.py - pyFluent 指令流的合并优化
+
+LLM 或脚本生成的 Fluent 协议中常见一长串单通道的"取枪头 → 吸液 → 排液 → 丢枪头"循环，
+每个循环只用 8 通道 FCA 中的一个通道。本模块在指令 IR (见 CommandIR.py) 上做一次
+可选的优化: 把相邻且兼容的单通道循环合并为一个多通道循环，减少机械臂移动次数。
+
+合并规则 (不满足任何一条就保持原样):
+    1. 循环必须是完整的 FCA 状态转换: GetTips (IDLE -> TIPS_LOADED)、若干次 Aspirate /
+       Dispense / Mix、DropTips (TIPS_LOADED -> IDLE)，全程只使用同一个通道、每步只涉及一个孔位；
+    2. 同一组内各循环的枪头类型、序列号、步骤序列 (类型、耗材、液体类型、混匀次数) 完全相同；
+    3. 每一步中各循环的孔位位于同一列，行号严格递增，且行距不小于通道最小间距
+       (96 孔板相邻行即可，384 孔板至少隔一行)；
+    4. 各循环之间不共用孔位 (同为吸液的除外)，保证合并后的执行顺序不改变液体去向；
+    5. 其它硬件臂的指令、直接添加的 XML 字符串都会截断分组，合并不会跨越它们。
+
+合并后第 i 个循环使用通道 i，体积和孔位按循环顺序排列。
+
+用法:
+    report = protocol.optimize()   # 在 save() 之前调用
+    print(report.summary())
+
+作者: Gaoyuan
+"""
+
+from dataclasses import dataclass, replace
+from typing import List, Optional, Sequence, Tuple, Union
+
+import CommandIR as ir
+from FluentWells import get_geometry
+
+# FCA 的通道数
+FCA_CHANNELS = 8
+
+# 8 个通道的最小间距等于 96 孔板的行距 (9 mm)
+_CHANNEL_PITCH_ROWS = {24: 1, 96: 1, 384: 2, 1536: 4}
+
+_PIPETTING_TYPES = (ir.Aspirate, ir.Dispense, ir.Mix)
+
+
+@dataclass
+class OptimizationReport:
+    """
+    合并优化的结果统计
+
+    每条 FCA 指令对应机械臂的一次定位移动 (枪头盒、耗材或废弃位)，
+    因此 moves_saved 即减少的 FCA 指令数。
+    """
+    commands_before: int = 0
+    commands_after: int = 0
+    cycles_merged: int = 0      # 被合并的单通道循环数
+    groups: int = 0             # 合并后得到的多通道循环数
+
+    @property
+    def moves_saved(self) -> int:
+        return self.commands_before - self.commands_after
+
+    def summary(self) -> str:
+        """返回一行可读的优化摘要"""
+        if not self.groups:
+            return f"未找到可合并的单通道循环 ({self.commands_before} 条指令)"
+        return (f"将 {self.cycles_merged} 个单通道循环合并为 {self.groups} 个多通道循环，"
+                f"指令 {self.commands_before} -> {self.commands_after} 条，"
+                f"预计减少 {self.moves_saved} 次机械臂移动")
+
+
+class _Cycle:
+    """一个完整的单通道 GetTips ... DropTips 循环"""
+
+    __slots__ = ("commands", "signature", "wells")
+
+    def __init__(self, commands: List[ir.FluentCommand], signature: tuple, wells: List[Tuple[int, int, int]]):
+        self.commands = commands
+        self.signature = signature
+        self.wells = wells  # 每个移液步骤的 (板型, 行, 列)
+
+
+def _single_channel_cycle(commands: Sequence[ir.FluentCommand]) -> Optional[_Cycle]:
+    """检查 GetTips ... DropTips 片段是否为可合并的单通道循环，不是则返回 None"""
+    get_tips, steps, drop_tips = commands[0], commands[1:-1], commands[-1]
+    if len(get_tips.channels) != 1 or drop_tips.channels != get_tips.channels:
+        return None
+    if drop_tips.fluent_sn != get_tips.fluent_sn or not steps:
+        return None
+
+    step_signatures = []
+    wells = []
+    for step in steps:
+        if not isinstance(step, _PIPETTING_TYPES):
+            return None
+        if step.channels != get_tips.channels or len(step.volumes) != 1 or step.fluent_sn != get_tips.fluent_sn:
+            return None
+        geometry = get_geometry(step.plate_format)
+        try:
+            indexes = geometry.parse(step.wells or "")
+        except ValueError:
+            return None
+        if len(indexes) != 1:
+            return None
+        row, column = geometry.row_col(indexes[0])
+        wells.append((step.plate_format, row, column))
+        step_signatures.append((type(step), step.labware, step.liquid_class, step.plate_format,
+                                getattr(step, "cycles", None)))
+
+    signature = (get_tips.tip_type, get_tips.fluent_sn, tuple(step_signatures))
+    return _Cycle(list(commands), signature, wells)
+
+
+def _can_join(group: List[_Cycle], cycle: _Cycle, max_channels: int) -> bool:
+    """判断循环能否加入当前分组"""
+    if len(group) >= max_channels or cycle.signature != group[0].signature:
+        return False
+    last = group[-1]
+    for (plate_format, row, column), (_, last_row, last_column) in zip(cycle.wells, last.wells):
+        if column != last_column or row - last_row < _CHANNEL_PITCH_ROWS.get(plate_format, 1):
+            return False
+
+    # 合并会把后面循环的步骤提前，只有在循环之间不共用孔位 (同为吸液除外) 时才安全
+    for step, (_, row, column) in zip(cycle.commands[1:-1], cycle.wells):
+        labware = step.labware
+        for member in group:
+            for other, (_, other_row, other_column) in zip(member.commands[1:-1], member.wells):
+                if (other.labware == labware and other_row == row and other_column == column
+                        and not (isinstance(step, ir.Aspirate) and isinstance(other, ir.Aspirate))):
+                    return False
+    return True
+
+
+def _merge(group: List[_Cycle]) -> List[ir.FluentCommand]:
+    """把一组单通道循环合并为一个多通道循环"""
+    first = group[0].commands
+    if len(group) == 1:
+        return first
+    channels = tuple(range(len(group)))
+    merged = [replace(first[0], channels=channels)]
+    for position, step in enumerate(first[1:-1], start=1):
+        steps = [cycle.commands[position] for cycle in group]
+        merged.append(replace(
+            step,
+            channels=channels,
+            volumes=tuple(item.volumes[0] for item in steps),
+            wells=",".join(get_geometry(item.plate_format).names(item.wells)[0] for item in steps),
+        ))
+    merged.append(replace(first[-1], channels=channels))
+    return merged
+
+
+def merge_single_channel_cycles(commands: Sequence[Union[ir.FluentCommand, str]],
+                                max_channels: int = FCA_CHANNELS
+                                ) -> Tuple[List[Union[ir.FluentCommand, str]], OptimizationReport]:
+    """
+    将相邻的单通道 FCA 循环合并为多通道循环
+
+    Args:
+        commands: 指令 IR 序列 (通常来自 ``Protocol.get_commands()``)
+        max_channels (int): 每个合并循环最多使用的通道数
+
+    Returns:
+        tuple: (优化后的指令列表, OptimizationReport)
+    """
+    if not 1 <= max_channels <= FCA_CHANNELS:
+        raise ValueError(f"max_channels 必须在 1-{FCA_CHANNELS} 之间: {max_channels}")
+
+    report = OptimizationReport(commands_before=len(commands))
+    optimized: List[Union[ir.FluentCommand, str]] = []
+    group: List[_Cycle] = []
+
+    def flush() -> None:
+        if len(group) > 1:
+            report.cycles_merged += len(group)
+            report.groups += 1
+        for command in _merge(group) if group else ():
+            optimized.append(command)
+        group.clear()
+
+    position = 0
+    count = len(commands)
+    while position < count:
+        command = commands[position]
+        if isinstance(command, ir.GetTips):
+            # 找到与之配对的 DropTips (中间只允许移液步骤)
+            end = position + 1
+            while end < count and isinstance(commands[end], _PIPETTING_TYPES):
+                end += 1
+            if end < count and isinstance(commands[end], ir.DropTips):
+                cycle = _single_channel_cycle(commands[position:end + 1])
+                if cycle is not None:
+                    if group and not _can_join(group, cycle, max_channels):
+                        flush()
+                    group.append(cycle)
+                    position = end + 1
+                    continue
+        flush()
+        optimized.append(command)
+        position += 1
+    flush()
+
+    report.commands_after = len(optimized)
+    return optimized, report
@@ -0,0 +1,584 @@
+"""
+FluentSimulator.py - pyFluent 协议的离线运行模拟
+
+Protocol 只检查粗粒度的状态 (FCAState / MCAState / RGAState) 和耗材是否已定义，
+吸空、枪头用尽、孔位溢出等问题只有在真机上才会暴露。本模块在进程内按顺序回放
+指令 IR (见 CommandIR.py)，同时记录:
+
+- 每个耗材每个孔的液体体积 (吸液不足、超过孔容积)；
+- 每个枪头盒的枪头占用 (FCA 按枪头类型依次取用，MCA 整盒拾取/放回)；
+- 每个通道枪头内的液体 (超过枪头容量、排液多于已吸体积、丢弃时仍有残液)；
+- 各硬件臂的状态转换和耗材是否存在。
+
+发现的问题不会中断回放，全部收集到 SimulationReport 中，可以直接转为 JSON 供 CI 使用。
+安装了 NumPy 时孔位体积和枪头占用使用数组批量更新 (384 孔 MCA 操作只需一次向量运算)；
+未安装时使用纯 Python 列表，结果一致。
+
+用法:
+    report = protocol.simulate(initial_volumes={"Source[001]": 1000})
+    if not report.ok:
+        print(report.summary())
+
+孔容积、枪头容量按耗材类型名称取值 (见 WELL_CAPACITIES)；未知类型的孔不检查溢出。
+未在 initial_volumes 中声明的孔初始为空，因此源板必须声明初始体积。
+
+作者: Gaoyuan
+"""
+
+import math
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Union
+
+import CommandIR as ir
+from FluentWells import get_geometry, plate_format_for
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+
+# 耗材类型 -> 单孔最大容积 (µL)
+WELL_CAPACITIES = {
+    "24 Well Flat": 3400.0,
+    "96 Well Flat": 360.0,
+    "96 Well Round": 300.0,
+    "96 Deep Well 0.5ml": 500.0,
+    "96 Deep Well 1ml": 1000.0,
+    "96 Deep Well 2ml": 2000.0,
+    "96 Well Skirted PCR": 200.0,
+    "384 Well Flat": 110.0,
+    "300ml SBS": 300000.0,
+}
+
+# 所有孔位共用同一腔体的槽
+RESERVOIR_TYPES = {"300ml SBS"}
+
+# 枪头盒类型前缀 (FCA 按 "FCA, {枪头类型}" 取用，MCA 按标签整盒拾取)
+FCA_TIP_RACK_PREFIX = "FCA, "
+MCA_TIP_RACK_PREFIX = "MCA96, "
+TIPS_PER_RACK = 96
+
+# 体积比较的容差 (µL)
+VOLUME_TOLERANCE = 1e-6
+
+_VOLUME_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*ul", re.IGNORECASE)
+
+
+def _tip_capacity(name: str) -> float:
+    """从枪头类型或枪头盒类型中解析枪头容量，如 "200ul" / "MCA96, 50ul, Box" """
+    match = _VOLUME_PATTERN.search(name or "")
+    return float(match.group(1)) if match else math.inf
+
+
+# ================================
+# 报告
+# ================================
+
+@dataclass
+class SimulationIssue:
+    """模拟中发现的一个问题"""
+    index: int                  # 指令在协议中的序号 (从 0 开始)
+    command: str                # 指令类型，如 "Aspirate"
+    kind: str                   # 问题类别，如 "well_overdraw" / "tips_exhausted"
+    severity: str               # "error" 或 "warning"
+    message: str
+    labware: Optional[str] = None
+    wells: List[str] = field(default_factory=list)
+
+
+@dataclass
+class SimulationReport:
+    """模拟结果"""
+    commands: int = 0
+    skipped: int = 0                                                # 无法模拟的 XML 字符串指令
+    issues: List[SimulationIssue] = field(default_factory=list)
+    tips_used: Dict[str, int] = field(default_factory=dict)         # 枪头类型 / 枪头盒 -> 用量
+    tips_remaining: Dict[str, int] = field(default_factory=dict)    # 枪头盒标签 -> 剩余枪头
+    volumes: Dict[str, Dict[str, float]] = field(default_factory=dict)  # 耗材 -> 非空孔的最终体积
+    elapsed_ms: float = 0.0
+
+    @property
+    def errors(self) -> List[SimulationIssue]:
+        return [issue for issue in self.issues if issue.severity == "error"]
+
+    @property
+    def warnings(self) -> List[SimulationIssue]:
+        return [issue for issue in self.issues if issue.severity == "warning"]
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def to_dict(self) -> dict:
+        """转为可 JSON 序列化的字典"""
+        result = asdict(self)
+        result["ok"] = self.ok
+        return result
+
+    def summary(self) -> str:
+        """返回多行可读摘要"""
+        status = "通过" if self.ok else "失败"
+        lines = [f"模拟{status}: {self.commands} 条指令，{len(self.errors)} 个错误，"
+                 f"{len(self.warnings)} 个警告，耗时 {self.elapsed_ms:.1f} ms"]
+        for issue in self.issues:
+            wells = f" ({', '.join(issue.wells[:8])}{' ...' if len(issue.wells) > 8 else ''})" if issue.wells else ""
+            lines.append(f"  [{issue.severity}] #{issue.index} {issue.command}: {issue.message}{wells}")
+        return "\n".join(lines)
+
+
+# ================================
+# 孔位 / 枪头存储 (NumPy 或纯 Python)
+# ================================
+
+def _filled(size: int, value):
+    if NUMPY_AVAILABLE:
+        return np.full(size, value, dtype=bool if isinstance(value, bool) else np.float64)
+    return [value] * size
+
+
+class _Labware:
+    """模拟中的一个耗材"""
+
+    __slots__ = ("label", "labware_type", "geometry", "reservoir", "capacity", "volumes", "tips", "tip_capacity")
+
+    def __init__(self, label: str, labware_type: str):
+        self.label = label
+        self.labware_type = labware_type
+        self.geometry = get_geometry(plate_format_for(labware_type))
+        self.reservoir = labware_type in RESERVOIR_TYPES
+        self.capacity = WELL_CAPACITIES.get(labware_type, math.inf)
+        self.volumes = _filled(1 if self.reservoir else self.geometry.size, 0.0)
+        self.tips = None
+        self.tip_capacity = math.inf
+        if labware_type.startswith((FCA_TIP_RACK_PREFIX, MCA_TIP_RACK_PREFIX)):
+            self.tips = _filled(TIPS_PER_RACK, True)
+            self.tip_capacity = _tip_capacity(labware_type)
+
+    def cells(self, indexes: Sequence[int]) -> List[int]:
+        """孔位索引转为体积数组下标 (槽的所有孔位共用一个下标)"""
+        return [0] * len(indexes) if self.reservoir else list(indexes)
+
+    def well_names(self, cells: Sequence[int]) -> List[str]:
+        if self.reservoir:
+            return [self.geometry.name(0)] if len(cells) else []
+        return [self.geometry.name(int(cell)) for cell in cells]
+
+    def tip_count(self) -> int:
+        return int(sum(self.tips)) if self.tips is not None else 0
+
+
+def _add(volumes, cells: Sequence[int], amounts: Sequence[float]) -> None:
+    """按下标累加体积 (同一下标可出现多次)"""
+    if NUMPY_AVAILABLE:
+        np.add.at(volumes, np.asarray(cells, dtype=np.int64), np.asarray(amounts, dtype=np.float64))
+    else:
+        for cell, amount in zip(cells, amounts):
+            volumes[cell] += amount
+
+
+def _below_zero(volumes, cells: Sequence[int]) -> List[int]:
+    """返回体积为负的下标 (去重、升序)，并将其归零"""
+    if NUMPY_AVAILABLE:
+        unique = np.unique(np.asarray(cells, dtype=np.int64))
+        negative = unique[volumes[unique] < -VOLUME_TOLERANCE]
+        volumes[negative] = 0.0
+        return negative.tolist()
+    negative = sorted(cell for cell in set(cells) if volumes[cell] < -VOLUME_TOLERANCE)
+    for cell in negative:
+        volumes[cell] = 0.0
+    return negative
+
+
+def _above(volumes, cells: Sequence[int], capacity: float) -> List[int]:
+    """返回体积超过容积的下标 (去重、升序)"""
+    if math.isinf(capacity):
+        return []
+    if NUMPY_AVAILABLE:
+        unique = np.unique(np.asarray(cells, dtype=np.int64))
+        return unique[volumes[unique] > capacity + VOLUME_TOLERANCE].tolist()
+    return sorted(cell for cell in set(cells) if volumes[cell] > capacity + VOLUME_TOLERANCE)
+
+
+@lru_cache(maxsize=None)
+def _mca_footprint(geometry, head_size: int, column: int, row: int) -> Optional[tuple]:
+    """MCA 头部 (96 / 384 通道) 在孔板上覆盖的孔位索引 (带缓存)；头部超出孔板时返回 None"""
+    head_rows, head_columns = (16, 24) if head_size == 384 else (8, 12)
+    step = geometry.rows // head_rows
+    if step == 0 or geometry.columns // head_columns != step:
+        return None
+    if row + step * (head_rows - 1) >= geometry.rows or column + step * (head_columns - 1) >= geometry.columns:
+        return None
+    if NUMPY_AVAILABLE:
+        rows = row + step * np.arange(head_rows)
+        columns = column + step * np.arange(head_columns)
+        return tuple((columns[:, None] * geometry.rows + rows[None, :]).ravel().tolist())
+    return tuple((column + step * c) * geometry.rows + row + step * r
+                 for c in range(head_columns) for r in range(head_rows))
+
+
+# ================================
+# 模拟器
+# ================================
+
+class FluentSimulator:
+    """
+    按顺序回放指令 IR 并记录体积、枪头与状态
+
+    Args:
+        initial_volumes (dict, optional): 耗材标签 -> 初始体积 (µL)。值可以是数字 (所有孔)
+            或 {孔位选择字符串: 体积} 字典，如 {"Source[001]": {"col1": 150}}
+    """
+
+    def __init__(self, initial_volumes: Optional[Dict[str, Union[float, Dict[str, float]]]] = None):
+        self.initial_volumes = initial_volumes or {}
+        self.labware: Dict[str, _Labware] = {}
+        self.report = SimulationReport()
+        # FCA: 通道 -> [枪头类型, 枪头内体积]
+        self.fca_tips: Dict[int, list] = {}
+        # MCA: 适配器标签、枪头来源的枪头盒、每个枪头内的体积
+        self.mca_adapter: Optional[str] = None
+        self.mca_tip_rack: Optional[str] = None
+        self.mca_tip_volume = 0.0
+        self.rga_holding: Optional[str] = None
+        self._index = 0
+        self._command = ""
+
+    # ------------------------------------------------------------------
+    # 入口
+    # ------------------------------------------------------------------
+
+    def run(self, commands: Sequence[Union[ir.FluentCommand, str]]) -> SimulationReport:
+        """
+        回放指令序列
+
+        Args:
+            commands: 指令 IR 序列 (通常来自 ``Protocol.get_commands()``)
+
+        Returns:
+            SimulationReport: 模拟结果
+        """
+        started = time.perf_counter()
+        for index, command in enumerate(commands):
+            self._index = index
+            if isinstance(command, str):
+                self.report.skipped += 1
+                continue
+            self._command = type(command).__name__
+            handler = getattr(self, f"_on_{self._command}", None)
+            if handler is None:
+                self.report.skipped += 1
+                continue
+            handler(command)
+            self.report.commands += 1
+        self._finish(len(commands))
+        self.report.elapsed_ms = (time.perf_counter() - started) * 1000
+        return self.report
+
+    def _issue(self, kind: str, message: str, labware: Optional[str] = None,
+               wells: Optional[List[str]] = None, severity: str = "error") -> None:
+        self.report.issues.append(SimulationIssue(self._index, self._command, kind, severity, message,
+                                                  labware, wells or []))
+
+    def _finish(self, count: int) -> None:
+        """回放结束: 检查未丢弃的枪头，汇总枪头余量和最终体积"""
+        self._command = "End"
+        self._index = count
+        if self.fca_tips:
+            self._issue("tips_not_dropped", f"协议结束时 FCA 通道 {sorted(self.fca_tips)} 仍装有枪头",
+                        severity="warning")
+        if self.mca_tip_rack is not None:
+            self._issue("tips_not_dropped", "协议结束时 MCA 仍装有枪头", severity="warning")
+        for label, labware in self.labware.items():
+            if labware.tips is not None:
+                self.report.tips_remaining[label] = labware.tip_count()
+                continue
+            volumes = labware.volumes.tolist() if NUMPY_AVAILABLE else labware.volumes
+            filled = {labware.well_names([cell])[0]: round(volume, 6)
+                      for cell, volume in enumerate(volumes) if volume > VOLUME_TOLERANCE}
+            if filled:
+                self.report.volumes[label] = filled
+
+    # ------------------------------------------------------------------
+    # 公共检查
+    # ------------------------------------------------------------------
+
+    def _get_labware(self, label: str) -> Optional[_Labware]:
+        labware = self.labware.get(label)
+        if labware is None:
+            self._issue("labware_missing", f"耗材 '{label}' 未添加到工作台", label)
+        return labware
+
+    def _aspirate(self, labware: _Labware, cells: List[int], amounts: List[float]) -> None:
+        _add(labware.volumes, cells, [-amount for amount in amounts])
+        short = _below_zero(labware.volumes, cells)
+        if short:
+            self._issue("well_overdraw", "孔内液体不足，吸液体积超过剩余体积", labware.label,
+                        labware.well_names(short))
+
+    def _dispense(self, labware: _Labware, cells: List[int], amounts: List[float]) -> None:
+        _add(labware.volumes, cells, amounts)
+        overflow = _above(labware.volumes, cells, labware.capacity)
+        if overflow:
+            self._issue("well_overflow", f"孔内体积超过容积 {labware.capacity:g} µL", labware.label,
+                        labware.well_names(overflow))
+
+    def _mix(self, labware: _Labware, cells: List[int], amounts: List[float]) -> None:
+        volumes = labware.volumes
+        low = sorted({cell for cell, amount in zip(cells, amounts)
+                      if volumes[cell] + VOLUME_TOLERANCE < amount})
+        if low:
+            self._issue("mix_volume", "混匀体积大于孔内液体体积", labware.label, labware.well_names(low),
+                        severity="warning")
+
+    # ------------------------------------------------------------------
+    # 工作台 / RGA
+    # ------------------------------------------------------------------
+
+    def _on_AddLabware(self, command: ir.AddLabware) -> None:
+        if command.label in self.labware:
+            self._issue("labware_duplicate", f"耗材标签 '{command.label}' 重复添加", command.label)
+        labware = _Labware(command.label, command.labware_type)
+        self.labware[command.label] = labware
+        initial = self.initial_volumes.get(command.label)
+        if initial is None or labware.tips is not None:
+            return
+        selections = initial if isinstance(initial, dict) else {"all": initial}
+        for selection, volume in selections.items():
+            try:
+                cells = labware.cells(labware.geometry.parse(selection))
+            except ValueError as e:
+                self._issue("initial_volume", str(e), command.label)
+                continue
+            for cell in set(cells):
+                labware.volumes[cell] = float(volume)
+        overflow = _above(labware.volumes, range(len(labware.volumes)), labware.capacity)
+        if overflow:
+            self._issue("well_overflow", f"初始体积超过容积 {labware.capacity:g} µL", command.label,
+                        labware.well_names(overflow))
+
+    def _on_RemoveLabware(self, command: ir.RemoveLabware) -> None:
+        if self.labware.pop(command.labware_name, None) is None:
+            self._issue("labware_missing", f"耗材 '{command.labware_name}' 未添加到工作台", command.labware_name)
+
+    def _on_InteriorLight(self, command: ir.InteriorLight) -> None:
+        pass
+
+    def _on_TransferLabware(self, command: ir.TransferLabware) -> None:
+        self._get_labware(command.labware)
+        # 与 RGA 生成器的状态转换一致: 空闲时抓取，抓取中时放置
+        self.rga_holding = None if self.rga_holding else command.labware
+
+    # ------------------------------------------------------------------
+    # FCA
+    # ------------------------------------------------------------------
+
+    def _on_GetTips(self, command: ir.GetTips) -> None:
+        loaded = sorted(channel for channel in command.channels if channel in self.fca_tips)
+        if loaded:
+            self._issue("invalid_state", f"通道 {loaded} 已装有枪头")
+        needed = len(command.channels)
+        racks = [labware for labware in self.labware.values()
+                 if labware.tips is not None and labware.labware_type in
+                 (f"{FCA_TIP_RACK_PREFIX}{command.tip_type}", f"{FCA_TIP_RACK_PREFIX}{command.tip_type} SBS")]
+        if racks:
+            # UseNextPosition: 依次从各枪头盒取下一个可用位置
+            remaining = needed
+            for rack in racks:
+                for position in range(TIPS_PER_RACK):
+                    if not remaining:
+                        break
+                    if rack.tips[position]:
+                        rack.tips[position] = False
+                        remaining -= 1
+            if remaining:
+                self._issue("tips_exhausted", f"{command.tip_type} 枪头不足，缺少 {remaining} 个")
+        else:
+            self._issue("tip_rack_missing", f"工作台上没有 {command.tip_type} 的 FCA 枪头盒", severity="warning")
+        self.report.tips_used[command.tip_type] = self.report.tips_used.get(command.tip_type, 0) + needed
+        for channel in command.channels:
+            self.fca_tips[channel] = [command.tip_type, 0.0]
+
+    def _fca_targets(self, command) -> Optional[tuple]:
+        """返回 (耗材, 体积数组下标, 每通道体积, 每通道枪头)；无法模拟时返回 None"""
+        missing = sorted(channel for channel in command.channels if channel not in self.fca_tips)
+        if missing:
+            self._issue("invalid_state", f"通道 {missing} 没有枪头")
+            return None
+        labware = self._get_labware(command.labware)
+        if labware is None:
+            return None
+        try:
+            indexes = get_geometry(command.plate_format).parse(command.wells or "")
+        except ValueError as e:
+            self._issue("invalid_wells", str(e), command.labware)
+            return None
+        if len(indexes) == 1:
+            indexes = indexes * len(command.channels)
+        if len(indexes) != len(command.channels) or len(command.volumes) != len(command.channels):
+            self._issue("channel_mismatch",
+                        f"{len(command.channels)} 个通道对应 {len(indexes)} 个孔位、{len(command.volumes)} 个体积",
+                        command.labware)
+            return None
+        volumes = [float(volume) for volume in command.volumes]
+        return labware, labware.cells(indexes), volumes, [self.fca_tips[channel] for channel in command.channels]
+
+    def _on_Aspirate(self, command: ir.Aspirate) -> None:
+        targets = self._fca_targets(command)
+        if targets is None:
+            return
+        labware, cells, volumes, tips = targets
+        self._aspirate(labware, cells, volumes)
+        over = []
+        for channel, tip, volume in zip(command.channels, tips, volumes):
+            tip[1] += volume
+            if tip[1] > _tip_capacity(tip[0]) + VOLUME_TOLERANCE:
+                over.append(channel)
+        if over:
+            self._issue("tip_overflow", f"通道 {over} 的枪头内体积超过枪头容量", command.labware)
+
+    def _on_Dispense(self, command: ir.Dispense) -> None:
+        targets = self._fca_targets(command)
+        if targets is None:
+            return
+        labware, cells, volumes, tips = targets
+        short = []
+        for channel, tip, volume in zip(command.channels, tips, volumes):
+            tip[1] -= volume
+            if tip[1] < -VOLUME_TOLERANCE:
+                short.append(channel)
+                tip[1] = 0.0
+        if short:
+            self._issue("tip_underdraw", f"通道 {short} 排液体积超过枪头内已吸体积", command.labware)
+        self._dispense(labware, cells, volumes)
+
+    def _on_Mix(self, command: ir.Mix) -> None:
+        targets = self._fca_targets(command)
+        if targets is not None:
+            labware, cells, volumes, _ = targets
+            self._mix(labware, cells, volumes)
+
+    def _on_DropTips(self, command: ir.DropTips) -> None:
+        missing = sorted(channel for channel in command.channels if channel not in self.fca_tips)
+        if missing:
+            self._issue("invalid_state", f"通道 {missing} 没有枪头")
+        residual = sorted(channel for channel in command.channels
+                          if channel in self.fca_tips and self.fca_tips[channel][1] > VOLUME_TOLERANCE)
+        if residual:
+            self._issue("tip_residual", f"通道 {residual} 丢弃的枪头内仍有液体", severity="warning")
+        for channel in command.channels:
+            self.fca_tips.pop(channel, None)
+
+    # ------------------------------------------------------------------
+    # MCA
+    # ------------------------------------------------------------------
+
+    def _on_MCAGetHeadAdapter(self, command: ir.MCAGetHeadAdapter) -> None:
+        if self.mca_adapter is not None:
+            self._issue("invalid_state", "MCA 已装有适配器")
+        self.mca_adapter = command.adapter_label
+
+    def _on_MCADropHeadAdapter(self, command: ir.MCADropHeadAdapter) -> None:
+        if self.mca_adapter is None:
+            self._issue("invalid_state", "MCA 没有适配器")
+        if self.mca_tip_rack is not None:
+            self._issue("invalid_state", "MCA 仍装有枪头，不能释放适配器")
+        self.mca_adapter = None
+
+    def _on_MCAPickUpTips(self, command: ir.MCAPickUpTips) -> None:
+        if self.mca_adapter is None or self.mca_tip_rack is not None:
+            self._issue("invalid_state", "MCA 拾取枪头前须已装适配器且没有枪头")
+        rack = self._get_labware(command.labware)
+        if rack is None:
+            return
+        if rack.tips is None:
+            self._issue("not_a_tip_rack", f"耗材 '{command.labware}' 不是枪头盒", command.labware)
+            return
+        missing = TIPS_PER_RACK - rack.tip_count()
+        if missing:
+            self._issue("tips_exhausted", f"枪头盒 '{command.labware}' 缺少 {missing} 个枪头，MCA 需要整盒拾取",
+                        command.labware)
+        rack.tips[:] = _filled(TIPS_PER_RACK, False)
+        self.mca_tip_rack = command.labware
+        self.mca_tip_volume = 0.0
+        self.report.tips_used[command.labware] = self.report.tips_used.get(command.labware, 0) + TIPS_PER_RACK
+
+    def _on_MCASetTipsBack(self, command: ir.MCASetTipsBack) -> None:
+        if self.mca_tip_rack is None:
+            self._issue("invalid_state", "MCA 没有枪头")
+            return
+        rack = self.labware.get(self.mca_tip_rack)
+        if rack is None:
+            self._issue("labware_missing", f"枪头盒 '{self.mca_tip_rack}' 已被移除，无法放回枪头", self.mca_tip_rack)
+        else:
+            rack.tips[:] = _filled(TIPS_PER_RACK, True)
+        if self.mca_tip_volume > VOLUME_TOLERANCE:
+            self._issue("tip_residual", "放回的枪头内仍有液体", self.mca_tip_rack, severity="warning")
+        self.mca_tip_rack = None
+        self.mca_tip_volume = 0.0
+
+    def _mca_targets(self, command) -> Optional[tuple]:
+        if self.mca_tip_rack is None:
+            self._issue("invalid_state", "MCA 没有枪头")
+            return None
+        labware = self._get_labware(command.labware)
+        if labware is None:
+            return None
+        head_size = 384 if command.adapter_id.startswith("DiTi384") else 96
+        indexes = _mca_footprint(labware.geometry, head_size, command.column, command.row)
+        if indexes is None:
+            self._issue("head_out_of_labware",
+                        f"{head_size} 通道头部从第 {command.row + 1} 行第 {command.column + 1} 列开始超出 "
+                        f"{labware.geometry.plate_format} 孔板", command.labware)
+            return None
+        return labware, labware.cells(indexes)
+
+    def _mca_tip_capacity(self) -> float:
+        rack = self.labware.get(self.mca_tip_rack)
+        return rack.tip_capacity if rack is not None else math.inf
+
+    def _on_MCAAspirate(self, command: ir.MCAAspirate) -> None:
+        targets = self._mca_targets(command)
+        if targets is None:
+            return
+        labware, cells = targets
+        self._aspirate(labware, cells, [float(command.volume)] * len(cells))
+        self.mca_tip_volume += float(command.volume)
+        capacity = self._mca_tip_capacity()
+        if self.mca_tip_volume > capacity + VOLUME_TOLERANCE:
+            self._issue("tip_overflow", f"MCA 枪头内体积 {self.mca_tip_volume:g} µL 超过枪头容量 {capacity:g} µL",
+                        command.labware)
+
+    def _on_MCADispense(self, command: ir.MCADispense) -> None:
+        targets = self._mca_targets(command)
+        if targets is None:
+            return
+        labware, cells = targets
+        self.mca_tip_volume -= float(command.volume)
+        if self.mca_tip_volume < -VOLUME_TOLERANCE:
+            self._issue("tip_underdraw", "MCA 排液体积超过枪头内已吸体积", command.labware)
+            self.mca_tip_volume = 0.0
+        self._dispense(labware, cells, [float(command.volume)] * len(cells))
+
+    def _on_MCAMix(self, command: ir.MCAMix) -> None:
+        targets = self._mca_targets(command)
+        if targets is not None:
+            labware, cells = targets
+            self._mix(labware, cells, [float(command.volume)] * len(cells))
+
+
+def simulate(commands: Sequence[Union[ir.FluentCommand, str]],
+             initial_volumes: Optional[Dict[str, Union[float, Dict[str, float]]]] = None) -> SimulationReport:
+    """
+    便捷函数: 回放指令序列并返回模拟结果
+
+    Args:
+        commands: 指令 IR 序列
+        initial_volumes (dict, optional): 耗材标签 -> 初始体积，见 FluentSimulator
+    """
+    return FluentSimulator(initial_volumes).run(commands)
@@ -0,0 +1,342 @@
+"""
+FluentWells.py - 按板型预计算的孔位寻址表
+
+支持 24 / 96 / 384 / 1536 孔板。每种板型在首次使用时预计算孔位名称与索引的双向查找表，
+孔位选择字符串的解析结果按 (板型, 字符串, 顺序) 缓存，重复的指令不再重复解析。
+
+索引按 Tecan 的列优先顺序编号: index = (列 - 1) * 行数 + 行号 (均从 0 开始)，
+例如 96 孔板 A1 = 0, H1 = 7, A2 = 8。
+
+孔位选择语法 (逗号分隔，可混用):
+    "A1, B2, C3"     单个孔位 (行号不区分大小写，列号允许前导零，如 A01)
+    "A1:H12"         矩形区域
+    "col3" / "column3"  整列
+    "rowB"           整行
+    "all" / "*"      整板
+
+区域、整列、整行、整板的展开顺序由 order 参数决定:
+    "column"          列优先 (默认，与索引顺序一致)
+    "row"             行优先
+    "serpentine"      列优先蛇形 (偶数列反向)
+    "serpentine_row"  行优先蛇形 (偶数行反向)
+
+安装了 NumPy 时，大区域展开和批量索引/行列换算使用向量化实现；未安装时使用纯 Python 实现，结果一致。
+
+作者: Gaoyuan
+"""
+
+import re
+from enum import Enum
+from functools import lru_cache
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+
+# 板型 -> (行数, 列数)
+PLATE_GEOMETRIES = {
+    24: (4, 6),
+    96: (8, 12),
+    384: (16, 24),
+    1536: (32, 48),
+}
+
+DEFAULT_PLATE_FORMAT = 96
+
+ORDERS = ("column", "row", "serpentine", "serpentine_row")
+
+# 象限转移 (96 -> 384、384 -> 1536) 中四个象限在目标板上的起始孔位
+QUADRANT_START_WELLS = ("A1", "A2", "B1", "B2")
+
+# 区域中孔位数超过该值时使用 NumPy 展开
+NUMPY_BLOCK_THRESHOLD = 256
+
+_WELL_PATTERN = re.compile(r"^([A-Z]{1,2})0*(\d+)$")
+_RANGE_PATTERN = re.compile(r"^([A-Z]{1,2}0*\d+)\s*:\s*([A-Z]{1,2}0*\d+)$")
+_COLUMN_PATTERN = re.compile(r"^COL(?:UMN)?\s*0*(\d+)$")
+_ROW_PATTERN = re.compile(r"^ROW\s*([A-Z]{1,2})$")
+_PLATE_FORMAT_PATTERN = re.compile(r"^(\d+)\b")
+
+
+def row_label(row: int) -> str:
+    """行号 (从 0 开始) 转为行标签: 0 -> A, 25 -> Z, 26 -> AA"""
+    if row < 26:
+        return chr(ord('A') + row)
+    return chr(ord('A') + row // 26 - 1) + chr(ord('A') + row % 26)
+
+
+def plate_format_for(labware_type: Union[Enum, str, None]) -> int:
+    """
+    根据耗材类型推断板型 (孔数)
+
+    Args:
+        labware_type: LabwareType 枚举、其取值字符串或 None
+
+    Returns:
+        int: 板型；无法识别时 (如槽、枪头盒) 返回 DEFAULT_PLATE_FORMAT
+    """
+    if isinstance(labware_type, Enum):
+        labware_type = labware_type.value
+    if not labware_type:
+        return DEFAULT_PLATE_FORMAT
+    match = _PLATE_FORMAT_PATTERN.match(str(labware_type))
+    if match and int(match.group(1)) in PLATE_GEOMETRIES:
+        return int(match.group(1))
+    return DEFAULT_PLATE_FORMAT
+
+
+def serialize_indexes(indexes: Iterable[int]) -> str:
+    """索引序列转为 Tecan 的 SerializedWellIndexes 格式，如 "0;1;2;" """
+    return ';'.join(str(index) for index in indexes) + ';'
+
+
+class PlateGeometry:
+    """
+    单一板型的孔位寻址表
+
+    Args:
+        plate_format (int): 板型 (24 / 96 / 384 / 1536)
+
+    Raises:
+        ValueError: 不支持的板型
+    """
+
+    __slots__ = ("plate_format", "rows", "columns", "size", "row_labels", "_names", "_index")
+
+    def __init__(self, plate_format: int):
+        if plate_format not in PLATE_GEOMETRIES:
+            raise ValueError(f"不支持的板型: {plate_format}，可选: {sorted(PLATE_GEOMETRIES)}")
+        self.plate_format = plate_format
+        self.rows, self.columns = PLATE_GEOMETRIES[plate_format]
+        self.size = self.rows * self.columns
+        self.row_labels = tuple(row_label(row) for row in range(self.rows))
+        self._names = tuple(
+            f"{self.row_labels[index % self.rows]}{index // self.rows + 1}" for index in range(self.size)
+        )
+        self._index = {name: index for index, name in enumerate(self._names)}
+
+    def __repr__(self) -> str:
+        return f"PlateGeometry({self.plate_format})"
+
+    # ------------------------------------------------------------------
+    # 单个孔位
+    # ------------------------------------------------------------------
+
+    def index(self, well: str) -> int:
+        """孔位名称转为索引 (如 "B1" -> 1)"""
+        key = well.strip().upper()
+        index = self._index.get(key)
+        if index is None:
+            match = _WELL_PATTERN.match(key)
+            if match:
+                index = self._index.get(f"{match.group(1)}{int(match.group(2))}")
+            if index is None:
+                raise ValueError(f"无效的孔位 '{well}'：{self.plate_format} 孔板为 "
+                                 f"A1-{self.row_labels[-1]}{self.columns}")
+        return index
+
+    def name(self, index: int) -> str:
+        """索引转为孔位名称 (如 1 -> "B1")"""
+        if not 0 <= index < self.size:
+            raise ValueError(f"孔位索引 {index} 超出 {self.plate_format} 孔板范围 (0-{self.size - 1})")
+        return self._names[index]
+
+    def row_col(self, index: int) -> Tuple[int, int]:
+        """索引转为 (行, 列)，均从 0 开始"""
+        return index % self.rows, index // self.rows
+
+    # ------------------------------------------------------------------
+    # 区域展开
+    # ------------------------------------------------------------------
+
+    def block(self, first: str, last: str, order: str = "column") -> Tuple[int, ...]:
+        """展开矩形区域 first:last (含两端)"""
+        first_row, first_col = self.row_col(self.index(first))
+        last_row, last_col = self.row_col(self.index(last))
+        return self._block(min(first_row, last_row), max(first_row, last_row),
+                           min(first_col, last_col), max(first_col, last_col), order)
+
+    def column(self, column: int, order: str = "column") -> Tuple[int, ...]:
+        """整列 (列号从 1 开始)"""
+        if not 1 <= column <= self.columns:
+            raise ValueError(f"列号 {column} 超出 {self.plate_format} 孔板范围 (1-{self.columns})")
+        return self._block(0, self.rows - 1, column - 1, column - 1, order)
+
+    def row(self, label: str, order: str = "column") -> Tuple[int, ...]:
+        """整行 (如 "B")"""
+        label = label.strip().upper()
+        if label not in self.row_labels:
+            raise ValueError(f"行 '{label}' 超出 {self.plate_format} 孔板范围 (A-{self.row_labels[-1]})")
+        row = self.row_labels.index(label)
+        return self._block(row, row, 0, self.columns - 1, order)
+
+    def _block(self, row_start: int, row_end: int, col_start: int, col_end: int,
+               order: str) -> Tuple[int, ...]:
+        if order not in ORDERS:
+            raise ValueError(f"不支持的孔位顺序: {order}，可选: {', '.join(ORDERS)}")
+        count = (row_end - row_start + 1) * (col_end - col_start + 1)
+        if NUMPY_AVAILABLE and count > NUMPY_BLOCK_THRESHOLD:
+            return tuple(self.block_array(row_start, row_end, col_start, col_end, order).tolist())
+
+        rows = range(row_start, row_end + 1)
+        columns = range(col_start, col_end + 1)
+        indexes: List[int] = []
+        if order in ("column", "serpentine"):
+            for position, col in enumerate(columns):
+                ordered_rows = reversed(rows) if order == "serpentine" and position % 2 else rows
+                indexes.extend(col * self.rows + row for row in ordered_rows)
+        else:
+            for position, row in enumerate(rows):
+                ordered_columns = reversed(columns) if order == "serpentine_row" and position % 2 else columns
+                indexes.extend(col * self.rows + row for col in ordered_columns)
+        return tuple(indexes)
+
+    def block_array(self, row_start: int, row_end: int, col_start: int, col_end: int,
+                    order: str = "column"):
+        """
+        向量化展开矩形区域 (行列均从 0 开始，含两端)，返回 NumPy 整数数组
+
+        Raises:
+            RuntimeError: 未安装 NumPy
+        """
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("block_array 需要安装 numpy")
+        rows = np.arange(row_start, row_end + 1)
+        columns = np.arange(col_start, col_end + 1)
+        if order in ("column", "serpentine"):
+            grid = columns[:, None] * self.rows + rows[None, :]
+            if order == "serpentine":
+                grid[1::2] = grid[1::2, ::-1]
+        else:
+            grid = columns[None, :] * self.rows + rows[:, None]
+            if order == "serpentine_row":
+                grid[1::2] = grid[1::2, ::-1]
+        return grid.ravel()
+
+    # ------------------------------------------------------------------
+    # 选择字符串
+    # ------------------------------------------------------------------
+
+    def parse(self, selection: str, order: str = "column") -> Tuple[int, ...]:
+        """
+        解析孔位选择字符串为索引元组 (结果带缓存)
+
+        Raises:
+            ValueError: 孔位或选择语法无效
+        """
+        return _parse_selection(self.plate_format, selection, order)[0]
+
+    def names(self, selection: str, order: str = "column") -> Tuple[str, ...]:
+        """解析孔位选择字符串为孔位名称元组"""
+        return tuple(self._names[index] for index in self.parse(selection, order))
+
+    def serialize(self, selection: str, order: str = "column") -> str:
+        """孔位选择字符串转为 SerializedWellIndexes (如 "A1,B1" -> "0;1;")"""
+        return _serialize_selection(self.plate_format, selection, order)
+
+    def normalize(self, selection: str, order: str = "column") -> str:
+        """
+        返回写入 SelectedWellsString 的孔位字符串: 只含单个孔位时原样返回，
+        含区域/整行/整列等选择器时展开为逗号分隔的孔位列表
+        """
+        indexes, expanded = _parse_selection(self.plate_format, selection, order)
+        if not expanded:
+            return selection
+        return ','.join(self._names[index] for index in indexes)
+
+    # ------------------------------------------------------------------
+    # 批量换算
+    # ------------------------------------------------------------------
+
+    def indexes_of(self, wells: Sequence[str]):
+        """批量孔位名称转索引；安装了 NumPy 时返回整数数组，否则返回列表"""
+        indexes = [self.index(well) for well in wells]
+        return np.asarray(indexes, dtype=np.int64) if NUMPY_AVAILABLE else indexes
+
+    def names_of(self, indexes) -> List[str]:
+        """批量索引转孔位名称"""
+        if NUMPY_AVAILABLE:
+            indexes = np.asarray(indexes, dtype=np.int64)
+            if indexes.size and (indexes.min() < 0 or indexes.max() >= self.size):
+                raise ValueError(f"孔位索引超出 {self.plate_format} 孔板范围 (0-{self.size - 1})")
+            return np.asarray(self._names, dtype=object)[indexes].tolist()
+        return [self.name(int(index)) for index in indexes]
+
+    def rows_cols(self, indexes):
+        """批量索引转 (行数组, 列数组)，均从 0 开始；未安装 NumPy 时返回两个列表"""
+        if NUMPY_AVAILABLE:
+            columns, rows = np.divmod(np.asarray(indexes, dtype=np.int64), self.rows)
+            return rows, columns
+        return [index % self.rows for index in indexes], [index // self.rows for index in indexes]
+
+
+@lru_cache(maxsize=None)
+def get_geometry(plate_format: int = DEFAULT_PLATE_FORMAT) -> PlateGeometry:
+    """返回板型的寻址表 (每种板型只构建一次)"""
+    return PlateGeometry(plate_format)
+
+
+@lru_cache(maxsize=4096)
+def _parse_selection(plate_format: int, selection: str, order: str) -> Tuple[Tuple[int, ...], bool]:
+    """解析选择字符串，返回 (索引元组, 是否含有需要展开的选择器)"""
+    geometry = get_geometry(plate_format)
+    indexes: List[int] = []
+    expanded = False
+    for token in selection.split(','):
+        token = token.strip().upper()
+        if not token:
+            continue
+        if token in geometry._index:
+            indexes.append(geometry._index[token])
+            continue
+        if token in ("ALL", "*"):
+            indexes.extend(geometry._block(0, geometry.rows - 1, 0, geometry.columns - 1, order))
+            expanded = True
+            continue
+        match = _RANGE_PATTERN.match(token)
+        if match:
+            indexes.extend(geometry.block(match.group(1), match.group(2), order))
+            expanded = True
+            continue
+        match = _COLUMN_PATTERN.match(token)
+        if match:
+            indexes.extend(geometry.column(int(match.group(1)), order))
+            expanded = True
+            continue
+        match = _ROW_PATTERN.match(token)
+        if match:
+            indexes.extend(geometry.row(match.group(1), order))
+            expanded = True
+            continue
+        indexes.append(geometry.index(token))
+    return tuple(indexes), expanded
+
+
+@lru_cache(maxsize=4096)
+def _serialize_selection(plate_format: int, selection: str, order: str) -> str:
+    return serialize_indexes(_parse_selection(plate_format, selection, order)[0])
+
+
+def wells_to_indexes(selection: str, plate_format: int = DEFAULT_PLATE_FORMAT,
+                     order: str = "column") -> Tuple[int, ...]:
+    """便捷函数: 解析孔位选择字符串为索引元组"""
+    return get_geometry(plate_format).parse(selection, order)
+
+
+def indexes_to_wells(indexes: Iterable[int], plate_format: int = DEFAULT_PLATE_FORMAT) -> List[str]:
+    """便捷函数: 索引转孔位名称列表"""
+    return get_geometry(plate_format).names_of(list(indexes))
+
+
+def start_well_offset(start_well: Optional[str], plate_format: int = DEFAULT_PLATE_FORMAT) -> Tuple[int, int]:
+    """起始孔位转为 (列, 行) 偏移，均从 0 开始；None 视为 A1"""
+    if not start_well:
+        return 0, 0
+    geometry = get_geometry(plate_format)
+    row, column = geometry.row_col(geometry.index(start_well))
+    return column, row
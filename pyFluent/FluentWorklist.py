@@ -0,0 +1,421 @@
+"""
+FluentWorklist.py - .gwl 工作列表的流式解析与按需解码
+
+把 Protocol.save() 生成的 (或其它来源的) .gwl 文件重新读回 Python，用于比较、修补、
+重新优化旧的工作列表。文件通过 mmap 只读映射，打开时只扫描一遍:
+
+1. 索引: 每一行记录一条 WorklistRecord (字节偏移、长度、指令类型、耗材、孔位)。
+   指令类型、耗材标签和孔位直接用正则在映射的字节上提取，不构建 XML 树，
+   数十万条指令的文件也只占用很少的内存；
+2. 按需解码: text(i) 取出第 i 条记录的原文，element(i) 完整解析为 XML 树，
+   command(i) 还原为指令 IR (见 CommandIR.py)。
+
+还原的 IR 会重新序列化并与原文逐字节比较，不一致时 (如不同版本 FluentControl 导出的
+指令、手工编辑过的记录、非 ``B;<ScriptGroup>`` 行) 保留原文字符串，
+因此 load → save 的结果与原文件逐行一致。
+
+用法:
+    with GwlReader("legacy.gwl") as reader:
+        print(len(reader), reader.count_by_type())
+        for index in reader.find(command_type="Aspirate", labware="Plate[001]"):
+            print(reader.record(index).wells, reader.command(index))
+
+    protocol = Protocol.load("legacy.gwl", output_file="patched.gwl")
+    protocol.optimize()
+    protocol.save()
+
+作者: Gaoyuan
+"""
+
+import mmap
+import re
+import sys
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+from xml.etree.ElementTree import Element, fromstring
+from xml.sax.saxutils import unescape
+
+import CommandIR as ir
+from FluentWells import DEFAULT_PLATE_FORMAT, PLATE_GEOMETRIES, get_geometry, plate_format_for
+
+# slots=True 需要 Python 3.10+
+_DATACLASS_OPTIONS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+RECORD_PREFIX = "B;"
+
+_OBJECT_TYPE_PATTERN = re.compile(rb'B;<ScriptGroup><Objects><Object Type="(?:[^"]*\.)?([^".]+)"')
+# 耗材标签所在的元素: (开始标记, 结束标记, 反转义次数)；RGA 的参数是转义后嵌入文本的 XML
+_LABWARE_TAGS = {
+    "AddLabware": (b"<LabwareLable>", b"</LabwareLable>", 1),
+    "TransferLabware": (b"&amp;lt;Labware&amp;gt;", b"&amp;lt;/Labware&amp;gt;", 2),
+}
+_DEFAULT_LABWARE_TAG = (b"<LabwareName>", b"</LabwareName>", 1)
+_WELLS_TAG = (b"<SelectedWellsString>", b"</SelectedWellsString>", 1)
+_VERSION_PATTERN = re.compile(r"V\d+$")
+_SERIAL_PATTERN = re.compile(r"MYRIUS,([^/]*)/")
+_RGA_PARAMETER_PATTERN = re.compile(r"<(\w+)>([^<]*)</\1>")
+
+# XML 中的指令对象类型 (去掉版本号) -> 指令 IR 类名
+COMMAND_TYPES = {
+    "LihaGetTipsScriptCommandData": "GetTips",
+    "LihaAspirateScriptCommandData": "Aspirate",
+    "LihaDispenseScriptCommandData": "Dispense",
+    "LihaMixScriptCommandData": "Mix",
+    "LihaDropTipsScriptCommandData": "DropTips",
+    "Mca384GetHeadAdapterScriptCommandData": "MCAGetHeadAdapter",
+    "Mca384DropHeadAdapterScriptCommandData": "MCADropHeadAdapter",
+    "Mca384PickUpTipsScriptCommandData": "MCAPickUpTips",
+    "Mca384SetTipsBackScriptCommandData": "MCASetTipsBack",
+    "Mca384AspirateScriptCommandData": "MCAAspirate",
+    "Mca384DispenseScriptCommandData": "MCADispense",
+    "Mca384MixScriptCommandData": "MCAMix",
+    "AddLabwareData": "AddLabware",
+    "RemoveLabwareData": "RemoveLabware",
+    "InteriorLightOnStatement": "InteriorLight",
+    "InteriorLightOffStatement": "InteriorLight",
+}
+
+_WELL_COMMANDS = {"Aspirate", "Dispense", "Mix"}
+
+# 推断板型时依次尝试的孔数
+_PLATE_FORMAT_CANDIDATES = (DEFAULT_PLATE_FORMAT,) + tuple(
+    plate_format for plate_format in PLATE_GEOMETRIES if plate_format != DEFAULT_PLATE_FORMAT)
+
+
+@dataclass(**_DATACLASS_OPTIONS)
+class WorklistRecord:
+    """
+    .gwl 文件中一条记录 (一行) 的索引项
+
+    command_type 为指令 IR 类名 (如 "Aspirate")；无法识别的 ScriptGroup 为 XML 中的对象类型名，
+    非 ``B;<ScriptGroup>`` 行为 None。labware / wells 没有时为空字符串。
+    """
+    offset: int
+    length: int
+    command_type: Optional[str]
+    labware: str = ""
+    wells: str = ""
+
+
+def _decode_text(value: bytes, times: int = 1) -> str:
+    text = value.decode("utf-8")
+    for _ in range(times):
+        text = unescape(text)
+    return text
+
+
+def _number(text: str) -> Union[int, float]:
+    """体积等数值按原文还原: "50" -> 50, "20.5" -> 20.5"""
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def _find_text(element: Element, path: str) -> str:
+    found = element.find(path)
+    return (found.text or "") if found is not None else ""
+
+
+def _channels(element: Element) -> tuple:
+    return tuple(int(item.text) for item in element.iterfind(".//SelectedTipsIndexes/Object/int"))
+
+
+def _fluent_sn(element: Element) -> str:
+    match = _SERIAL_PATTERN.search(_find_text(element, ".//AvailableID"))
+    return match.group(1) if match else ""
+
+
+class GwlReader:
+    """
+    基于 mmap 的 .gwl 读取器，打开时建立记录索引，按需解码单条记录
+
+    Args:
+        path (str): .gwl 文件路径
+
+    支持 len()、迭代 (得到 WorklistRecord) 和 with 语句。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # 空文件无法映射
+            self._data = b""
+        self.records: List[WorklistRecord] = []
+        self._labware_types: Optional[Dict[str, str]] = None
+        self._build_index()
+
+    def _build_index(self) -> None:
+        data = self._data
+        size = len(data)
+        append = self.records.append
+        start = 0
+        while start < size:
+            end = data.find(b"\n", start)
+            if end == -1:
+                end = size
+            line_end = end - 1 if end > start and data[end - 1] == 13 else end  # 兼容 \r\n
+            if line_end > start:
+                append(self._index_record(start, line_end))
+            start = end + 1
+
+    def _index_record(self, start: int, end: int) -> WorklistRecord:
+        data = self._data
+        match = _OBJECT_TYPE_PATTERN.match(data, start, end)
+        if match is None:
+            return WorklistRecord(start, end - start, None)
+        object_type = match.group(1).decode("ascii", "replace")
+        command_type = COMMAND_TYPES.get(_VERSION_PATTERN.sub("", object_type), object_type)
+        if object_type == "ApplicationDriverMacro" and data.find(b'_TransferLabware"', start, end) != -1:
+            command_type = "TransferLabware"
+
+        labware = self._element_text(_LABWARE_TAGS.get(command_type, _DEFAULT_LABWARE_TAG), match.end(), end)
+        wells = self._element_text(_WELLS_TAG, match.end(), end) if command_type in _WELL_COMMANDS else ""
+        return WorklistRecord(start, end - start, command_type, labware, wells)
+
+    def _element_text(self, tag: tuple, start: int, end: int) -> str:
+        """在 [start, end) 中查找第一个 (非空) 元素的文本"""
+        open_tag, close_tag, unescape_times = tag
+        position = self._data.find(open_tag, start, end)
+        if position == -1:
+            return ""
+        position += len(open_tag)
+        close = self._data.find(close_tag, position, end)
+        if close == -1:
+            return ""
+        return _decode_text(self._data[position:close], unescape_times)
+
+    # ---------------- 访问 ----------------
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[WorklistRecord]:
+        return iter(self.records)
+
+    def __enter__(self) -> "GwlReader":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """释放映射并关闭文件"""
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def record(self, index: int) -> WorklistRecord:
+        """返回第 index 条记录的索引项"""
+        return self.records[index]
+
+    def text(self, index: int) -> str:
+        """返回第 index 条记录的原文 (不含换行)"""
+        record = self.records[index]
+        return self._data[record.offset:record.offset + record.length].decode("utf-8")
+
+    def element(self, index: int) -> Element:
+        """
+        将第 index 条记录完整解析为 XML 树 (ScriptGroup 元素)
+
+        Raises:
+            ValueError: 该记录不是 ``B;<ScriptGroup>`` 记录
+        """
+        if self.records[index].command_type is None:
+            raise ValueError(f"第 {index} 条记录不是 B;<ScriptGroup> 指令")
+        return fromstring(self.text(index)[len(RECORD_PREFIX):])
+
+    def find(self, command_type: Optional[str] = None, labware: Optional[str] = None) -> List[int]:
+        """
+        按指令类型和/或耗材标签查找记录 (只使用索引，不解析 XML)
+
+        Returns:
+            list: 符合条件的记录下标
+        """
+        return [index for index, record in enumerate(self.records)
+                if (command_type is None or record.command_type == command_type)
+                and (labware is None or record.labware == labware)]
+
+    def count_by_type(self) -> Dict[Optional[str], int]:
+        """按指令类型统计记录数"""
+        return dict(Counter(record.command_type for record in self.records))
+
+    # ---------------- 还原指令 IR ----------------
+
+    def command(self, index: int) -> Union[ir.FluentCommand, str]:
+        """
+        将第 index 条记录还原为指令 IR
+
+        只有重新序列化的结果与原文完全一致时才返回 IR，否则返回原文字符串
+        (Protocol 可以直接保存字符串指令)。
+        """
+        text = self.text(index)
+        decoder = _DECODERS.get(self.records[index].command_type)
+        if decoder is None:
+            return text
+        try:
+            command = decoder(self, index, fromstring(text[len(RECORD_PREFIX):]))
+            if command is not None and command.to_xml() == text:
+                return command
+        except (ValueError, TypeError, KeyError, AttributeError):
+            pass
+        return text
+
+    def commands(self, indexes: Optional[Sequence[int]] = None) -> List[Union[ir.FluentCommand, str]]:
+        """还原多条记录 (默认全部)，见 command()"""
+        if indexes is None:
+            indexes = range(len(self.records))
+        return [self.command(index) for index in indexes]
+
+    def labware_types(self) -> Dict[str, str]:
+        """文件中 AddLabware 定义的 {耗材标签: 耗材类型}"""
+        if self._labware_types is None:
+            self._labware_types = {}
+            for index in self.find(command_type="AddLabware"):
+                element = self.element(index)
+                self._labware_types[self.records[index].labware] = _find_text(element, ".//LabwareType")
+        return self._labware_types
+
+    def _plate_format(self, labware: str, wells: str, serialized_indexes: str) -> int:
+        """按耗材类型确定板型；类型未知时选择能还原出原索引的板型"""
+        preferred = plate_format_for(self.labware_types().get(labware))
+        for plate_format in (preferred,) + _PLATE_FORMAT_CANDIDATES:
+            try:
+                if get_geometry(plate_format).serialize(wells) == serialized_indexes:
+                    return plate_format
+            except ValueError:
+                continue
+        return preferred
+
+    def _adapter_label(self, index: int) -> str:
+        """MCA 指令所用适配器的标签: 之前最近一条 MCAGetHeadAdapter 的耗材"""
+        for position in range(index - 1, -1, -1):
+            if self.records[position].command_type == "MCAGetHeadAdapter":
+                return self.records[position].labware
+        return ""
+
+
+def _decode_get_tips(reader: GwlReader, index: int, element: Element) -> ir.GetTips:
+    tool = _find_text(element, ".//DitiType/AvailableID")
+    return ir.GetTips(tip_type=tool.split("TOOLNAME:FCA, ", 1)[1], channels=_channels(element),
+                      fluent_sn=_fluent_sn(element))
+
+
+def _decode_drop_tips(reader: GwlReader, index: int, element: Element) -> ir.DropTips:
+    return ir.DropTips(channels=_channels(element), fluent_sn=_fluent_sn(element))
+
+
+def _decode_pipetting(reader: GwlReader, index: int, element: Element):
+    record = reader.records[index]
+    command_class = getattr(ir, record.command_type)
+    volumes = tuple(_number(item.text) for item in element.iterfind(".//Volumes/Object/string"))
+    extra = {"cycles": int(_find_text(element, ".//Cycles"))} if command_class is ir.Mix else {}
+    return command_class(
+        volumes=volumes,
+        labware=record.labware,
+        channels=_channels(element),
+        liquid_class=_find_text(element, ".//LiquidClassNameBySelection") or None,
+        wells=record.wells,
+        fluent_sn=_fluent_sn(element),
+        plate_format=reader._plate_format(record.labware, record.wells,
+                                          _find_text(element, ".//SerializedWellIndexes")),
+        **extra,
+    )
+
+
+def _mca_adapter(element: Element) -> dict:
+    return {"adapter_name": _find_text(element, ".//AdapterData/Name"),
+            "adapter_id": _find_text(element, ".//AdapterData/ID").split("TOOLNAME:", 1)[1]}
+
+
+def _decode_get_head_adapter(reader: GwlReader, index: int, element: Element) -> ir.MCAGetHeadAdapter:
+    return ir.MCAGetHeadAdapter(adapter_label=reader.records[index].labware, fluent_sn=_fluent_sn(element))
+
+
+def _decode_drop_head_adapter(reader: GwlReader, index: int, element: Element) -> ir.MCADropHeadAdapter:
+    return ir.MCADropHeadAdapter(fluent_sn=_fluent_sn(element))
+
+
+def _decode_pick_up_tips(reader: GwlReader, index: int, element: Element) -> ir.MCAPickUpTips:
+    return ir.MCAPickUpTips(adapter_label=reader._adapter_label(index), labware=reader.records[index].labware,
+                            fluent_sn=_fluent_sn(element), **_mca_adapter(element))
+
+
+def _decode_set_tips_back(reader: GwlReader, index: int, element: Element) -> ir.MCASetTipsBack:
+    return ir.MCASetTipsBack(adapter_label=reader._adapter_label(index), fluent_sn=_fluent_sn(element),
+                             **_mca_adapter(element))
+
+
+def _decode_mca_pipetting(reader: GwlReader, index: int, element: Element):
+    record = reader.records[index]
+    command_class = getattr(ir, record.command_type)
+    extra = {"cycles": int(_find_text(element, ".//Cycles"))} if command_class is ir.MCAMix else {}
+    return command_class(
+        adapter_label=reader._adapter_label(index),
+        volume=_number(_find_text(element, ".//Volume")),
+        labware=record.labware,
+        liquid_class=_find_text(element, ".//LiquidClassName"),
+        fluent_sn=_fluent_sn(element),
+        column=int(_find_text(element, ".//Column")),
+        row=int(_find_text(element, ".//Row")),
+        **_mca_adapter(element),
+        **extra,
+    )
+
+
+def _position(text: str) -> Union[int, str]:
+    return int(text) if text.isdigit() else text
+
+
+def _decode_add_labware(reader: GwlReader, index: int, element: Element) -> ir.AddLabware:
+    return ir.AddLabware(
+        labware_type=_find_text(element, ".//LabwareType"),
+        label=reader.records[index].labware,
+        location=_find_text(element, ".//Location"),
+        position=_position(_find_text(element, ".//Position")),
+        rotation=int(_find_text(element, ".//Rotation")),
+        has_lid=_find_text(element, ".//HasLid") == "true",
+    )
+
+
+def _decode_remove_labware(reader: GwlReader, index: int, element: Element) -> ir.RemoveLabware:
+    return ir.RemoveLabware(labware_name=reader.records[index].labware)
+
+
+def _decode_interior_light(reader: GwlReader, index: int, element: Element) -> ir.InteriorLight:
+    return ir.InteriorLight(on=element.find(".//Object").get("Type", "").endswith("InteriorLightOnStatement"))
+
+
+def _decode_transfer_labware(reader: GwlReader, index: int, element: Element) -> ir.TransferLabware:
+    parameters = {name: unescape(value) for name, value in
+                  _RGA_PARAMETER_PATTERN.findall(unescape(_find_text(element, ".//ExecutionSettings")))}
+    return ir.TransferLabware(
+        labware=parameters["Labware"],
+        target_location=parameters["Location"],
+        target_position=_position(parameters["Site"]),
+        only_use_selected_site=parameters["FixedSite"] == "true",
+    )
+
+
+_DECODERS = {
+    "GetTips": _decode_get_tips,
+    "Aspirate": _decode_pipetting,
+    "Dispense": _decode_pipetting,
+    "Mix": _decode_pipetting,
+    "DropTips": _decode_drop_tips,
+    "MCAGetHeadAdapter": _decode_get_head_adapter,
+    "MCADropHeadAdapter": _decode_drop_head_adapter,
+    "MCAPickUpTips": _decode_pick_up_tips,
+    "MCASetTipsBack": _decode_set_tips_back,
+    "MCAAspirate": _decode_mca_pipetting,
+    "MCADispense": _decode_mca_pipetting,
+    "MCAMix": _decode_mca_pipetting,
+    "AddLabware": _decode_add_labware,
+    "RemoveLabware": _decode_remove_labware,
+    "InteriorLight": _decode_interior_light,
+    "TransferLabware": _decode_transfer_labware,
+}
@@ -1,8 +1,11 @@
 from enum import Enum
-from xml.etree.ElementTree import Element, SubElement, tostring
+from xml.etree.ElementTree import Element, SubElement
 from typing import Optional, TYPE_CHECKING
 from FluentLabware import MCA384HeadAdapter
 from FluentLiquidClass import LiquidClass
+from XMLTemplate import render_command
+import CommandIR as ir
+from FluentWells import QUADRANT_START_WELLS, plate_format_for, start_well_offset
 
 if TYPE_CHECKING:
     from Protocol import Protocol, MCAState, InvalidStateException
@@ -42,6 +45,9 @@ class TecanMCA384ScriptGenerator:
             "SortNumber": "50",
             "MountColumnRowWise": "false"
         }
+        self.PREFIX = "B;"
+        # 使用预编译模板生成指令；False 时逐个构建 ElementTree (参考实现，输出一致)
+        self.use_templates = True
         
         # 状态管理
         self.state = MCAState.IDLE
@@ -77,22 +83,31 @@ class TecanMCA384ScriptGenerator:
         if self.protocol and labware_label not in self.protocol.get_defined_labware():
             raise ValueError(f"错误：耗材 '{labware_label}' 未定义。请先使用 add_labware() 添加。")
     
-    def _execute_command(self, xml_command: str) -> 'TecanMCA384ScriptGenerator':
+    def _execute_command(self, command: ir.FluentCommand) -> 'TecanMCA384ScriptGenerator':
         """
-        执行命令：将 XML 添加到协议或返回字符串
+        执行命令：将指令 IR 添加到协议 (保存时再序列化) 或返回 XML 字符串
         
         Args:
-            xml_command (str): 生成的 XML 指令
+            command (FluentCommand): 指令 IR
             
         Returns:
             TecanMCA384ScriptGenerator: 返回自身支持链式调用，或字符串（向后兼容）
         """
         if self.protocol:
-            self.protocol.add_command(xml_command)
+            self.protocol.add_command(command)
             return self
         else:
             # 向后兼容：直接返回 XML 字符串
-            return xml_command
+            return self.serialize(command)
+    
+    def serialize(self, command: ir.FluentCommand) -> str:
+        """
+        将 MCA 指令 IR 序列化为带前缀的 XML 字符串
+        
+        Args:
+            command (FluentCommand): MCAGetHeadAdapter / MCAPickUpTips / MCAAspirate 等
+        """
+        return getattr(self, command.XML_METHOD)(command)
 
     def _validate_adapter(self, adapter):
         """Validate that the adapter is of correct type."""
@@ -100,6 +115,17 @@ class TecanMCA384ScriptGenerator:
             raise ValueError(
                 f"Adapterplate must be an instance of MCA384HeadAdapter, but got {type(adapter).__name__}")
 
+    def _render(self, build, static, values) -> str:
+        """
+        生成带前缀的指令字符串
+
+        Args:
+            build: 构建方法，以 ``build(*static, **values)`` 调用
+            static (tuple): 嵌入在文本中的静态参数 (如序列号、适配器 ID)，每种取值编译一个模板
+            values (dict): 可变的槽位值
+        """
+        return render_command(build, static, values, self.PREFIX, self.use_templates)
+
     def _create_base_structure(self):
         """Create the basic XML structure common to all commands."""
         script_group = Element("ScriptGroup")
@@ -150,7 +176,7 @@ class TecanMCA384ScriptGenerator:
 
         return common_data_v2
 
-    def _add_well_selection_data(self, parent, adapter):
+    def _add_well_selection_data(self, parent, adapter_name, adapter_id, column=None, row=None):
         """Add common well selection data structure."""
         well_selection = SubElement(parent, "Data",
                                     Type="Tecan.Core.Instrument.Devices.Mca._384.Scripting.Data.Mca384ScriptCommandUsingWellSelectionBaseDataV6")
@@ -165,7 +191,7 @@ class TecanMCA384ScriptGenerator:
         SubElement(well_data, "Compartment").text = "1"
 
         # Adapter plate info
-        self._add_adapter_plate(well_data, adapter)
+        self._add_adapter_plate(well_data, adapter_name, adapter_id)
 
         # Other well parameters
         used_tip = SubElement(well_data, "UsedTip")
@@ -176,7 +202,11 @@ class TecanMCA384ScriptGenerator:
         SubElement(well_data, "LastTipXPosition").text = "12"
         SubElement(well_data, "LastTipYPosition").text = "8"
 
-        for param in ["Column", "Row", "RowOffset", "ColumnOffset",
+        # Target position of the first tip (0-based column/row on the labware)
+        SubElement(well_data, "Column").text = column if column is not None else self.DEFAULT_POSITION
+        SubElement(well_data, "Row").text = row if row is not None else self.DEFAULT_POSITION
+
+        for param in ["RowOffset", "ColumnOffset",
                       "OrientationPhi", "OrientationPsi", "OrientationTheta"]:
             SubElement(well_data, param).text = self.DEFAULT_POSITION
 
@@ -187,19 +217,19 @@ class TecanMCA384ScriptGenerator:
 
         return well_data
 
-    def _add_adapter_plate(self, parent, adapter):
+    def _add_adapter_plate(self, parent, adapter_name, adapter_id):
         """Add adapter plate information."""
         adapter_plate = SubElement(parent, "AdapterPlate")
         adapter_data = SubElement(adapter_plate, "AdapterData")
 
-        SubElement(adapter_data, "Name").text = adapter.Name
+        SubElement(adapter_data, "Name").text = adapter_name
         SubElement(adapter_data, "Type").text = self.ADAPTER_TYPE
         SubElement(adapter_data, "CanMountTecanDiTis").text = "true"
 
         for key, value in self.TIP_LAYOUT.items():
             SubElement(adapter_data, key).text = value
 
-        SubElement(adapter_data, "ID").text = f"TOOLTYPE:Mca384.Adapter/TOOLNAME:{adapter.ID}"
+        SubElement(adapter_data, "ID").text = f"TOOLTYPE:Mca384.Adapter/TOOLNAME:{adapter_id}"
 
         usable_tips = SubElement(adapter_data, "UsableTips")
         SubElement(usable_tips, "UsableTips").text = "All"
@@ -262,6 +292,20 @@ class TecanMCA384ScriptGenerator:
         elif fluent_sn is None:
             fluent_sn = "19905"  # 向后兼容的默认值
 
+        command = ir.MCAGetHeadAdapter(adapter_label=adapter.Label, fluent_sn=fluent_sn)
+        
+        # 更新状态
+        self.state = MCAState.ADAPTER_LOADED
+        self.current_adapter = adapter
+        
+        return self._execute_command(command)
+
+    def _get_head_adapter_xml(self, command: ir.MCAGetHeadAdapter) -> str:
+        """Serialize a GetHeadAdapter command."""
+        return self._render(self._build_get_head_adapter, (command.fluent_sn,), {"labware": command.adapter_label})
+
+    def _build_get_head_adapter(self, fluent_sn, labware):
+        """Build the GetHeadAdapter command tree."""
         script_group, objects = self._create_base_structure()
 
         # Create command object
@@ -272,16 +316,10 @@ class TecanMCA384ScriptGenerator:
         SubElement(get_head, "BlowoutAirgap").text = self.DEFAULT_POSITION
 
         # Add common data structure
-        common_data_v2 = self._add_common_data_v2(get_head, adapter.Label)
+        common_data_v2 = self._add_common_data_v2(get_head, labware)
         self._add_common_device_data(common_data_v2, fluent_sn)
 
-        xml_command = "B;" + tostring(script_group, encoding='utf-8').decode('utf-8')
-        
-        # 更新状态
-        self.state = MCAState.ADAPTER_LOADED
-        self.current_adapter = adapter
-        
-        return self._execute_command(xml_command)
+        return script_group
     
     # 链式调用友好的方法
     def get_head_adapter(self, adapter: MCA384HeadAdapter, fluent_sn: str = None):
@@ -327,6 +365,20 @@ class TecanMCA384ScriptGenerator:
         elif fluent_sn is None:
             fluent_sn = "19905"  # 向后兼容的默认值
 
+        command = ir.MCADropHeadAdapter(fluent_sn=fluent_sn)
+        
+        # 更新状态
+        self.state = MCAState.IDLE
+        self.current_adapter = None
+        
+        return self._execute_command(command)
+
+    def _drop_head_adapter_xml(self, command: ir.MCADropHeadAdapter) -> str:
+        """Serialize a DropHeadAdapter command."""
+        return self._render(self._build_drop_head_adapter, (command.fluent_sn,), {})
+
+    def _build_drop_head_adapter(self, fluent_sn):
+        """Build the DropHeadAdapter command tree."""
         script_group, objects = self._create_base_structure()
 
         # Create command object
@@ -344,13 +396,7 @@ class TecanMCA384ScriptGenerator:
         common_data_v2 = self._add_common_data_v2(drop_head)
         self._add_common_device_data(common_data_v2, fluent_sn)
 
-        xml_command = "B;" + tostring(script_group, encoding='utf-8').decode('utf-8')
-        
-        # 更新状态
-        self.state = MCAState.IDLE
-        self.current_adapter = None
-        
-        return self._execute_command(xml_command)
+        return script_group
     
     # 链式调用友好的方法
     def drop_head_adapter(self, fluent_sn: str = None):
@@ -413,6 +459,21 @@ class TecanMCA384ScriptGenerator:
         elif fluent_sn is None:
             fluent_sn = "19905"  # 向后兼容的默认值
 
+        command = ir.MCAPickUpTips(adapter_label=adapter.Label, adapter_name=adapter.Name,
+                                   adapter_id=adapter.ID, labware=labwareLabel, fluent_sn=fluent_sn)
+        
+        # 更新状态
+        self.state = MCAState.TIPS_LOADED
+        
+        return self._execute_command(command)
+
+    def _pick_up_tips_xml(self, command: ir.MCAPickUpTips) -> str:
+        """Serialize a PickUpTips command."""
+        return self._render(self._build_pick_up_tips, (command.fluent_sn, command.adapter_id),
+                            {"adapter_name": command.adapter_name, "labware": command.labware})
+
+    def _build_pick_up_tips(self, fluent_sn, adapter_id, adapter_name, labware):
+        """Build the PickUpTips command tree."""
         script_group, objects = self._create_base_structure()
 
         # Create command object
@@ -426,18 +487,13 @@ class TecanMCA384ScriptGenerator:
         partial_tip_data = self._add_partial_tip_data(pick_up)
 
         # Add well selection data
-        well_data = self._add_well_selection_data(partial_tip_data, adapter)
+        well_data = self._add_well_selection_data(partial_tip_data, adapter_name, adapter_id)
 
         # Add common data structure
-        common_data_v2 = self._add_common_data_v2(well_data, labwareLabel)
+        common_data_v2 = self._add_common_data_v2(well_data, labware)
         self._add_common_device_data(common_data_v2, fluent_sn)
 
-        xml_command = "B;" + tostring(script_group, encoding='utf-8').decode('utf-8')
-        
-        # 更新状态
-        self.state = MCAState.TIPS_LOADED
-        
-        return self._execute_command(xml_command)
+        return script_group
     
     # 链式调用友好的方法
     def pick_up_tips(self, tip_rack_label: str = "MCA96 50ul[001]", adapter: MCA384HeadAdapter = None, fluent_sn: str = None):
@@ -483,6 +539,17 @@ class TecanMCA384ScriptGenerator:
         """
         self._validate_adapter(adapter)
 
+        command = ir.MCASetTipsBack(adapter_label=adapter.Label, adapter_name=adapter.Name,
+                                    adapter_id=adapter.ID, fluent_sn=fluent_sn)
+        return self.serialize(command)
+
+    def _set_tips_back_xml(self, command: ir.MCASetTipsBack) -> str:
+        """Serialize a SetTipsBack command."""
+        return self._render(self._build_set_tips_back, (command.fluent_sn, command.adapter_id),
+                            {"adapter_name": command.adapter_name})
+
+    def _build_set_tips_back(self, fluent_sn, adapter_id, adapter_name):
+        """Build the SetTipsBack command tree."""
         script_group, objects = self._create_base_structure()
 
         # Create command object
@@ -497,13 +564,13 @@ class TecanMCA384ScriptGenerator:
         partial_tip_data = self._add_partial_tip_data(set_tips_back, "0", "0")
 
         # Add well selection data
-        well_data = self._add_well_selection_data(partial_tip_data, adapter)
+        well_data = self._add_well_selection_data(partial_tip_data, adapter_name, adapter_id)
 
         # Add common data structure
         common_data_v2 = self._add_common_data_v2(well_data)
         self._add_common_device_data(common_data_v2, fluent_sn)
 
-        return "B;" + tostring(script_group, encoding='utf-8').decode('utf-8')
+        return script_group
 
     def Aspirate(
             self,
@@ -511,7 +578,8 @@ class TecanMCA384ScriptGenerator:
             volume: float,
             labwareLabel: str,
             liquid_class: LiquidClass.Water_Free_Single,
-            fluent_sn: str = "19905"
+            fluent_sn: str = "19905",
+            start_well: str = "A1"
             ) -> str:
         """
         Generate XML script for aspiration operation using MCA384 head.
@@ -522,6 +590,8 @@ class TecanMCA384ScriptGenerator:
             labwareLabel (str): Label of the source labware (e.g., "96 Well Flat[001]")
             liquid_class (str): Liquid class name for aspiration (e.g., "Water Free Single")
             fluent_sn (str, optional): Device serial number. Defaults to "19905".
+            start_well (str, optional): Labware well under the first tip (A1 of the
+                head), e.g. "B2" for the second quadrant of a 384-well plate. Defaults to "A1".
 
         Returns:
             str: Compact XML string prefixed with "B;" containing aspiration command
@@ -553,28 +623,9 @@ class TecanMCA384ScriptGenerator:
         else:
             raise ValueError(f"Invalid liquid_class,{liquid_class} ")
 
-        script_group, objects = self._create_base_structure()
-
-        # Create command object
-        object_elem = SubElement(objects, "Object",
-                                 Type="Tecan.Core.Scripting.Commands.Mca384.Mca384AspirateScriptCommandDataV2")
-        aspirate = SubElement(object_elem, "Mca384AspirateScriptCommandDataV2")
-
-        # Add pipetting data
-        pipetting = SubElement(aspirate, "Data",
-                               Type="Tecan.Core.Instrument.Devices.Mca.Mca384.Scripting.Mca384PipettingWithVolumesScriptCommandDataV2")
-        pipetting_data = SubElement(pipetting, "Mca384PipettingWithVolumesScriptCommandDataV2")
-
-        self._add_pipetting_params(pipetting_data, volume, liquid_class_name)
-
-        # Add well selection data
-        well_data = self._add_well_selection_data(pipetting_data, adapter)
-
-        # Add common data structure
-        common_data_v2 = self._add_common_data_v2(well_data, labwareLabel)
-        self._add_common_device_data(common_data_v2, fluent_sn)
-
-        return "B;" + tostring(script_group, encoding='utf-8').decode('utf-8')
+        command = self._pipetting_command(ir.MCAAspirate, adapter, volume, labwareLabel, liquid_class_name,
+                                          fluent_sn, start_well)
+        return self.serialize(command)
 
     def Dispense(
             self,
@@ -582,7 +633,8 @@ class TecanMCA384ScriptGenerator:
             volume: float,
             labwareLabel: str,
             liquid_class: LiquidClass.Water_Free_Single,
-            fluent_sn: str = "19905"
+            fluent_sn: str = "19905",
+            start_well: str = "A1"
             ) -> str:
         """
         Generate XML script for aspiration operation using MCA384 head.
@@ -593,6 +645,8 @@ class TecanMCA384ScriptGenerator:
             labwareLabel (str): Label of the source labware (e.g., "96 Well Flat[001]")
             liquid_class (str): Liquid class name for aspiration (e.g., "Water Free Single")
             fluent_sn (str, optional): Device serial number. Defaults to "19905".
+            start_well (str, optional): Labware well under the first tip (A1 of the
+                head), e.g. "B2" for the second quadrant of a 384-well plate. Defaults to "A1".
 
         Returns:
             str: Compact XML string prefixed with "B;" containing aspiration command
@@ -625,28 +679,9 @@ class TecanMCA384ScriptGenerator:
         if not isinstance(volume, (int, float)) or volume <= 0:
             raise ValueError("Volume must be a positive number")
 
-        script_group, objects = self._create_base_structure()
-
-        # Create command object
-        object_elem = SubElement(objects, "Object",
-                                 Type="Tecan.Core.Scripting.Commands.Mca384.Mca384DispenseScriptCommandDataV2")
-        dispense = SubElement(object_elem, "Mca384DispenseScriptCommandDataV2")
-
-        # Add pipetting data
-        pipetting = SubElement(dispense, "Data",
-                               Type="Tecan.Core.Instrument.Devices.Mca.Mca384.Scripting.Mca384PipettingWithVolumesScriptCommandDataV2")
-        pipetting_data = SubElement(pipetting, "Mca384PipettingWithVolumesScriptCommandDataV2")
-
-        self._add_pipetting_params(pipetting_data, volume, liquid_class_name)
-
-        # Add well selection data
-        well_data = self._add_well_selection_data(pipetting_data, adapter)
-
-        # Add common data structure
-        common_data_v2 = self._add_common_data_v2(well_data, labwareLabel)
-        self._add_common_device_data(common_data_v2, fluent_sn)
-
-        return "B;" + tostring(script_group, encoding='utf-8').decode('utf-8')
+        command = self._pipetting_command(ir.MCADispense, adapter, volume, labwareLabel, liquid_class_name,
+                                          fluent_sn, start_well)
+        return self.serialize(command)
 
     def Mix(self,
             adapter: MCA384HeadAdapter(Label="EVA[001]"),
@@ -654,7 +689,8 @@ class TecanMCA384ScriptGenerator:
             labwareLabel: str,
             liquid_class: LiquidClass.Water_Mix,
             cycles:int,
-            fluent_sn="19905")->str:
+            fluent_sn="19905",
+            start_well: str = "A1")->str:
         """Generate XML script for mixing operation.
 
         Args:
@@ -664,6 +700,7 @@ class TecanMCA384ScriptGenerator:
             liquid_class (str): Liquid class name (e.g., "Water Mix")
             cycles (int): Number of mixing cycles
             fluent_sn (str): Fluent serial number (default "19905")
+            start_well (str): Labware well under the first tip (default "A1")
 
         Returns:
             str: XML script string with "B;" prefix
@@ -678,28 +715,129 @@ class TecanMCA384ScriptGenerator:
         if not isinstance(cycles, int) or cycles <= 0:
             raise ValueError("Cycles must be a positive integer")
 
+        command = self._pipetting_command(ir.MCAMix, adapter, volume, labwareLabel, liquid_class_name,
+                                          fluent_sn, start_well, cycles=cycles)
+        return self.serialize(command)
+
+    def stamp_quadrants(self, volume: float, sources, destination: str,
+                        liquid_class: LiquidClass = LiquidClass.Water_Free_Single,
+                        quadrants=QUADRANT_START_WELLS, tip_racks=None, fluent_sn: str = None):
+        """
+        象限转移 (如 4 块 96 孔板 -> 1 块 384 孔板): 依次从每块源板吸液，排到目标板对应象限
+
+        Args:
+            volume (float): 每孔体积 (μL)
+            sources (str | list): 源板标签，与 quadrants 一一对应；单个标签时每个象限都从它吸液
+            destination (str): 目标板标签
+            liquid_class (LiquidClass): 液体类型
+            quadrants (list): 每块源板对应的目标起始孔位 (头部 A1 对准的孔)，默认 A1, A2, B1, B2
+            tip_racks (list, optional): 每个象限使用的枪头盒标签。给出时每个象限先拾取新枪头、
+                结束后放回 (要求已加载适配器且未拾取枪头)；不给出时全程使用已拾取的枪头
+            fluent_sn (str, optional): 设备序列号，默认使用 protocol 中的
+
+        Returns:
+            TecanMCA384ScriptGenerator 或 list: 绑定 Protocol 时支持链式调用，否则返回 XML 字符串列表
+
+        Raises:
+            InvalidStateException: 枪头状态与 tip_racks 的用法不符
+            ValueError: 未加载适配器、体积非正、数量不一致或耗材未定义
+
+        Example:
+            >>> mca.get_head_adapter(adapter) \\
+            ...    .stamp_quadrants(10, ["Src[001]", "Src[002]", "Src[003]", "Src[004]"], "Dst384[001]",
+            ...                     tip_racks=["MCA96 50ul[001]"] * 4) \\
+            ...    .drop_head_adapter()
+        """
+        if isinstance(sources, str):
+            sources = [sources] * len(quadrants)
+        if len(sources) != len(quadrants):
+            raise ValueError(f"源板数量 ({len(sources)}) 与象限数量 ({len(quadrants)}) 不一致")
+        if tip_racks is not None and len(tip_racks) != len(quadrants):
+            raise ValueError(f"枪头盒数量 ({len(tip_racks)}) 与象限数量 ({len(quadrants)}) 不一致")
+        if not isinstance(volume, (int, float)) or volume <= 0:
+            raise ValueError("Volume must be a positive number")
+        if not isinstance(liquid_class, Enum):
+            raise ValueError(f"Invalid liquid_class,{liquid_class} ")
+        adapter = self.current_adapter
+        if adapter is None:
+            raise ValueError("象限转移前必须先加载适配器 (get_head_adapter)")
+        self._validate_state(MCAState.ADAPTER_LOADED if tip_racks else MCAState.TIPS_LOADED, "stamp_quadrants")
+        for label in list(sources) + [destination] + list(tip_racks or []):
+            self._validate_labware_exists(label)
+        if fluent_sn is None:
+            fluent_sn = self.protocol.fluent_sn if self.protocol else "19905"
+
+        results = []
+        for index, (source, start_well) in enumerate(zip(sources, quadrants)):
+            if tip_racks:
+                results.append(self._execute_command(ir.MCAPickUpTips(
+                    adapter_label=adapter.Label, adapter_name=adapter.Name, adapter_id=adapter.ID,
+                    labware=tip_racks[index], fluent_sn=fluent_sn)))
+            results.append(self._execute_command(self._pipetting_command(
+                ir.MCAAspirate, adapter, volume, source, liquid_class.value, fluent_sn)))
+            results.append(self._execute_command(self._pipetting_command(
+                ir.MCADispense, adapter, volume, destination, liquid_class.value, fluent_sn, start_well)))
+            if tip_racks:
+                results.append(self._execute_command(ir.MCASetTipsBack(
+                    adapter_label=adapter.Label, adapter_name=adapter.Name, adapter_id=adapter.ID,
+                    fluent_sn=fluent_sn)))
+        return self if self.protocol else results
+
+    def _pipetting_command(self, command_class, adapter, volume, labware_name, liquid_class_name,
+                           fluent_sn, start_well=None, **extra):
+        """Create the IR of an Aspirate/Dispense/Mix command."""
+        labware_type = self.protocol.get_labware_type(labware_name) if self.protocol else None
+        column, row = start_well_offset(start_well, plate_format_for(labware_type))
+        return command_class(adapter_label=adapter.Label, adapter_name=adapter.Name, adapter_id=adapter.ID,
+                             volume=volume, labware=labware_name, liquid_class=liquid_class_name,
+                             fluent_sn=fluent_sn, column=column, row=row, **extra)
+
+    def _pipetting_xml(self, command) -> str:
+        """Serialize an Aspirate/Dispense/Mix command."""
+        if isinstance(command, ir.MCAAspirate):
+            command_type = "Tecan.Core.Scripting.Commands.Mca384.Mca384AspirateScriptCommandDataV2"
+        elif isinstance(command, ir.MCADispense):
+            command_type = "Tecan.Core.Scripting.Commands.Mca384.Mca384DispenseScriptCommandDataV2"
+        else:
+            command_type = "Tecan.Core.Scripting.Commands.Mca384.Mca384MixScriptCommandDataV2"
+        values = {
+            "adapter_name": command.adapter_name,
+            "volume": str(command.volume),
+            "labware": command.labware,
+            "liquid_class": command.liquid_class,
+            "column": str(command.column),
+            "row": str(command.row),
+        }
+        if isinstance(command, ir.MCAMix):
+            values["cycles"] = str(command.cycles)
+        return self._render(self._build_pipetting_command, (command_type, command.fluent_sn, command.adapter_id),
+                            values)
+
+    def _build_pipetting_command(self, command_type, fluent_sn, adapter_id, adapter_name, volume, labware,
+                                 liquid_class, column, row, cycles=None):
+        """Build the command tree shared by Aspirate/Dispense/Mix."""
         script_group, objects = self._create_base_structure()
 
         # Create command object
-        object_elem = SubElement(objects, "Object",
-                                 Type="Tecan.Core.Scripting.Commands.Mca384.Mca384MixScriptCommandDataV2")
-        mix = SubElement(object_elem, "Mca384MixScriptCommandDataV2")
+        object_elem = SubElement(objects, "Object", Type=command_type)
+        command = SubElement(object_elem, command_type.split('.')[-1])
 
-        # Add cycles parameter
-        SubElement(mix, "Cycles").text = str(cycles)
+        # Add cycles parameter (Mix only)
+        if cycles is not None:
+            SubElement(command, "Cycles").text = cycles
 
         # Add pipetting data
-        pipetting = SubElement(mix, "Data",
+        pipetting = SubElement(command, "Data",
                                Type="Tecan.Core.Instrument.Devices.Mca.Mca384.Scripting.Mca384PipettingWithVolumesScriptCommandDataV2")
         pipetting_data = SubElement(pipetting, "Mca384PipettingWithVolumesScriptCommandDataV2")
 
-        self._add_pipetting_params(pipetting_data, volume, liquid_class_name)
+        self._add_pipetting_params(pipetting_data, volume, liquid_class)
 
         # Add well selection data
-        well_data = self._add_well_selection_data(pipetting_data, adapter)
+        well_data = self._add_well_selection_data(pipetting_data, adapter_name, adapter_id, column, row)
 
         # Add common data structure
-        common_data_v2 = self._add_common_data_v2(well_data, labwareLabel)
+        common_data_v2 = self._add_common_data_v2(well_data, labware)
         self._add_common_device_data(common_data_v2, fluent_sn)
 
-        return "B;" + tostring(script_group, encoding='utf-8').decode('utf-8')
\ No newline at end of file
+        return script_group
\ No newline at end of file
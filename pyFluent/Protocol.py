@@ -8,9 +8,14 @@ Protocol.py - pyFluent 核心协议类
 版本: 2.0.0
 """
 
-from typing import Set, List, Optional
+import os
+from typing import Any, Callable, Dict, Iterable, Iterator, Set, List, Mapping, Optional, Sequence, TextIO, Union
 from enum import Enum, auto
 
+import CommandIR as ir
+from CommandIR import FluentCommand
+from FluentWells import get_geometry, plate_format_for
+
 
 # ================================
 # 状态管理和异常定义
@@ -61,20 +66,39 @@ class Protocol:
            .drop_tips()
         
         protocol.save()
+    
+    内存模式下协议保存的是指令 IR (见 CommandIR.py)，save() 时才序列化为 XML，
+    可通过 get_commands() / replace_commands() 在保存前对整个协议做检查或变换。
+    
+    流式模式 (大型多板协议): 每条指令在生成时即写入带缓冲的文件，不在内存中保留
+        with Protocol(fluent_sn="19905", output_file="big.gwl", stream=True, fsync_every=1000) as protocol:
+            ...  # 指令边生成边写入，退出 with 时自动 save()
     """
     
-    def __init__(self, fluent_sn: str, output_file: str):
+    def __init__(self, fluent_sn: str, output_file: str, stream: bool = False,
+                 fsync_every: int = 0, buffer_size: int = 1024 * 1024):
         """
         初始化协议编排器
         
         Args:
             fluent_sn (str): Tecan Fluent 设备序列号
             output_file (str): 输出的 .gwl 文件路径
+            stream (bool): 流式模式，指令在 add_command 时直接写入文件，默认 False
+            fsync_every (int): 流式模式下每写入多少条指令做一次 fsync 检查点，0 表示不自动检查点
+            buffer_size (int): 流式模式下文件写缓冲区大小 (字节)
         """
         self.fluent_sn = fluent_sn
         self.output_file = output_file
-        self._commands: List[str] = []
+        self.stream = stream
+        self.fsync_every = fsync_every
+        self.buffer_size = buffer_size
+        self._commands: List[Union[FluentCommand, str]] = []
+        self._command_count = 0
+        self._stream_file: Optional[TextIO] = None
+        self._stream_started = False  # 首次打开时截断文件，之后以追加方式重新打开
         self._defined_labware: Set[str] = set()  # 用于后续验证
+        self._labware_types: Dict[str, object] = {}  # 耗材标签 -> LabwareType，用于确定板型
+        self._recording: Optional[List[Union[FluentCommand, str]]] = None  # replicate() 录制的指令块
         
         # 实例化所有硬件臂的控制器 (延迟导入避免循环依赖)
         self._fca_gen = None
@@ -82,15 +106,355 @@ class Protocol:
         self._worktable_gen = None
         self._rga_gen = None
     
-    def add_command(self, command: str) -> None:
+    def add_command(self, command: Union[FluentCommand, str]) -> None:
         """
         内部方法，供各个生成器回调，用以添加指令
         
         Args:
-            command (str): 要添加的 XML 指令字符串
+            command (FluentCommand | str): 指令 IR，或已序列化的 XML 指令字符串
+        """
+        if self._recording is not None:
+            self._recording.append(command)
+        self._command_count += 1
+        if not self.stream:
+            self._commands.append(command)
+            return
+        handle = self._stream_file or self._open_stream()
+        handle.write(self._serialize(command))
+        handle.write("\n")
+        if self.fsync_every and self._command_count % self.fsync_every == 0:
+            self.checkpoint()
+    
+    def _add_commands(self, commands: List[Union[FluentCommand, str]]) -> None:
+        """批量添加指令 (不经过各生成器，流式模式下一次写入)"""
+        previous = self._command_count
+        self._command_count += len(commands)
+        if not self.stream:
+            self._commands.extend(commands)
+            return
+        handle = self._stream_file or self._open_stream()
+        handle.writelines(self._serialize(command) + "\n" for command in commands)
+        if self.fsync_every and self._command_count // self.fsync_every > previous // self.fsync_every:
+            self.checkpoint()
+    
+    def _serialize(self, command: Union[FluentCommand, str]) -> str:
+        """用本协议对应硬件臂的生成器将指令 IR 序列化 (字符串原样返回)"""
+        if isinstance(command, str):
+            return command
+        return command.to_xml(getattr(self, command.ARM)())
+    
+    def _open_stream(self) -> TextIO:
+        """打开流式输出文件 (首次截断，之后追加)"""
+        mode = 'a' if self._stream_started else 'w'
+        self._stream_file = open(self.output_file, mode, encoding='utf-8', buffering=self.buffer_size)
+        self._stream_started = True
+        return self._stream_file
+    
+    def checkpoint(self) -> None:
+        """
+        流式模式下将已生成的指令刷新并 fsync 到磁盘，
+        即使进程随后中断，文件中也至少包含到此为止的完整指令
+        """
+        if self._stream_file is not None:
+            self._stream_file.flush()
+            os.fsync(self._stream_file.fileno())
+    
+    def close(self) -> None:
+        """关闭流式输出文件 (内存模式下无操作)"""
+        if self._stream_file is not None:
+            self._stream_file.close()
+            self._stream_file = None
+    
+    def __enter__(self) -> 'Protocol':
+        if self.stream and self._stream_file is None:
+            self._open_stream()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.save()
+        else:
+            # 出错时不写出内存中的指令；流式模式保留已写入的部分并关闭文件
+            self.close()
+    
+    def iter_commands(self) -> Iterator[str]:
+        """
+        逐条产出已生成的指令 (不带换行)，便于通过管道交给其它工具处理
+        
+        流式模式下会先刷新缓冲区，再从输出文件中逐行读回。
+        
+        Yields:
+            str: XML 指令字符串
+        """
+        if not self.stream:
+            for command in self._commands:
+                yield self._serialize(command)
+            return
+        if self._stream_file is not None:
+            self._stream_file.flush()
+        if not self._stream_started:
+            return
+        with open(self.output_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield line.rstrip("\n")
+    
+    def get_commands(self) -> List[Union[FluentCommand, str]]:
+        """
+        获取尚未序列化的指令列表 (副本)，用于在保存前做验证、合并、估算等处理
+        
+        Returns:
+            list: 指令 IR (直接添加的 XML 字符串原样保留)
+            
+        Raises:
+            ValueError: 流式模式下指令已写入文件，不保留 IR
         """
-        self._commands.append(command)
+        if self.stream:
+            raise ValueError("流式模式下指令已写入文件，无法获取指令 IR")
+        return list(self._commands)
     
+    @classmethod
+    def load(cls, gwl_file: str, output_file: Optional[str] = None, fluent_sn: Optional[str] = None) -> 'Protocol':
+        """
+        从已有的 .gwl 文件载入协议 (见 FluentWorklist.py)
+
+        能还原的记录载入为指令 IR，其余记录按原文保留，save() 的结果与原文件逐行一致；
+        文件中 AddLabware 定义的耗材会被登记，之后可以继续追加指令或调用 optimize() 等。
+
+        Args:
+            gwl_file (str): 要载入的 .gwl 文件
+            output_file (str, optional): 保存路径，默认覆盖 gwl_file
+            fluent_sn (str, optional): 设备序列号，默认取文件中第一条设备指令的序列号
+
+        Returns:
+            Protocol: 载入了全部指令的协议 (内存模式)
+        """
+        from FluentWorklist import GwlReader
+
+        with GwlReader(gwl_file) as reader:
+            commands = reader.commands()
+            labware_types = reader.labware_types()
+        if fluent_sn is None:
+            fluent_sn = next((command.fluent_sn for command in commands
+                              if getattr(command, "fluent_sn", None)), "")
+        protocol = cls(fluent_sn, output_file or gwl_file)
+        protocol._add_commands(commands)
+        for command in commands:
+            if isinstance(command, ir.AddLabware):
+                protocol._defined_labware.add(command.label)
+                protocol._labware_types[command.label] = labware_types.get(command.label)
+            elif isinstance(command, ir.RemoveLabware):
+                protocol._defined_labware.discard(command.labware_name)
+                protocol._labware_types.pop(command.labware_name, None)
+        return protocol
+
+    def replace_commands(self, commands: Iterable[Union[FluentCommand, str]]) -> None:
+        """
+        用处理后的指令列表替换当前指令 (耗材记录保持不变)
+        
+        Args:
+            commands: 新的指令 IR / XML 字符串序列
+            
+        Raises:
+            ValueError: 流式模式下无法替换已写入的指令
+        """
+        if self.stream:
+            raise ValueError("流式模式下指令已写入文件，无法替换")
+        self._commands = list(commands)
+        self._command_count = len(self._commands)
+
+    def replicate(self, block: Callable[..., Any], over: Sequence[Union[str, Sequence[str], Mapping[str, str]]],
+                  positions: Optional[Sequence[Union[int, str, Mapping[str, Union[int, str]]]]] = None
+                  ) -> 'Protocol':
+        """
+        在多块板上重复同一段操作: 指令块只录制一次，其余各份通过替换耗材标签批量生成
+        
+        block 以 over 的第一项调用一次 (正常生成并校验指令)，录制到的指令 IR 随后按
+        "第一项的标签 -> 第 k 项的标签" 替换，批量添加到协议中，不再重复调用生成器。
+        
+        Args:
+            block: 录制的操作，调用方式取决于 over 的元素类型:
+                str -> block(protocol, label)；
+                元组/列表 -> block(protocol, *labels)；
+                字典 -> block(protocol, **labels)
+            over: 每块板 (或每组耗材) 的标签，如 ["Plate[001]", "Plate[002]"] 或
+                [{"source": "S[001]", "dest": "D[001]"}, ...]
+            positions (optional): 与 over 对应的工作台位置编号，用于替换块中 AddLabware 的位置；
+                元素为数字 (块中只添加一个耗材) 或 {第一项中的标签: 位置}
+        
+        Returns:
+            Protocol: 返回自身，支持链式调用
+        
+        Raises:
+            ValueError: over 为空、格式不一致、标签重复或耗材未定义 (整组一次校验)
+            InvalidStateException: 指令块结束时硬件臂状态与开始时不同 (无法直接重复)
+        
+        Example:
+            def transfer(protocol, plate):
+                protocol.fca().get_tips("200ul", list(range(8))) \\
+                    .aspirate(50, "Trough[001]", wells="A1") \\
+                    .dispense(50, plate, wells="col1").drop_tips()
+            
+            protocol.replicate(transfer, over=[f"Plate[{i:03d}]" for i in range(1, 11)])
+        """
+        if not over:
+            raise ValueError("replicate() 的 over 不能为空")
+        if positions is not None and len(positions) != len(over):
+            raise ValueError(f"positions 的长度 ({len(positions)}) 与 over ({len(over)}) 不一致")
+        groups = [self._replicate_labels(item) for item in over]
+        template = groups[0]
+        for group in groups[1:]:
+            if group.keys() != template.keys():
+                raise ValueError(f"over 中各项的格式必须一致: {over[0]!r} / {group!r}")
+        
+        # 整组一次校验: 块开始前已定义的耗材，其它各份对应的耗材也必须已定义
+        labels = [label for group in groups for label in group.values()]
+        duplicates = sorted({label for label in labels if labels.count(label) > 1})
+        if duplicates:
+            raise ValueError(f"replicate() 中的耗材标签重复: {duplicates}")
+        missing = sorted(group[key] for group in groups[1:] for key in template
+                         if template[key] in self._defined_labware and group[key] not in self._defined_labware)
+        if missing:
+            raise ValueError(f"以下耗材未定义，请先调用 add_labware(): {missing}")
+        
+        # 录制第一份
+        arms = (self._fca_gen, self._mca_gen, self._rga_gen)
+        states = [arm.state if arm is not None else None for arm in arms]
+        self._recording = []
+        try:
+            item = over[0]
+            if isinstance(item, str):
+                block(self, item)
+            elif isinstance(item, Mapping):
+                block(self, **item)
+            else:
+                block(self, *item)
+            recorded = self._recording
+        finally:
+            self._recording = None
+        for before, arm in zip(states, (self._fca_gen, self._mca_gen, self._rga_gen)):
+            if arm is not None and before is not None and arm.state != before:
+                raise InvalidStateException(
+                    f"错误：replicate() 的指令块结束时 {type(arm).__name__} 状态为 {arm.state.name}，"
+                    f"开始时为 {before.name}，指令块必须回到开始时的状态才能重复"
+                )
+            if arm is not None and before is None and arm.state.name != "IDLE":
+                raise InvalidStateException(
+                    f"错误：replicate() 的指令块结束时 {type(arm).__name__} 状态为 {arm.state.name}，"
+                    f"指令块必须回到 IDLE 状态才能重复"
+                )
+        
+        added = {command.label for command in recorded if isinstance(command, ir.AddLabware)}
+        unresolved = sorted(group[key] for group in groups[1:] for key in template
+                            if group[key] not in self._defined_labware and template[key] not in added)
+        if unresolved:
+            raise ValueError(f"以下耗材未定义，请先调用 add_labware(): {unresolved}")
+        
+        # 批量生成其余各份: 预先找出引用了模板标签的指令，其余指令 (frozen dataclass，不可变) 直接共享
+        template_labels = set(template.values())
+        plan = []
+        for command in recorded:
+            if isinstance(command, str):
+                plan.append((command, (), None))
+                continue
+            refs = tuple((name, getattr(command, name)) for name in command.LABWARE_FIELDS
+                         if getattr(command, name) in template_labels)
+            plan.append((command, refs, command.field_values() if refs else None))
+        
+        copies: List[Union[FluentCommand, str]] = []
+        plate_formats: Dict[str, int] = {}
+        for index, group in enumerate(groups[1:], start=1):
+            mapping = {template[key]: group[key] for key in template}
+            position = positions[index] if positions is not None else None
+            for command, refs, values in plan:
+                if not refs:
+                    copies.append(command)
+                    continue
+                changes = {name: mapping[label] for name, label in refs}
+                if isinstance(command, ir.AddLabware):
+                    if position is not None:
+                        new_position = position.get(command.label) if isinstance(position, Mapping) else position
+                        if new_position is not None:
+                            changes["position"] = new_position
+                    self._defined_labware.add(changes["label"])
+                    self._labware_types[changes["label"]] = self._labware_types.get(command.label)
+                elif isinstance(command, ir.RemoveLabware):
+                    self._defined_labware.discard(changes["labware_name"])
+                    self._labware_types.pop(changes["labware_name"], None)
+                elif "plate_format" in values:
+                    # 替换后的耗材可能是不同板型: 按其类型重新确定板型并校验孔位
+                    labware = changes["labware"]
+                    plate_format = plate_formats.get(labware)
+                    if plate_format is None:
+                        plate_format = plate_formats[labware] = plate_format_for(self._labware_types.get(labware))
+                    if plate_format != command.plate_format:
+                        get_geometry(plate_format).parse(command.wells)
+                        changes["plate_format"] = plate_format
+                copies.append(type(command)(**{**values, **changes}))
+        self._add_commands(copies)
+        return self
+    
+    @staticmethod
+    def _replicate_labels(item) -> Dict[Any, str]:
+        """将 over 的一项规整为 {键: 耗材标签}"""
+        if isinstance(item, str):
+            return {0: item}
+        if isinstance(item, Mapping):
+            return dict(item)
+        return dict(enumerate(item))
+
+    def optimize(self, max_channels: int = 8):
+        """
+        将相邻的单通道 FCA 循环合并为多通道循环 (可选，在 save() 之前调用)
+
+        合并规则见 FluentOptimizer.py；不满足条件的指令保持原样。
+
+        Args:
+            max_channels (int): 每个合并循环最多使用的通道数，默认 8
+
+        Returns:
+            OptimizationReport: 合并统计 (合并的循环数、减少的机械臂移动次数等)
+
+        Raises:
+            ValueError: 流式模式下指令已写入文件，无法优化
+        """
+        from FluentOptimizer import merge_single_channel_cycles
+        commands, report = merge_single_channel_cycles(self.get_commands(), max_channels)
+        self.replace_commands(commands)
+        return report
+
+    def simulate(self, initial_volumes=None):
+        """
+        离线回放当前协议，检查吸液不足、孔位溢出、枪头用尽等问题 (不修改协议)
+
+        Args:
+            initial_volumes (dict, optional): 耗材标签 -> 初始体积 (µL)，值为数字 (所有孔)
+                或 {孔位选择字符串: 体积}；未声明的孔初始为空
+
+        Returns:
+            SimulationReport: 模拟结果，report.ok 为 False 时表示存在错误
+
+        Raises:
+            ValueError: 流式模式下指令已写入文件，无法模拟
+        """
+        from FluentSimulator import simulate
+        return simulate(self.get_commands(), initial_volumes)
+
+    def estimate(self, model=None):
+        """
+        估算当前协议的运行时间 (用于排期)
+
+        Args:
+            model (DurationModel, optional): 耗时参数，默认使用 FluentEstimator.DurationModel()
+
+        Returns:
+            RunTimeEstimate: 总时长及按类别 / 指令类型的分解
+
+        Raises:
+            ValueError: 流式模式下指令已写入文件，无法估算
+        """
+        from FluentEstimator import estimate
+        return estimate(self.get_commands(), model)
+
     def get_defined_labware(self) -> Set[str]:
         """
         获取已定义的耗材标签集合
@@ -100,6 +464,18 @@ class Protocol:
         """
         return self._defined_labware.copy()
     
+    def get_labware_type(self, labware_label: str):
+        """
+        获取已定义耗材的类型
+        
+        Args:
+            labware_label (str): 耗材标签
+            
+        Returns:
+            LabwareType 或 None: 耗材类型，未定义时返回 None
+        """
+        return self._labware_types.get(labware_label)
+    
     def fca(self):
         """
         获取 FCA (灵活通道臂) 控制器
@@ -174,15 +550,26 @@ class Protocol:
         )
         # 注意：AddLabware 已经通过回调添加了指令，这里我们只需要记录标签
         self._defined_labware.add(labware_label)
+        self._labware_types[labware_label] = labware_type
         return self
     
     def save(self) -> None:
         """
         将所有累积的指令写入 .gwl 文件
+        
+        流式模式下指令已在生成时写入，这里只刷新缓冲区并关闭文件
+        (设置了 fsync_every 时先做一次检查点)。
         """
-        with open(self.output_file, 'w', encoding='utf-8') as f:
-            for command in self._commands:
-                f.write(command + "\n")
+        if self.stream:
+            if not self._stream_started:
+                self._open_stream()
+            if self.fsync_every:
+                self.checkpoint()
+            self.close()
+        else:
+            with open(self.output_file, 'w', encoding='utf-8') as f:
+                for command in self._commands:
+                    f.write(self._serialize(command) + "\n")
         print(f"脚本已成功生成到: {self.output_file}")
     
     def get_command_count(self) -> int:
@@ -192,12 +579,20 @@ class Protocol:
         Returns:
             int: 指令数量
         """
-        return len(self._commands)
+        return self._command_count
     
     def clear_commands(self) -> None:
         """
         清空所有指令 (用于调试或重新开始)
+        
+        流式模式下会截断输出文件。
         """
         self._commands.clear()
+        self._command_count = 0
+        if self.stream and self._stream_started:
+            self.close()
+            self._stream_started = False
+            self._open_stream()
         self._defined_labware.clear()
+        self._labware_types.clear()
         print("所有指令和耗材记录已清空")
\ No newline at end of file
@@ -1,6 +1,7 @@
 from xml.etree.ElementTree import Element, SubElement, tostring
 from xml.sax.saxutils import escape
 from typing import Optional, TYPE_CHECKING
+import CommandIR as ir
 
 if TYPE_CHECKING:
     from Protocol import Protocol, RGAState, InvalidStateException
@@ -48,24 +49,49 @@ class TecanRGAScriptGenerator:
                 f"当前状态: {self.state.name}，要求状态: {required_state.name}"
             )
     
-    def _execute_command(self, xml_command: str) -> 'TecanRGAScriptGenerator':
+    def _execute_command(self, command: ir.FluentCommand) -> 'TecanRGAScriptGenerator':
         """
-        执行命令：将 XML 添加到协议或返回字符串
+        执行命令：将指令 IR 添加到协议 (保存时再序列化) 或返回 XML 字符串
         
         Args:
-            xml_command (str): 生成的 XML 指令
+            command (FluentCommand): 指令 IR
             
         Returns:
             TecanRGAScriptGenerator: 返回自身支持链式调用，或字符串（向后兼容）
         """
         if self.protocol:
-            self.protocol.add_command(xml_command)
+            self.protocol.add_command(command)
             return self
         else:
             # 向后兼容：直接返回 XML 字符串
-            return xml_command
+            return self.serialize(command)
+
+    def serialize(self, command: ir.FluentCommand) -> str:
+        """
+        将 RGA 指令 IR 序列化为带前缀的 XML 字符串
+        
+        Args:
+            command (FluentCommand): TransferLabware
+        """
+        return getattr(self, command.XML_METHOD)(command)
 
     def TransferLabware(self, Labware, TargetLocation, TargetPosition, OnlyUseSelectedSite=True):
+        command = ir.TransferLabware(labware=Labware, target_location=TargetLocation,
+                                     target_position=TargetPosition, only_use_selected_site=OnlyUseSelectedSite)
+        
+        # 更新状态（简化的状态管理，实际应用中可能更复杂）
+        if self.state == RGAState.IDLE:
+            self.state = RGAState.HOLDING
+            self.current_labware = Labware
+        else:
+            # 如果已经在抓取状态，这可能是放置操作
+            self.state = RGAState.IDLE
+            self.current_labware = None
+        
+        return self._execute_command(command)
+
+    def _transfer_labware_xml(self, command: ir.TransferLabware) -> str:
+        """Serialize a TransferLabware command."""
         # 创建根元素
         script_group = Element("ScriptGroup")
 
@@ -90,12 +116,12 @@ class TecanRGAScriptGenerator:
         params = f"""
         <TransferLabwareCommandParameters xmlns:i="http://www.w3.org/2001/XMLSchema-instance" 
                                          xmlns="http://schemas.datacontract.org/2004/07/Tecan.VisionX.Drivers.RobotDriverBase">
-            <FixedSite>{str(OnlyUseSelectedSite).lower()}</FixedSite>
-            <Labware>{Labware}</Labware>
-            <Location>{TargetLocation}</Location>
+            <FixedSite>{str(command.only_use_selected_site).lower()}</FixedSite>
+            <Labware>{command.labware}</Labware>
+            <Location>{command.target_location}</Location>
             <MoveToBase>false</MoveToBase>
             <OnTheFlyTool></OnTheFlyTool>
-            <Site>{TargetPosition}</Site>
+            <Site>{command.target_position}</Site>
             <UseOnTheFlyTool>false</UseOnTheFlyTool>
         </TransferLabwareCommandParameters>
         """
@@ -110,18 +136,7 @@ class TecanRGAScriptGenerator:
         SubElement(script_group, "LineNumber").text = "0"
 
         # 转换为紧凑格式的XML字符串
-        xml_command = "B;" + tostring(script_group, encoding='utf-8').decode('utf-8')
-        
-        # 更新状态（简化的状态管理，实际应用中可能更复杂）
-        if self.state == RGAState.IDLE:
-            self.state = RGAState.HOLDING
-            self.current_labware = Labware
-        else:
-            # 如果已经在抓取状态，这可能是放置操作
-            self.state = RGAState.IDLE
-            self.current_labware = None
-        
-        return self._execute_command(xml_command)
+        return "B;" + tostring(script_group, encoding='utf-8').decode('utf-8')
     
     # 链式调用友好的方法
     def transfer_labware(self, labware: str, target_location: str, target_position: int, 
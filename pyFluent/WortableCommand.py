@@ -1,7 +1,9 @@
 from enum import Enum
-from xml.etree.ElementTree import Element, SubElement, tostring
+from xml.etree.ElementTree import Element, SubElement
 from typing import Optional, TYPE_CHECKING
 from FluentLabware import LabwareType, Nest_position
+from XMLTemplate import render_command
+import CommandIR as ir
 
 if TYPE_CHECKING:
     from Protocol import Protocol
@@ -22,23 +24,45 @@ class TecanWorktableScriptGenerator:
         self.DEFAULT_LINE_NUMBER = "1"
         self.SCRIPT_GROUP_LINE_NUMBER = "0"
         self.PREFIX = "B;"
+        # 使用预编译模板生成指令；False 时逐个构建 ElementTree (参考实现，输出一致)
+        self.use_templates = True
     
-    def _execute_command(self, xml_command: str) -> 'TecanWorktableScriptGenerator':
+    def _execute_command(self, command: ir.FluentCommand) -> 'TecanWorktableScriptGenerator':
         """
-        执行命令：将 XML 添加到协议或返回字符串
+        执行命令：将指令 IR 添加到协议 (保存时再序列化) 或返回 XML 字符串
         
         Args:
-            xml_command (str): 生成的 XML 指令
+            command (FluentCommand): 指令 IR
             
         Returns:
             TecanWorktableScriptGenerator: 返回自身支持链式调用，或字符串（向后兼容）
         """
         if self.protocol:
-            self.protocol.add_command(xml_command)
+            self.protocol.add_command(command)
             return self
         else:
             # 向后兼容：直接返回 XML 字符串
-            return xml_command
+            return self.serialize(command)
+
+    def serialize(self, command: ir.FluentCommand) -> str:
+        """
+        将工作台指令 IR 序列化为带前缀的 XML 字符串
+        
+        Args:
+            command (FluentCommand): AddLabware / RemoveLabware / InteriorLight
+        """
+        return getattr(self, command.XML_METHOD)(command)
+
+    def _render(self, build, static, values) -> str:
+        """
+        生成带前缀的指令字符串
+
+        Args:
+            build: 构建方法，以 ``build(*static, **values)`` 调用
+            static (tuple): 静态参数，每种取值编译一个模板
+            values (dict): 可变的槽位值
+        """
+        return render_command(build, static, values, self.PREFIX, self.use_templates)
 
     def _create_base_structure(self):
         """Create the basic XML structure common to all commands."""
@@ -105,6 +129,23 @@ class TecanWorktableScriptGenerator:
         else:
             raise ValueError(f"Invalid Location: {Location}")
 
+        command = ir.AddLabware(labware_type=labware_type_value, label=LabwareLabel, location=labware_location,
+                                position=Position, rotation=Rotation, has_lid=HasLid)
+        return self._execute_command(command)
+
+    def _add_labware_xml(self, command: ir.AddLabware) -> str:
+        """Serialize an AddLabware command."""
+        return self._render(self._build_add_labware, (), {
+            "labware_type": command.labware_type,
+            "label": command.label,
+            "location": command.location,
+            "position": str(command.position),
+            "rotation": str(command.rotation),
+            "has_lid": str(command.has_lid).lower(),
+        })
+
+    def _build_add_labware(self, labware_type, label, location, position, rotation, has_lid):
+        """Build the AddLabware command tree."""
         script_group, objects = self._create_base_structure()
 
         object_elem = SubElement(objects, "Object",
@@ -112,17 +153,16 @@ class TecanWorktableScriptGenerator:
         add_labware = SubElement(object_elem, "AddLabwareDataV1")
 
         # Add labware parameters
-        SubElement(add_labware, "LabwareType").text = labware_type_value
-        SubElement(add_labware, "LabwareLable").text = LabwareLabel
-        SubElement(add_labware, "Location").text = labware_location
-        SubElement(add_labware, "Position").text = str(Position)
-        SubElement(add_labware, "Rotation").text = str(Rotation)
-        SubElement(add_labware, "HasLid").text = str(HasLid).lower()
+        SubElement(add_labware, "LabwareType").text = labware_type
+        SubElement(add_labware, "LabwareLable").text = label
+        SubElement(add_labware, "Location").text = location
+        SubElement(add_labware, "Position").text = position
+        SubElement(add_labware, "Rotation").text = rotation
+        SubElement(add_labware, "HasLid").text = has_lid
 
         self._add_programming_statement(add_labware)
 
-        xml_command = self.PREFIX + tostring(script_group, encoding='utf-8').decode('utf-8')
-        return self._execute_command(xml_command)
+        return script_group
     
     # 链式调用友好的方法
     def add_labware(self, labware_type: LabwareType, label: str, location: Nest_position, 
@@ -153,16 +193,24 @@ class TecanWorktableScriptGenerator:
         Returns:
             str: Compact XML string with prefix
         """
+        return self.serialize(ir.RemoveLabware(labware_name=LabwareName))
+
+    def _remove_labware_xml(self, command: ir.RemoveLabware) -> str:
+        """Serialize a RemoveLabware command."""
+        return self._render(self._build_remove_labware, (), {"labware_name": command.labware_name})
+
+    def _build_remove_labware(self, labware_name):
+        """Build the RemoveLabware command tree."""
         script_group, objects = self._create_base_structure()
 
         object_elem = SubElement(objects, "Object",
                                  Type="Tecan.Core.Scripting.Worktable.Data.RemoveLabwareDataV1")
         remove_labware = SubElement(object_elem, "RemoveLabwareDataV1")
 
-        SubElement(remove_labware, "LabwareName").text = LabwareName
+        SubElement(remove_labware, "LabwareName").text = labware_name
         self._add_programming_statement(remove_labware)
 
-        return self.PREFIX + tostring(script_group, encoding='utf-8').decode('utf-8')
+        return script_group
 
     def InteriorLightOn(self):
         """
@@ -171,13 +219,7 @@ class TecanWorktableScriptGenerator:
         Returns:
             str: Compact XML string with prefix
         """
-        script_group, objects = self._create_base_structure()
-
-        object_elem = SubElement(objects, "Object",
-                                 Type="Tecan.Core.Scripting.Statements.InteriorLightOnStatement")
-        self._add_light_statement(object_elem, "InteriorLightOn")
-
-        return self.PREFIX + tostring(script_group, encoding='utf-8').decode('utf-8')
+        return self.serialize(ir.InteriorLight(on=True))
 
     def InteriorLightOff(self):
         """
@@ -186,10 +228,19 @@ class TecanWorktableScriptGenerator:
         Returns:
             str: Compact XML string with prefix
         """
+        return self.serialize(ir.InteriorLight(on=False))
+
+    def _interior_light_xml(self, command: ir.InteriorLight) -> str:
+        """Serialize an InteriorLightOn/InteriorLightOff command."""
+        light_type = "InteriorLightOn" if command.on else "InteriorLightOff"
+        return self._render(self._build_light_command, (light_type,), {})
+
+    def _build_light_command(self, light_type):
+        """Build an InteriorLightOn/InteriorLightOff command tree."""
         script_group, objects = self._create_base_structure()
 
         object_elem = SubElement(objects, "Object",
-                                 Type="Tecan.Core.Scripting.Statements.InteriorLightOffStatement")
-        self._add_light_statement(object_elem, "InteriorLightOff")
+                                 Type=f"Tecan.Core.Scripting.Statements.{light_type}Statement")
+        self._add_light_statement(object_elem, light_type)
 
-        return self.PREFIX + tostring(script_group, encoding='utf-8').decode('utf-8')
\ No newline at end of file
+        return script_group
\ No newline at end of file
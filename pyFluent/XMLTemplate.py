@@ -0,0 +1,234 @@
+"""
+XMLTemplate.py - 预编译的 XML 指令模板
+
+每条 Fluent 指令的 XML 中绝大部分是固定的样板结构 (设备别名、ScriptStatement、
+8 个空的 LiquidClassNames 等)，只有少数几个值 (体积、孔位、耗材标签、通道) 随调用变化。
+本模块把指令生成拆成两步:
+
+1. 编译: 用各生成器原有的 ElementTree 构建方法，以占位标记代替可变值构建一次指令，
+   序列化后切分成 "固定文本 + 槽位" 的片段列表，并按 (构建方法, 静态参数) 缓存;
+2. 渲染: 之后每次调用只需转义可变值并拼接片段。
+
+渲染结果与 ``tostring(...)`` 的输出逐字节一致:
+- 标量槽位对应一个完整元素的文本，值为空时输出 ``<Tag />``;
+- 列表槽位对应一个父元素下重复的 ``<Object ...><tag>值</tag></Object>`` 子元素，
+  列表为空时输出 ``<Parent />``;
+- 文本转义规则与 ElementTree 相同 (仅转义 ``& < >``)。
+
+嵌入在文本中间的值 (如序列号、枪头类型、适配器 ID) 不能作为槽位，需作为静态参数
+参与缓存键，每种取值编译一个模板。
+
+作者: Gaoyuan
+"""
+
+import re
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+from xml.etree.ElementTree import Element, tostring
+
+# 占位标记使用 Unicode 私有区字符，不会出现在正常的指令内容中
+_FIELD_START = "\ue000"
+_LIST_START = "\ue002"
+_FIELD_END = "\ue001"
+_MARKER_CHARS = (_FIELD_START, _LIST_START, _FIELD_END)
+
+_SLOT_PATTERN = re.compile(
+    # 标量槽位: <Tag>标记</Tag>
+    r"<(?P<tag>[^\s/>]+)>\ue000(?P<name>[^\ue001]+)\ue001</(?P=tag)>"
+    # 列表槽位: <Parent><Object ...><tag>标记</tag></Object></Parent>
+    r"|<(?P<parent>[^\s/>]+)>(?P<item_open><(?P<item>[^\s/>]+)[^>]*>)"
+    r"<(?P<item_tag>[^\s/>]+)>\ue002(?P<list_name>[^\ue001]+)\ue001</(?P=item_tag)></(?P=item)></(?P=parent)>"
+)
+
+_SCALAR = 0
+_LIST = 1
+
+DEFAULT_MAX_TEMPLATES = 256
+
+
+def field(name: str) -> str:
+    """返回标量槽位的占位标记"""
+    return _FIELD_START + name + _FIELD_END
+
+
+def list_field(name: str) -> List[str]:
+    """返回列表槽位的占位标记 (只含一个元素的列表，构建方法会为其生成一个子元素)"""
+    return [_LIST_START + name + _FIELD_END]
+
+
+def escape_text(text: str) -> str:
+    """按 ElementTree 的规则转义元素文本"""
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+
+class XMLTemplate:
+    """
+    由固定文本和槽位组成的已编译指令模板
+
+    Args:
+        xml (str): 含占位标记的序列化指令 (由 ``field`` / ``list_field`` 生成)
+
+    Raises:
+        ValueError: 占位标记不是完整元素的文本 (例如被拼接进其它文本或被修改)
+    """
+
+    def __init__(self, xml: str):
+        self._head = ""
+        self._slots: List[tuple] = []
+        self.fields: Tuple[str, ...] = ()
+        self._compile(xml)
+
+    def _compile(self, xml: str) -> None:
+        literals = []
+        slots = []
+        position = 0
+        for match in _SLOT_PATTERN.finditer(xml):
+            literals.append(xml[position:match.start()])
+            position = match.end()
+            if match.group("tag") is not None:
+                tag = match.group("tag")
+                slots.append((_SCALAR, match.group("name"), f"<{tag}>", f"</{tag}>", f"<{tag} />", "", ""))
+            else:
+                parent = match.group("parent")
+                item_open = match.group("item_open")
+                item_tag = match.group("item_tag")
+                item_close = f"</{match.group('item')}>"
+                slots.append((
+                    _LIST,
+                    match.group("list_name"),
+                    f"<{parent}>",
+                    f"</{parent}>",
+                    f"<{parent} />",
+                    (item_open + f"<{item_tag}>", f"</{item_tag}>" + item_close),
+                    item_open + f"<{item_tag} />" + item_close,
+                ))
+        literals.append(xml[position:])
+
+        for literal in literals:
+            if any(marker in literal for marker in _MARKER_CHARS):
+                raise ValueError(f"模板中存在无法编译的占位标记: {literal!r}")
+
+        self._head = literals[0]
+        self._slots = [slot + (literal,) for slot, literal in zip(slots, literals[1:])]
+        self.fields = tuple(slot[1] for slot in slots)
+
+    def render(self, values: Dict[str, Any]) -> str:
+        """
+        用给定的值填充所有槽位
+
+        Args:
+            values (dict): 槽位名到值的映射；标量值须为 str 或 None，列表项会先经过 str()
+
+        Returns:
+            str: 与 ElementTree 序列化结果一致的指令字符串
+
+        Raises:
+            KeyError: 缺少某个槽位的值
+            TypeError: 标量值不是字符串 (与 ElementTree 的行为一致)
+        """
+        parts = [self._head]
+        append = parts.append
+        for kind, name, open_tag, close_tag, empty, item, empty_item, literal in self._slots:
+            value = values[name]
+            if kind == _SCALAR:
+                if not value:
+                    append(empty)
+                elif value.__class__ is str:
+                    append(open_tag)
+                    append(escape_text(value))
+                    append(close_tag)
+                else:
+                    raise TypeError(f"cannot serialize {value!r} (type {type(value).__name__})")
+            elif not value:
+                append(empty)
+            else:
+                append(open_tag)
+                item_prefix, item_suffix = item
+                for entry in value:
+                    text = str(entry)
+                    if text:
+                        append(item_prefix)
+                        append(escape_text(text))
+                        append(item_suffix)
+                    else:
+                        append(empty_item)
+                append(close_tag)
+            append(literal)
+        return "".join(parts)
+
+
+def compile_element(element: Element, prefix: str = "") -> XMLTemplate:
+    """序列化一个含占位标记的元素树并编译为模板"""
+    return XMLTemplate(prefix + tostring(element, encoding='utf-8').decode('utf-8'))
+
+
+class TemplateCache:
+    """
+    按 (构建方法, 静态参数) 缓存已编译模板的 LRU 缓存
+
+    Args:
+        max_entries (int): 最多缓存的模板数量
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_TEMPLATES):
+        self.max_entries = max_entries
+        self._templates: "OrderedDict[Hashable, XMLTemplate]" = OrderedDict()
+
+    def get(self, key: Hashable, factory: Callable[[], XMLTemplate]) -> XMLTemplate:
+        template = self._templates.get(key)
+        if template is None:
+            template = factory()
+            self._templates[key] = template
+            if len(self._templates) > self.max_entries:
+                self._templates.popitem(last=False)
+        else:
+            self._templates.move_to_end(key)
+        return template
+
+    def clear(self) -> None:
+        self._templates.clear()
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+
+# 所有生成器共享的模板缓存
+template_cache = TemplateCache()
+
+
+def render_command(build: Callable[..., Element], static: Tuple, values: Dict[str, Any],
+                   prefix: str = "B;", use_template: bool = True,
+                   cache: Optional[TemplateCache] = None) -> str:
+    """
+    生成一条指令: 使用缓存的模板，或直接用 ElementTree 构建 (参考实现)
+
+    Args:
+        build: 构建方法，调用方式为 ``build(*static, **values)``，返回根元素
+        static (tuple): 嵌入在文本中的静态参数，参与缓存键
+        values (dict): 槽位值；list/tuple 值对应列表槽位，其它值对应标量槽位
+        prefix (str): 指令前缀
+        use_template (bool): False 时直接使用 ElementTree 构建并序列化
+        cache (TemplateCache, optional): 模板缓存，默认使用全局缓存
+
+    Returns:
+        str: 带前缀的指令字符串
+    """
+    if not use_template:
+        return prefix + tostring(build(*static, **values), encoding='utf-8').decode('utf-8')
+
+    def factory() -> XMLTemplate:
+        placeholders = {
+            name: list_field(name) if isinstance(value, (list, tuple)) else field(name)
+            for name, value in values.items()
+        }
+        return compile_element(build(*static, **placeholders), prefix)
+
+    key = (build.__qualname__, prefix, tuple(sorted(values)), static)
+    cache = cache if cache is not None else template_cache
+    return cache.get(key, factory).render(values)